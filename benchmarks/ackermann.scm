@@ -0,0 +1,10 @@
+; Ackermann function: a mix of tail calls and deep non-tail recursion.
+
+(define (ack m n)
+  (cond ((= m 0) (+ n 1))
+        ((= n 0) (ack (- m 1) 1))
+        (else (ack (- m 1) (ack m (- n 1))))))
+
+(define bench-input 4)
+(define (bench-run n) (ack 3 n))
+(define bench-expected 125)
@@ -0,0 +1,20 @@
+; call/cc escapes: leave a search as soon as the element is found.
+
+(define (callcc-find pred lst)
+  (call/cc
+    (lambda (return)
+      (let loop ((l lst))
+        (cond ((null? l) #f)
+              ((pred (car l)) (return (car l)))
+              (else (loop (cdr l))))))))
+
+(define callcc-data
+  (let loop ((k 100) (acc '()))
+    (if (= k 0) acc (loop (- k 1) (cons k acc)))))
+
+(define bench-input 200)
+(define (bench-run n)
+  (do ((k 0 (+ k 1))
+       (found 0 (+ found (callcc-find (lambda (x) (> x 50)) callcc-data))))
+      ((= k n) found)))
+(define bench-expected 10200)
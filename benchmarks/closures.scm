@@ -0,0 +1,24 @@
+; Closure-heavy code: counters, composition and higher-order folds.
+
+(define (closures-counter)
+  (let ((n 0))
+    (lambda () (set! n (+ n 1)) n)))
+
+(define (closures-compose f g) (lambda (x) (f (g x))))
+
+(define (closures-fold f acc lst)
+  (if (null? lst) acc (closures-fold f (f acc (car lst)) (cdr lst))))
+
+(define (closures-range n)
+  (let loop ((k n) (acc '()))
+    (if (= k 0) acc (loop (- k 1) (cons k acc)))))
+
+(define bench-input 2000)
+(define (bench-run n)
+  (let ((counter (closures-counter))
+        (inc-twice (closures-compose (lambda (x) (+ x 1)) (lambda (x) (+ x 1)))))
+    (closures-fold (lambda (acc x) (counter) (+ acc (inc-twice x)))
+                   0
+                   (closures-range n))
+    (list (counter) (closures-fold (lambda (acc x) (+ acc x)) 0 (closures-range 100)))))
+(define bench-expected '(2001 5050))
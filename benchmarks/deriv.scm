@@ -0,0 +1,25 @@
+; Symbolic differentiation (Gabriel): building and walking list structure.
+
+(define (deriv-map f lst)
+  (if (null? lst) '() (cons (f (car lst)) (deriv-map f (cdr lst)))))
+
+(define (deriv a)
+  (cond ((not (pair? a)) (if (eq? a 'x) 1 0))
+        ((eq? (car a) '+) (cons '+ (deriv-map deriv (cdr a))))
+        ((eq? (car a) '-) (cons '- (deriv-map deriv (cdr a))))
+        ((eq? (car a) '*)
+         (list '* a (cons '+ (deriv-map (lambda (b) (list '/ (deriv b) b)) (cdr a)))))
+        ((eq? (car a) '/)
+         (list '- (list '/ (deriv (car (cdr a))) (car (cdr (cdr a))))
+               (list '/ (car (cdr a))
+                     (list '* (car (cdr (cdr a))) (car (cdr (cdr a))) (deriv (car (cdr (cdr a))))))))
+        (else (raise "deriv: unknown operator"))))
+
+(define deriv-input '(+ (* 3 x x) (* a x x) (* b x) 5))
+
+(define bench-input 300)
+(define (bench-run n)
+  (do ((k 0 (+ k 1))
+       (result '() (deriv deriv-input)))
+      ((= k n) (car (cdr (car (cdr result)))))))
+(define bench-expected '(* 3 x x))
@@ -0,0 +1,41 @@
+; Destructive updates: in-place insertion sort and reversal of a vector,
+; and counting in a hash table. Lists are immutable here, so vectors and
+; hash tables stand for set-car!/set-cdr! in the classic benchmark.
+
+(define (destructive-random-vector n seed)
+  (let ((v (make-vector n 0)))
+    (do ((k 0 (+ k 1))
+         (x seed (let ((y (+ (* x 1103515245) 12345))) (- y (* 2147483648 (floor (/ y 2147483648)))))))
+        ((= k n) v)
+      (vector-set! v k (floor (/ x 65536))))))
+
+(define (destructive-sort! v)
+  (do ((k 1 (+ k 1)))
+      ((= k (vector-length v)) v)
+    (let ((x (vector-ref v k)))
+      (let loop ((m (- k 1)))
+        (if (and (>= m 0) (> (vector-ref v m) x))
+            (begin (vector-set! v (+ m 1) (vector-ref v m)) (loop (- m 1)))
+            (vector-set! v (+ m 1) x))))))
+
+(define (destructive-reverse! v)
+  (do ((k 0 (+ k 1))
+       (m (- (vector-length v) 1) (- m 1)))
+      ((>= k m) v)
+    (let ((x (vector-ref v k)))
+      (vector-set! v k (vector-ref v m))
+      (vector-set! v m x))))
+
+(define (destructive-count v)
+  (let ((h (make-hash-table)))
+    (do ((k 0 (+ k 1)))
+        ((= k (vector-length v)) (hash-count h))
+      (hash-set! h (remainder (vector-ref v k) 64) #t))))
+
+(define bench-input 200)
+(define (bench-run n)
+  (let ((v (destructive-random-vector n 42)))
+    (destructive-sort! v)
+    (destructive-reverse! v)
+    (list (>= (vector-ref v 0) (vector-ref v (- n 1))) (destructive-count v))))
+(define bench-expected '(#t 61))
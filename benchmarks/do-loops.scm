@@ -0,0 +1,21 @@
+; Numeric do loops: nested integer loops and a floating-point series.
+
+(define (do-loops-sum n)
+  (do ((k 0 (+ k 1))
+       (acc 0 (do ((m 0 (+ m 1))
+                   (inner acc (+ inner (* k m))))
+                  ((= m 20) inner))))
+      ((= k n) acc)))
+
+(define (do-loops-leibniz n)
+  (do ((k 0 (+ k 1))
+       (sign 1.0 (- 0.0 sign))
+       (acc 0.0 (+ acc (/ sign (+ (* 2 k) 1)))))
+      ((= k n) (* 4 acc))))
+
+(define (do-loops-close? a b) (< (fabs (- a b)) 0.001))
+
+(define bench-input 300)
+(define (bench-run n)
+  (list (do-loops-sum n) (do-loops-close? (do-loops-leibniz (* n 20)) pi)))
+(define bench-expected '(8521500 #t))
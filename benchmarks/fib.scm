@@ -0,0 +1,10 @@
+; Doubly recursive Fibonacci: procedure calls and integer arithmetic.
+
+(define (fib n)
+  (if (< n 2)
+      n
+      (+ (fib (- n 1)) (fib (- n 2)))))
+
+(define bench-input 20)
+(define (bench-run n) (fib n))
+(define bench-expected 6765)
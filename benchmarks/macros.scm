@@ -0,0 +1,35 @@
+; Macro-heavy expansion: eval expands a program full of user macros each time.
+
+(define-syntax macros-swap!
+  (syntax-rules ()
+    ((_ a b) (let ((tmp a)) (set! a b) (set! b tmp)))))
+
+(define-syntax macros-while
+  (syntax-rules ()
+    ((_ cond body ...) (let loop () (when cond body ... (loop))))))
+
+(define-syntax macros-my-or
+  (syntax-rules ()
+    ((_) #f)
+    ((_ e) e)
+    ((_ e r ...) (let ((t e)) (if t t (macros-my-or r ...))))))
+
+(define-macro macros-unless-zero
+  (lambda (x body) `(if (= ,x 0) #f ,body)))
+
+(define macros-program
+  '(let ((a 1) (b 2) (k 0))
+     (macros-while (< k 10)
+       (macros-swap! a b)
+       (macros-unless-zero k (macros-my-or #f (and #t (> k 100)) (set! k (+ k 1))))
+       (cond ((= k 0) (set! k 1))
+             ((macros-my-or (= k 5) (= k 6)) (set! k (+ k 1)))
+             (else (set! k (+ k 1)))))
+     (list a b k)))
+
+(define bench-input 40)
+(define (bench-run n)
+  (do ((k 0 (+ k 1))
+       (result #f (eval macros-program)))
+      ((= k n) result)))
+(define bench-expected '(1 2 11))
@@ -0,0 +1,26 @@
+; N-queens (Gabriel): count the solutions with list operations and backtracking.
+
+(define (queens-iota n)
+  (let loop ((k n) (acc '()))
+    (if (= k 0) acc (loop (- k 1) (cons k acc)))))
+
+(define (queens-ok? row dist placed)
+  (if (null? placed)
+      #t
+      (and (not (= (car placed) (+ row dist)))
+           (not (= (car placed) (- row dist)))
+           (queens-ok? row (+ dist 1) (cdr placed)))))
+
+(define (queens-try x y z)
+  (if (null? x)
+      (if (null? y) 1 0)
+      (+ (if (queens-ok? (car x) 1 z)
+             (queens-try (append (cdr x) y) '() (cons (car x) z))
+             0)
+         (queens-try (cdr x) (cons (car x) y) z))))
+
+(define (queens n) (queens-try (queens-iota n) '() '()))
+
+(define bench-input 7)
+(define (bench-run n) (queens n))
+(define bench-expected 40)
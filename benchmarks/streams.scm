@@ -0,0 +1,22 @@
+; delay/force streams: a lazy sieve of Eratosthenes.
+
+; A stream is a list of its first element and a promise of the rest.
+(define (streams-from n) (list n (delay (streams-from (+ n 1)))))
+(define (streams-tail s) (force (car (cdr s))))
+
+(define (streams-filter pred s)
+  (if (pred (car s))
+      (list (car s) (delay (streams-filter pred (streams-tail s))))
+      (streams-filter pred (streams-tail s))))
+
+(define (streams-sieve s)
+  (let ((p (car s)))
+    (list p (delay (streams-sieve (streams-filter (lambda (x) (not (= (remainder x p) 0)))
+                                                  (streams-tail s)))))))
+
+(define (streams-ref s n)
+  (if (= n 0) (car s) (streams-ref (streams-tail s) (- n 1))))
+
+(define bench-input 60)
+(define (bench-run n) (streams-ref (streams-sieve (streams-from 2)) n))
+(define bench-expected 283)
@@ -0,0 +1,10 @@
+; String building: repeated string-append and number formatting.
+
+(define (strings-build n)
+  (do ((k 0 (+ k 1))
+       (s "" (string-append s (str k) ",")))
+      ((= k n) s)))
+
+(define bench-input 6000)
+(define (bench-run n) (length (strings-build n)))
+(define bench-expected 28890)
@@ -0,0 +1,12 @@
+; Takeuchi function (Gabriel): deep non-tail recursion with three arguments.
+
+(define (tak x y z)
+  (if (not (< y x))
+      z
+      (tak (tak (- x 1) y z)
+           (tak (- y 1) z x)
+           (tak (- z 1) x y))))
+
+(define bench-input 16)
+(define (bench-run n) (tak n 12 6))
+(define bench-expected 7)
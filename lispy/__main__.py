@@ -1,9 +1,53 @@
+import argparse
 import sys
 
+from .constants import DEFAULT_SAMPLE_INTERVAL
+from .counters import write_prometheus
+from .coverage import coverage_file
+from .env import count_find_depths
+from .evaluator import count_events
+from .memory import memory_file
+from .profiler import profile_file
 from .repl import load, repl
+from .sampler import sample_file
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        load(sys.argv[1])
-    else:
-        repl(out=sys.stdout)
+    parser = argparse.ArgumentParser(prog='lispy', description='Run a Lispy program, or the REPL without one.')
+    parser.add_argument('file', nargs='?', help='the program to run')
+    parser.add_argument('--profile', action='store_true', help='profile the procedures of the program')
+    parser.add_argument('--profile-output', metavar='FILE',
+                        help='write the profile to FILE (JSON if it ends with .json, pstats otherwise)')
+    parser.add_argument('--sample', metavar='FILE',
+                        help='sample the call stack of the program and write collapsed stacks to FILE')
+    parser.add_argument('--sample-interval', metavar='SECONDS', type=float, default=DEFAULT_SAMPLE_INTERVAL,
+                        help='the time between samples (default: %(default)s)')
+    parser.add_argument('--memory', action='store_true',
+                        help='measure the memory the procedures of the program allocate and the globals keep')
+    parser.add_argument('--memory-output', metavar='FILE', help='write the memory report to FILE as JSON')
+    parser.add_argument('--coverage', action='store_true', help='measure the lines, branches and procedures run')
+    parser.add_argument('--coverage-output', metavar='FILE',
+                        help='write the coverage to FILE (JSON if it ends with .json, LCOV otherwise)')
+    parser.add_argument('--stats', metavar='FILE',
+                        help='write the counters and lookup depths to FILE in the Prometheus text format on exit')
+    args = parser.parse_args()
+    if (args.profile or args.sample or args.memory or args.coverage) and args.file is None:
+        parser.error('--profile, --sample, --memory and --coverage require a file')
+    if args.stats:
+        count_events(True)
+        count_find_depths(True)
+    try:
+        if args.profile:
+            profile_file(args.file, args.profile_output)
+        elif args.sample:
+            sample_file(args.file, args.sample, args.sample_interval)
+        elif args.memory:
+            memory_file(args.file, args.memory_output)
+        elif args.coverage:
+            coverage_file(args.file, args.coverage_output)
+        elif args.file is not None:
+            load(args.file)
+        else:
+            repl(out=sys.stdout)
+    finally:
+        if args.stats:
+            write_prometheus(args.stats)
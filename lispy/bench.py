@@ -0,0 +1,271 @@
+"""
+Benchmark runner.
+
+The benchmarks are Lispy programs in the `benchmarks/` directory of the
+repository. Each one defines its workload as a procedure `bench-run` of one
+argument, the problem size `bench-input`, and the value `bench-expected` the
+run must return. The size is passed when the benchmark runs, so the
+optimizer cannot fold the workload away when it is defined.
+
+For each benchmark, the runner loads the program, calls `bench-run` a few
+times to warm up (and checks its result), then times a number of runs and
+reports the minimum, mean, median, standard deviation and maximum.
+
+    python -m lispy.bench                           # every benchmark
+    python -m lispy.bench fib tak --repeat 10 --output new.json
+    python -m lispy.bench --compare old.json new.json
+    python -m lispy.bench --micro --budgets benchmarks/budgets.json
+
+The compare mode reads two result files and flags the benchmarks whose
+minimum time changed by more than a threshold (10% by default); it exits
+with status 1 if one got slower, so it can guard a CI job.
+
+`--micro` runs the microbenchmarks of the subsystems instead (see
+`lispy.microbench`): `--pin FILE` writes their results as budgets, and
+`--budgets FILE` checks them, exiting with status 1 if one is over budget.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, TextIO
+
+from .constants import (
+    BENCHMARK_EXPECTED,
+    BENCHMARK_INPUT,
+    BENCHMARK_RUN,
+    BENCHMARK_SUFFIX,
+    BENCHMARKS_DIRNAME,
+    BUDGETS_FILENAME,
+    DEFAULT_BENCHMARK_REPEAT,
+    DEFAULT_BENCHMARK_WARMUP,
+    DEFAULT_BUDGET_SLACK,
+    DEFAULT_REGRESSION_THRESHOLD,
+)
+from .env import global_env
+from .errors import BenchmarkError
+from .messages import ERR_BENCHMARK_DEFINITION, ERR_BENCHMARK_RESULT, ERR_BENCHMARK_UNKNOWN
+from .microbench import check_budgets, pin_budgets, print_micro, run_micro
+from .parser import to_string
+from .repl import load
+
+BENCHMARKS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), BENCHMARKS_DIRNAME)
+"""The benchmarks of the repository."""
+
+BUDGETS_FILE = os.path.join(BENCHMARKS_DIR, BUDGETS_FILENAME)
+"""The budgets of the microbenchmarks (see `lispy.microbench`)."""
+
+RESULT_LINE = '{:<14} {:>10.6f} {:>10.6f} {:>10.6f} {:>6.1%}'
+RESULT_HEADER = '{:<14} {:>10} {:>10} {:>10} {:>6}'.format('benchmark', 'min', 'median', 'mean', 'stdev')
+COMPARISON_LINE = '{:<14} {:>10.6f} {:>10.6f} {:>7.2f}x  {}'
+COMPARISON_HEADER = '{:<14} {:>10} {:>10} {:>8}'.format('benchmark', 'old', 'new', 'ratio')
+
+
+def find_benchmarks(directory: str = BENCHMARKS_DIR, names: Optional[List[str]] = None) -> List[str]:
+    """
+    Return the files of benchmarks, in alphabetical order.
+
+    Args:
+        directory (str): The directory of the benchmarks.
+        names (Optional[List[str]]): The benchmarks to return, by file name without suffix. Defaults to all.
+
+    Returns:
+        List[str]: The paths of the files.
+
+    Raises:
+        BenchmarkError: If one of the names is not a benchmark.
+    """
+    available = sorted(f[:-len(BENCHMARK_SUFFIX)] for f in os.listdir(directory) if f.endswith(BENCHMARK_SUFFIX))
+    for name in names or ():
+        if name not in available:
+            raise BenchmarkError(ERR_BENCHMARK_UNKNOWN.format(name, directory))
+    return [os.path.join(directory, name + BENCHMARK_SUFFIX) for name in (names or available)]
+
+
+def summarize(times: List[float]) -> Dict[str, float]:
+    """
+    Return the statistics of timings: min, mean, median, stdev and max, in seconds.
+    """
+    return {
+        'min': min(times),
+        'mean': statistics.mean(times),
+        'median': statistics.median(times),
+        'stdev': statistics.stdev(times) if len(times) > 1 else 0.0,
+        'max': max(times),
+    }
+
+
+def run_benchmark(filename: str, repeat: int = DEFAULT_BENCHMARK_REPEAT, warmup: int = DEFAULT_BENCHMARK_WARMUP,
+                  timer: Callable[[], float] = time.perf_counter) -> Dict[str, Any]:
+    """
+    Load a benchmark and time it.
+
+    The garbage collector runs before each timed run, so that collecting
+    the garbage of a run is not charged to the next one.
+
+    Args:
+        filename (str): The program of the benchmark.
+        repeat (int): The number of timed runs.
+        warmup (int): The number of runs before, which are not timed (at least one, to check the result).
+        timer (Callable[[], float]): The clock.
+
+    Returns:
+        Dict[str, Any]: The input, the times of the runs, and their statistics (see `summarize`).
+
+    Raises:
+        BenchmarkError: If the program does not define the benchmark, or the benchmark returns a wrong result.
+    """
+    name = os.path.basename(filename)[:-len(BENCHMARK_SUFFIX)]
+    for var in (BENCHMARK_RUN, BENCHMARK_INPUT, BENCHMARK_EXPECTED):
+        global_env.pop(var, None)
+    load(filename)
+    for var in (BENCHMARK_RUN, BENCHMARK_INPUT, BENCHMARK_EXPECTED):
+        if var not in global_env:
+            raise BenchmarkError(ERR_BENCHMARK_DEFINITION.format(name, var))
+    run, size, expected = global_env[BENCHMARK_RUN], global_env[BENCHMARK_INPUT], global_env[BENCHMARK_EXPECTED]
+    for _ in range(max(warmup, 1)):         # the result is checked at least once
+        result = run(size)
+        if result != expected:
+            raise BenchmarkError(ERR_BENCHMARK_RESULT.format(name, to_string(result), to_string(expected)))
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = timer()
+        run(size)
+        times.append(timer() - start)
+    return dict({'input': size, 'times': times}, **summarize(times))
+
+
+def run_suite(filenames: List[str], repeat: int = DEFAULT_BENCHMARK_REPEAT, warmup: int = DEFAULT_BENCHMARK_WARMUP,
+              out: Optional[TextIO] = None) -> Dict[str, Any]:
+    """
+    Run benchmarks, printing their statistics as they finish.
+
+    Args:
+        filenames (List[str]): The programs of the benchmarks.
+        repeat (int): The number of timed runs of each.
+        warmup (int): The number of untimed runs of each before.
+        out (Optional[TextIO]): The output stream. Defaults to sys.stdout.
+
+    Returns:
+        Dict[str, Any]: The results, as written to JSON: the Python version and platform,
+            the settings, and the results of each benchmark by name.
+    """
+    out = sys.stdout if out is None else out
+    results: Dict[str, Any] = {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'warmup': warmup,
+        'benchmarks': {},
+    }
+    print(RESULT_HEADER, file=out)
+    for filename in filenames:
+        name = os.path.basename(filename)[:-len(BENCHMARK_SUFFIX)]
+        result = results['benchmarks'][name] = run_benchmark(filename, repeat, warmup)
+        stdev = result['stdev'] / result['mean'] if result['mean'] else 0.0
+        print(RESULT_LINE.format(name, result['min'], result['median'], result['mean'], stdev), file=out)
+    return results
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any], threshold: float = DEFAULT_REGRESSION_THRESHOLD,
+            metric: str = 'min') -> List[Dict[str, Any]]:
+    """
+    Compare two results of the suite.
+
+    Args:
+        old (Dict[str, Any]): The results before (see `run_suite`).
+        new (Dict[str, Any]): The results after.
+        threshold (float): The relative change below which a benchmark has not changed.
+        metric (str): The statistic compared.
+
+    Returns:
+        List[Dict[str, Any]]: For each benchmark in both results, its name, old and new times,
+            the ratio new/old and its status: 'slower', 'faster' or 'same'.
+    """
+    rows = []
+    for name, before in old['benchmarks'].items():
+        after = new['benchmarks'].get(name)
+        if after is None:
+            continue
+        ratio = after[metric] / before[metric] if before[metric] else float('inf')
+        status = 'slower' if ratio > 1 + threshold else 'faster' if ratio < 1 - threshold else 'same'
+        rows.append({'name': name, 'old': before[metric], 'new': after[metric], 'ratio': ratio, 'status': status})
+    return rows
+
+
+def print_comparison(rows: List[Dict[str, Any]], out: Optional[TextIO] = None) -> None:
+    """
+    Print a comparison (see `compare`), one benchmark per line.
+    """
+    out = sys.stdout if out is None else out
+    print(COMPARISON_HEADER, file=out)
+    for row in rows:
+        status = '' if row['status'] == 'same' else row['status'].upper()
+        print(COMPARISON_LINE.format(row['name'], row['old'], row['new'], row['ratio'], status).rstrip(), file=out)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Run `python -m lispy.bench`.
+
+    Args:
+        argv (Optional[List[str]]): The arguments. Defaults to those of the process.
+
+    Returns:
+        int: The exit status: 1 if a comparison found a regression or a microbenchmark is over
+            budget, 0 otherwise.
+    """
+    parser = argparse.ArgumentParser(prog='python -m lispy.bench', description='Run the Lispy benchmarks.')
+    parser.add_argument('names', nargs='*', metavar='NAME', help='the benchmarks to run (default: all)')
+    parser.add_argument('--dir', default=BENCHMARKS_DIR, help='the directory of the benchmarks')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_BENCHMARK_REPEAT, help='timed runs of each benchmark')
+    parser.add_argument('--warmup', type=int, default=DEFAULT_BENCHMARK_WARMUP,
+                        help='untimed runs of each benchmark before')
+    parser.add_argument('--output', metavar='FILE', help='write the results to FILE as JSON')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                        help='the relative change flagged by --compare (default: %(default)s)')
+    parser.add_argument('--metric', choices=('min', 'median', 'mean'), default='min',
+                        help='the statistic compared (default: %(default)s)')
+    parser.add_argument('--micro', action='store_true', help='run the microbenchmarks of the subsystems')
+    parser.add_argument('--budgets', metavar='FILE',
+                        help='check the microbenchmarks against the budgets in FILE, such as ' + BUDGETS_FILE)
+    parser.add_argument('--pin', metavar='FILE', help='write the results of the microbenchmarks to FILE as budgets')
+    parser.add_argument('--slack', type=float, default=DEFAULT_BUDGET_SLACK,
+                        help='the factor --pin allows the results to worsen by (default: %(default)s)')
+    args = parser.parse_args(argv)
+    if args.micro:
+        results = run_micro(args.names, args.repeat)
+        budgets = None
+        if args.budgets:
+            with open(args.budgets) as f:
+                budgets = json.load(f)
+        print_micro(results, budgets)
+        for filename, data in ((args.output, results), (args.pin, pin_budgets(results, args.slack))):
+            if filename:
+                with open(filename, 'w') as f:
+                    json.dump(data, f, indent=2)
+        return int(bool(budgets and check_budgets(results, budgets)))
+    if args.compare:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        rows = compare(old, new, args.threshold, args.metric)
+        print_comparison(rows)
+        return int(any(row['status'] == 'slower' for row in rows))
+    results = run_suite(find_benchmarks(args.dir, args.names), args.repeat, args.warmup)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,597 @@
+"""
+Closure conversion module.
+
+This module implements the last compilation pass, after `lispy.inference.infer_types`,
+which makes closures capture only the variables they use, instead of the whole
+chain of frames they were created in.
+
+An analysis computes, for every lambda and named let, its free variables, and
+for every binding form, which of its variables are captured by a closure and
+which are assigned. The rewrite then:
+
+- appends the list of free lexical variables to converted lambdas and named
+  lets, so that `eval` builds their environment from those variables only;
+- boxes the captured variables that are assigned (set!, dynamic-let) or bound
+  after a closure may have captured them (letrec, internal define): the frame
+  boxes them on entry (`#%box`), and references and assignments go through the
+  box (`#%unbox`, `#%set-box!`), so the frame and its closures share them.
+
+Frames whose variables cannot be boxed (`do` loops, loop names) are kept as
+they are: a closure that shares such a variable captures its whole
+environment, as before. Like the expander, both passes run as generator tasks
+driven by `lispy.macros.run_tasks`.
+"""
+from types import GeneratorType
+from typing import Dict, List, NamedTuple, Optional, Set
+
+from .env import Env, GlobalEnv, global_env
+from .evaluator import SPECIAL_FORMS
+from .macros import Tasks, is_pair, param_names, run_tasks
+from .types import (
+    Exp,
+    OptimizedExp,
+    Symbol,
+    _arrow,
+    _begin,
+    _box,
+    _case,
+    _cond,
+    _define,
+    _do,
+    _dynamic_let,
+    _field_ref,
+    _field_set,
+    _lambda,
+    _let,
+    _letrec,
+    _letrec_star,
+    _loop,
+    _operator,
+    _quote,
+    _recur,
+    _set,
+    _set_box,
+    _typed_call,
+    _unbox,
+)
+
+PLAIN, BOXED, SHARED = 'plain', 'boxed', 'shared'
+"""Kinds of lexical variables: copied into closures, boxed, or shared through the whole frame."""
+
+
+class Usage:
+    """
+    The variables an expression uses.
+
+    Attributes:
+        free (Set[Symbol]): Variables referenced and not bound by the expression.
+        captured (Set[Symbol]): Free variables referenced from inside a closure.
+        assigned (Set[Symbol]): Free variables assigned by set! or dynamic-let.
+        defines (Set[Symbol]): Variables defined in the current frame.
+    """
+    __slots__ = ('free', 'captured', 'assigned', 'defines')
+
+    def __init__(self) -> None:
+        self.free: Set[Symbol] = set()
+        self.captured: Set[Symbol] = set()
+        self.assigned: Set[Symbol] = set()
+        self.defines: Set[Symbol] = set()
+
+    def merge(self, other: 'Usage') -> 'Usage':
+        """
+        Add the variables used by another expression evaluated in the same frame.
+        """
+        self.free |= other.free
+        self.captured |= other.captured
+        self.assigned |= other.assigned
+        self.defines |= other.defines
+        return self
+
+    def enclose(self, inner: 'Usage', bound: Set[Symbol], closure: bool = False) -> None:
+        """
+        Add the variables used by an expression evaluated in a new frame binding `bound`.
+        """
+        free = inner.free - bound
+        self.free |= free
+        self.captured |= free if closure else inner.captured - bound
+        self.assigned |= inner.assigned - bound
+
+
+class Frame(NamedTuple):
+    """
+    What the analysis found out about a binding form.
+
+    Attributes:
+        captured (Set[Symbol]): Its variables captured by a closure.
+        assigned (Set[Symbol]): Its variables that are assigned.
+        defines (Set[Symbol]): The variables defined in its frame.
+        free (Set[Symbol]): Its free variables (lambdas and named lets).
+    """
+    captured: Set[Symbol]
+    assigned: Set[Symbol]
+    defines: Set[Symbol]
+    free: Set[Symbol]
+
+
+class Context:
+    """
+    The state of a conversion.
+
+    Attributes:
+        env (Env): The global environment the code will run in.
+        frames (Dict[int, Frame]): The analysis of each binding form, by id.
+        bindings (Dict[Symbol, List[str]]): The kinds of the lexical variables in scope.
+    """
+    def __init__(self, env: Env) -> None:
+        self.env = env
+        self.frames: Dict[int, Frame] = {}
+        self.bindings: Dict[Symbol, List[str]] = {}
+
+    def record(self, x: Exp, inner: Usage, bound: Set[Symbol], free: Set[Symbol] = frozenset()) -> None:
+        """
+        Record the analysis of a binding form.
+        """
+        self.frames[id(x)] = Frame(inner.captured & bound, inner.assigned & bound, inner.defines, free)
+
+    def enter(self, x: Exp, names: List[Symbol], late: Set[Symbol] = frozenset(),
+              unboxable: Set[Symbol] = frozenset(), boxes: bool = True) -> List[Symbol]:
+        """
+        Enter the scope of a binding form, deciding the kind of each variable.
+
+        A captured variable is boxed if it is assigned, defined in the frame or
+        bound late; if the form cannot box it, it is shared through the frame.
+
+        Args:
+            x (Exp): The binding form.
+            names (List[Symbol]): The variables it binds.
+            late (Set[Symbol]): Variables bound after closures may capture them.
+            unboxable (Set[Symbol]): Variables that cannot be boxed.
+            boxes (bool): Whether the form can box variables at all.
+
+        Returns:
+            List[Symbol]: The variables to box when the frame is entered.
+        """
+        frame = self.frames[id(x)]
+        names = names + sorted(frame.defines.difference(names))
+        boxed = []
+        for name in names:
+            kind = PLAIN
+            if name in frame.captured and (name in frame.assigned or name in frame.defines or name in late):
+                kind = BOXED if boxes and name not in unboxable else SHARED
+            if kind is BOXED and name not in boxed:
+                boxed.append(name)
+            self.bindings.setdefault(name, []).append(kind)
+        return boxed
+
+    def leave(self, x: Exp, names: List[Symbol]) -> None:
+        """
+        Leave the scope entered by `enter`.
+        """
+        for name in names + sorted(self.frames[id(x)].defines.difference(names)):
+            stack = self.bindings[name]
+            stack.pop()
+            if not stack:
+                del self.bindings[name]
+
+    def kind(self, name: Symbol) -> Optional[str]:
+        """
+        Return the kind of a variable, or None if it is not lexically bound.
+        """
+        stack = self.bindings.get(name)
+        return stack[-1] if stack else None
+
+    def closure_vars(self, x: Exp) -> Optional[List[Symbol]]:
+        """
+        Return the lexical variables a closure must capture, or None if it must keep its whole environment.
+        """
+        free = sorted(name for name in self.frames[id(x)].free if name in self.bindings)
+        if any(self.kind(name) is SHARED for name in free):
+            return None
+        return free
+
+
+def _vars(bindings: List[List[Exp]]) -> List[Symbol]:
+    """
+    Return the variables of a binding list.
+    """
+    return [b[0] for b in bindings]
+
+
+def _run_handler(table: Dict[Symbol, object], default: object, x: List[Exp], ctx: Context) -> Tasks:
+    """
+    Run the handler of a compound expression, which may be a generator or a plain function.
+    """
+    op = x[0]
+    handler = table.get(op, default) if isinstance(op, Symbol) else default
+    result = handler(x, ctx)
+    if isinstance(result, GeneratorType):
+        result = yield from result
+    return result
+
+
+# Analysis
+
+def _analyze(x: Exp, ctx: Context) -> Tasks:
+    """
+    Task that computes the variables an expression uses.
+
+    Args:
+        x (Exp): The expression.
+        ctx (Context): The conversion state, where binding forms are recorded.
+
+    Returns:
+        Usage: The variables used by x.
+    """
+    usage = Usage()
+    if isinstance(x, Symbol):
+        usage.free.add(x)
+    elif is_pair(x):
+        usage = yield from _run_handler(ANALYZERS, analyze_all, x, ctx)
+        if isinstance(x, OptimizedExp):
+            usage.merge((yield _analyze(x.original, ctx)))
+    return usage
+
+
+def _analyze_all(xs: List[Exp], ctx: Context) -> Tasks:
+    """
+    Compute the variables used by expressions evaluated in the same frame.
+    """
+    usage = Usage()
+    for x in xs:
+        if isinstance(x, Symbol):
+            usage.free.add(x)
+        elif is_pair(x):
+            usage.merge((yield _analyze(x, ctx)))
+    return usage
+
+
+def analyze_all(x: Exp, ctx: Context) -> Tasks:
+    """
+    Analyze a call or a special form whose operands are all expressions.
+    """
+    return (yield from _analyze_all(x, ctx))
+
+
+def analyze_quote(x: Exp, ctx: Context) -> Usage:
+    """
+    Analyze a quote expression: it uses no variable.
+    """
+    return Usage()
+
+
+def analyze_set(x: Exp, ctx: Context) -> Tasks:
+    """
+    Analyze a set! expression.
+    """
+    usage = yield from _analyze_all([x[1], x[2]], ctx)
+    usage.assigned.add(x[1])
+    return usage
+
+
+def analyze_define(x: Exp, ctx: Context) -> Tasks:
+    """
+    Analyze a define expression: it binds a variable in the current frame.
+    """
+    usage = yield from _analyze_all([x[-1]], ctx)
+    usage.defines.add(x[1])
+    return usage
+
+
+def analyze_lambda(x: Exp, ctx: Context) -> Tasks:
+    """
+    Analyze a lambda expression, recording its free variables.
+    """
+    inner = yield from _analyze_all([x[2]], ctx)
+    bound = set(param_names(x[1])) | inner.defines
+    ctx.record(x, inner, bound, inner.free - bound)
+    usage = Usage()
+    usage.enclose(inner, bound, closure=True)
+    return usage
+
+
+def analyze_let(x: Exp, ctx: Context) -> Tasks:
+    """
+    Analyze a let, named let or #%loop expression.
+    """
+    named = isinstance(x[1], Symbol)
+    bindings, body = (x[2], x[3]) if named else (x[1], x[2])
+    usage = yield from _analyze_all([b[1] for b in bindings], ctx)
+    inner = yield from _analyze_all([body], ctx)
+    bound = set(_vars(bindings)) | inner.defines | ({x[1]} if named else set())
+    closure = named and x[0] is _let
+    ctx.record(x, inner, bound, inner.free - bound if closure else frozenset())
+    usage.enclose(inner, bound, closure=closure)
+    return usage
+
+
+def analyze_letrec(x: Exp, ctx: Context) -> Tasks:
+    """
+    Analyze a letrec or letrec* expression; the values are in the new frame.
+    """
+    inner = yield from _analyze_all([b[1] for b in x[1]] + [x[2]], ctx)
+    bound = set(_vars(x[1])) | inner.defines
+    ctx.record(x, inner, bound)
+    usage = Usage()
+    usage.enclose(inner, bound)
+    return usage
+
+
+def analyze_do(x: Exp, ctx: Context) -> Tasks:
+    """
+    Analyze a do loop; the steps, test, results and command are in the new frame.
+    """
+    (_, bindings, test_and_result, command, _) = x
+    usage = yield from _analyze_all([b[1] for b in bindings], ctx)
+    inner = yield from _analyze_all([b[2] for b in bindings if len(b) == 3] + test_and_result + [command], ctx)
+    bound = set(_vars(bindings)) | inner.defines
+    ctx.record(x, inner, bound)
+    usage.enclose(inner, bound)
+    return usage
+
+
+def analyze_recur(x: Exp, ctx: Context) -> Tasks:
+    """
+    Analyze a #%recur expression.
+    """
+    return (yield from _analyze_all(x[1:], ctx))
+
+
+def analyze_operands(x: Exp, ctx: Context) -> Tasks:
+    """
+    Analyze a #%typed-call, #%operator or record field expression, whose second element is not an expression.
+    """
+    return (yield from _analyze_all(x[2:], ctx))
+
+
+def analyze_cond(x: Exp, ctx: Context) -> Tasks:
+    """
+    Analyze a cond expression.
+    """
+    return (yield from _analyze_all([e for clause in x[1:] for e in clause if e is not _arrow], ctx))
+
+
+def analyze_case(x: Exp, ctx: Context) -> Tasks:
+    """
+    Analyze a case expression; the jump table holds no expression.
+    """
+    (_, key, _, bodies, default) = x
+    return (yield from _analyze_all([key, default] + bodies, ctx))
+
+
+def analyze_dynamic_let(x: Exp, ctx: Context) -> Tasks:
+    """
+    Analyze a dynamic-let expression: it assigns its variables.
+    """
+    (_, bindings, *body) = x
+    usage = yield from _analyze_all(_vars(bindings) + [b[1] for b in bindings] + body, ctx)
+    usage.assigned.update(_vars(bindings))
+    return usage
+
+
+ANALYZERS = {
+    _quote: analyze_quote,
+    _set: analyze_set,
+    _define: analyze_define,
+    _lambda: analyze_lambda,
+    _let: analyze_let,
+    _loop: analyze_let,
+    _recur: analyze_recur,
+    _letrec: analyze_letrec,
+    _letrec_star: analyze_letrec,
+    _do: analyze_do,
+    _cond: analyze_cond,
+    _case: analyze_case,
+    _dynamic_let: analyze_dynamic_let,
+    _typed_call: analyze_operands,
+    _operator: analyze_operands,
+    _field_ref: analyze_operands,
+    _field_set: analyze_operands,
+}
+
+
+# Rewrite
+
+def _convert(x: Exp, ctx: Context) -> Tasks:
+    """
+    Task that rewrites an analyzed expression.
+
+    Args:
+        x (Exp): The expression.
+        ctx (Context): The conversion state.
+
+    Returns:
+        Exp: The converted expression.
+    """
+    if isinstance(x, Symbol):
+        return [_unbox, x] if ctx.kind(x) is BOXED else x
+    elif not is_pair(x):
+        return x
+    result = yield from _run_handler(CONVERTERS, convert_all, x, ctx)
+    if isinstance(x, OptimizedExp):
+        result = OptimizedExp(result, (yield _convert(x.original, ctx)), x.deps)
+        if isinstance(ctx.env, GlobalEnv):
+            ctx.env.depend(x.deps, result)
+    return result
+
+
+def _convert_all(xs: List[Exp], ctx: Context) -> Tasks:
+    """
+    Rewrite every expression of a list, in order.
+    """
+    result = []
+    for x in xs:
+        result.append((yield _convert(x, ctx)) if is_pair(x) or isinstance(x, Symbol) else x)
+    return result
+
+
+def convert_all(x: Exp, ctx: Context) -> Tasks:
+    """
+    Convert a call or a special form whose operands are all expressions.
+    """
+    if isinstance(x[0], Symbol) and x[0] in SPECIAL_FORMS:
+        return [x[0]] + (yield from _convert_all(x[1:], ctx))
+    return (yield from _convert_all(x, ctx))
+
+
+def convert_quote(x: Exp, ctx: Context) -> Exp:
+    """
+    Convert a quote expression: it is left unchanged.
+    """
+    return x
+
+
+def convert_set(x: Exp, ctx: Context) -> Tasks:
+    """
+    Convert a set! or define expression, assigning the box of boxed variables.
+    """
+    (value,) = yield from _convert_all([x[-1]], ctx)
+    if ctx.kind(x[1]) is BOXED:
+        return [_set_box] + x[1:-1] + [value]
+    return x[:-1] + [value]
+
+
+def _with_boxes(boxed: List[Symbol], body: Exp) -> Exp:
+    """
+    Prefix a frame body with the boxing of its variables, if any.
+    """
+    return [_box, boxed, body] if boxed else body
+
+
+def convert_lambda(x: Exp, ctx: Context) -> Tasks:
+    """
+    Convert a lambda expression, listing its free variables unless it shares a frame.
+    """
+    free = ctx.closure_vars(x)
+    names = param_names(x[1])
+    boxed = ctx.enter(x, names)
+    (body,) = yield from _convert_all([x[2]], ctx)
+    ctx.leave(x, names)
+    exp = [_lambda, x[1], _with_boxes(boxed, body)]
+    return exp if free is None else exp + [free]
+
+
+def convert_let(x: Exp, ctx: Context) -> Tasks:
+    """
+    Convert a let, named let or #%loop expression.
+    """
+    named = isinstance(x[1], Symbol)
+    bindings, body = (x[2], x[3]) if named else (x[1], x[2])
+    inits = yield from _convert_all([b[1] for b in bindings], ctx)
+    names = ([x[1]] if named else []) + _vars(bindings)
+    free = ctx.closure_vars(x) if named and x[0] is _let else None
+    boxed = ctx.enter(x, names, unboxable={x[1]} if named else frozenset(), boxes=x[0] is _let)
+    (body,) = yield from _convert_all([body], ctx)
+    ctx.leave(x, names)
+    bindings = [[var, init] for var, init in zip(_vars(bindings), inits)]
+    exp = x[:-2] + [bindings, _with_boxes(boxed, body)] if named else [_let, bindings, _with_boxes(boxed, body)]
+    return exp if free is None else exp + [free]
+
+
+def convert_letrec(x: Exp, ctx: Context) -> Tasks:
+    """
+    Convert a letrec or letrec* expression.
+
+    When some variables are boxed, the frame is created by a let, boxed on
+    entry, and the values are assigned in order.
+    """
+    (op, bindings, body) = x
+    names = _vars(bindings)
+    boxed = ctx.enter(x, names, late=set(names))
+    inits = yield from _convert_all([b[1] for b in bindings], ctx)
+    (body,) = yield from _convert_all([body], ctx)
+    kinds = [ctx.kind(name) for name in names]
+    ctx.leave(x, names)
+    if not boxed:
+        return [op, [[var, init] for var, init in zip(names, inits)], body]
+    assigns = [[_set_box if kind is BOXED else _set, var, init] for var, init, kind in zip(names, inits, kinds)]
+    return [_let, [[var, None] for var in names], [_box, boxed, [_begin] + assigns + [body]]]
+
+
+def convert_do(x: Exp, ctx: Context) -> Tasks:
+    """
+    Convert a do loop; its variables are never boxed.
+    """
+    (_, bindings, test_and_result, command, fresh) = x
+    inits = yield from _convert_all([b[1] for b in bindings], ctx)
+    names = _vars(bindings)
+    ctx.enter(x, names, boxes=False)
+    steps = yield from _convert_all([b[2] for b in bindings if len(b) == 3], ctx)
+    test_and_result = yield from _convert_all(test_and_result, ctx)
+    (command,) = yield from _convert_all([command], ctx)
+    ctx.leave(x, names)
+    steps = iter(steps)
+    bindings = [[b[0], init] + ([next(steps)] if len(b) == 3 else []) for b, init in zip(bindings, inits)]
+    return [_do, bindings, test_and_result, command, fresh]
+
+
+def convert_recur(x: Exp, ctx: Context) -> Tasks:
+    """
+    Convert a #%recur, #%typed-call, #%operator or record field expression, whose second element is not an expression.
+    """
+    return x[:2] + (yield from _convert_all(x[2:], ctx))
+
+
+def convert_cond(x: Exp, ctx: Context) -> Tasks:
+    """
+    Convert a cond expression.
+    """
+    clauses = []
+    for clause in x[1:]:
+        clauses.append((yield from _convert_all(clause, ctx)))
+    return [_cond] + clauses
+
+
+def convert_case(x: Exp, ctx: Context) -> Tasks:
+    """
+    Convert a case expression.
+    """
+    (_, key, table, bodies, default) = x
+    (key, default) = yield from _convert_all([key, default], ctx)
+    return [_case, key, table, (yield from _convert_all(bodies, ctx)), default]
+
+
+def convert_dynamic_let(x: Exp, ctx: Context) -> Tasks:
+    """
+    Convert a dynamic-let expression; boxed variables are rebound in their box at run time.
+    """
+    (_, bindings, *body) = x
+    inits = yield from _convert_all([b[1] for b in bindings], ctx)
+    body = yield from _convert_all(body, ctx)
+    return [_dynamic_let, [[b[0], init] for b, init in zip(bindings, inits)]] + body
+
+
+CONVERTERS = {
+    _quote: convert_quote,
+    _set: convert_set,
+    _define: convert_set,
+    _lambda: convert_lambda,
+    _let: convert_let,
+    _loop: convert_let,
+    _recur: convert_recur,
+    _letrec: convert_letrec,
+    _letrec_star: convert_letrec,
+    _do: convert_do,
+    _cond: convert_cond,
+    _case: convert_case,
+    _dynamic_let: convert_dynamic_let,
+    _typed_call: convert_recur,
+    _operator: convert_recur,
+    _field_ref: convert_recur,
+    _field_set: convert_recur,
+}
+
+
+def convert_closures(x: Exp, env: Optional[Env] = None) -> Exp:
+    """
+    Convert the closures of an optimized program.
+
+    Args:
+        x (Exp): The program.
+        env (Optional[Env]): The global environment it will run in. Defaults to global_env.
+
+    Returns:
+        Exp: The converted program.
+    """
+    ctx = Context(global_env if env is None else env)
+    run_tasks(_analyze(x, ctx))
+    return run_tasks(_convert(x, ctx))
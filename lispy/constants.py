@@ -18,8 +18,81 @@ COMPLEX_IMAG_CHAR_SCHEME = 'i'
 COMPLEX_IMAG_CHAR_PYTHON = 'j'
 FILE_WRITE_MODE = 'w'
 
+VECTOR_PREFIX = '#'
+HASH_TABLE_FORMAT = '#<hash-table {}>'
+RECORD_FORMAT = '#<{}>'
+RECORD_FIELD_FORMAT = '{}={}'
+
+# Slot names of record fields, and the brackets record type names are conventionally written in
+RECORD_SLOT_FORMAT = '_{}'
+RECORD_TYPE_BRACKETS = ('<', '>')
+
 TYPE_ANNOTATION_CHAR = '::'
 
+# The type of every value, for unannotated record fields
+ANY_TYPE = 'any'
+
+# array.array typecode of the unboxed storage of float vectors
+FLOAT_ARRAY_TYPECODE = 'd'
+
+# Largest procedure body (in nodes) the optimizer inlines, and how deep inlined bodies are inlined in turn
+INLINE_SIZE_LIMIT = 24
+INLINE_DEPTH_LIMIT = 4
+
+# Largest decision tree (in tests) a match expression compiles into; larger ones test each clause in turn
+MATCH_TREE_LIMIT = 256
+
+# Source name of code read from a string, and how profiles show procedures
+SOURCE_STRING = '<string>'
+LAMBDA_NAME = 'lambda'
+UNKNOWN_LOCATION = ('<unknown>', 0)
+PROFILE_NAME = 'profile'
+JSON_SUFFIX = '.json'
+
+# Sampling profiler: seconds between samples, the most evaluator frames read per sample, and the
+# collapsed-stack format of flame graph tools
+DEFAULT_SAMPLE_INTERVAL = 0.005
+SAMPLE_DEPTH_LIMIT = 128
+COLLAPSED_STACK_FORMAT = '{} ({}:{})'
+COLLAPSED_STACK_SEPARATOR = ';'
+TOPLEVEL_FRAME = '<toplevel>'
+TRUNCATED_FRAME = '<truncated>'
+
+# Tracer: the number of events kept, and how they are printed (time, indentation, kind, subject, duration)
+DEFAULT_TRACE_CAPACITY = 10000
+TRACE_EVENT_FORMAT = '{:.6f} {}{} {}{}'
+
+# Runtime counters: the prefix of their Prometheus metric names
+PROMETHEUS_PREFIX = 'lispy_'
+
+# Benchmarks: where they are, and the names each one defines
+BENCHMARKS_DIRNAME = 'benchmarks'
+BENCHMARK_SUFFIX = '.scm'
+BENCHMARK_RUN = 'bench-run'
+BENCHMARK_INPUT = 'bench-input'
+BENCHMARK_EXPECTED = 'bench-expected'
+DEFAULT_BENCHMARK_REPEAT = 5
+DEFAULT_BENCHMARK_WARMUP = 1
+DEFAULT_REGRESSION_THRESHOLD = 0.1
+DEFAULT_BUDGET_SLACK = 2.0
+BUDGETS_FILENAME = 'budgets.json'
+
+# (time exp) and (bench exp #:iterations n #:warmup k): the defaults, and how the reports are printed (in ms)
+DEFAULT_BENCH_ITERATIONS = 100
+DEFAULT_BENCH_WARMUP = 10
+TIME_REPORT_FORMAT = '; wall {:.3f} ms, cpu {:.3f} ms, {} frames, {} procedures, {} collections'
+BENCH_REPORT_FORMAT = '; {} iterations: median {:.3f} ms, p90 {:.3f} ms, p99 {:.3f} ms, min {:.3f} ms, stdev {:.3f} ms'
+
+# Libraries: the file extensions looked for, the variable extending the search path, and the on-disk cache
+LIBRARY_EXTENSIONS = ('.sld', '.scm')
+LIBRARY_PATH_VARIABLE = 'LISPY_PATH'
+LIBRARY_CACHE_DIRNAME = '__lispycache__'
+LIBRARY_CACHE_FORMAT = '{}.lispy-{}.pickle'
+LIBRARY_CACHE_VERSION = 1
+
+# Names of generated symbols; ';' starts a comment, so the reader never produces them
+GENSYM_FORMAT = '{};{}'
+
 # Special characters that delimit atoms
 _SPECIAL_CHARS = "".join([
     LPAREN, RPAREN, QUOTE_CHAR, QUASIQUOTE_CHAR, UNQUOTE_CHAR, STRING_QUOTE, COMMENT_CHAR
@@ -0,0 +1,191 @@
+"""
+Runtime counters.
+
+The interpreter counts the events that tell where the time of a program
+goes: environment frames and procedures allocated, tail calls taken by the
+evaluator loop, variable lookups (and how many reached the global
+environment), macro expansions, promises forced and exceptions caught by
+`try`. Each count is one integer increment where the event happens.
+
+Macro expansions, promises and exceptions are counted at all times. The
+other events happen on every step of the evaluator loop, where reading the
+counters of the current thread would cost more than the step, so they are
+only counted while `lispy.evaluator.count_events` is on (`time`, the memory
+profiler and `--stats` turn it on). The histogram of how far up the chain of
+environments `Env.find` had to go costs every lookup an index more, so it is
+only kept while it is turned on with `lispy.env.count_find_depths`.
+
+    >>> count_events(True)
+    >>> reset_stats()
+    >>> lispy.eval(lispy.parse('(fib 20)'))
+    >>> stats()['env_frames']
+    21891
+
+The counters are read from Lisp with `(lispy-stats)`, from Python with
+`stats`, and written in the Prometheus text format with `write_prometheus`.
+
+Events are counted in the counters of the code running in the current
+thread (`CURRENT_COUNTERS`): an `Interpreter` sets its own while it runs
+code (see `lispy.interpreter`), so interpreters running in other threads
+are not charged for each other's events. Elsewhere, they go to `COUNTERS`,
+those of the default interpreter.
+"""
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from .constants import PROMETHEUS_PREFIX
+from .types import HashTable, get_symbol
+
+COUNTS = (
+    ('env_frames', 'Environment frames allocated.'),
+    ('procedures', 'Procedure objects created.'),
+    ('tail_calls', 'Tail calls taken by the evaluator loop.'),
+    ('lookups', 'Variable lookups.'),
+    ('global_lookups', 'Variable lookups that reached the global environment.'),
+    ('macro_expansions', 'Macro expansions.'),
+    ('promises_forced', 'Promises forced.'),
+    ('exceptions_caught', 'Exceptions caught by try.'),
+)
+"""The counters, with their descriptions."""
+
+FIND_DEPTH_HELP = 'Number of outer environments Env.find went through to find a variable.'
+
+
+class Counters:
+    """
+    The runtime counters.
+
+    Attributes:
+        find_depths (List[int]): The number of lookups found at each depth in the chain of
+            environments, while depths are counted.
+    """
+    __slots__ = ('env_frames', 'procedures', 'tail_calls', 'lookups', 'global_lookups', 'macro_expansions',
+                 'promises_forced', 'exceptions_caught', 'find_depths')
+
+    def __init__(self) -> None:
+        """
+        Initialize the counters to zero.
+        """
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Set the counters to zero.
+        """
+        for name, _ in COUNTS:
+            setattr(self, name, 0)
+        self.find_depths: List[int] = [0] * 8
+
+    def count_depth(self, depth: int) -> None:
+        """
+        Count a lookup in the histogram of depths.
+        """
+        depths = self.find_depths
+        if depth >= len(depths):
+            depths.extend([0] * (depth + 1 - len(depths)))
+        depths[depth] += 1
+
+    def copy(self) -> 'Counters':
+        """
+        Return a copy of the counters.
+        """
+        counters = Counters()
+        counters.accumulate(self, counters)
+        return counters
+
+    def accumulate(self, after: 'Counters', before: 'Counters') -> None:
+        """
+        Add the events counted between two copies of counters, such as those of a run.
+
+        Args:
+            after (Counters): The counters at the end.
+            before (Counters): The counters at the start.
+        """
+        for name in self.__slots__[:-1]:
+            setattr(self, name, getattr(self, name) + getattr(after, name) - getattr(before, name))
+        depths = self.find_depths
+        depths.extend([0] * (len(after.find_depths) - len(depths)))
+        for depth, count in enumerate(after.find_depths):
+            depths[depth] += count - (before.find_depths[depth] if depth < len(before.find_depths) else 0)
+
+
+COUNTERS = Counters()
+"""The counters of the default interpreter, and of the code no other interpreter runs."""
+
+CURRENT_COUNTERS: ContextVar[Counters] = ContextVar('counters', default=COUNTERS)
+"""The counters the events of the current thread are counted in."""
+
+
+def stats(counters: Optional[Counters] = None) -> Dict[str, Any]:
+    """
+    Return the counters.
+
+    Args:
+        counters (Optional[Counters]): The counters. Defaults to the current ones.
+
+    Returns:
+        Dict[str, Any]: The value of each counter, and the histogram of lookup depths under
+            `find_depths`, as a list indexed by depth.
+    """
+    counters = CURRENT_COUNTERS.get() if counters is None else counters
+    result: Dict[str, Any] = {name: getattr(counters, name) for name, _ in COUNTS}
+    depths = counters.find_depths
+    while len(depths) > 1 and not depths[-1]:
+        depths = depths[:-1]
+    result['find_depths'] = list(depths)
+    return result
+
+
+def reset_stats() -> None:
+    """
+    Set the current counters to zero.
+    """
+    CURRENT_COUNTERS.get().reset()
+
+
+def lispy_stats(counters: Optional[Counters] = None) -> HashTable:
+    """
+    Return the counters as a hash table from symbols, for `(lispy-stats)`.
+
+    Names are written with dashes (`env-frames`), and the histogram of lookup
+    depths is a list.
+    """
+    table = HashTable()
+    for name, value in stats(counters).items():
+        table[get_symbol(name.replace('_', '-'))] = value
+    return table
+
+
+def to_prometheus(counters: Optional[Counters] = None) -> str:
+    """
+    Return the counters in the Prometheus text exposition format.
+
+    The counters are counters, and the lookup depths a histogram with one
+    bucket per depth.
+    """
+    values = stats(counters)
+    lines = []
+    for name, description in COUNTS:
+        metric = '{}{}_total'.format(PROMETHEUS_PREFIX, name)
+        lines += ['# HELP {} {}'.format(metric, description), '# TYPE {} counter'.format(metric),
+                  '{} {}'.format(metric, values[name])]
+    metric = PROMETHEUS_PREFIX + 'find_depth'
+    lines += ['# HELP {} {}'.format(metric, FIND_DEPTH_HELP), '# TYPE {} histogram'.format(metric)]
+    total = 0
+    for depth, count in enumerate(values['find_depths']):
+        total += count
+        lines.append('{}_bucket{{le="{}"}} {}'.format(metric, depth, total))
+    lines += ['{}_bucket{{le="+Inf"}} {}'.format(metric, total),
+              '{}_sum {}'.format(metric, sum(depth * count for depth, count in enumerate(values['find_depths']))),
+              '{}_count {}'.format(metric, total)]
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(filename: str, counters: Optional[Counters] = None) -> None:
+    """
+    Write the counters to a file in the Prometheus text exposition format.
+
+    The file can be read by the textfile collector of the node exporter.
+    """
+    with open(filename, 'w') as f:
+        f.write(to_prometheus(counters))
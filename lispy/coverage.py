@@ -0,0 +1,595 @@
+"""
+Code coverage.
+
+Coverage is measured by instrumenting programs when they are compiled rather
+than by watching them run. While a `Coverage` is enabled, every top-level form
+is instrumented after it is expanded: probes, `(#%cover bits index... exp)`,
+are put around each form that starts a new source line, each procedure body
+and each branch of `if`, `cond`, `case`, `when` and `unless` expressions,
+including the implicit ones (an `if` without alternative, a `cond` without
+`else`). A probe is a special form that sets bytes of
+a bytearray, then evaluates its expression in tail position, and replaces
+itself with that expression: once covered, code runs at full speed. Probes
+that always run together are merged into one.
+
+The source lines come from the reader: while instrumenting, it records the
+line on which each list starts. Forms built by macros take the line of the
+nearest enclosing form that was read.
+
+    >>> coverage = Coverage()
+    >>> coverage.run('(define (f x) (if (> x 0) x (- x))) (f 1)')
+    1
+    >>> coverage.report()['<string>']['branches']
+    [(1, 0, 0, 1), (1, 0, 1, 0)]
+
+The results are written in the LCOV tracefile format (`to_lcov`,
+`dump_lcov`), which genhtml and most CI services read, or as JSON
+(`to_json`, `dump_json`). `python -m lispy --coverage file.scm` measures
+the coverage of a program and of the files it loads.
+"""
+import io
+import json
+import sys
+from collections import defaultdict
+from typing import Any, Dict, List, NamedTuple, Optional, TextIO, Tuple, Union
+
+from . import evaluator
+from .constants import JSON_SUFFIX, LAMBDA_NAME
+from .evaluator import SPECIAL_FORMS
+from .macros import Tasks, is_pair, run_tasks
+from .parser import InPort, to_string
+from .repl import INSTRUMENTERS, locate, parse
+from .types import (
+    EOF_OBJECT,
+    Exp,
+    Symbol,
+    _begin,
+    _case,
+    _cond,
+    _cover,
+    _define,
+    _do,
+    _dynamic_let,
+    _if,
+    _lambda,
+    _let,
+    _letrec,
+    _letrec_star,
+    _loop,
+    _quote,
+    _recur,
+    _set,
+    _try,
+    _unless,
+    _when,
+)
+
+LINE, BRANCH, FUNCTION = 'line', 'branch', 'function'
+
+SUMMARY_HEADER = '{:<40} {:>14} {:>14} {:>14}'.format('file', 'lines', 'branches', 'functions')
+SUMMARY_LINE = '{:<40} {:>14} {:>14} {:>14}'
+SUMMARY_COUNT = '{}/{} {:>4.0%}'
+
+
+class Probe(NamedTuple):
+    """
+    A place in the code where execution is recorded.
+
+    Attributes:
+        kind (str): LINE for a form, BRANCH for a branch of an if, FUNCTION for the entry of a procedure.
+        source (str): The name of the source.
+        line (int): The line.
+        block (int): For a branch, the number of its if.
+        branch (int): For a branch, 0 for the consequent and 1 for the alternative.
+        name (str): For a function, the name of the procedure.
+    """
+    kind: str
+    source: str
+    line: int
+    block: int = 0
+    branch: int = 0
+    name: str = ''
+
+
+class Instrumenter:
+    """
+    The state of the instrumentation of a top-level form.
+
+    Attributes:
+        coverage (Coverage): The coverage the probes belong to.
+        source (str): The name of the source.
+        positions (Dict[int, Tuple[int, Exp]]): The line of each list read or expanded from one, by id.
+    """
+    def __init__(self, coverage: 'Coverage', source: str, positions: Dict[int, Tuple[int, Exp]]) -> None:
+        self.coverage = coverage
+        self.source = source
+        self.positions = positions
+
+    def line(self, x: Exp, default: int) -> int:
+        """
+        Return the line x starts on, or default if it was not read.
+        """
+        entry = self.positions.get(id(x)) if isinstance(x, list) else None
+        return entry[0] if entry is not None and entry[1] is x else default
+
+    def probe(self, kind: str, line: int, x: Exp, **fields: Any) -> Exp:
+        """
+        Return x with a new probe.
+
+        If x is a probe already, the new one is merged into it, since both are executed together.
+        """
+        coverage = self.coverage
+        coverage.probes.append(Probe(kind, self.source, line, **fields))
+        coverage.bits.append(0)
+        if is_pair(x) and x[0] is _cover:
+            return [_cover, coverage.bits, len(coverage.bits) - 1, *x[2:]]
+        return [_cover, coverage.bits, len(coverage.bits) - 1, x]
+
+
+def _visit(x: Exp, line: int, ins: Instrumenter) -> Tasks:
+    """
+    Task that instruments the subforms of an expression.
+
+    Special forms without a handler are left unchanged.
+
+    Args:
+        x (Exp): The expression.
+        line (int): The line it starts on.
+        ins (Instrumenter): The state of the instrumentation.
+
+    Returns:
+        Exp: The instrumented expression.
+    """
+    if not is_pair(x):
+        return x
+    op = x[0]
+    if isinstance(op, Symbol) and op in SPECIAL_FORMS:
+        if op not in VISITORS:
+            return x
+        return (yield from VISITORS[op](x, line, ins))
+    return (yield from _expressions(x, line, ins))
+
+
+def _expression(x: Exp, line: int, ins: Instrumenter) -> Tasks:
+    """
+    Task that instruments an expression, with a probe if it starts a new line.
+
+    Lambda expressions are not probed: the entry of their body is.
+    """
+    start = ins.line(x, line)
+    if start == line or not is_pair(x) or x[0] is _lambda:
+        return (yield _visit(x, start, ins))
+    return ins.probe(LINE, start, (yield _visit(x, start, ins)))
+
+
+def _expressions(xs: List[Exp], line: int, ins: Instrumenter) -> Tasks:
+    """
+    Task that instruments a list of expressions.
+    """
+    result = []
+    for x in xs:
+        result.append((yield _expression(x, line, ins)))
+    return result
+
+
+def _sequence(xs: List[Exp], line: int, ins: Instrumenter) -> Tasks:
+    """
+    Task that instruments the forms of a body, with a probe on each one that starts a new line.
+
+    Args:
+        xs (List[Exp]): The forms.
+        line (int): The line of the last probe before them.
+        ins (Instrumenter): The state of the instrumentation.
+
+    Returns:
+        List[Exp]: The instrumented forms, with their probes.
+    """
+    result = []
+    for x in xs:
+        start = ins.line(x, line)
+        x = yield _visit(x, start, ins)
+        if start != line:
+            x = ins.probe(LINE, start, x)
+            line = start
+        result.append(x)
+    return result
+
+
+def _procedure(x: Exp, line: int, ins: Instrumenter, name: Optional[Symbol] = None) -> Tasks:
+    """
+    Task that instruments a lambda expression, with a probe at the entry of its body.
+
+    Args:
+        x (Exp): The expression (lambda params body).
+        line (int): The line it starts on.
+        ins (Instrumenter): The state of the instrumentation.
+        name (Optional[Symbol]): The variable it is defined as.
+
+    Returns:
+        Exp: The instrumented expression.
+    """
+    line = ins.line(x, line)
+    (_, params, body) = x
+    label = str(name) if name is not None else '{} {}'.format(LAMBDA_NAME, to_string(params))
+    forms = yield from _sequence(body[1:] if is_pair(body) and body[0] is _begin else [body], line, ins)
+    body = forms[0] if len(forms) == 1 else [_begin, *forms]
+    return [_lambda, params, ins.probe(FUNCTION, line, body, name=label)]
+
+
+def _value(x: Exp, line: int, ins: Instrumenter, name: Symbol) -> Tasks:
+    """
+    Task that instruments the value bound to a variable, naming it if it is a procedure.
+    """
+    if is_pair(x) and x[0] is _lambda:
+        return (yield from _procedure(x, line, ins, name))
+    return (yield _expression(x, line, ins))
+
+
+def visit_quote(x: Exp, line: int, ins: Instrumenter) -> Tasks:
+    """
+    Instrument a quote expression: it is left unchanged.
+    """
+    return x
+    yield
+
+
+def _block(ins: Instrumenter) -> int:
+    """
+    Return the number of a new block of branches.
+    """
+    ins.coverage.blocks += 1
+    return ins.coverage.blocks - 1
+
+
+def _branch(x: Exp, line: int, ins: Instrumenter, block: int, branch: int) -> Tasks:
+    """
+    Task that instruments a branch, with a probe around it.
+
+    A missing branch (None) gets a probe of None, like its value.
+    """
+    exp = None if x is None else (yield _expression(x, line, ins))
+    return ins.probe(BRANCH, line, exp, block=block, branch=branch)
+
+
+def visit_if(x: Exp, line: int, ins: Instrumenter) -> Tasks:
+    """
+    Instrument an if expression, with a probe around each branch.
+    """
+    block = _block(ins)
+    test = yield _expression(x[1], line, ins)
+    consequent = yield from _branch(x[2], line, ins, block, 0)
+    alternative = yield from _branch(x[3] if len(x) == 4 else None, line, ins, block, 1)
+    return [_if, test, consequent, alternative]
+
+
+def visit_when(x: Exp, line: int, ins: Instrumenter) -> Tasks:
+    """
+    Instrument a when or unless expression: it becomes an if, so that skipping the body is a branch.
+    """
+    block = _block(ins)
+    test = yield _expression(x[1], line, ins)
+    body = yield from _branch(x[2], line, ins, block, 0)
+    skip = yield from _branch(None, line, ins, block, 1)
+    return [_if, test, body, skip] if x[0] is _when else [_if, test, skip, body]
+
+
+def visit_set(x: Exp, line: int, ins: Instrumenter) -> Tasks:
+    """
+    Instrument a set! or define expression (with or without a type annotation).
+    """
+    return x[:-1] + [(yield from _value(x[-1], line, ins, x[1]))]
+
+
+def visit_lambda(x: Exp, line: int, ins: Instrumenter) -> Tasks:
+    """
+    Instrument an anonymous lambda expression.
+    """
+    return (yield from _procedure(x, line, ins))
+
+
+def visit_begin(x: Exp, line: int, ins: Instrumenter) -> Tasks:
+    """
+    Instrument a begin expression.
+    """
+    return [_begin, *(yield from _sequence(x[1:], line, ins))]
+
+
+def visit_try(x: Exp, line: int, ins: Instrumenter) -> Tasks:
+    """
+    Instrument a try expression, whose operands are all expressions.
+    """
+    return [x[0], *(yield from _expressions(x[1:], line, ins))]
+
+
+def visit_let(x: Exp, line: int, ins: Instrumenter) -> Tasks:
+    """
+    Instrument a let, named let, #%loop, letrec, letrec* or dynamic-let expression.
+    """
+    head = x[:2] if isinstance(x[1], Symbol) else x[:1]
+    bindings, body = x[len(head)], x[len(head) + 1]
+    values = []
+    for var, exp in bindings:
+        values.append([var, (yield from _value(exp, ins.line(bindings, line), ins, var))])
+    return head + [values, (yield _expression(body, line, ins))]
+
+
+def visit_recur(x: Exp, line: int, ins: Instrumenter) -> Tasks:
+    """
+    Instrument a #%recur expression.
+    """
+    return x[:2] + (yield from _expressions(x[2:], line, ins))
+
+
+def visit_do(x: Exp, line: int, ins: Instrumenter) -> Tasks:
+    """
+    Instrument a do loop.
+    """
+    (_, bindings, test_and_result, command, fresh) = x
+    steps = []
+    for binding in bindings:
+        steps.append([binding[0], *(yield from _expressions(binding[1:], line, ins))])
+    test_and_result = yield from _expressions(test_and_result, line, ins)
+    if command is not None:
+        command = yield _expression(command, line, ins)
+    return [x[0], steps, test_and_result, command, fresh]
+
+
+def visit_cond(x: Exp, line: int, ins: Instrumenter) -> Tasks:
+    """
+    Instrument a cond expression, with a probe around the body of each clause.
+
+    A clause (test) has no body to probe; a cond without else clause gets one, a probe of None.
+    """
+    block = _block(ins)
+    clauses = []
+    for branch, clause in enumerate(x[1:]):
+        result = [(yield _expression(clause[0], line, ins)), *clause[1:]]
+        if len(clause) > 1:             # (test body) or (test => proc)
+            result[-1] = yield from _branch(clause[-1], line, ins, block, branch)
+        clauses.append(result)
+    if len(x) == 1 or x[-1][0] is not True:
+        clauses.append([True, (yield from _branch(None, line, ins, block, len(clauses)))])
+    return [_cond, *clauses]
+
+
+def visit_case(x: Exp, line: int, ins: Instrumenter) -> Tasks:
+    """
+    Instrument a case expression, with a probe around each body; the jump table holds no expression.
+    """
+    (_, key, table, bodies, default) = x
+    block = _block(ins)
+    key = yield _expression(key, line, ins)
+    probed = []
+    for branch, body in enumerate(bodies):
+        probed.append((yield from _branch(body, line, ins, block, branch)))
+    default = yield from _branch(default, line, ins, block, len(bodies))
+    return [_case, key, table, probed, default]
+
+
+VISITORS = {
+    _quote: visit_quote,
+    _if: visit_if,
+    _set: visit_set,
+    _define: visit_set,
+    _lambda: visit_lambda,
+    _begin: visit_begin,
+    _try: visit_try,
+    _when: visit_when,
+    _unless: visit_when,
+    _dynamic_let: visit_let,
+    _let: visit_let,
+    _loop: visit_let,
+    _letrec: visit_let,
+    _letrec_star: visit_let,
+    _recur: visit_recur,
+    _do: visit_do,
+    _cond: visit_cond,
+    _case: visit_case,
+}
+
+
+class Coverage:
+    """
+    The coverage of Lispy code.
+
+    It instruments the programs parsed between `enable` and `disable`, or in a `with` block.
+
+    Attributes:
+        bits (bytearray): For each probe, 1 if it was executed, 0 otherwise.
+        probes (List[Probe]): The probes, in the order of their bits.
+        blocks (int): The number of blocks of branches (if, cond, case, when or unless expressions) instrumented.
+    """
+    def __init__(self) -> None:
+        self.bits = bytearray()
+        self.probes: List[Probe] = []
+        self.blocks = 0
+
+    def enable(self) -> None:
+        """
+        Instrument the programs parsed from now on.
+        """
+        INSTRUMENTERS.append(self.instrument)
+
+    def disable(self) -> None:
+        """
+        Stop instrumenting programs. Those already instrumented still record their execution.
+        """
+        INSTRUMENTERS.remove(self.instrument)
+
+    def __enter__(self) -> 'Coverage':
+        self.enable()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.disable()
+
+    def clear(self) -> None:
+        """
+        Mark every probe as not executed.
+        """
+        self.bits[:] = bytes(len(self.bits))
+
+    def instrument(self, x: Exp, inport: InPort) -> Exp:
+        """
+        Instrument an expanded top-level form.
+
+        Args:
+            x (Exp): The form.
+            inport (InPort): The port it was read from, with the positions of its lists.
+
+        Returns:
+            Exp: The form with probes.
+        """
+        if not is_pair(x):
+            return x
+        ins = Instrumenter(self, inport.name, inport.positions or {})
+        line = ins.line(x, inport.datum_line)
+        if x[0] is _begin:
+            return [_begin, *run_tasks(_sequence(x[1:], 0, ins))]
+        return ins.probe(LINE, line, run_tasks(_visit(x, line, ins)))
+
+    def run(self, source: Union[str, InPort]) -> Any:
+        """
+        Evaluate a program with coverage.
+
+        Args:
+            source (Union[str, InPort]): The program, or a port to read it from.
+
+        Returns:
+            Any: The value of the last expression.
+        """
+        inport = InPort(io.StringIO(source)) if isinstance(source, str) else source
+        val = None
+        with self:
+            while True:
+                x = parse(inport)
+                if x is EOF_OBJECT:
+                    return val
+                val = evaluator.eval(x)
+                locate(x, (inport.name, inport.datum_line))
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Return the coverage of each source.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: For each source, by name:
+                - `lines`: for each line with code, 1 if some of it was executed, 0 otherwise;
+                - `branches`: (line, block, branch, taken) for each branch, in order, where taken
+                  is None if the expression of its block was never evaluated;
+                - `functions`: (line, name, called) for each procedure;
+                - `forms`: the number of probes executed, and the total.
+        """
+        lines: Dict[str, Dict[int, int]] = defaultdict(dict)
+        blocks: Dict[int, int] = defaultdict(int)
+        for probe, bit in zip(self.probes, self.bits):
+            lines[probe.source][probe.line] = lines[probe.source].get(probe.line, 0) | bit
+            if probe.kind == BRANCH:
+                blocks[probe.block] |= bit
+        report: Dict[str, Dict[str, Any]] = {}
+        for source in lines:
+            report[source] = {'lines': dict(sorted(lines[source].items())), 'branches': [], 'functions': [],
+                              'forms': [0, 0]}
+        for probe, bit in zip(self.probes, self.bits):
+            entry = report[probe.source]
+            entry['forms'][0] += bit
+            entry['forms'][1] += 1
+            if probe.kind == BRANCH:
+                entry['branches'].append((probe.line, probe.block, probe.branch, bit if blocks[probe.block] else None))
+            elif probe.kind == FUNCTION:
+                entry['functions'].append((probe.line, probe.name, bit))
+        for entry in report.values():
+            entry['branches'].sort()
+        return report
+
+    def to_lcov(self) -> str:
+        """
+        Return the coverage in the LCOV tracefile format, one record per source.
+        """
+        records = []
+        for source, entry in self.report().items():
+            lines = ['TN:', 'SF:{}'.format(source)]
+            for line, name, _ in entry['functions']:
+                lines.append('FN:{},{}'.format(line, name))
+            for _, name, called in entry['functions']:
+                lines.append('FNDA:{},{}'.format(called, name))
+            lines += ['FNF:{}'.format(len(entry['functions'])),
+                      'FNH:{}'.format(sum(called for _, _, called in entry['functions']))]
+            for line, block, branch, taken in entry['branches']:
+                lines.append('BRDA:{},{},{},{}'.format(line, block, branch, '-' if taken is None else taken))
+            lines += ['BRF:{}'.format(len(entry['branches'])),
+                      'BRH:{}'.format(sum(bool(taken) for _, _, _, taken in entry['branches']))]
+            for line, hit in entry['lines'].items():
+                lines.append('DA:{},{}'.format(line, hit))
+            lines += ['LF:{}'.format(len(entry['lines'])), 'LH:{}'.format(sum(entry['lines'].values())),
+                      'end_of_record']
+            records.append('\n'.join(lines) + '\n')
+        return ''.join(records)
+
+    def dump_lcov(self, filename: str) -> None:
+        """
+        Write the coverage to a file in the LCOV tracefile format.
+        """
+        with open(filename, 'w') as f:
+            f.write(self.to_lcov())
+
+    def to_json(self) -> Dict[str, Any]:
+        """
+        Return the coverage as a JSON-serializable dictionary (see `report`), with lines as strings.
+        """
+        result = {}
+        for source, entry in self.report().items():
+            result[source] = {
+                'lines': {str(line): hit for line, hit in entry['lines'].items()},
+                'branches': [{'line': line, 'block': block, 'branch': branch, 'taken': taken}
+                             for line, block, branch, taken in entry['branches']],
+                'functions': [{'line': line, 'name': name, 'called': called}
+                              for line, name, called in entry['functions']],
+                'forms': {'executed': entry['forms'][0], 'total': entry['forms'][1]},
+            }
+        return result
+
+    def dump_json(self, filename: str) -> None:
+        """
+        Write the coverage to a file as JSON.
+        """
+        with open(filename, 'w') as f:
+            json.dump(self.to_json(), f, indent=2)
+
+    def print_summary(self, out: Optional[TextIO] = None) -> None:
+        """
+        Print the part of the lines, branches and functions of each source that was executed.
+
+        Args:
+            out (Optional[TextIO]): The output stream. Defaults to sys.stdout.
+        """
+        out = sys.stdout if out is None else out
+        print(SUMMARY_HEADER, file=out)
+        for source, entry in self.report().items():
+            counts = []
+            for hits in (list(entry['lines'].values()), [bool(taken) for _, _, _, taken in entry['branches']],
+                         [called for _, _, called in entry['functions']]):
+                counts.append(SUMMARY_COUNT.format(sum(hits), len(hits), sum(hits) / len(hits) if hits else 1))
+            print(SUMMARY_LINE.format(source, *counts), file=out)
+
+
+def coverage_file(filename: str, output: Optional[str] = None) -> None:
+    """
+    Run a program with coverage, for `python -m lispy --coverage`.
+
+    Args:
+        filename (str): The program.
+        output (Optional[str]): The file to write the coverage to, as JSON if its name ends
+            with .json and in the LCOV format otherwise. Defaults to a summary on stderr.
+    """
+    coverage = Coverage()
+    try:
+        with open(filename) as f:
+            coverage.run(InPort(f))
+    finally:
+        if output is None:
+            coverage.print_summary(out=sys.stderr)
+        elif output.endswith(JSON_SUFFIX):
+            coverage.dump_json(output)
+        else:
+            coverage.dump_lcov(output)
@@ -4,11 +4,14 @@ Environment module.
 This module defines the `Env` class, which represents the execution environment
 (scope) for variables.
 """
-from typing import List, Optional, Union
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+from weakref import WeakValueDictionary
 
+from .counters import CURRENT_COUNTERS
 from .errors import ArgumentError, SymbolNotFoundError
 from .parser import to_string
-from .types import Exp, Symbol
+from .types import Exp, OptimizedExp, Symbol
 
 
 class Env(dict):
@@ -18,7 +21,12 @@ class Env(dict):
     This class represents a scope in the Scheme interpreter. It inherits from `dict`
     to store variable bindings and maintains a reference to the outer (enclosing)
     environment for lexical scoping.
+
+    Attributes:
+        forked (bool): Whether the environment has forks (see `GlobalEnv.fork`).
     """
+    forked = False
+
     def __init__(
         self,
         parms: Union[List[Symbol], Symbol] = (),
@@ -45,10 +53,21 @@ class Env(dict):
                 raise ArgumentError('expected %s, given %s' % (to_string(parms), to_string(args)))
             self.update(zip(parms, args))
 
+    def _init_counting(self, parms: Union[List[Symbol], Symbol] = (), args: List[Exp] = (),
+                       outer: Optional['Env'] = None) -> None:
+        """
+        `__init__`, also counting the frame, while events are counted (see `count_env_events`).
+        """
+        CURRENT_COUNTERS.get().env_frames += 1
+        Env._init(self, parms, args, outer)
+
     def find(self, var: Symbol) -> 'Env':
         """
         Find the innermost Env where var appears.
 
+        A binding found in a global environment that has forks may be
+        overridden by the fork the code runs in (see `GlobalEnv.resolve`).
+
         Args:
             var (Symbol): The variable name to look up.
 
@@ -58,12 +77,367 @@ class Env(dict):
         Raises:
             SymbolNotFoundError: If the variable is not found in this or any outer environment.
         """
-        if var in self:
+        env = self
+        while var not in env:
+            env = env.outer
+            if env is None:
+                raise SymbolNotFoundError(var)
+        if env.forked:
+            return env.resolve(var)
+        return env
+
+    def _find_counting(self, var: Symbol) -> 'Env':
+        """
+        `find`, also counting the lookup and whether it reached the global environment, while events are
+        counted (see `count_env_events`).
+        """
+        env = self
+        while var not in env:
+            env = env.outer
+            if env is None:
+                raise SymbolNotFoundError(var)
+        counters = CURRENT_COUNTERS.get()
+        counters.lookups += 1
+        if env.outer is None or env.__class__ is GlobalEnv:
+            counters.global_lookups += 1
+            if env.forked:
+                return env.resolve(var)
+        return env
+
+    def _find_counting_depths(self, var: Symbol) -> 'Env':
+        """
+        `_find_counting`, also counting the depth at which the variable is found, while `count_find_depths`
+        is on.
+        """
+        env, depth = self, 0
+        while var not in env:
+            env = env.outer
+            if env is None:
+                raise SymbolNotFoundError(var)
+            depth += 1
+        counters = CURRENT_COUNTERS.get()
+        counters.count_depth(depth)
+        counters.lookups += 1
+        if env.outer is None or env.__class__ is GlobalEnv:
+            counters.global_lookups += 1
+            if env.forked:
+                return env.resolve(var)
+        return env
+
+    def capture(self, names: List[Symbol]) -> 'Env':
+        """
+        Return an environment holding only the bindings of names, on top of the outermost environment.
+
+        This is the environment of a converted closure: it keeps the variables
+        the closure uses alive, but none of the frames that bind them.
+        Its outer environment is that of `top`.
+
+        Args:
+            names (List[Symbol]): The variables to capture.
+
+        Returns:
+            Env: The new environment, or the outermost one if names is empty.
+        """
+        root = self.top()
+        if not names:
+            return root
+        return Env(names, [self.find(name)[name] for name in names], root)
+
+    def find_type(self, name: str) -> Optional[type]:
+        """
+        Return the record type defined under a name in the global environment of the chain, or its bases.
+
+        Args:
+            name (str): The type symbol.
+
+        Returns:
+            Optional[type]: The record class, or None if no record type has that name.
+        """
+        env = self.top()
+        while isinstance(env, GlobalEnv):
+            if name in env.types:
+                return env.types[name]
+            env = env.outer
+        return None
+
+    def top(self) -> 'Env':
+        """
+        Return the global environment of the chain: the first GlobalEnv, or the outermost environment.
+
+        This is where the top-level definitions of the code running in this environment go.
+        """
+        env = self
+        while env.outer is not None and not isinstance(env, GlobalEnv):
+            env = env.outer
+        return env
+
+
+class GlobalEnv(Env):
+    """
+    The top-level environment, which keeps optimized code consistent with its bindings.
+
+    It also holds the macros of the programs that run in it, so that each
+    global environment is a separate Lispy world (see `lispy.interpreter`).
+
+    A global environment can be forked in constant time (see `fork`): the
+    fork is a new global environment whose outer environment is the base,
+    so it has every binding and macro of the base, and what it defines or
+    assigns goes to itself. Code of the base called in a fork sees the
+    bindings of the fork too (see `resolve`). The fork is an overlay: the
+    names it does not bind keep following the base.
+
+    Names imported from a library (see `lispy.modules`) are bound in the
+    importing environment itself when it imports them, and registered with
+    `link`: when the library rebinds one, the importers that still have its
+    old value get the new one.
+
+    Code optimized under the assumption that a global name keeps its current
+    value (a folded call to `+`, a propagated constant) is registered with
+    `depend`. Rebinding that name deoptimizes the registered nodes. Nodes are
+    held weakly, so code that is no longer reachable is not kept alive.
+
+    Attributes:
+        dependents (Dict[Symbol, WeakValueDictionary]): The optimized nodes depending on
+            each name, by id.
+        assigned (Set[Symbol]): Global names that compiled code assigns with set!.
+        macros (Dict[Symbol, Callable]): The macro transformers, by name (see `lispy.macros`). A fork
+            shares those of its base until it defines one (see `define_macro`).
+        forks (WeakValueDictionary): The forks of the environment, by id.
+        links (Dict[Symbol, WeakValueDictionary]): The environments each name was imported into, by
+            id and name there.
+        libraries (Optional[Libraries]): The libraries the programs running in it import (see
+            `lispy.modules`), shared with the base. None if they cannot import any.
+        types (Dict[str, type]): The record types defined in it, by type symbol (see `find_type`).
+        type_checks (Dict[int, Tuple[Exp, Callable]]): The compiled predicates of the type
+            expressions checked in it, by id (see `lispy.type_checker.compile_type`).
+    """
+    def __init__(self, base: Optional['GlobalEnv'] = None) -> None:
+        """
+        Initialize an empty global environment.
+
+        Args:
+            base (Optional[GlobalEnv]): The environment it is a fork of, if any (see `fork`).
+        """
+        self.dependents: Dict[Symbol, WeakValueDictionary] = {}
+        self.assigned: Set[Symbol] = set()
+        self.macros: Dict[Symbol, Callable] = {} if base is None else base.macros
+        self._own_macros = base is None
+        self._macro_names: Set[Symbol] = set()
+        self.forks: WeakValueDictionary = WeakValueDictionary()
+        self.links: Dict[Symbol, WeakValueDictionary] = {}
+        self.libraries = None if base is None else base.libraries
+        self.types: Dict[str, type] = {}
+        self.type_checks: Dict[int, Tuple[Exp, Callable]] = {}
+        super().__init__((), (), base)
+
+    def fork(self) -> 'GlobalEnv':
+        """
+        Return a fork of the environment: an overlay whose definitions and assignments do not change it.
+
+        This takes constant time, whatever the number of bindings. The fork
+        sees what the base defines or assigns later, for the names it does
+        not bind itself.
+
+        Returns:
+            GlobalEnv: The fork.
+        """
+        fork = GlobalEnv(self)
+        self.forks[id(fork)] = fork
+        self.forked = True
+        return fork
+
+    def resolve(self, var: Symbol, assigning: bool = False) -> 'GlobalEnv':
+        """
+        Return the environment that binds a variable of this one for the code running now.
+
+        Procedures find their global variables in the environment they were
+        defined in. When the global environment of the running interpreter
+        (`CURRENT_ENV`) is a fork of this one, the variables that fork binds
+        override those of this one, so that procedures of a base called in a
+        fork see its definitions, and assign in it.
+
+        Args:
+            var (Symbol): A variable bound in this environment.
+            assigning (bool): Whether the variable is assigned: it then goes to
+                the running fork even if the fork does not bind it yet.
+
+        Returns:
+            GlobalEnv: The environment to read or assign the variable in.
+        """
+        current = CURRENT_ENV.get()
+        if current is self:
             return self
-        elif self.outer is None:
-            raise SymbolNotFoundError(var)
-        else:
-            return self.outer.find(var)
+        if not self.forks:
+            self.forked = False
+            return self
+        env, found = current, None
+        while env is not self:
+            if env is None:             # not running in a fork of this environment
+                return self
+            if found is None and var in env:
+                found = env
+            env = env.outer
+        if found is None:
+            return current if assigning else self
+        return found
+
+    def define_macro(self, name: Symbol, transformer: Callable) -> None:
+        """
+        Define a macro, copying the macro table first if it is shared with the base.
+
+        The forks that have a table of their own and did not define the name get it too.
+        """
+        if not self._own_macros:
+            self.macros = dict(self.macros)
+            self._own_macros = True
+        self.macros[name] = transformer
+        self._macro_names.add(name)
+        self._inherit_macro(name, transformer)
+
+    def _inherit_macro(self, name: Symbol, transformer: Callable) -> None:
+        for fork in list(self.forks.values()):
+            if fork._own_macros and name not in fork._macro_names:
+                fork.macros[name] = transformer
+                fork._inherit_macro(name, transformer)
+
+    def define_type(self, name: str, cls: type) -> None:
+        """
+        Define a record type, for the annotations of the code running in the environment and its forks.
+        """
+        self.types[name] = cls
+
+    def get(self, var: Symbol, default: Any = None) -> Any:
+        """
+        Return the value of a variable, looked up in the bases of a fork too, or default if it is unbound.
+        """
+        env: Optional[Env] = self
+        while env is not None:
+            if var in env:
+                return dict.__getitem__(env, var)
+            env = env.outer
+        return default
+
+    def depend(self, names: Iterable[Symbol], node: OptimizedExp) -> None:
+        """
+        Register an optimized node as depending on the current value of names.
+
+        Args:
+            names (Iterable[Symbol]): The global names the node depends on.
+            node (OptimizedExp): The node to deoptimize when one of them is rebound.
+        """
+        for name in names:
+            self.dependents.setdefault(name, WeakValueDictionary())[id(node)] = node
+
+    def link(self, var: Symbol, env: 'GlobalEnv', name: Symbol) -> None:
+        """
+        Register that a variable was imported into another environment.
+
+        Args:
+            var (Symbol): The variable, bound in this environment.
+            env (GlobalEnv): The importing environment, held weakly.
+            name (Symbol): The name of the variable there.
+        """
+        self.links.setdefault(var, WeakValueDictionary())[(id(env), name)] = env
+
+    def _propagate(self, var: Symbol, val: Any) -> None:
+        """
+        Rebind an imported variable in the environments that still have its old value.
+
+        Args:
+            var (Symbol): The rebound variable.
+            val (Any): Its new value.
+        """
+        old = dict.get(self, var)
+        for (_, name), env in list(self.links[var].items()):
+            if name in env and dict.__getitem__(env, name) is old:
+                env[name] = val
+
+    def _invalidate(self, var: Symbol) -> None:
+        """
+        Deoptimize every node depending on var, here and in the forks that do not bind it.
+
+        Args:
+            var (Symbol): The rebound name.
+        """
+        if var in self.dependents:
+            for node in list(self.dependents.pop(var).values()):
+                node.deoptimize()
+        for fork in list(self.forks.values()):
+            if var not in fork:
+                fork._invalidate(var)
+
+    def _override(self, var: Symbol) -> None:
+        """
+        Record that a fork binds a variable of its bases.
+
+        Code of the bases may run in the fork: the optimized code relying on
+        their binding is deoptimized, and code they compile later does not
+        rely on it (see `assigned`).
+
+        Args:
+            var (Symbol): The variable the fork binds.
+        """
+        base = self.outer
+        while isinstance(base, GlobalEnv):
+            if var in base:
+                base.assigned.add(var)
+                base._invalidate(var)
+            base = base.outer
+
+    def __setitem__(self, var: Symbol, val: Any) -> None:
+        if var in self.links:
+            self._propagate(var, val)
+        if self.outer is not None and var not in self:
+            self._override(var)
+        super().__setitem__(var, val)
+        if var in self.dependents or self.forked:
+            self._invalidate(var)
+
+    def __delitem__(self, var: Symbol) -> None:
+        super().__delitem__(var)
+        if var in self.dependents or self.forked:
+            self._invalidate(var)
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        """
+        Bind several names, deoptimizing code that depends on them.
+        """
+        for var, val in dict(*args, **kwargs).items():
+            self[var] = val
+
+
+Env._init = Env.__init__
+Env._find = Env.find
+_counting = {'events': False, 'depths': False}
+
+
+def _install() -> None:
+    Env.__init__ = Env._init_counting if _counting['events'] else Env._init
+    Env.find = (Env._find_counting_depths if _counting['depths']
+                else Env._find_counting if _counting['events'] else Env._find)
+
+
+def count_env_events(enabled: bool = True) -> None:
+    """
+    Turn on or off the counting of frames and lookups (see `lispy.evaluator.count_events`).
+    """
+    _counting['events'] = enabled
+    _install()
+
+
+def count_find_depths(enabled: bool = True) -> None:
+    """
+    Turn on or off the histogram of lookup depths (`find_depths` in `lispy.counters`).
+
+    The depth costs `Env.find` an index into the histogram on every lookup,
+    so it is only counted on request: this installs a `find` that counts
+    it, and the lookups, and removes it.
+    """
+    _counting['depths'] = enabled
+    _install()
+
 
+global_env = GlobalEnv()
 
-global_env = Env()
+CURRENT_ENV: ContextVar[GlobalEnv] = ContextVar('env', default=global_env)
+"""The global environment of the code running in the current thread, that of the running interpreter."""
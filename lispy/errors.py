@@ -65,3 +65,24 @@ class TypeMismatchError(LispyError, TypeError):
     Raised when a type check fails.
     """
     pass
+
+
+class MatchError(LispyError):
+    """
+    Raised when no clause of a match expression matches the value.
+    """
+    pass
+
+
+class BenchmarkError(LispyError):
+    """
+    Raised when a benchmark is malformed or returns a wrong result.
+    """
+    pass
+
+
+class LibraryError(LispyError):
+    """
+    Raised when a library cannot be found, instantiated or imported.
+    """
+    pass
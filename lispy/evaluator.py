@@ -5,28 +5,52 @@ This module contains the core evaluation logic, including the `eval` function
 and handlers for special forms. It implements Tail Call Optimization (TCO)
 using the `TailCall` class.
 """
-from typing import Any, List, Optional
+import threading
+from contextvars import ContextVar
+from typing import Any, List, Optional, Tuple
 
 from .constants import TYPE_ANNOTATION_CHAR
-from .env import Env, global_env
-from .errors import SchemeSyntaxError, TypeMismatchError
+from .counters import CURRENT_COUNTERS
+from .env import Env, count_env_events, global_env
+from .errors import SchemeSyntaxError, SymbolNotFoundError, TypeMismatchError
 from .messages import (
     ERR_MISSING_TYPE_ANNOTATION,
     ERR_TYPE_MISMATCH,
     ERR_UNEXPECTED_TYPE_ANNOTATION,
 )
-from .type_checker import check_type
+from .type_checker import check_type, type_name
 from .types import (
+    Box,
     Exp,
+    OptimizedExp,
     Symbol,
+    _arrow,
     _begin,
+    _box,
+    _case,
+    _cond,
+    _cover,
     _define,
+    _do,
     _dynamic_let,
+    _field_ref,
+    _field_set,
     _if,
     _lambda,
+    _let,
+    _letrec,
+    _letrec_star,
+    _loop,
+    _operator,
     _quote,
+    _recur,
     _set,
+    _set_box,
     _try,
+    _typed_call,
+    _unbox,
+    _unless,
+    _when,
 )
 
 
@@ -38,7 +62,14 @@ class Procedure:
         parms (List[Symbol]): The parameter names.
         exp (Exp): The body of the procedure.
         env (Env): The environment in which the procedure was defined (closure).
+        types (Dict[Symbol, Symbol]): The type annotations of the parameters.
+        signature (Exp): The parameter list of the lambda expression, with its annotations.
+        name (Optional[Symbol]): The name the procedure was first defined under, for profiles.
+        location (Optional[Tuple[str, int]]): The file and line of its top-level definition.
     """
+    name: Optional[Symbol] = None
+    location: Optional[Tuple[str, int]] = None
+
     def __init__(self, parms: List[Symbol], exp: Exp, env: Env) -> None:
         """
         Initialize the Procedure.
@@ -50,6 +81,7 @@ class Procedure:
         """
         self.types = {}
         self.parms = []
+        self.signature = parms
 
         if isinstance(parms, list):
             i = 0
@@ -71,6 +103,13 @@ class Procedure:
 
         self.exp, self.env = exp, env
 
+    def _init_counting(self, parms: List[Symbol], exp: Exp, env: Env) -> None:
+        """
+        `__init__`, also counting the procedure, while events are counted (see `count_events`).
+        """
+        CURRENT_COUNTERS.get().procedures += 1
+        Procedure._init(self, parms, exp, env)
+
     def check_types(self, args: List[Any]) -> None:
         """
         Check argument types against annotations.
@@ -80,8 +119,8 @@ class Procedure:
                 if p in self.types and i < len(args):
                     val = args[i]
                     type_sym = self.types[p]
-                    if not check_type(val, type_sym):
-                        raise TypeMismatchError(ERR_TYPE_MISMATCH.format(type_sym, type(val).__name__))
+                    if not check_type(val, type_sym, self.env):
+                        raise TypeMismatchError(ERR_TYPE_MISMATCH.format(type_name(type_sym), type(val).__name__))
 
     def __call__(self, *args: Exp) -> Any:
         """
@@ -111,6 +150,32 @@ class TailCall:
         self.x = x
         self.env = env
 
+    def _init_counting(self, x: Exp, env: Env) -> None:
+        """
+        `__init__`, also counting the tail call, while events are counted (see `count_events`).
+        """
+        CURRENT_COUNTERS.get().tail_calls += 1
+        TailCall._init(self, x, env)
+
+
+class ProcedureCall(TailCall):
+    """
+    A tail call that enters the body of a procedure, returned by the special forms that call one.
+
+    The evaluator loop handles it as any tail call; the hooked loop also
+    reports the call (see `Hook`).
+    """
+    def __init__(self, proc: Procedure, args: List[Any]) -> None:
+        """
+        Initialize the ProcedureCall.
+
+        Args:
+            proc (Procedure): The called procedure.
+            args (List[Any]): The arguments.
+        """
+        super().__init__(proc.exp, Env(proc.parms, args, proc.env))
+        self.proc, self.args = proc, args
+
 
 def eval_quote(x: Exp, env: Env) -> Any:
     """
@@ -158,7 +223,10 @@ def eval_set(x: Exp, env: Env) -> Any:
         Any: None.
     """
     (_, var, exp) = x
-    env.find(var)[var] = eval(exp, env)
+    target = env.find(var)
+    if target.forked:                   # assigned in the running fork (see `GlobalEnv.resolve`)
+        target = target.resolve(var, assigning=True)
+    target[var] = eval(exp, env)
     return None
 
 
@@ -176,12 +244,14 @@ def eval_define(x: Exp, env: Env) -> Any:
     if len(x) == 5 and x[2] == TYPE_ANNOTATION_CHAR:
         (_, var, _, type_sym, exp) = x
         val = eval(exp, env)
-        if not check_type(val, type_sym):
-            raise TypeMismatchError(ERR_TYPE_MISMATCH.format(type_sym, type(val).__name__))
-        env[var] = val
+        if not check_type(val, type_sym, env):
+            raise TypeMismatchError(ERR_TYPE_MISMATCH.format(type_name(type_sym), type(val).__name__))
     else:
         (_, var, exp) = x
-        env[var] = eval(exp, env)
+        val = eval(exp, env)
+    if isinstance(val, Procedure) and val.name is None:
+        val.name = var
+    env[var] = val
     return None
 
 
@@ -189,13 +259,19 @@ def eval_lambda(x: Exp, env: Env) -> Any:
     """
     Evaluate a lambda expression.
 
+    A lambda converted by `lispy.closures` lists its free variables; the
+    procedure then captures only those, instead of the whole environment.
+
     Args:
-        x (Exp): The expression (lambda vars body).
+        x (Exp): The expression (lambda vars body [free]).
         env (Env): The environment.
 
     Returns:
         Procedure: The created procedure.
     """
+    if len(x) == 4:
+        (_, vars, exp, free) = x
+        return Procedure(vars, exp, env.capture(free))
     (_, vars, exp) = x
     return Procedure(vars, exp, env)
 
@@ -231,9 +307,12 @@ def eval_try(x: Exp, env: Env) -> Any:
     try:
         return eval(exp, env)
     except Exception as e:
+        CURRENT_COUNTERS.get().exceptions_caught += 1
+        for hook in CURRENT_HOOKS.get():
+            hook.catch(e, x, env)
         proc = eval(handler, env)
         if isinstance(proc, Procedure):
-            return TailCall(proc.exp, Env(proc.parms, [e], proc.env))
+            return ProcedureCall(proc, [e])
         else:
             return proc(e)
 
@@ -255,15 +334,18 @@ def eval_dynamic_let(x: Exp, env: Env) -> Any:
     vals = [eval(e, env) for e in exps]
 
     old_vals = []
-    # Save old values
+    # Save old values; a boxed variable is rebound inside its box
     for v in vars_list:
         target_env = env.find(v)
-        old_vals.append((target_env, v, target_env[v]))
+        if isinstance(target_env[v], Box):
+            target_env, v = target_env[v], 'value'
+            old_vals.append((target_env, v, target_env.value))
+        else:
+            old_vals.append((target_env, v, target_env[v]))
 
     # Apply new values
-    for i, v in enumerate(vars_list):
-        target_env = env.find(v)
-        target_env[v] = vals[i]
+    for (target_env, v, _), val in zip(old_vals, vals):
+        _assign(target_env, v, val)
 
     try:
         result = None
@@ -273,7 +355,397 @@ def eval_dynamic_let(x: Exp, env: Env) -> Any:
     finally:
         # Restore old values
         for target_env, v, old_val in old_vals:
-            target_env[v] = old_val
+            _assign(target_env, v, old_val)
+
+
+def _assign(target: Any, var: str, val: Any) -> None:
+    """
+    Assign a variable in an environment, or the value of a box.
+    """
+    if isinstance(target, Box):
+        target.value = val
+    else:
+        target[var] = val
+
+
+def eval_let(x: Exp, env: Env) -> Any:
+    """
+    Evaluate a let expression.
+
+    The values are bound in a new frame directly, without creating a procedure.
+
+    Args:
+        x (Exp): The expression (let ((var exp)...) body) or (let name ((var exp)...) body).
+        env (Env): The environment.
+
+    Returns:
+        Any: The body, wrapped in TailCall.
+    """
+    if isinstance(x[1], Symbol):
+        return eval_named_let(x, env)
+    (_, bindings, body) = x
+    return TailCall(body, Env([b[0] for b in bindings], [eval(b[1], env) for b in bindings], env))
+
+
+def eval_named_let(x: Exp, env: Env) -> Any:
+    """
+    Evaluate a named let whose name escapes or is called outside tail position.
+
+    The loop procedure is created once per entry into the let.
+
+    Like a lambda, a named let converted by `lispy.closures` lists its free
+    variables and captures only those.
+
+    Args:
+        x (Exp): The expression (let name ((var exp)...) body [free]).
+        env (Env): The environment.
+
+    Returns:
+        Any: The body, wrapped in TailCall.
+    """
+    (_, name, bindings, body, *free) = x
+    vals = [eval(b[1], env) for b in bindings]
+    loop_env = Env([name], [None], env.capture(free[0]) if free else env)
+    parms = [b[0] for b in bindings]
+    loop_env[name] = Procedure(parms, body, loop_env)
+    return TailCall(body, Env(parms, vals, loop_env))
+
+
+def eval_loop(x: Exp, env: Env) -> Any:
+    """
+    Evaluate a named let that only calls itself in tail position.
+
+    The loop form is stored in the frame under the loop name, so that
+    `#%recur` can find the frame and the body again.
+
+    Args:
+        x (Exp): The expression (#%loop name ((var exp)...) body).
+        env (Env): The environment.
+
+    Returns:
+        Any: The body, wrapped in TailCall.
+    """
+    (_, name, bindings, body) = x
+    frame = Env([b[0] for b in bindings], [eval(b[1], env) for b in bindings], env)
+    frame[name] = x
+    return TailCall(body, frame)
+
+
+def eval_recur(x: Exp, env: Env) -> Any:
+    """
+    Evaluate the next iteration of a `#%loop`, rebinding its variables in place.
+
+    Args:
+        x (Exp): The expression (#%recur name exp...).
+        env (Env): The environment.
+
+    Returns:
+        Any: The loop body, wrapped in TailCall.
+    """
+    name = x[1]
+    frame = env.find(name)
+    loop = frame[name]
+    vals = [eval(exp, env) for exp in x[2:]]
+    for b, val in zip(loop[2], vals):
+        frame[b[0]] = val
+    return TailCall(loop[3], frame)
+
+
+def eval_box(x: Exp, env: Env) -> Any:
+    """
+    Put variables of the current frame in boxes, so that closures can share them.
+
+    Variables that are not bound yet (internal defines) get an empty box.
+
+    Args:
+        x (Exp): The expression (#%box (var...) body).
+        env (Env): The environment.
+
+    Returns:
+        Any: The body, wrapped in TailCall.
+    """
+    (_, names, body) = x
+    for name in names:
+        box = Box()
+        if name in env:
+            box.value = env[name]
+        env[name] = box
+    return TailCall(body, env)
+
+
+def eval_unbox(x: Exp, env: Env) -> Any:
+    """
+    Evaluate a reference to a boxed variable.
+
+    Args:
+        x (Exp): The expression (#%unbox var).
+        env (Env): The environment.
+
+    Returns:
+        Any: The value of the variable.
+
+    Raises:
+        SymbolNotFoundError: If the variable is not bound yet.
+    """
+    try:
+        return env.find(x[1])[x[1]].value
+    except AttributeError:
+        raise SymbolNotFoundError(x[1]) from None
+
+
+def eval_set_box(x: Exp, env: Env) -> Any:
+    """
+    Assign or define a boxed variable.
+
+    Args:
+        x (Exp): The expression (#%set-box! var exp) or, for typed defines, (#%set-box! var :: type exp).
+        env (Env): The environment.
+
+    Returns:
+        Any: None.
+    """
+    (_, var, *_, exp) = x
+    val = eval(exp, env)
+    if len(x) == 5 and not check_type(val, x[3], env):
+        raise TypeMismatchError(ERR_TYPE_MISMATCH.format(type_name(x[3]), type(val).__name__))
+    env.find(var)[var].value = val
+    return None
+
+
+def eval_typed_call(x: Exp, env: Env) -> Any:
+    """
+    Evaluate a call whose arguments were proven to match the annotations of the callee.
+
+    The proof holds for procedures made from the lambda expression whose
+    parameter list is recorded in the form; any other procedure is called
+    with the usual type checks.
+
+    Args:
+        x (Exp): The expression (#%typed-call params proc exp...).
+        env (Env): The environment.
+
+    Returns:
+        Any: The procedure body wrapped in TailCall, or the result of a primitive.
+    """
+    exps = [eval(exp, env) for exp in x[2:]]
+    proc = exps.pop(0)
+    if isinstance(proc, Procedure):
+        if proc.signature is not x[1]:
+            proc.check_types(exps)
+        return ProcedureCall(proc, exps)
+    return proc(*exps)
+
+
+def eval_operator(x: Exp, env: Env) -> Any:
+    """
+    Evaluate a binary operator applied to operands proven to be numbers.
+
+    Variables and literals are evaluated in place, without calling `eval`.
+
+    Args:
+        x (Exp): The expression (#%operator function exp exp).
+        env (Env): The environment.
+
+    Returns:
+        Any: The result of the operator.
+    """
+    (_, operator, a, b) = x
+    a = env.find(a)[a] if isinstance(a, Symbol) else eval(a, env) if isinstance(a, list) else a
+    b = env.find(b)[b] if isinstance(b, Symbol) else eval(b, env) if isinstance(b, list) else b
+    return operator(a, b)
+
+
+def eval_field_ref(x: Exp, env: Env) -> Any:
+    """
+    Read a field of a value proven to be a record of the accessor's type.
+
+    Args:
+        x (Exp): The expression (#%field-ref getter exp).
+        env (Env): The environment.
+
+    Returns:
+        Any: The value of the field.
+    """
+    (_, getter, obj) = x
+    return getter(env.find(obj)[obj] if isinstance(obj, Symbol) else eval(obj, env) if isinstance(obj, list) else obj)
+
+
+def eval_field_set(x: Exp, env: Env) -> Any:
+    """
+    Set a field of a value proven to be a record of the modifier's type, to a value proven to fit the field.
+
+    Args:
+        x (Exp): The expression (#%field-set! setter exp exp).
+        env (Env): The environment.
+
+    Returns:
+        Any: None.
+    """
+    (_, setter, obj, val) = x
+    obj = env.find(obj)[obj] if isinstance(obj, Symbol) else eval(obj, env) if isinstance(obj, list) else obj
+    setter(obj, env.find(val)[val] if isinstance(val, Symbol) else eval(val, env) if isinstance(val, list) else val)
+    return None
+
+
+def eval_letrec(x: Exp, env: Env) -> Any:
+    """
+    Evaluate a letrec or letrec* expression.
+
+    The values are evaluated in the new frame, so they can refer to each other.
+    letrec* binds each value as soon as it is computed; letrec binds them all
+    at the end.
+
+    Args:
+        x (Exp): The expression (letrec ((var exp)...) body).
+        env (Env): The environment.
+
+    Returns:
+        Any: The body, wrapped in TailCall.
+    """
+    (op, bindings, body) = x
+    frame = Env([b[0] for b in bindings], [None] * len(bindings), env)
+    if op is _letrec_star:
+        for var, exp in bindings:
+            frame[var] = eval(exp, frame)
+    else:
+        frame.update([(var, eval(exp, frame)) for var, exp in bindings])
+    return TailCall(body, frame)
+
+
+def eval_do(x: Exp, env: Env) -> Any:
+    """
+    Evaluate a do loop.
+
+    The loop variables live in a single frame that is updated in place, unless
+    the expander flagged that the loop may capture them in a closure, in which
+    case every iteration gets a fresh frame.
+
+    Args:
+        x (Exp): The expression (do ((var init [step])...) (test exp...) command fresh).
+        env (Env): The environment.
+
+    Returns:
+        Any: The result of the last result expression, wrapped in TailCall.
+    """
+    (_, bindings, test_and_result, command, fresh) = x
+    test, results = test_and_result[0], test_and_result[1:]
+    frame = Env([b[0] for b in bindings], [eval(b[1], env) for b in bindings], env)
+    steps = [(b[0], b[2]) for b in bindings if len(b) == 3]
+    while not eval(test, frame):
+        if command is not None:
+            eval(command, frame)
+        vals = [(var, eval(step, frame)) for var, step in steps]
+        if fresh:
+            previous, frame = frame, Env((), (), env)
+            frame.update(previous)
+        frame.update(vals)
+    if not results:
+        return None
+    for exp in results[:-1]:
+        eval(exp, frame)
+    return TailCall(results[-1], frame)
+
+
+def eval_cond(x: Exp, env: Env) -> Any:
+    """
+    Evaluate a cond expression.
+
+    Args:
+        x (Exp): The expression (cond (test body) (test => proc) (test) ...).
+        env (Env): The environment.
+
+    Returns:
+        Any: The body of the first clause whose test is true, wrapped in TailCall;
+            None if no test is true.
+    """
+    for clause in x[1:]:
+        val = eval(clause[0], env)
+        if val:
+            if len(clause) == 1:
+                return val
+            elif clause[1] is _arrow:
+                return TailCall([clause[2], [_quote, val]], env)
+            return TailCall(clause[1], env)
+    return None
+
+
+def eval_when(x: Exp, env: Env) -> Any:
+    """
+    Evaluate a when or unless expression.
+
+    Args:
+        x (Exp): The expression (when test body) or (unless test body).
+        env (Env): The environment.
+
+    Returns:
+        Any: The body wrapped in TailCall, or None if it is skipped.
+    """
+    (op, test, body) = x
+    val = eval(test, env)
+    if (op is _when and val) or (op is _unless and not val):
+        return TailCall(body, env)
+    return None
+
+
+def case_key(datum: Any) -> Any:
+    """
+    Return the jump table key of a case datum.
+
+    The type is part of the key so that, as with eqv?, 1, 1.0 and #t are
+    different datums.
+
+    Args:
+        datum (Any): A hashable datum.
+
+    Returns:
+        Any: The key.
+    """
+    return (type(datum), datum)
+
+
+def eval_case(x: Exp, env: Env) -> Any:
+    """
+    Evaluate a case expression with a single jump table lookup.
+
+    Args:
+        x (Exp): The expression (case key table (body...) else-body).
+        env (Env): The environment.
+
+    Returns:
+        Any: The selected body wrapped in TailCall, or None.
+    """
+    (_, key, table, bodies, default) = x
+    val = eval(key, env)
+    try:
+        index = table.get(case_key(val))
+    except TypeError:                   # unhashable keys match no datum
+        index = None
+    if index is not None:
+        return TailCall(bodies[index], env)
+    elif default is not None:
+        return TailCall(default, env)
+    return None
+
+
+def eval_cover(x: Exp, env: Env) -> Any:
+    """
+    Evaluate a coverage probe, inserted by `lispy.coverage`: mark its places as executed, then its expression.
+
+    A probe is needed only once: it then replaces itself with its expression, in place,
+    so that code runs at full speed once covered.
+
+    Args:
+        x (Exp): The expression (#%cover bits index... exp).
+        env (Env): The environment.
+
+    Returns:
+        Any: The expression, wrapped in TailCall.
+    """
+    bits, exp = x[1], x[-1]
+    for index in x[2:-1]:
+        bits[index] = 1
+    x[:] = exp if type(exp) is list else [_begin, exp]
+    return TailCall(exp, env)
 
 
 SPECIAL_FORMS = {
@@ -285,6 +757,24 @@ SPECIAL_FORMS = {
     _begin: eval_begin,
     _try: eval_try,
     _dynamic_let: eval_dynamic_let,
+    _let: eval_let,
+    _letrec: eval_letrec,
+    _letrec_star: eval_letrec,
+    _do: eval_do,
+    _loop: eval_loop,
+    _recur: eval_recur,
+    _box: eval_box,
+    _unbox: eval_unbox,
+    _set_box: eval_set_box,
+    _typed_call: eval_typed_call,
+    _operator: eval_operator,
+    _field_ref: eval_field_ref,
+    _field_set: eval_field_set,
+    _cond: eval_cond,
+    _case: eval_case,
+    _when: eval_when,
+    _unless: eval_when,
+    _cover: eval_cover,
 }
 
 
@@ -296,6 +786,10 @@ def eval(x: Exp, env: Optional[Env] = None) -> Any:
     special forms (quote, if, set!, define, lambda, begin), and procedure calls.
     It implements Tail Call Optimization (TCO) by using a loop for tail calls.
 
+    The local variable `proc` holds the procedure whose body the loop is
+    running, if any; the sampling profiler (`lispy.sampler`) reads it from
+    the frames of the loop.
+
     Args:
         x (Exp): The expression to evaluate.
         env (Optional[Env]): The environment to evaluate in. Defaults to global_env.
@@ -316,15 +810,274 @@ def eval(x: Exp, env: Optional[Env] = None) -> Any:
         if isinstance(op, Symbol) and op in SPECIAL_FORMS:
             res = SPECIAL_FORMS[op](x, env)
             if isinstance(res, TailCall):
+                if res.__class__ is ProcedureCall:
+                    proc = res.proc
+                x, env = res.x, res.env
+                continue
+            return res
+        else:                           # (proc exp*)
+            exps = [eval(exp, env) for exp in x]
+            f = exps.pop(0)
+            if isinstance(f, Procedure):
+                proc = f
+                proc.check_types(exps)
+                x = proc.exp
+                env = Env(proc.parms, exps, proc.env)
+            else:
+                return f(*exps)
+
+
+class Hook:
+    """
+    A receiver of evaluation events, such as a profiler or a tracer.
+
+    Hooks are installed with `add_hook` (or in a `with` block) and removed
+    with `remove_hook`. While at least one is installed, the evaluator runs
+    a loop that reports the events (`eval_hooked`); without hooks it runs
+    the plain loop, which does not check for them. The methods do nothing
+    by default.
+
+    A hook is installed in an interpreter, the one running in the thread
+    that installs it unless given, and is told of the events of the code
+    that interpreter runs, in any thread (see `CURRENT_HOOKS`): the hooks of
+    one interpreter do not see the calls of another running meanwhile.
+    Hooks see the calls the optimizer would inline: code compiled while a
+    hook is installed does not inline them, and the hooked loop runs code
+    compiled before as it was written.
+    """
+    def enter(self, proc: Procedure, args: List[Any]) -> None:
+        """
+        Called when a procedure is called, except in tail position.
+        """
+
+    def tail_call(self, caller: Procedure, proc: Procedure, args: List[Any]) -> None:
+        """
+        Called when a procedure is called in tail position: the call of caller ends and that of proc begins.
+        """
+
+    def exit(self, proc: Procedure, value: Any, error: Optional[BaseException]) -> None:
+        """
+        Called when a procedure call returns a value, or ends with an exception (error is then set).
+        """
+
+    def special_form(self, x: Exp, env: Env) -> None:
+        """
+        Called before a special form is evaluated.
+        """
+
+    def macro(self, name: Symbol, x: Exp, expansion: Exp) -> None:
+        """
+        Called when the expander applies a macro (see `lispy.macros.expand`).
+        """
+
+    def catch(self, error: Exception, x: Exp, env: Env) -> None:
+        """
+        Called when a try expression catches an exception, before its handler runs.
+        """
+
+    def __enter__(self) -> 'Hook':
+        add_hook(self)
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        remove_hook(self)
+
+
+HOOKS: List[Hook] = []
+"""The hooks of the default interpreter, and of the code no other interpreter runs."""
+
+CURRENT_HOOKS: ContextVar[List[Hook]] = ContextVar('hooks', default=HOOKS)
+"""The hooks the events of the current thread are reported to (see `lispy.interpreter.Interpreter`)."""
+
+
+class _Calls(threading.local):
+    """
+    The procedure calls in progress in the hooked loops of a thread.
+    """
+    def __init__(self) -> None:
+        self.active: List[Procedure] = []
+
+
+_calls = _Calls()
+_installed = 0
+
+PROFILERS: List[Any] = []
+"""The hooks installed in any interpreter. While there are any, the optimizer does not inline
+procedure calls (see `lispy.optimizer`), so that the procedures show in profiles."""
+_lock = threading.Lock()
+
+_eval = eval
+_call = Procedure.__call__
+Procedure._init = Procedure.__init__
+TailCall._init = TailCall.__init__
+_counting = 0
+
+
+def count_events(enabled: bool = True) -> None:
+    """
+    Turn on or off the counting of frames, procedures, tail calls and lookups (see `lispy.counters`).
+
+    They happen on every step of the evaluator loop, where reading the
+    counters of the current thread would cost more than the step itself,
+    so they are only counted on request: this installs constructors and a
+    `find` that count them, and removes them once every call that turned
+    the counting on has turned it off.
+
+    Args:
+        enabled (bool): Whether to turn the counting on or off.
+    """
+    global _counting
+    with _lock:
+        _counting += 1 if enabled else -1
+        counting = _counting > 0
+        Procedure.__init__ = Procedure._init_counting if counting else Procedure._init
+        TailCall.__init__ = TailCall._init_counting if counting else TailCall._init
+        count_env_events(counting)
+
+
+def add_hook(hook: Hook, hooks: Optional[List[Hook]] = None) -> None:
+    """
+    Install a hook, and the hooked evaluator loop if it is the first one.
+
+    Args:
+        hook (Hook): The hook.
+        hooks (Optional[List[Hook]]): The hooks of the interpreter to install it in. Defaults to those
+            of the interpreter running in the current thread.
+    """
+    global eval, _installed
+    with _lock:
+        (CURRENT_HOOKS.get() if hooks is None else hooks).append(hook)
+        PROFILERS.append(hook)
+        _installed += 1
+        eval = eval_hooked
+        Procedure.__call__ = _call_hooked
+
+
+def remove_hook(hook: Hook, hooks: Optional[List[Hook]] = None) -> None:
+    """
+    Remove a hook, and go back to the plain evaluator loop if it was the last one.
+
+    Args:
+        hook (Hook): The hook.
+        hooks (Optional[List[Hook]]): The hooks of the interpreter it was installed in. Defaults to
+            those of the interpreter running in the current thread.
+    """
+    global eval, _installed
+    with _lock:
+        (CURRENT_HOOKS.get() if hooks is None else hooks).remove(hook)
+        PROFILERS.remove(hook)
+        _installed -= 1
+        if not _installed:
+            eval = _eval
+            Procedure.__call__ = _call
+
+
+def eval_hooked(x: Exp, env: Optional[Env] = None) -> Any:
+    """
+    Evaluate an expression, reporting the events to the installed hooks.
+
+    This is the evaluator loop `add_hook` installs as `eval`. Each call of
+    `eval_hooked` owns the procedure call it enters: a procedure applied in
+    its loop replaces the call it entered before (a tail call), and the
+    call ends when it returns or raises.
+
+    Args:
+        x (Exp): The expression to evaluate.
+        env (Optional[Env]): The environment to evaluate in. Defaults to global_env.
+
+    Returns:
+        Any: The result of the evaluation.
+    """
+    active = _calls.active
+    depth = len(active)
+    try:
+        value = _eval_hooked(x, global_env if env is None else env, active, depth)
+    except BaseException as e:
+        _leave(active, depth, None, e)
+        raise
+    _leave(active, depth, value, None)
+    return value
+
+
+def _enter(proc: Procedure, args: List[Any], active: List[Procedure], depth: int) -> None:
+    """
+    Record a procedure call made by the loop that owns the calls above depth.
+    """
+    if len(active) > depth:
+        caller = active[depth]
+        active[depth] = proc
+        for hook in CURRENT_HOOKS.get():
+            hook.tail_call(caller, proc, args)
+    else:
+        active.append(proc)
+        for hook in CURRENT_HOOKS.get():
+            hook.enter(proc, args)
+
+
+def _leave(active: List[Procedure], depth: int, value: Any, error: Optional[BaseException]) -> None:
+    """
+    End the procedure call owned by a loop, if any.
+    """
+    if len(active) > depth:
+        proc = active.pop()
+        for hook in CURRENT_HOOKS.get():
+            hook.exit(proc, value, error)
+
+
+def _eval_hooked(x: Exp, env: Env, active: List[Procedure], depth: int) -> Any:
+    """
+    The loop of `eval`, with the events reported to the hooks.
+
+    The procedure calls above depth on the stack of calls of the thread belong to this loop.
+    While the interpreter has hooks, optimized code runs as its original
+    code, so that the calls the optimizer inlined or folded are reported.
+    """
+    hooks = CURRENT_HOOKS.get()
+    while True:
+        if isinstance(x, Symbol):       # variable reference
+            return env.find(x)[x]
+        elif not isinstance(x, list):   # constant literal
+            return x
+        elif hooks and x.__class__ is OptimizedExp:
+            x = x.original
+            continue
+
+        op = x[0]
+        if isinstance(op, Symbol) and op in SPECIAL_FORMS:
+            for hook in hooks:
+                hook.special_form(x, env)
+            res = SPECIAL_FORMS[op](x, env)
+            if isinstance(res, TailCall):
+                if res.__class__ is ProcedureCall:
+                    proc = res.proc
+                    _enter(proc, res.args, active, depth)
                 x, env = res.x, res.env
                 continue
             return res
         else:                           # (proc exp*)
             exps = [eval(exp, env) for exp in x]
-            proc = exps.pop(0)
-            if isinstance(proc, Procedure):
+            f = exps.pop(0)
+            if isinstance(f, Procedure):
+                proc = f
                 proc.check_types(exps)
+                _enter(proc, exps, active, depth)
                 x = proc.exp
                 env = Env(proc.parms, exps, proc.env)
             else:
-                return proc(*exps)
+                return f(*exps)
+
+
+def _call_hooked(self: Procedure, *args: Exp) -> Any:
+    """
+    `Procedure.__call__` while hooks are installed.
+    """
+    active = _calls.active
+    depth = len(active)
+    _enter(self, list(args), active, depth)
+    try:
+        value = _eval_hooked(self.exp, Env(self.parms, args, self.env), active, depth)
+    except BaseException as e:
+        _leave(active, depth, None, e)
+        raise
+    _leave(active, depth, value, None)
+    return value
@@ -0,0 +1,877 @@
+"""
+Static type inference module.
+
+This module implements the pass that runs after `lispy.optimizer.optimize`
+and proves type annotations ahead of time, so that annotated code does not
+pay for its checks on every call.
+
+The types of literals, annotated parameters and typed defines are known, and
+the results of the pure primitives are computed from the types of their
+arguments. A call of an annotated procedure whose arguments are all proven to
+match becomes a `#%typed-call`, which skips the checks at run time; a typed
+define whose value is proven drops its check. An argument whose type is known
+and wrong is reported as a type error before the program runs.
+
+Checks remain where a value comes from untyped code. A proof that relies on
+a global primitive is guarded like the optimizer's folds (see
+`lispy.types.OptimizedExp`), and a `#%typed-call` checks at run time that the
+callee is still a procedure made from the lambda expression it was proven for.
+"""
+from types import GeneratorType
+from typing import Any, Callable, Dict, FrozenSet, List, NamedTuple, Optional, Set, Tuple
+
+from .constants import TYPE_ANNOTATION_CHAR
+from .env import Env, GlobalEnv, global_env
+from .errors import TypeMismatchError
+from .evaluator import SPECIAL_FORMS, Procedure
+from .macros import Tasks, is_pair, param_names, run_tasks
+from .messages import ERR_STATIC_TYPE_MISMATCH
+from .optimizer import BINDING_FORMS, NO_DEPS
+from .parser import to_string
+from .type_checker import ANY, TYPE_MAPPING, check_type, type_name
+from .types import (
+    Exp,
+    OptimizedExp,
+    Symbol,
+    _arrow,
+    _begin,
+    _case,
+    _cond,
+    _cover,
+    _define,
+    _do,
+    _dynamic_let,
+    _field_ref,
+    _field_set,
+    _if,
+    _lambda,
+    _let,
+    _letrec,
+    _letrec_star,
+    _loop,
+    _operator,
+    _quote,
+    _recur,
+    _set,
+    _try,
+    _typed_call,
+    _unless,
+    _when,
+)
+
+PROCEDURE = 'procedure'
+"""The type of lambda expressions."""
+
+RESULT_TYPES: Dict[Callable, Callable[[List[Optional[str]]], Optional[str]]] = {}
+"""The result type of primitives, from the types of their arguments; filled by `lispy.primitives`."""
+
+OPERATORS: Dict[Callable, Callable[[Any, Any], Any]] = {}
+"""The binary operators that replace primitives applied to two numbers; filled by `lispy.primitives`."""
+
+
+class Field(NamedTuple):
+    """
+    A record field, as reached through an accessor or modifier procedure.
+
+    Attributes:
+        record (type): The record class.
+        type (Exp): The type of the field, as proofs know it (see `proof_type`).
+        access (Callable): The unchecked getter, or setter for modifiers.
+        modifier (bool): Whether the procedure is a modifier.
+    """
+    record: type
+    type: Exp
+    access: Callable
+    modifier: bool
+
+
+FIELDS: Dict[Callable, Field] = {}
+"""The fields of record accessors and modifiers; filled by `lispy.records`."""
+
+
+class Inferred(NamedTuple):
+    """
+    A type proven at compile time.
+
+    Attributes:
+        type (Any): The type symbol, or the class of a record type.
+        deps (FrozenSet[Symbol]): The global names whose bindings the proof relies on.
+        params (Optional[Exp]): The parameter list, for lambda expressions.
+    """
+    type: Any
+    deps: FrozenSet[Symbol]
+    params: Optional[Exp] = None
+
+
+Result = Tuple[Exp, Optional[Inferred]]
+
+
+def returns(type_sym: str) -> Callable[[List[Optional[str]]], Optional[str]]:
+    """
+    Return the result type rule of a primitive that always returns type_sym.
+    """
+    return lambda types: type_sym
+
+
+def numeric_type(types: List[Optional[str]]) -> Optional[str]:
+    """
+    Return the result type of +, - and *: int for ints, float if any argument is a float.
+    """
+    if not all(t == 'int' or t == 'float' for t in types):
+        return None
+    return 'float' if 'float' in types else 'int'
+
+
+def quotient_type(types: List[Optional[str]]) -> Optional[str]:
+    """
+    Return the result type of /, which is always a float for numbers.
+    """
+    return 'float' if numeric_type(types) else None
+
+
+def comparison_type(types: List[Optional[str]]) -> Optional[str]:
+    """
+    Return the result type of comparisons: bool, when the types of the arguments are known.
+    """
+    return 'bool' if all(types) else None
+
+
+def sequence_type(types: List[Optional[str]]) -> Optional[str]:
+    """
+    Return the result type of cdr: the type of its list or string argument.
+    """
+    return types[0] if types in (['list'], ['str']) else None
+
+
+def value_type(value: Any) -> Optional[str]:
+    """
+    Return the type symbol a value satisfies, if any.
+    """
+    return next((type_sym for type_sym in TYPE_MAPPING if check_type(value, type_sym)), None)
+
+
+def proof_type(type_exp: Exp, env: Env) -> Any:
+    """
+    Return the type proofs track for an annotation, if any.
+
+    Record types are tracked by class rather than by name, so that the
+    records of a record type and those of a later one of the same name are
+    not confused. Type expressions such as (list-of int) and unions are
+    always checked at run time.
+
+    Args:
+        type_exp (Exp): The annotation.
+        env (Env): The environment its record types are looked up in.
+
+    Returns:
+        Any: The type symbol, or the record class; None if the type is not tracked.
+    """
+    if not isinstance(type_exp, Symbol):
+        return None
+    elif type_exp in TYPE_MAPPING or type_exp == PROCEDURE:
+        return type_exp
+    return env.find_type(type_exp)
+
+
+def _type_name(type_sym: Any) -> str:
+    """
+    Return the printed form of a tracked type, for error messages.
+
+    Record types are printed by name, and the others as annotations (see `type_name`).
+    """
+    return type_sym.type_name if isinstance(type_sym, type) else type_name(type_sym)
+
+
+def annotations(params: Exp) -> Optional[List[Optional[Symbol]]]:
+    """
+    Return the type annotation of each parameter of a lambda expression.
+
+    Args:
+        params (Exp): The parameter list.
+
+    Returns:
+        Optional[List[Optional[Symbol]]]: The type of each parameter, or None if
+            it is not annotated; None for variadic procedures.
+    """
+    if isinstance(params, Symbol):
+        return None
+    types, i = [], 0
+    while i < len(params):
+        annotated = i + 2 < len(params) and params[i + 1] == TYPE_ANNOTATION_CHAR
+        types.append(params[i + 2] if annotated else None)
+        i += 3 if annotated else 1
+    return types
+
+
+def _declared(x: Exp, env: Env) -> Optional[Inferred]:
+    """
+    Return the type a define expression gives its variable, known before the value is computed.
+    """
+    type_sym = proof_type(x[3], env) if len(x) == 5 and x[2] == TYPE_ANNOTATION_CHAR else None
+    if type_sym is not None:
+        return Inferred(type_sym, NO_DEPS)
+    value = x[-1]
+    if is_pair(value) and value[0] is _lambda:
+        return Inferred(PROCEDURE, NO_DEPS, value[1])
+    return None
+
+
+def _frame_defines(body: Exp) -> List[Exp]:
+    """
+    Collect the define expressions evaluated in the frame of a body.
+
+    Binding forms create their own frame and are not searched.
+    """
+    defines, stack = [], [body]
+    while stack:
+        x = stack.pop()
+        if not is_pair(x) or x[0] is _quote or (isinstance(x[0], Symbol) and x[0] in BINDING_FORMS):
+            continue
+        elif x[0] is _define:
+            defines.append(x)
+        stack.extend(x)
+    return defines
+
+
+def _unstable(x: Exp) -> Set[Symbol]:
+    """
+    Collect the names a program assigns with set! or dynamic-let, or defines more than once.
+    """
+    assigned, defined = set(), set()
+    stack = [x]
+    while stack:
+        x = stack.pop()
+        if not is_pair(x) or x[0] is _quote:
+            continue
+        op = x[0]
+        if op is _set:
+            assigned.add(x[1])
+        elif op is _dynamic_let:
+            assigned.update(b[0] for b in x[1])
+        elif op is _define:
+            if x[1] in defined:
+                assigned.add(x[1])
+            defined.add(x[1])
+        stack.extend(x)
+        if isinstance(x, OptimizedExp):
+            stack.append(x.original)
+    return assigned
+
+
+class Scope:
+    """
+    The lexical context of type inference.
+
+    Attributes:
+        env (Env): The global environment the code will run in.
+        unstable (Set[Symbol]): Names whose type may change after they are bound.
+        bindings (Dict[Symbol, List[Optional[Inferred]]]): The types of the lexical variables in scope.
+        globals (Dict[Symbol, Optional[Inferred]]): The procedures the program defines at top level.
+        loops (Dict[Symbol, List[List[List[Optional[Inferred]]]]]): The types passed by the
+            #%recur expressions of the #%loop forms being inferred, by loop name.
+        speculating (int): Whether types are assumed, in which case errors are not reported.
+    """
+    def __init__(self, env: Env, unstable: Set[Symbol]) -> None:
+        self.env = env
+        self.tracked = isinstance(env, GlobalEnv)
+        self.unstable = unstable
+        self.bindings: Dict[Symbol, List[Optional[Inferred]]] = {}
+        self.globals: Dict[Symbol, Optional[Inferred]] = {}
+        self.loops: Dict[Symbol, List[List[List[Optional[Inferred]]]]] = {}
+        self.speculating = 0
+
+    def bind(self, names: List[Symbol], types: Optional[List[Optional[Inferred]]] = None) -> None:
+        """
+        Enter a scope binding names, with their types if known.
+        """
+        for i, name in enumerate(names):
+            known = types[i] if types and name not in self.unstable else None
+            self.bindings.setdefault(name, []).append(known)
+
+    def unbind(self, names: List[Symbol]) -> None:
+        """
+        Leave the scope entered by `bind`.
+        """
+        for name in names:
+            stack = self.bindings[name]
+            stack.pop()
+            if not stack:
+                del self.bindings[name]
+
+    def bind_defines(self, defines: List[Exp], toplevel: bool = False) -> List[Symbol]:
+        """
+        Bind the variables defined in a frame, with the type their define gives them.
+
+        Returns:
+            List[Symbol]: The variables, to unbind when the frame is left.
+        """
+        names = [x[1] for x in defines]
+        types = [_declared(x, self.env) for x in defines]
+        if toplevel:
+            self.globals.update((name, t) for name, t in zip(names, types)
+                                if name not in self.unstable and t is not None and t.type == PROCEDURE)
+            return []
+        self.bind(names, types)
+        return names
+
+    def _global(self, name: Symbol) -> Any:
+        """
+        Return the value of a free name in the global environment, if it can be relied upon.
+        """
+        if (not self.tracked or name in self.bindings or name in self.globals
+                or name in self.unstable or name in self.env.assigned):
+            return None
+        return self.env.get(name)
+
+    def lookup(self, name: Symbol) -> Optional[Inferred]:
+        """
+        Return the type of a variable, if proven.
+
+        The values of global variables may change between programs, so only
+        the procedures they are bound to are known, by their parameter list.
+        """
+        stack = self.bindings.get(name)
+        if stack:
+            return stack[-1]
+        elif name in self.globals:
+            return self.globals[name]
+        proc = self._global(name)
+        if isinstance(proc, Procedure):
+            return Inferred(PROCEDURE, NO_DEPS, proc.signature)
+        return None
+
+    def rule(self, name: Symbol) -> Optional[Callable[[List[Optional[str]]], Optional[str]]]:
+        """
+        Return the result type rule of the primitive a name is bound to, if any.
+        """
+        try:
+            return RESULT_TYPES.get(self._global(name))
+        except TypeError:               # unhashable values are not primitives
+            return None
+
+    def operator(self, name: Symbol) -> Optional[Callable[[Any, Any], Any]]:
+        """
+        Return the binary operator that may replace the primitive a name is bound to, for numbers.
+        """
+        try:
+            return OPERATORS.get(self._global(name))
+        except TypeError:               # unhashable values are not primitives
+            return None
+
+    def field(self, name: Symbol) -> Optional[Field]:
+        """
+        Return the record field of the accessor or modifier a name is bound to, if any.
+        """
+        try:
+            return FIELDS.get(self._global(name))
+        except TypeError:               # unhashable values are not procedures
+            return None
+
+    def mismatch(self, x: Exp, expected: str, known: Inferred) -> None:
+        """
+        Report an expression whose type is known and wrong, unless types are only assumed.
+
+        Raises:
+            TypeMismatchError: Always, when not speculating.
+        """
+        if not self.speculating:
+            raise TypeMismatchError(ERR_STATIC_TYPE_MISMATCH.format(
+                to_string(x), _type_name(expected), _type_name(known.type)))
+
+    def guard(self, exp: List[Exp], original: List[Exp], deps: FrozenSet[Symbol]) -> Exp:
+        """
+        Make proven code that falls back to the original when a dependency is rebound.
+        """
+        if not deps:
+            return exp
+        node = OptimizedExp(exp, original, deps)
+        self.env.depend(deps, node)
+        return node
+
+
+def _deps(types: List[Optional[Inferred]]) -> FrozenSet[Symbol]:
+    """
+    Return the dependencies of several proofs.
+    """
+    return frozenset().union(*(t.deps for t in types if t is not None))
+
+
+def _child(x: Exp, scope: Scope) -> Tasks:
+    """
+    Infer the type of a sub-expression; lists are handled as a sub-task.
+
+    Returns:
+        Result: The expression, with its proven calls rewritten, and its type if proven.
+    """
+    if isinstance(x, Symbol):
+        return x, scope.lookup(x)
+    elif isinstance(x, list):
+        return (yield _infer(x, scope))
+    type_sym = value_type(x)
+    return x, type_sym and Inferred(type_sym, NO_DEPS)
+
+
+def _children(xs: List[Exp], scope: Scope) -> Tasks:
+    """
+    Infer the types of every expression of a list, in order.
+
+    Returns:
+        List[Result]: The results.
+    """
+    results = []
+    for x in xs:
+        results.append((yield from _child(x, scope)))
+    return results
+
+
+def _exps(results: List[Result]) -> List[Exp]:
+    """
+    Return the expressions of several results.
+    """
+    return [e for e, _ in results]
+
+
+def _merge(types: List[Optional[Inferred]], steps: List[List[Optional[Inferred]]]) -> List[Optional[Inferred]]:
+    """
+    Keep the types of loop variables that every iteration passes again.
+
+    Args:
+        types (List[Optional[Inferred]]): The assumed types of the variables.
+        steps (List[List[Optional[Inferred]]]): The types of the new values, for each iteration.
+
+    Returns:
+        List[Optional[Inferred]]: The types that hold, with the dependencies of the new values.
+    """
+    merged = []
+    for i, known in enumerate(types):
+        new = [step[i] for step in steps]
+        if known is None or any(t is None or t.type != known.type for t in new):
+            merged.append(None)
+        else:
+            merged.append(Inferred(known.type, known.deps | _deps(new)))
+    return merged
+
+
+def infer_quote(x: Exp, scope: Scope) -> Result:
+    """
+    Infer the type of a quote expression from its datum.
+    """
+    type_sym = value_type(x[1])
+    return x, type_sym and Inferred(type_sym, NO_DEPS)
+
+
+def infer_if(x: Exp, scope: Scope) -> Tasks:
+    """
+    Infer the type of an if expression: the type of both branches, when they agree.
+    """
+    results = yield from _children(x[1:], scope)
+    exp = [_if] + _exps(results)
+    branches = [known for _, known in results[1:]]
+    if len(branches) == 2 and None not in branches and branches[0].type == branches[1].type != PROCEDURE:
+        return exp, Inferred(branches[0].type, _deps(branches))
+    return exp, None
+
+
+def infer_set(x: Exp, scope: Scope) -> Tasks:
+    """
+    Infer the types in a set! expression.
+    """
+    value, _ = yield from _child(x[2], scope)
+    return [_set, x[1], value], None
+
+
+def infer_define(x: Exp, scope: Scope) -> Tasks:
+    """
+    Infer the types in a define expression, dropping the check of a typed define whose value is proven.
+
+    Raises:
+        TypeMismatchError: If the type of the value is known and differs from the annotation.
+    """
+    value, known = yield from _child(x[-1], scope)
+    exp = x[:-1] + [value]
+    type_sym = proof_type(x[3], scope.env) if len(x) == 5 else None
+    if type_sym is not None and known is not None:
+        if known.type != type_sym:
+            scope.mismatch(x, type_sym, known)
+            return exp, None
+        return scope.guard([_define, x[1], value], exp, known.deps), None
+    stack = scope.bindings.get(x[1])
+    if stack and stack[-1] is None and x[1] not in scope.unstable and known is not None:
+        stack[-1] = known
+    return exp, None
+
+
+def infer_lambda(x: Exp, scope: Scope) -> Tasks:
+    """
+    Infer the types in a lambda expression, whose annotated parameters have their type.
+    """
+    names = param_names(x[1])
+    types = [proof_type(t, scope.env) for t in annotations(x[1]) or [None]]
+    types = [None if t is None else Inferred(t, NO_DEPS) for t in types]
+    scope.bind(names, types)
+    defined = scope.bind_defines(_frame_defines(x[2]))
+    body, _ = yield from _child(x[2], scope)
+    scope.unbind(defined)
+    scope.unbind(names)
+    return [_lambda, x[1], body] + x[3:], Inferred(PROCEDURE, NO_DEPS, x[1])
+
+
+def infer_begin(x: Exp, scope: Scope) -> Tasks:
+    """
+    Infer the type of a begin expression: the type of its last subform.
+    """
+    if len(x) == 1:
+        return x, None
+    results = yield from _children(x[1:], scope)
+    return [_begin] + _exps(results), results[-1][1]
+
+
+def _loop_body(x: Exp, types: List[Optional[Inferred]], scope: Scope) -> Tasks:
+    """
+    Infer the types in the body of a let, named let or #%loop, with the types of its variables.
+
+    Returns:
+        Tuple[Result, List[List[Optional[Inferred]]]]: The body and its type, and
+            the types passed by each #%recur of a #%loop.
+    """
+    named = isinstance(x[1], Symbol)
+    names = [x[1]] if named else []
+    names_vars = [b[0] for b in x[-2]]
+    if x[0] is _loop:
+        scope.loops.setdefault(x[1], []).append([])
+    scope.bind(names)
+    scope.bind(names_vars, types)
+    defined = scope.bind_defines(_frame_defines(x[-1]))
+    result = yield from _child(x[-1], scope)
+    scope.unbind(defined)
+    scope.unbind(names_vars)
+    scope.unbind(names)
+    steps = []
+    if x[0] is _loop:
+        steps = scope.loops[x[1]].pop()
+        if not scope.loops[x[1]]:
+            del scope.loops[x[1]]
+    return result, steps
+
+
+def infer_let(x: Exp, scope: Scope) -> Tasks:
+    """
+    Infer the types in a let, named let or #%loop expression.
+
+    The variables of a plain let have the type of their value. The variables
+    of a #%loop keep the type of their initial value if every #%recur passes
+    a value of that type again: the body is inferred speculatively, with the
+    types assumed, until they are stable. The variables of a named let may be
+    rebound by any call and have no known type.
+
+    A loop nested in the body of a loop being speculated assumes no types for
+    its variables: speculating it again on every pass of the enclosing loop
+    would make the passes grow exponentially with the nesting depth. Its types
+    are proven in the final pass of the enclosing loop.
+    """
+    named = isinstance(x[1], Symbol)
+    inits = yield from _children([b[1] for b in x[-2]], scope)
+    types = None if named and x[0] is _let else [known for _, known in inits]
+    if x[0] is _loop and scope.speculating:
+        types = None
+    elif x[0] is _loop:
+        scope.speculating += 1
+        while any(types):
+            _, steps = yield from _loop_body(x, types, scope)
+            merged = _merge(types, steps)
+            if merged == types:
+                break
+            types = merged
+        scope.speculating -= 1
+    (body, known), _ = yield from _loop_body(x, types, scope)
+    bindings = [[b[0], init] for b, init in zip(x[-2], _exps(inits))]
+    return x[:-2] + [bindings, body], None if named else known
+
+
+def infer_letrec(x: Exp, scope: Scope) -> Tasks:
+    """
+    Infer the types in a letrec or letrec* expression; procedures are known before their value is computed.
+    """
+    (op, bindings, body) = x
+    names_vars = [b[0] for b in bindings]
+    scope.bind(names_vars, [_declared(b, scope.env) for b in bindings])
+    defined = scope.bind_defines(_frame_defines(body))
+    inits = yield from _children([b[1] for b in bindings], scope)
+    body, known = yield from _child(body, scope)
+    scope.unbind(defined)
+    scope.unbind(names_vars)
+    return [op, [[var, init] for var, init in zip(names_vars, _exps(inits))], body], known
+
+
+def _do_body(x: Exp, types: List[Optional[Inferred]], scope: Scope) -> Tasks:
+    """
+    Infer the types in the steps, test, results and command of a do loop, with the types of its variables.
+
+    Returns:
+        Tuple[List[Result], List[Result], Exp]: The steps, the test and results, and the command.
+    """
+    (_, bindings, test_and_result, command, _) = x
+    names_vars = [b[0] for b in bindings]
+    scope.bind(names_vars, types)
+    defined = scope.bind_defines(_frame_defines([test_and_result, command]))
+    steps = yield from _children([b[2] if len(b) == 3 else b[0] for b in bindings], scope)
+    test_and_result = yield from _children(test_and_result, scope)
+    command, _ = yield from _child(command, scope)
+    scope.unbind(defined)
+    scope.unbind(names_vars)
+    return steps, test_and_result, command
+
+
+def infer_do(x: Exp, scope: Scope) -> Tasks:
+    """
+    Infer the types in a do loop.
+
+    Its variables keep the type of their initial value if their step has the
+    same type; like for #%loop, this is found by speculative inference, which
+    is not nested.
+    """
+    (_, bindings, _, _, fresh) = x
+    inits = yield from _children([b[1] for b in bindings], scope)
+    types = None if scope.speculating else [known for _, known in inits]
+    if types is not None:
+        scope.speculating += 1
+        while any(types):
+            steps, _, _ = yield from _do_body(x, types, scope)
+            merged = _merge(types, [[known for _, known in steps]])
+            if merged == types:
+                break
+            types = merged
+        scope.speculating -= 1
+    steps, test_and_result, command = yield from _do_body(x, types, scope)
+    bindings = [[b[0], init] + ([step] if len(b) == 3 else [])
+                for b, init, (step, _) in zip(bindings, _exps(inits), steps)]
+    return [_do, bindings, _exps(test_and_result), command, fresh], None
+
+
+def infer_recur(x: Exp, scope: Scope) -> Tasks:
+    """
+    Infer the types in a #%recur expression, recording the types it passes to its loop.
+    """
+    args = yield from _children(x[2:], scope)
+    if x[1] in scope.loops:
+        scope.loops[x[1]][-1].append([known for _, known in args])
+    return x[:2] + _exps(args), None
+
+
+def infer_cond(x: Exp, scope: Scope) -> Tasks:
+    """
+    Infer the types in a cond expression.
+    """
+    clauses = []
+    for clause in x[1:]:
+        parts = _exps((yield from _children([e for e in clause if e is not _arrow], scope)))
+        if len(clause) == 3:
+            parts.insert(1, _arrow)
+        clauses.append(parts)
+    return [_cond] + clauses, None
+
+
+def infer_case(x: Exp, scope: Scope) -> Tasks:
+    """
+    Infer the types in a case expression.
+    """
+    (_, key, table, bodies, default) = x
+    key, _ = yield from _child(key, scope)
+    bodies = yield from _children(bodies, scope)
+    default, _ = yield from _child(default, scope)
+    return [_case, key, table, _exps(bodies), default], None
+
+
+def infer_children(x: Exp, scope: Scope) -> Tasks:
+    """
+    Infer the types in a special form whose operands are all expressions (try, when, unless).
+    """
+    return [x[0]] + _exps((yield from _children(x[1:], scope))), None
+
+
+def infer_cover(x: Exp, scope: Scope) -> Tasks:
+    """
+    Infer the type of a coverage probe: the type of its expression.
+    """
+    (exp, known), = yield from _children(x[-1:], scope)
+    return x[:-1] + [exp], known
+
+
+def infer_dynamic_let(x: Exp, scope: Scope) -> Tasks:
+    """
+    Infer the types in a dynamic-let expression.
+    """
+    (_, bindings, *body) = x
+    inits = yield from _children([b[1] for b in bindings], scope)
+    body = yield from _children(body, scope)
+    return [_dynamic_let, [[b[0], init] for b, init in zip(bindings, _exps(inits))]] + _exps(body), None
+
+
+def infer_call(x: Exp, scope: Scope) -> Tasks:
+    """
+    Infer the type of a procedure call.
+
+    A call of a primitive has the type its rule computes from the arguments.
+    A binary arithmetic or comparison primitive applied to numbers becomes an
+    `#%operator` that calls the Python operator directly, unless both are
+    literals (the optimizer did not fold the call because it raises). A call
+    of an annotated procedure whose annotated arguments are all proven becomes
+    a `#%typed-call`.
+
+    Raises:
+        TypeMismatchError: If the type of an argument is known and differs from the annotation.
+    """
+    results = yield from _children(x, scope)
+    exp, callee, args = _exps(results), results[0][1], [known for _, known in results[1:]]
+    rule = scope.rule(x[0]) if isinstance(x[0], Symbol) else None
+    if rule is not None:
+        type_sym = rule([known and known.type for known in args])
+        if type_sym is None:
+            return exp, None
+        deps = frozenset([x[0]]) | _deps(args)
+        operator = scope.operator(x[0])
+        numbers = len(args) == 2 and all(args) and numeric_type([known.type for known in args])
+        if operator is not None and numbers and any(isinstance(e, (Symbol, list)) for e in exp[1:]):
+            return scope.guard([_operator, operator] + exp[1:], exp, deps), Inferred(type_sym, deps)
+        return exp, Inferred(type_sym, deps)
+    field = scope.field(x[0]) if isinstance(x[0], Symbol) else None
+    if field is not None and len(args) == 1 + field.modifier:
+        return _infer_field(x, exp, args, field, scope)
+    types = annotations(callee.params) if callee is not None and callee.params is not None else None
+    if not types or not any(types) or len(types) != len(args):
+        return exp, None
+    proven = True
+    for type_exp, known in zip(types, args):
+        if type_exp is None or type_exp == ANY:
+            continue
+        type_sym = proof_type(type_exp, scope.env)
+        if type_sym is None or known is None:
+            proven = False
+        elif known.type != type_sym:
+            scope.mismatch(x, type_sym, known)
+            proven = False
+    if not proven:
+        return exp, None
+    return scope.guard([_typed_call, callee.params] + exp, exp, callee.deps | _deps(args)), None
+
+
+def _infer_field(x: Exp, exp: List[Exp], args: List[Optional[Inferred]], field: Field, scope: Scope) -> Result:
+    """
+    Infer the type of a call of a record accessor or modifier.
+
+    When the record is proven to be of the record class of the field, the
+    call becomes a `#%field-ref` or, if the value is proven to fit the field,
+    a `#%field-set!`, which access the slot without checks.
+
+    Raises:
+        TypeMismatchError: If the type of the record or of the value is known and wrong.
+    """
+    record, value = args[0], args[1] if field.modifier else None
+    if record is None:
+        return exp, None
+    elif record.type is not field.record:
+        scope.mismatch(x, field.record, record)
+        return exp, None
+    deps = frozenset([x[0]]) | _deps(args)
+    tracked = field.type is not None and field.type != ANY
+    if not field.modifier:
+        known = Inferred(field.type, deps) if tracked else None
+        return scope.guard([_field_ref, field.access, exp[1]], exp, deps), known
+    if field.type != ANY:
+        if not tracked or value is None:
+            return exp, None
+        elif value.type != field.type:
+            scope.mismatch(x, field.type, value)
+            return exp, None
+    return scope.guard([_field_set, field.access] + exp[1:], exp, deps), None
+
+
+def infer_operator(x: Exp, scope: Scope) -> Tasks:
+    """
+    Infer the types in an #%operator or record field expression made earlier (in an inlined body).
+    """
+    return x[:2] + _exps((yield from _children(x[2:], scope))), None
+
+
+def infer_typed_call(x: Exp, scope: Scope) -> Tasks:
+    """
+    Infer the type of a call proven earlier (in an inlined body): it is proven again.
+    """
+    return (yield from infer_call(x[2:], scope))
+
+
+INFERRERS = {
+    _quote: infer_quote,
+    _if: infer_if,
+    _set: infer_set,
+    _define: infer_define,
+    _lambda: infer_lambda,
+    _begin: infer_begin,
+    _try: infer_children,
+    _dynamic_let: infer_dynamic_let,
+    _let: infer_let,
+    _loop: infer_let,
+    _recur: infer_recur,
+    _letrec: infer_letrec,
+    _letrec_star: infer_letrec,
+    _do: infer_do,
+    _cond: infer_cond,
+    _case: infer_case,
+    _when: infer_children,
+    _unless: infer_children,
+    _typed_call: infer_typed_call,
+    _operator: infer_operator,
+    _field_ref: infer_operator,
+    _field_set: infer_operator,
+    _cover: infer_cover,
+}
+
+
+def _infer(x: List[Exp], scope: Scope) -> Tasks:
+    """
+    Task that infers the type of a compound expression.
+
+    Special forms without an inferrer are left unchanged. Guarded nodes are
+    rebuilt with the same dependencies.
+
+    Args:
+        x (List[Exp]): The expression.
+        scope (Scope): The lexical context.
+
+    Returns:
+        Result: The expression, with its proven calls rewritten, and its type if proven.
+    """
+    op = x[0] if x else None
+    if isinstance(op, Symbol) and op in SPECIAL_FORMS:
+        if op not in INFERRERS:
+            return x, None
+        result = INFERRERS[op](x, scope)
+        if isinstance(result, GeneratorType):
+            result = yield from result
+    else:
+        result = yield from infer_call(x, scope)
+    if isinstance(x, OptimizedExp):
+        exp, known = result
+        node = OptimizedExp(exp, x.original, x.deps | getattr(exp, 'deps', NO_DEPS))
+        scope.env.depend(node.deps, node)
+        return node, known and Inferred(known.type, known.deps | x.deps, known.params)
+    return result
+
+
+def infer_types(x: Exp, env: Optional[Env] = None) -> Exp:
+    """
+    Prove the type annotations of an optimized program.
+
+    Args:
+        x (Exp): The optimized program.
+        env (Optional[Env]): The global environment it will run in. Defaults to global_env.
+
+    Returns:
+        Exp: The program, with the checks of its proven calls and defines removed.
+
+    Raises:
+        TypeMismatchError: If a value of a known type is passed where another type is expected.
+    """
+    scope = Scope(global_env if env is None else env, _unstable(x))
+    scope.bind_defines(_frame_defines(x), toplevel=True)
+    return run_tasks(_child(x, scope))[0]
@@ -0,0 +1,272 @@
+"""
+Isolated interpreters.
+
+An `Interpreter` is a Lispy world of its own: a global environment with its
+bindings and macros, an output port, and runtime counters. Programs run by
+one interpreter do not see the definitions, macros or redefined primitives
+of another, so a process can host many of them, such as one sandbox per
+tenant, each in its own thread if needed:
+
+    >>> a, b = Interpreter(), Interpreter()
+    >>> a.run('(define x 1) (define-syntax twice (syntax-rules () ((_ e) (begin e e))))')
+    >>> b.run('(define x 2)')
+    >>> a.run('x'), b.run('x')
+    (1, 2)
+
+The functions of the `lispy` package (`lispy.eval`, `lispy.parse`,
+`lispy.load`, `lispy.repl`) run in the default interpreter, `DEFAULT`,
+whose environment is `lispy.global_env`.
+
+An interpreter can also be forked (see `Interpreter.fork`): the fork starts
+with every definition and macro of its base, in constant time, so a base
+loaded once with a library can serve many short-lived sandboxes:
+
+    >>> base = Interpreter()
+    >>> base.run('(define (square x) (* x x))')
+    >>> sandbox = base.fork()
+    >>> sandbox.run('(define x 3) (square x)')
+    9
+
+What interpreters share is what cannot carry definitions: the primitives
+themselves, interned symbols (special forms are recognized by identity),
+and the process-wide tools (coverage, the sampler). Evaluator hooks, such
+as profilers, are installed in one interpreter (see `Interpreter.add_hook`).
+Record types are defined in the global environment that creates them, and
+seen by its forks.
+"""
+import io
+import sys
+from contextvars import Token
+from typing import Any, Callable, Dict, List, Optional, TextIO, Tuple, Union
+
+from . import evaluator
+from .counters import COUNTERS, CURRENT_COUNTERS, Counters, lispy_stats, stats
+from .env import CURRENT_ENV, GlobalEnv, global_env
+from .errors import SymbolNotFoundError
+from .evaluator import CURRENT_HOOKS, HOOKS, Hook, add_hook, remove_hook
+from .macros import BUILTIN_MACROS
+from .messages import PROMPT
+from .modules import Libraries
+from .parser import InPort
+from .primitives import add_globals, fork_globals
+from .repl import load, locate, parse, repl
+from .types import EOF_OBJECT, Exp, Symbol, get_symbol
+
+
+def populate(env: GlobalEnv, out: Optional[TextIO] = None) -> GlobalEnv:
+    """
+    Add the built-in macros and the primitives to a global environment.
+
+    Args:
+        env (GlobalEnv): The environment.
+        out (Optional[TextIO]): The output port of the primitives. Defaults to sys.stdout.
+
+    Returns:
+        GlobalEnv: The environment.
+    """
+    env.macros.update(BUILTIN_MACROS)
+    add_globals(env, out)
+    return env
+
+
+class Interpreter:
+    """
+    A Lispy interpreter, isolated from the others.
+
+    The libraries it imports (see `lispy.modules`) are instantiated once,
+    whichever of its programs or libraries imports them first; its forks
+    share them.
+
+    Its counters count the events of the code it runs through its methods
+    (`eval`, `run`, `load`, `repl`), including code called back from Python
+    meanwhile, in the thread running it: they are the current counters of
+    that thread while it runs (see `lispy.counters.CURRENT_COUNTERS`), so the
+    events of other threads are not counted. Code it runs that starts threads
+    of its own is not counted in them either. Those of the default
+    interpreter count the code no other interpreter runs. Its hooks are
+    told of the same events.
+
+    Attributes:
+        env (GlobalEnv): The global environment, with the macros.
+        out (Optional[TextIO]): The output port of display, write and the reports of profile, time and
+            bench. None for sys.stdout.
+        counters (Counters): The runtime counters.
+        hooks (List[Hook]): The evaluator hooks installed in it.
+    """
+    def __init__(self, out: Optional[TextIO] = None, env: Optional[GlobalEnv] = None,
+                 counters: Optional[Counters] = None, path: Optional[List[str]] = None,
+                 hooks: Optional[List[Hook]] = None) -> None:
+        """
+        Initialize an interpreter with the primitives and the prelude.
+
+        Args:
+            out (Optional[TextIO]): The output port. Defaults to sys.stdout.
+            env (Optional[GlobalEnv]): The global environment to populate. Defaults to a new one.
+            counters (Optional[Counters]): The counters to count in. Defaults to new ones.
+            path (Optional[List[str]]): The directories to look for library files in (see
+                `lispy.modules.Libraries`). Defaults to the current directory and LISPY_PATH.
+            hooks (Optional[List[Hook]]): The list of its evaluator hooks. Defaults to a new one.
+        """
+        env = populate(GlobalEnv() if env is None else env, out)
+        env.libraries = Libraries(lambda: populate(GlobalEnv(), out), out, path)
+        self._attach(env, out, counters, hooks)
+
+    def _attach(self, env: GlobalEnv, out: Optional[TextIO], counters: Optional[Counters],
+                hooks: Optional[List[Hook]] = None) -> None:
+        self.env = env
+        self.out = out
+        self.counters = Counters() if counters is None else counters
+        self.hooks: List[Hook] = [] if hooks is None else hooks
+        env[get_symbol('lispy-stats')] = lambda: lispy_stats(self.counters)
+
+    def fork(self, out: Optional[TextIO] = None) -> 'Interpreter':
+        """
+        Return an interpreter whose environment is a fork of this one (see `GlobalEnv.fork`).
+
+        The fork starts with the definitions and macros of this interpreter,
+        in constant time, and its own definitions, assignments and macros do
+        not change them, even those made by procedures of this interpreter
+        it calls. It sees what this interpreter defines or assigns later, for
+        the names it does not bind itself.
+
+        Args:
+            out (Optional[TextIO]): The output port of the fork. Defaults to sys.stdout.
+
+        Returns:
+            Interpreter: The fork, with new counters and no hooks.
+        """
+        fork = Interpreter.__new__(Interpreter)
+        fork._attach(fork_globals(self.env, out), out, None)
+        return fork
+
+    @property
+    def libraries(self) -> Libraries:
+        """
+        The libraries declared, found or instantiated.
+        """
+        return self.env.libraries
+
+    @property
+    def macros(self) -> Dict[Symbol, Callable]:
+        """
+        The macro transformers, by name.
+        """
+        return self.env.macros
+
+    def __getitem__(self, name: str) -> Any:
+        """
+        Return the value of a global variable.
+        """
+        var = get_symbol(name)
+        return self.env.find(var)[var]
+
+    def __setitem__(self, name: str, value: Any) -> None:
+        """
+        Define a global variable, such as a Python function for the programs to call.
+        """
+        self.env[get_symbol(name)] = value
+
+    def __contains__(self, name: str) -> bool:
+        """
+        Return whether a global variable is defined.
+        """
+        try:
+            self.env.find(get_symbol(name))
+        except SymbolNotFoundError:
+            return False
+        return True
+
+    def _enter(self) -> Tuple[Token, Token, Token]:
+        return CURRENT_COUNTERS.set(self.counters), CURRENT_HOOKS.set(self.hooks), CURRENT_ENV.set(self.env)
+
+    def _exit(self, tokens: Tuple[Token, Token, Token]) -> None:
+        CURRENT_COUNTERS.reset(tokens[0])
+        CURRENT_HOOKS.reset(tokens[1])
+        CURRENT_ENV.reset(tokens[2])
+
+    def add_hook(self, hook: Hook) -> None:
+        """
+        Install an evaluator hook, such as a profiler, told of the events of the code this interpreter runs.
+        """
+        add_hook(hook, self.hooks)
+
+    def remove_hook(self, hook: Hook) -> None:
+        """
+        Remove an evaluator hook installed with `add_hook`.
+        """
+        remove_hook(hook, self.hooks)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Return the counters (see `lispy.counters.stats`).
+        """
+        return stats(self.counters)
+
+    def reset_stats(self) -> None:
+        """
+        Set the counters to zero.
+        """
+        self.counters.reset()
+
+    def parse(self, source: Union[str, InPort]) -> Exp:
+        """
+        Parse the next expression of a program for this interpreter (see `lispy.repl.parse`).
+        """
+        return parse(source, self.env)
+
+    def eval(self, x: Exp) -> Any:
+        """
+        Evaluate a parsed expression in the global environment, with the evaluator hooks installed.
+        """
+        tokens = self._enter()
+        try:
+            return evaluator.eval(x, self.env)
+        finally:
+            self._exit(tokens)
+
+    def run(self, source: Union[str, InPort]) -> Any:
+        """
+        Evaluate a program.
+
+        Args:
+            source (Union[str, InPort]): The program, or a port to read it from.
+
+        Returns:
+            Any: The value of the last expression.
+        """
+        inport = InPort(io.StringIO(source)) if isinstance(source, str) else source
+        val = None
+        tokens = self._enter()
+        try:
+            while True:
+                x = parse(inport, self.env)
+                if x is EOF_OBJECT:
+                    return val
+                val = evaluator.eval(x, self.env)
+                locate(x, (inport.name, inport.datum_line), self.env)
+        finally:
+            self._exit(tokens)
+
+    def load(self, filename: str) -> None:
+        """
+        Evaluate every expression of a file, exiting on the first error (see `lispy.repl.load`).
+        """
+        tokens = self._enter()
+        try:
+            load(filename, self.env)
+        finally:
+            self._exit(tokens)
+
+    def repl(self, prompt: str = PROMPT, inport: Optional[InPort] = None) -> None:
+        """
+        Run a read-eval-print loop, printing the values to the output port (see `lispy.repl.repl`).
+        """
+        tokens = self._enter()
+        try:
+            repl(prompt, inport, sys.stdout if self.out is None else self.out, env=self.env)
+        finally:
+            self._exit(tokens)
+
+
+DEFAULT = Interpreter(env=global_env, counters=COUNTERS, hooks=HOOKS)
+"""The interpreter of the functions of the package, in global_env."""
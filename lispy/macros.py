@@ -3,44 +3,107 @@ Macro expansion module.
 
 This module handles the expansion of macros and special forms before evaluation.
 It includes the `expand` function and handlers for various special forms.
+
+Expansion does not recurse on the Python stack. Each special form handler is a
+generator that yields sub-tasks (generators produced by `_expand` or
+`_quasiquote`) and receives their results back; `run_tasks` drives these tasks
+with an explicit stack, so arbitrarily deep programs expand in linear time.
 """
-from .constants import TYPE_ANNOTATION_CHAR
+from contextvars import ContextVar
+from types import GeneratorType
+from typing import Any, Dict, Generator, List, Optional, Tuple
+
+from .constants import ANY_TYPE, DEFAULT_BENCH_ITERATIONS, DEFAULT_BENCH_WARMUP, TYPE_ANNOTATION_CHAR
+from .counters import CURRENT_COUNTERS
+from .env import GlobalEnv, global_env
 from .errors import SchemeSyntaxError
-from .evaluator import eval
+from .evaluator import CURRENT_HOOKS, case_key, eval
 from .messages import (
+    ERR_BENCH_OPTION,
     ERR_CANT_SPLICE,
+    ERR_DEFINE_LIBRARY_TOPLEVEL,
     ERR_DEFINE_MACRO_TOPLEVEL,
     ERR_DEFINE_SYMBOL,
+    ERR_DEFINE_SYNTAX_TOPLEVEL,
+    ERR_ELSE_NOT_LAST,
     ERR_ILLEGAL_BINDING,
+    ERR_ILLEGAL_CLAUSE,
     ERR_ILLEGAL_LAMBDA,
+    ERR_IMPORT_TOPLEVEL,
     ERR_MACRO_PROCEDURE,
+    ERR_NO_LIBRARIES,
+    ERR_RECORD_TYPE,
     ERR_SET_SYMBOL,
     ERR_WRONG_LENGTH,
 )
 from .parser import to_string
+from .patterns import compile_match
+from .syntax_rules import SyntaxRules
 from .types import (
     Exp,
     Symbol,
+    _and,
     _append,
+    _arrow,
     _begin,
-    _cons,
+    _bench,
+    _bench_call,
+    _case,
+    _cond,
     _define,
+    _define_library,
+    _define_record_type,
     _definemacro,
+    _definesyntax,
     _delay,
     _do,
     _dynamic_let,
+    _else,
     _if,
+    _import,
+    _iterations_keyword,
     _lambda,
     _let,
+    _letrec,
+    _letrec_star,
+    _list,
+    _list_star,
+    _loop,
     _make_promise,
+    _make_record_type,
+    _match,
+    _or,
+    _profile,
+    _profile_call,
     _quasiquote,
     _quote,
+    _record_accessor,
+    _record_constructor,
+    _record_modifier,
+    _record_predicate,
+    _recur,
     _set,
+    _time,
+    _time_call,
     _try,
+    _unless,
     _unquote,
     _unquotesplicing,
+    _warmup_keyword,
+    _when,
+    gensym,
 )
 
+Tasks = Generator[Exp, Exp, Exp]
+
+EXPANSION_ENV: ContextVar[GlobalEnv] = ContextVar('expansion_env', default=global_env)
+"""The global environment of the program being expanded (see `expand`): its macros are expanded,
+and the transformers of define-macro are evaluated in it.
+"""
+
+LOCATING: List[Dict[int, Tuple[int, Exp]]] = []
+"""The positions of the programs being expanded with positions (see `expand`), innermost last."""
+
 
 def is_pair(x: Exp) -> bool:
     """
@@ -86,7 +149,7 @@ def expand_quote(x: Exp, toplevel: bool) -> Exp:
     return x
 
 
-def expand_if(x: Exp, toplevel: bool) -> Exp:
+def expand_if(x: Exp, toplevel: bool) -> Tasks:
     """
     Expand an if expression.
 
@@ -100,10 +163,10 @@ def expand_if(x: Exp, toplevel: bool) -> Exp:
     if len(x) == 3:
         x = x + [None]
     require(x, len(x) == 4)
-    return list(map(expand, x))
+    return (yield from _expand_all(x))
 
 
-def expand_set(x: Exp, toplevel: bool) -> Exp:
+def expand_set(x: Exp, toplevel: bool) -> Tasks:
     """
     Expand a set! expression.
 
@@ -117,10 +180,10 @@ def expand_set(x: Exp, toplevel: bool) -> Exp:
     require(x, len(x) == 3)
     var = x[1]
     require(x, isinstance(var, Symbol), ERR_SET_SYMBOL.format(to_string(var)))
-    return [_set, var, expand(x[2])]
+    return [_set, var, (yield _expand(x[2]))]
 
 
-def expand_define(x: Exp, toplevel: bool) -> Exp:
+def expand_define(x: Exp, toplevel: bool) -> Tasks:
     """
     Expand a define expression.
 
@@ -135,27 +198,49 @@ def expand_define(x: Exp, toplevel: bool) -> Exp:
     _def, v, body = x[0], x[1], x[2:]
     if isinstance(v, list) and v:
         f, args = v[0], v[1:]
-        return expand([_def, f, [_lambda, args] + body], toplevel)
+        return (yield _expand([_def, f, [_lambda, args] + body], toplevel))
     else:
         if len(x) == 5 and x[2] == TYPE_ANNOTATION_CHAR:
             # Typed definition: (define var :: type exp)
             require(x, isinstance(v, Symbol), ERR_DEFINE_SYMBOL.format(to_string(v)))
-            exp = expand(x[4])
-            return [_define, v, TYPE_ANNOTATION_CHAR, x[3], exp]
+            exp = yield _expand(x[4])
+            return [_define, v, x[2], x[3], exp]
 
         require(x, len(x) == 3)
         require(x, isinstance(v, Symbol), ERR_DEFINE_SYMBOL.format(to_string(v)))
-        exp = expand(x[2])
+        exp = yield _expand(x[2])
         if _def is _definemacro:
             require(x, toplevel, ERR_DEFINE_MACRO_TOPLEVEL)
-            proc = eval(exp)
+            env = EXPANSION_ENV.get()
+            proc = eval(exp, env)
             require(x, callable(proc), ERR_MACRO_PROCEDURE.format(to_string(proc)))
-            macro_table[v] = proc
+            env.define_macro(v, proc)
             return None
         return [_define, v, exp]
 
 
-def expand_begin(x: Exp, toplevel: bool) -> Exp:
+def expand_define_syntax(x: Exp, toplevel: bool) -> Exp:
+    """
+    Expand a define-syntax expression.
+
+    (define-syntax name (syntax-rules (literal ...) (pattern template) ...))
+    compiles the rules and registers the transformer in the macro table.
+
+    Args:
+        x (Exp): The expression.
+        toplevel (bool): Whether it's at the top level.
+
+    Returns:
+        Exp: None, the definition takes effect during expansion.
+    """
+    require(x, len(x) == 3)
+    require(x, isinstance(x[1], Symbol), ERR_DEFINE_SYMBOL.format(to_string(x[1])))
+    require(x, toplevel, ERR_DEFINE_SYNTAX_TOPLEVEL)
+    EXPANSION_ENV.get().define_macro(x[1], SyntaxRules(x[1], x[2]))
+    return None
+
+
+def expand_begin(x: Exp, toplevel: bool) -> Tasks:
     """
     Expand a begin expression.
 
@@ -169,10 +254,29 @@ def expand_begin(x: Exp, toplevel: bool) -> Exp:
     if len(x) == 1:
         return None
     else:
-        return [expand(xi, toplevel) for xi in x]
+        return (yield from _expand_all(x, toplevel))
 
 
-def expand_lambda(x: Exp, toplevel: bool) -> Exp:
+def param_names(params: Exp) -> List[Symbol]:
+    """
+    Return the variables bound by a lambda parameter list, without type annotations.
+
+    Args:
+        params (Exp): The parameter list, or a single symbol for variadic procedures.
+
+    Returns:
+        List[Symbol]: The variables.
+    """
+    if isinstance(params, Symbol):
+        return [params]
+    names, i = [], 0
+    while i < len(params):
+        names.append(params[i])
+        i += 3 if i + 1 < len(params) and params[i + 1] == TYPE_ANNOTATION_CHAR else 1
+    return names
+
+
+def expand_lambda(x: Exp, toplevel: bool) -> Tasks:
     """
     Expand a lambda expression.
 
@@ -185,16 +289,21 @@ def expand_lambda(x: Exp, toplevel: bool) -> Exp:
     """
     require(x, len(x) >= 3)
     vars, body = x[1], x[2:]
-    require(x, (isinstance(vars, list) and all(isinstance(v, Symbol) for v in vars))
+    # Type expressions such as (list-of int) may follow a '::'
+    require(x, (isinstance(vars, list) and all(isinstance(v, Symbol) or (i > 0 and vars[i - 1] == TYPE_ANNOTATION_CHAR)
+                                               for i, v in enumerate(vars)))
             or isinstance(vars, Symbol), ERR_ILLEGAL_LAMBDA.format(to_string(vars)))
     exp = body[0] if len(body) == 1 else [_begin] + body
-    return [_lambda, vars, expand(exp)]
+    return [_lambda, vars, (yield _expand(exp))]
 
 
-def expand_quasiquote_macro(x: Exp, toplevel: bool) -> Exp:
+def expand_quasiquote_macro(x: Exp, toplevel: bool) -> Tasks:
     """
     Expand a quasiquote expression.
 
+    The construction code is expanded in turn, so that macros used inside
+    unquoted expressions are expanded too.
+
     Args:
         x (Exp): The expression.
         toplevel (bool): Whether it's at the top level.
@@ -203,10 +312,11 @@ def expand_quasiquote_macro(x: Exp, toplevel: bool) -> Exp:
         Exp: The expanded expression.
     """
     require(x, len(x) == 2)
-    return expand_quasiquote(x[1])
+    exp = yield _quasiquote(x[1])
+    return (yield _expand(exp))
 
 
-def expand_try(x: Exp, toplevel: bool) -> Exp:
+def expand_try(x: Exp, toplevel: bool) -> Tasks:
     """
     Expand a try expression.
 
@@ -218,10 +328,10 @@ def expand_try(x: Exp, toplevel: bool) -> Exp:
         Exp: The expanded expression.
     """
     require(x, len(x) == 3)
-    return [_try, expand(x[1], toplevel), expand(x[2], toplevel)]
+    return [_try, (yield _expand(x[1], toplevel)), (yield _expand(x[2], toplevel))]
 
 
-def expand_dynamic_let(x: Exp, toplevel: bool) -> Exp:
+def expand_dynamic_let(x: Exp, toplevel: bool) -> Tasks:
     """
     Expand a dynamic-let expression.
 
@@ -234,33 +344,582 @@ def expand_dynamic_let(x: Exp, toplevel: bool) -> Exp:
     """
     require(x, len(x) >= 3)
     bindings, body = x[1], x[2:]
-    require(x, isinstance(bindings, list), ERR_ILLEGAL_BINDING.format(to_string(bindings)))
+    _check_bindings(x, bindings)
+    expanded_bindings = []
     for b in bindings:
-        require(
-            x,
-            isinstance(b, list) and len(b) == 2 and isinstance(b[0], Symbol),
-            ERR_ILLEGAL_BINDING.format(to_string(b))
-        )
-    expanded_bindings = [[b[0], expand(b[1], toplevel)] for b in bindings]
-    expanded_body = [expand(e, toplevel) for e in body]
+        expanded_bindings.append([b[0], (yield _expand(b[1], toplevel))])
+    expanded_body = yield from _expand_all(body, toplevel)
     return [_dynamic_let, expanded_bindings] + expanded_body
 
 
+def _check_bindings(x: Exp, bindings: Exp, sizes: range = range(2, 3)) -> None:
+    """
+    Check a binding list of the form ((var exp ...) ...).
+
+    Args:
+        x (Exp): The whole form, for error messages.
+        bindings (Exp): The binding list.
+        sizes (range): Allowed lengths of a single binding.
+
+    Raises:
+        SchemeSyntaxError: If a binding is malformed.
+    """
+    if not isinstance(bindings, list):
+        require(x, False, ERR_ILLEGAL_BINDING.format(to_string(bindings)))
+    for b in bindings:
+        if not (isinstance(b, list) and len(b) in sizes and isinstance(b[0], Symbol)):
+            require(x, False, ERR_ILLEGAL_BINDING.format(to_string(b)))
+
+
+def _body(body: List[Exp]) -> Exp:
+    """
+    Turn a body (a list of expressions) into a single expression.
+    """
+    return body[0] if len(body) == 1 else [_begin] + body
+
+
+def _subforms(x: Exp) -> Optional[Tuple[List[Exp], List[Exp], List[Symbol]]]:
+    """
+    Describe the sub-expressions of an expanded form for loop analysis.
+
+    Args:
+        x (Exp): An expanded compound expression.
+
+    Returns:
+        Optional[Tuple[List[Exp], List[Exp], List[Symbol]]]: The sub-expressions
+        not in tail position, those in tail position, and the variables the
+        form binds or assigns; None if the form creates a closure.
+    """
+    op = x[0]
+    if op is _quote:
+        return [], [], []
+    elif op is _if:
+        return [x[1]], x[2:], []
+    elif op is _begin:
+        return x[1:-1], x[-1:], []
+    elif op is _lambda or (op is _let and isinstance(x[1], Symbol)):
+        return None
+    elif op is _let or op is _letrec or op is _letrec_star:
+        return [b[1] for b in x[1]], [x[2]], [b[0] for b in x[1]]
+    elif op is _loop:
+        return [b[1] for b in x[2]], [x[3]], [x[1]] + [b[0] for b in x[2]]
+    elif op is _recur:
+        return x[2:], [], []
+    elif op is _do:
+        if x[4]:
+            return None
+        (_, bindings, (test, *results), command, _) = x
+        nontail = [b[i] for b in bindings for i in range(1, len(b))] + [test, command] + results[:-1]
+        return nontail, results[-1:], [b[0] for b in bindings]
+    elif op is _cond:
+        nontail = [c[0] for c in x[1:]] + [c[2] for c in x[1:] if len(c) == 3]
+        return nontail, [c[1] for c in x[1:] if len(c) == 2], []
+    elif op is _when or op is _unless:
+        return [x[1]], [x[2]], []
+    elif op is _case:
+        return [x[1]], x[3] + [x[4]], []
+    elif op is _define or op is _set:
+        return [x[-1]], [], [x[1]]
+    elif op is _dynamic_let:
+        return [b[1] for b in x[1]] + x[2:], [], [b[0] for b in x[1]]
+    return x, [], []
+
+
+def _creates_closures(xs: List[Exp]) -> bool:
+    """
+    Check whether evaluating expanded expressions may create a closure.
+
+    Args:
+        xs (List[Exp]): The expressions.
+
+    Returns:
+        bool: True if some sub-expression creates a procedure or a promise.
+    """
+    stack = list(xs)
+    while stack:
+        x = stack.pop()
+        if not is_pair(x):
+            continue
+        parts = _subforms(x)
+        if parts is None:
+            return True
+        stack.extend(parts[0])
+        stack.extend(parts[1])
+    return False
+
+
+def _tail_self_calls(body: Exp, name: Symbol, arity: int) -> Optional[List[Exp]]:
+    """
+    Find the calls a named let body makes to its own name.
+
+    Args:
+        body (Exp): The expanded body.
+        name (Symbol): The loop name.
+        arity (int): The number of loop variables.
+
+    Returns:
+        Optional[List[Exp]]: The call forms, or None unless every use of the
+        name is a call in tail position with the right number of arguments,
+        nothing rebinds it and the body creates no closure.
+    """
+    calls = []
+    stack = [(body, True)]
+    while stack:
+        x, tail = stack.pop()
+        if isinstance(x, Symbol) and x == name:
+            return None
+        if not is_pair(x):
+            continue
+        if isinstance(x[0], Symbol) and x[0] == name:
+            if not tail or len(x) - 1 != arity:
+                return None
+            calls.append(x)
+            stack.extend((arg, False) for arg in x[1:])
+            continue
+        parts = _subforms(x)
+        if parts is None or name in parts[2]:
+            return None
+        stack.extend((sub, False) for sub in parts[0])
+        stack.extend((sub, tail) for sub in parts[1])
+    return calls
+
+
+def expand_let(x: Exp, toplevel: bool) -> Tasks:
+    """
+    Expand a let expression.
+
+    (let ((v e) ...) body...) => (let ((v e) ...) body)
+    (let name ((v e) ...) body...) => (let name ((v e) ...) body)
+
+    A named let whose name is only called in tail position, and whose body
+    creates no closure, becomes (#%loop name ((v e) ...) body) and its calls
+    become (#%recur name arg ...), which rebind the loop variables in place.
+
+    Args:
+        x (Exp): The expression.
+        toplevel (bool): Whether it's at the top level.
+
+    Returns:
+        Exp: The expanded expression.
+    """
+    name = x[1] if len(x) > 1 and isinstance(x[1], Symbol) else None
+    args = x[2:] if name else x[1:]
+    require(x, len(args) > 1)
+    bindings, body = args[0], args[1:]
+    _check_bindings(x, bindings)
+    inits = []
+    for b in bindings:
+        inits.append((yield _expand(b[1])))
+    body = yield _expand(_body(body))
+    bindings = [[b[0], init] for b, init in zip(bindings, inits)]
+    if name is None:
+        return [_let, bindings, body]
+    calls = _tail_self_calls(body, name, len(bindings))
+    if calls is None:
+        return [_let, name, bindings, body]
+    for call in calls:
+        call.insert(0, _recur)
+    return [_loop, name, bindings, body]
+
+
+def expand_letrec(x: Exp, toplevel: bool) -> Tasks:
+    """
+    Expand a letrec or letrec* expression.
+
+    (letrec ((v e) ...) body...) => (letrec ((v e) ...) body)
+
+    Args:
+        x (Exp): The expression.
+        toplevel (bool): Whether it's at the top level.
+
+    Returns:
+        Exp: The expanded expression.
+    """
+    require(x, len(x) > 2)
+    bindings, body = x[1], x[2:]
+    _check_bindings(x, bindings)
+    expanded = []
+    for b in bindings:
+        expanded.append([b[0], (yield _expand(b[1]))])
+    return [x[0], expanded, (yield _expand(_body(body)))]
+
+
+def expand_do(x: Exp, toplevel: bool) -> Tasks:
+    """
+    Expand a do expression.
+
+    (do ((var init [step]) ...) (test expr ...) command ...)
+    => (do ((var init [step]) ...) (test expr ...) command fresh)
+
+    `fresh` tells the evaluator whether each iteration needs a new frame
+    (because the loop may capture its variables in a closure) or whether
+    the variables can be rebound in place.
+
+    Args:
+        x (Exp): The expression.
+        toplevel (bool): Whether it's at the top level.
+
+    Returns:
+        Exp: The expanded expression.
+    """
+    require(x, len(x) >= 3)
+    bindings, test_and_result, commands = x[1], x[2], x[3:]
+    _check_bindings(x, bindings, range(2, 4))
+    require(x, isinstance(test_and_result, list) and len(test_and_result) >= 1, ERR_WRONG_LENGTH)
+    expanded = []
+    for b in bindings:
+        expanded.append([b[0]] + (yield from _expand_all(b[1:])))
+    test_and_result = yield from _expand_all(test_and_result)
+    command = (yield _expand(_body(commands))) if commands else None
+    steps = [b[2] for b in expanded if len(b) == 3]
+    fresh = _creates_closures(steps + test_and_result[:1] + [command])
+    return [_do, expanded, test_and_result, command, fresh]
+
+
+def expand_cond(x: Exp, toplevel: bool) -> Tasks:
+    """
+    Expand a cond expression.
+
+    (cond (test exp...) (test => proc) (test) (else exp...))
+    => (cond (test body) (test => proc) (test) (#t body))
+
+    Args:
+        x (Exp): The expression.
+        toplevel (bool): Whether it's at the top level.
+
+    Returns:
+        Exp: The expanded expression.
+    """
+    clauses = []
+    for i, clause in enumerate(x[1:], 1):
+        require(x, is_pair(clause), ERR_ILLEGAL_CLAUSE.format(to_string(clause)))
+        test, body = clause[0], clause[1:]
+        if test is _else:
+            require(x, i == len(x) - 1, ERR_ELSE_NOT_LAST)
+            require(x, body != [], ERR_ILLEGAL_CLAUSE.format(to_string(clause)))
+        else:
+            test = yield _expand(test)
+        if body and body[0] is _arrow:
+            require(x, len(body) == 2, ERR_ILLEGAL_CLAUSE.format(to_string(clause)))
+            clauses.append([test, _arrow, (yield _expand(body[1]))])
+        elif body:
+            clauses.append([test, (yield _expand(_body(body)))])
+        else:
+            clauses.append([test])
+        if test is _else:
+            clauses[-1][0] = True
+    return [_cond] + clauses
+
+
+def expand_when(x: Exp, toplevel: bool) -> Tasks:
+    """
+    Expand a when or unless expression.
+
+    (when test exp...) => (when test body)
+
+    Args:
+        x (Exp): The expression.
+        toplevel (bool): Whether it's at the top level.
+
+    Returns:
+        Exp: The expanded expression.
+    """
+    require(x, len(x) >= 3)
+    return [x[0], (yield _expand(x[1])), (yield _expand(_body(x[2:])))]
+
+
+def expand_case(x: Exp, toplevel: bool) -> Tasks:
+    """
+    Expand a case expression into a jump table.
+
+    (case key ((datum...) exp...) ... (else exp...))
+    => (case key table (body ...) else-body)
+
+    `table` maps the `case_key` of every datum to the index of its clause
+    body, so that dispatch is a single dict lookup whatever the number of
+    clauses. Unhashable datums (lists) can never be eqv? to the key and are
+    dropped.
+
+    Args:
+        x (Exp): The expression.
+        toplevel (bool): Whether it's at the top level.
+
+    Returns:
+        Exp: The expanded expression.
+    """
+    require(x, len(x) >= 2)
+    key = yield _expand(x[1])
+    table, bodies, default = {}, [], None
+    for i, clause in enumerate(x[2:], 2):
+        require(x, is_pair(clause) and len(clause) >= 2, ERR_ILLEGAL_CLAUSE.format(to_string(clause)))
+        datums = clause[0]
+        body = yield _expand(_body(clause[1:]))
+        if datums is _else:
+            require(x, i == len(x) - 1, ERR_ELSE_NOT_LAST)
+            default = body
+            continue
+        require(x, isinstance(datums, list), ERR_ILLEGAL_CLAUSE.format(to_string(clause)))
+        for datum in datums:
+            if not isinstance(datum, list):
+                table.setdefault(case_key(datum), len(bodies))
+        bodies.append(body)
+    return [_case, key, table, bodies, default]
+
+
+def _field_spec(spec: Exp) -> Optional[Tuple[Symbol, Exp, List[Symbol]]]:
+    """
+    Parse a field specification (field [:: type] accessor [modifier]) of define-record-type.
+
+    Returns:
+        Optional[Tuple[Symbol, Exp, List[Symbol]]]: The field, its type and its
+            procedure names, or None if the specification is malformed.
+    """
+    if not is_pair(spec):
+        return None
+    field, type_exp, names = spec[0], ANY_TYPE, spec[1:]
+    if len(spec) > 2 and spec[1] == TYPE_ANNOTATION_CHAR:
+        type_exp, names = spec[2], spec[3:]
+    if not isinstance(field, Symbol) or len(names) not in (1, 2) or not all(isinstance(n, Symbol) for n in names):
+        return None
+    return field, type_exp, names
+
+
+def expand_define_record_type(x: Exp, toplevel: bool) -> Tasks:
+    """
+    Expand a define-record-type expression into the definitions of the record type and its procedures.
+
+    (define-record-type <point> (make-point x y) point? (x point-x set-point-x!) (y :: float point-y))
+    => (begin (define <point> (make-record-type '<point> '(x y) '(any float)))
+              (define make-point (record-constructor <point> '(x y)))
+              (define point? (record-predicate <point>))
+              (define point-x (record-accessor <point> 'x))
+              (define set-point-x! (record-modifier <point> 'x))
+              (define point-y (record-accessor <point> 'y)))
+
+    Args:
+        x (Exp): The expression.
+        toplevel (bool): Whether it's at the top level.
+
+    Returns:
+        Exp: The expanded expression.
+    """
+    msg = ERR_RECORD_TYPE.format(to_string(x))
+    require(x, len(x) >= 4, msg)
+    name, constructor, predicate, specs = x[1], x[2], x[3], [_field_spec(spec) for spec in x[4:]]
+    require(x, isinstance(name, Symbol) and isinstance(predicate, Symbol) and all(specs), msg)
+    require(x, is_pair(constructor) and all(isinstance(c, Symbol) for c in constructor), msg)
+    fields = [field for field, _, _ in specs]
+    definitions = [
+        [_define, name, [_make_record_type, [_quote, name], [_quote, fields], [_quote, [t for _, t, _ in specs]]]],
+        [_define, constructor[0], [_record_constructor, name, [_quote, constructor[1:]]]],
+        [_define, predicate, [_record_predicate, name]],
+    ]
+    for field, _, names in specs:
+        definitions.append([_define, names[0], [_record_accessor, name, [_quote, field]]])
+        if len(names) == 2:
+            definitions.append([_define, names[1], [_record_modifier, name, [_quote, field]]])
+    return (yield _expand([_begin] + definitions, toplevel))
+
+
+def expand_match(x: Exp, toplevel: bool) -> Tasks:
+    """
+    Expand a match expression into a decision tree (see `lispy.patterns`).
+
+    Args:
+        x (Exp): The expression.
+        toplevel (bool): Whether it's at the top level.
+
+    Returns:
+        Exp: The expanded expression.
+    """
+    return (yield _expand(compile_match(x)))
+
+
+def _libraries(x: Exp) -> Any:
+    """
+    Return the libraries of the environment being expanded into (see `lispy.modules`).
+
+    Raises:
+        SchemeSyntaxError: If the environment cannot import libraries.
+    """
+    libraries = EXPANSION_ENV.get().libraries
+    require(x, libraries is not None, ERR_NO_LIBRARIES)
+    return libraries
+
+
+def expand_define_library(x: Exp, toplevel: bool) -> Exp:
+    """
+    Expand a define-library expression.
+
+    (define-library name declaration ...) declares the library; it is
+    instantiated when first imported (see `lispy.modules`).
+
+    Args:
+        x (Exp): The expression.
+        toplevel (bool): Whether it's at the top level.
+
+    Returns:
+        Exp: None, the declaration takes effect during expansion.
+    """
+    require(x, toplevel, ERR_DEFINE_LIBRARY_TOPLEVEL)
+    _libraries(x).declare(x)
+    return None
+
+
+def expand_import(x: Exp, toplevel: bool) -> Exp:
+    """
+    Expand an import expression.
+
+    (import set ...) instantiates the libraries of the import sets, if they
+    are not yet, and binds the names they export in the environment being
+    expanded into, so that the forms after it can use their macros too.
+
+    Args:
+        x (Exp): The expression.
+        toplevel (bool): Whether it's at the top level.
+
+    Returns:
+        Exp: None, the import takes effect during expansion.
+    """
+    require(x, toplevel, ERR_IMPORT_TOPLEVEL)
+    libraries = _libraries(x)
+    env = EXPANSION_ENV.get()
+    for spec in x[1:]:
+        libraries.link(spec, env)
+    return None
+
+
 SPECIAL_FORMS = {
     _quote: expand_quote,
     _if: expand_if,
     _set: expand_set,
     _define: expand_define,
     _definemacro: expand_define,
+    _definesyntax: expand_define_syntax,
     _begin: expand_begin,
     _lambda: expand_lambda,
     _quasiquote: expand_quasiquote_macro,
     _try: expand_try,
     _dynamic_let: expand_dynamic_let,
+    _let: expand_let,
+    _letrec: expand_letrec,
+    _letrec_star: expand_letrec,
+    _do: expand_do,
+    _cond: expand_cond,
+    _case: expand_case,
+    _when: expand_when,
+    _unless: expand_when,
+    _define_record_type: expand_define_record_type,
+    _match: expand_match,
+    _define_library: expand_define_library,
+    _import: expand_import,
 }
 
 
-def expand(x: Exp, toplevel: bool = False) -> Exp:
+def run_tasks(task: Tasks) -> Exp:
+    """
+    Drive an expansion task to completion without recursion.
+
+    A task is a generator that yields sub-tasks and is resumed with their
+    results. Pending tasks are kept on an explicit stack, so the Python stack
+    depth stays constant whatever the nesting depth of the program.
+
+    Args:
+        task (Tasks): The root task.
+
+    Returns:
+        Exp: The value returned by the root task.
+    """
+    stack = [task]
+    value = None
+    while stack:
+        try:
+            child = stack[-1].send(value)
+        except StopIteration as done:
+            stack.pop()
+            value = done.value
+        else:
+            stack.append(child)
+            value = None
+    return value
+
+
+def _expand(x: Exp, toplevel: bool = False) -> Tasks:
+    """
+    Task that expands a single expression.
+
+    Macro calls are rewritten in place in a loop, and special forms delegate to
+    their handler. Handlers may be generators (yielding sub-tasks) or plain
+    functions returning the expanded form.
+
+    Args:
+        x (Exp): The expression to expand.
+        toplevel (bool): Whether this is a top-level expression.
+
+    Returns:
+        Exp: The expanded expression.
+    """
+    macros = EXPANSION_ENV.get().macros
+    while True:
+        require(x, x != [])             # () => Error
+        if not isinstance(x, list):     # constant => unchanged
+            return x
+
+        op = x[0]
+        if isinstance(op, Symbol) and op in SPECIAL_FORMS:
+            result = SPECIAL_FORMS[op](x, toplevel)
+            if isinstance(result, GeneratorType):
+                result = yield from result
+        elif isinstance(op, Symbol) and op in macros:
+            expansion = macros[op](*x[1:])          # (m arg...)
+            CURRENT_COUNTERS.get().macro_expansions += 1
+            for hook in CURRENT_HOOKS.get():
+                hook.macro(op, x, expansion)
+            if LOCATING:
+                _locate(x, expansion)
+            x = expansion
+            continue
+        else:                               # (f arg...) => expand each
+            result = yield from _expand_all(x)
+        if LOCATING:
+            _locate(x, result)
+        return result
+
+
+def _expand_all(xs: List[Exp], toplevel: bool = False) -> Tasks:
+    """
+    Expand every expression of a list, in order.
+
+    Atoms are left unchanged without spawning a sub-task.
+
+    Args:
+        xs (List[Exp]): The expressions to expand.
+        toplevel (bool): Whether these are top-level expressions.
+
+    Returns:
+        List[Exp]: The expanded expressions.
+    """
+    result = []
+    for xi in xs:
+        result.append((yield _expand(xi, toplevel)) if isinstance(xi, list) else xi)
+    return result
+
+
+def _locate(x: Exp, y: Exp) -> None:
+    """
+    Give the line of a form to the form it was rewritten into, unless that one was read itself.
+    """
+    positions = LOCATING[-1]
+    entry = positions.get(id(x))
+    if entry is None or entry[1] is not x or not isinstance(y, list):
+        return
+    old = positions.get(id(y))
+    if old is None or old[1] is not y:
+        positions[id(y)] = (entry[0], y)
+
+
+def expand(x: Exp, toplevel: bool = False, positions: Optional[Dict[int, Tuple[int, Exp]]] = None,
+           env: Optional[GlobalEnv] = None) -> Exp:
     """
     Walk tree of x, making optimizations/fixes, and signaling SchemeSyntaxError.
 
@@ -269,6 +928,10 @@ def expand(x: Exp, toplevel: bool = False) -> Exp:
     Args:
         x (Exp): The expression to expand.
         toplevel (bool): Whether this is a top-level expression (relevant for define-macro).
+        positions (Optional[Dict[int, Tuple[int, Exp]]]): The line of each list of x, by id (see
+            `InPort.positions`). If given, the forms x is rewritten into are added to it.
+        env (Optional[GlobalEnv]): The global environment the program will run in, whose macros
+            are used and defined. Defaults to that of the enclosing expansion, or global_env.
 
     Returns:
         Exp: The expanded expression.
@@ -276,72 +939,169 @@ def expand(x: Exp, toplevel: bool = False) -> Exp:
     Raises:
         SchemeSyntaxError: If the syntax is invalid.
     """
-    require(x, x != [])                 # () => Error
-    if not isinstance(x, list):         # constant => unchanged
-        return x
+    token = None if env is None else EXPANSION_ENV.set(env)
+    if positions is not None:
+        LOCATING.append(positions)
+    try:
+        return run_tasks(_expand(x, toplevel))
+    finally:
+        if positions is not None:
+            LOCATING.pop()
+        if token is not None:
+            EXPANSION_ENV.reset(token)
+
+
+def _is_constant(x: Exp) -> bool:
+    """
+    Check whether an expanded template evaluates to itself or a quoted literal.
 
-    op = x[0]
-    if isinstance(op, Symbol) and op in SPECIAL_FORMS:
-        return SPECIAL_FORMS[op](x, toplevel)
-    elif isinstance(op, Symbol) and op in macro_table:
-        return expand(macro_table[op](*x[1:]), toplevel)  # (m arg...)
-    else:                               # => macroexpand if m isa macro
-        return list(map(expand, x))     # (f arg...) => expand each
+    Args:
+        x (Exp): An expression produced by `_quasiquote`.
 
+    Returns:
+        bool: True if x is a quote form or a self-evaluating atom.
+    """
+    if isinstance(x, list):
+        return x != [] and x[0] is _quote
+    return not isinstance(x, Symbol)
 
-def expand_quasiquote(x: Exp) -> Exp:
+
+def _constant_value(x: Exp) -> Exp:
     """
-    Expand quasiquote expressions.
+    Return the value of an expression accepted by `_is_constant`.
+
+    Args:
+        x (Exp): A quote form or a self-evaluating atom.
+
+    Returns:
+        Exp: The literal value.
+    """
+    return x[1] if isinstance(x, list) else x
+
+
+def _quasiquote(x: Exp) -> Tasks:
+    """
+    Task that expands a quasiquoted template.
 
-    Expands `` `x => 'x``, `` `,x => x``, and `` `(,@x y) => (append x y)``.
+    The elements of a list template are grouped into segments: runs of plain
+    elements become a single `list` call and every `,@` splice is its own
+    segment. The segments are joined with one `list*` or `append` call, so an
+    n-element template is built in O(n). Templates without any unquote are
+    hoisted as a single quoted literal.
 
     Args:
         x (Exp): The quasiquoted expression.
 
     Returns:
-        Exp: The expanded expression using cons, append, and quote.
+        Exp: The expanded expression.
     """
     if not is_pair(x):
-        return [_quote, x]
+        return [_quote, x] if isinstance(x, (Symbol, list)) else x
     require(x, x[0] is not _unquotesplicing, ERR_CANT_SPLICE)
     if x[0] is _unquote:
         require(x, len(x) == 2)
         return x[1]
-    elif is_pair(x[0]) and x[0][0] is _unquotesplicing:
-        require(x[0], len(x[0]) == 2)
-        return [_append, x[0][1], expand_quasiquote(x[1:])]
-    else:
-        return [_cons, expand_quasiquote(x[0]), expand_quasiquote(x[1:])]
+
+    runs, splices = [], []              # splices[k] follows runs[k]; runs[k] may be empty
+    run = []
+    for i, item in enumerate(x):
+        if item is _unquotesplicing:
+            require(x[i:], False, ERR_CANT_SPLICE)
+        if item is _unquote:            # `(a . ,b) reads as (a unquote b)
+            require(x[i:], len(x) - i == 2)
+            runs.append(run)
+            splices.append(x[i + 1])
+            run = []
+            break
+        if is_pair(item) and item[0] is _unquotesplicing:
+            require(item, len(item) == 2)
+            runs.append(run)
+            splices.append(item[1])
+            run = []
+        elif is_pair(item):
+            run.append((yield _quasiquote(item)))
+        else:
+            run.append([_quote, item] if isinstance(item, (Symbol, list)) else item)
+
+    if not splices:
+        if all(map(_is_constant, run)):
+            return [_quote, [_constant_value(e) for e in run]]
+        return [_list] + run
+    if len(splices) == 1 and not run and runs[0]:
+        return [_list_star] + runs[0] + splices
+    parts = []
+    for exps, splice in zip(runs + [run], splices + [None]):
+        if not exps:
+            pass
+        elif all(map(_is_constant, exps)):
+            parts.append([_quote, [_constant_value(e) for e in exps]])
+        else:
+            parts.append([_list] + exps)
+        if splice is not None:
+            parts.append(splice)
+    return [_append] + parts
 
 
-def let(*args: Exp) -> Exp:
+def expand_quasiquote(x: Exp) -> Exp:
     """
-    Expand a `let` expression into a lambda application.
+    Expand quasiquote expressions.
 
-    (let ((v1 e1) ...) body...) => ((lambda (v1 ...) body...) e1 ...)
+    Expands `` `x => 'x``, `` `,x => x``, `` `(a ,b) => (list 'a b)``,
+    `` `(a ,@b) => (list* 'a b)`` and `` `(,@x y) => (append x '(y))``.
 
     Args:
-        *args (Exp): The arguments to the let macro (bindings and body).
+        x (Exp): The quasiquoted expression.
+
+    Returns:
+        Exp: The expanded expression using list, list*, append, and quote.
+    """
+    return run_tasks(_quasiquote(x))
+
+
+def and_(*exps: Exp) -> Exp:
+    """
+    Expand an and expression.
+
+    (and) -> #t, (and e) -> e, (and e1 e2 ...) -> (if e1 (and e2 ...) #f)
+
+    The chain of ifs is built from the last expression back in one pass, so
+    the expansion takes time linear in the number of expressions.
+
+    Args:
+        exps (Exp): The expressions.
 
     Returns:
         Exp: The expanded expression.
     """
-    args = list(args)
-    x = [_let] + args
-    require(x, len(args) > 1)
-    bindings, body = args[0], args[1:]
-    require(x, isinstance(bindings, list), ERR_ILLEGAL_BINDING.format(to_string(bindings)))
-    for b in bindings:
-        require(
-            x,
-            isinstance(b, list) and len(b) == 2 and isinstance(b[0], Symbol),
-            ERR_ILLEGAL_BINDING.format(to_string(b))
-        )
-    if not bindings:
-        vars, vals = [], []
-    else:
-        vars, vals = zip(*bindings)
-    return [[_lambda, list(vars)] + list(map(expand, body))] + list(map(expand, vals))
+    if not exps:
+        return True
+    x = exps[-1]
+    for i in range(len(exps) - 2, -1, -1):
+        x = [_if, exps[i], x, False]
+    return x
+
+
+def or_(*exps: Exp) -> Exp:
+    """
+    Expand an or expression.
+
+    (or) -> #f, (or e) -> e, (or e1 e2 ...) -> (let ((temp e1)) (if temp temp (or e2 ...)))
+
+    temp is a fresh symbol, so the expressions cannot see it. As for `and_`,
+    the chain is built from the last expression back in one pass.
+
+    Args:
+        exps (Exp): The expressions.
+
+    Returns:
+        Exp: The expanded expression.
+    """
+    if not exps:
+        return False
+    x, temp = exps[-1], gensym('temp')
+    for i in range(len(exps) - 2, -1, -1):
+        x = [_let, [[temp, exps[i]]], [_if, temp, temp, x]]
+    return x
 
 
 def delay(exp: Exp) -> Exp:
@@ -359,71 +1119,65 @@ def delay(exp: Exp) -> Exp:
     return [_make_promise, [_lambda, [], exp]]
 
 
-def do_macro(*args: Exp) -> Exp:
+def profile(exp: Exp) -> Exp:
     """
-    Expand a `do` expression.
+    Expand a profile expression.
 
-    (do ((var init [step]) ...) (test expr ...) command ...)
+    (profile exp) -> (#%profile (lambda () exp))
 
     Args:
-        *args (Exp): The arguments to the do macro.
+        exp (Exp): The expression to profile.
 
     Returns:
         Exp: The expanded expression.
     """
-    args = list(args)
-    x = [_do] + args
-    require(x, len(args) >= 2)
-    bindings = args[0]
-    test_and_result = args[1]
-    commands = args[2:]
+    return [_profile_call, [_lambda, [], exp]]
 
-    require(x, isinstance(bindings, list), ERR_ILLEGAL_BINDING.format(to_string(bindings)))
-    require(x, isinstance(test_and_result, list) and len(test_and_result) >= 1, ERR_WRONG_LENGTH)
 
-    vars_ = []
-    inits = []
-    steps = []
-    for b in bindings:
-        require(
-            x,
-            isinstance(b, list) and 2 <= len(b) <= 3 and isinstance(b[0], Symbol),
-            ERR_ILLEGAL_BINDING.format(to_string(b))
-        )
-        vars_.append(b[0])
-        inits.append(b[1])
-        if len(b) == 3:
-            steps.append(b[2])
-        else:
-            steps.append(b[0])
+def time(exp: Exp) -> Exp:
+    """
+    Expand a time expression.
 
-    test = test_and_result[0]
-    result_exprs = test_and_result[1:]
+    (time exp) -> (#%time (lambda () exp))
 
-    loop_name = Symbol('__do_loop__')
+    Args:
+        exp (Exp): The expression to time.
 
-    if not result_exprs:
-        conseq = [_quote, None]
-    elif len(result_exprs) == 1:
-        conseq = result_exprs[0]
-    else:
-        conseq = [_begin] + result_exprs
+    Returns:
+        Exp: The expanded expression.
+    """
+    return [_time_call, [_lambda, [], exp]]
 
-    recur_call = [loop_name] + steps
-    if not commands:
-        alt = recur_call
-    else:
-        alt = [_begin] + commands + [recur_call]
 
-    # ((lambda (vars...)
-    #    (define (loop vars...) (if test conseq alt))
-    #    (loop vars...))
-    #  inits...)
+def bench(exp: Exp, *options: Exp) -> Exp:
+    """
+    Expand a bench expression.
 
-    loop_def = [_define, [loop_name] + vars_, [_if, test, conseq, alt]]
-    body = [loop_def, [loop_name] + vars_]
+    (bench exp #:iterations n #:warmup k) -> (#%bench (lambda () exp) n k)
+
+    Both options may be left out, in any order.
+
+    Args:
+        exp (Exp): The expression to time.
+        options (Exp): The options, as keywords each followed by its value.
+
+    Returns:
+        Exp: The expanded expression.
+
+    Raises:
+        SchemeSyntaxError: If an option is unknown or has no value.
+    """
+    x = [_bench, exp, *options]
+    require(x, len(options) % 2 == 0)
+    settings = {_iterations_keyword: DEFAULT_BENCH_ITERATIONS, _warmup_keyword: DEFAULT_BENCH_WARMUP}
+    for key, value in zip(options[::2], options[1::2]):
+        require(x, key in settings, ERR_BENCH_OPTION.format(key))
+        settings[key] = value
+    return [_bench_call, [_lambda, [], exp], settings[_iterations_keyword], settings[_warmup_keyword]]
 
-    return [[_lambda, vars_] + body] + inits
 
+BUILTIN_MACROS = {_and: and_, _or: or_, _delay: delay, _profile: profile, _time: time, _bench: bench}
+"""The macros every global environment starts with."""
 
-macro_table = {_let: let, _delay: delay, _do: do_macro}
+macro_table = global_env.macros
+"""The macros of global_env, the environment of the default interpreter (see `lispy.interpreter`)."""
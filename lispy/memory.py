@@ -0,0 +1,367 @@
+"""
+Memory profiler.
+
+The memory profiler attributes memory to Lispy procedures and to the values
+bound in the global environment, which `tracemalloc` alone cannot do: it
+sees the allocations of `eval` and `Env.__init__`, not of the procedures
+they run.
+
+`MemoryProfiler` is an evaluator hook (see `lispy.evaluator.Hook`), like
+`lispy.profiler.Profiler`. At each procedure call, tail call and return it
+reads the memory traced by `tracemalloc` and the runtime counters (see
+`lispy.counters`), and charges the difference since the previous event to
+the procedure that was running: the bytes allocated (the growths) and the
+net bytes (growths less what was freed), and the environment frames and
+procedures created.
+
+    >>> with MemoryProfiler() as profiler:
+    ...     lispy.eval(lispy.parse('(handle request)'))
+    >>> profiler.print_stats()
+
+`structures` measures what each global variable keeps alive: the objects
+reachable from its value, without going through the global environment
+(nor modules, classes and Python functions). A closure holding a chain of
+environment frames, or a forced promise holding its thunk, show there by
+their size and the number of frames they retain. `MemorySnapshot` records
+those sizes (and a `tracemalloc` snapshot if tracing), and `compare_to`
+gives the growth between two snapshots, e.g. between two requests of a
+long-running worker.
+"""
+import gc
+import io
+import json
+import sys
+import tracemalloc
+import types
+from typing import Any, Dict, List, NamedTuple, Optional, TextIO, Tuple, Union
+
+from . import evaluator
+from .constants import TOPLEVEL_FRAME, UNKNOWN_LOCATION
+from .counters import CURRENT_COUNTERS
+from .env import Env, global_env
+from .evaluator import Hook, Procedure, add_hook, count_events, remove_hook
+from .parser import InPort
+from .profiler import Label, label
+from .repl import locate, parse
+from .types import EOF_OBJECT, Exp, Symbol
+
+OPAQUE_TYPES = (types.ModuleType, type, types.FunctionType, types.BuiltinFunctionType, types.MethodType,
+                types.CodeType)
+"""The objects that are not counted in the structures, nor looked into: they belong to the interpreter."""
+
+REPORT_HEADER = '{:>12} {:>12} {:>9} {:>9} {:>9}  {}'.format(
+    'allocated', 'net', 'frames', 'procs', 'calls', 'procedure')
+REPORT_LINE = '{:>12} {:>12} {:>9} {:>9} {:>9}  {} ({}:{})'
+STRUCTURES_HEADER = '{:>12} {:>9} {:>9}  {}'.format('size', 'objects', 'frames', 'global')
+STRUCTURES_LINE = '{:>12} {:>9} {:>9}  {}'
+
+
+class MemoryEntry:
+    """
+    The memory statistics of a procedure.
+
+    Attributes:
+        label (Label): The location and name of the procedure.
+        calls (int): The number of calls.
+        allocated (int): The bytes allocated while its body ran.
+        net (int): The bytes allocated less the bytes freed while its body ran.
+        frames (int): The environment frames created while its body ran.
+        procedures (int): The procedures created while its body ran.
+    """
+    def __init__(self, label: Label) -> None:
+        self.label = label
+        self.calls = self.allocated = self.net = self.frames = self.procedures = 0
+
+
+class Structure(NamedTuple):
+    """
+    What a global variable keeps alive.
+
+    Attributes:
+        name (Symbol): The variable.
+        size (int): The bytes of the objects reachable from its value.
+        objects (int): The number of those objects.
+        frames (int): The number of environment frames among them.
+    """
+    name: Symbol
+    size: int
+    objects: int
+    frames: int
+
+
+def reachable(root: Any, stop: Tuple[Any, ...] = ()) -> Tuple[int, int, int]:
+    """
+    Measure the objects reachable from an object.
+
+    Args:
+        root (Any): The object.
+        stop (Tuple[Any, ...]): Objects not counted nor looked into (besides OPAQUE_TYPES).
+
+    Returns:
+        Tuple[int, int, int]: The bytes, the number of objects and the number of environment frames.
+    """
+    seen = {id(obj) for obj in stop}
+    pending = [root]
+    size = objects = frames = 0
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen or isinstance(obj, OPAQUE_TYPES):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        objects += 1
+        frames += isinstance(obj, Env)
+        pending.extend(gc.get_referents(obj))
+    return size, objects, frames
+
+
+def structures(env: Env = global_env, limit: Optional[int] = None) -> List[Structure]:
+    """
+    Measure what each variable of an environment keeps alive, the largest first.
+
+    Each value is measured on its own, so objects shared by two values count for both.
+
+    Args:
+        env (Env): The environment, which is not looked into from the values. Defaults to the global one.
+        limit (Optional[int]): The number of variables to return. Defaults to all.
+
+    Returns:
+        List[Structure]: The sizes, without the variables whose values are opaque (primitives).
+    """
+    result = []
+    for name, value in list(env.items()):
+        size, objects, frames = reachable(value, (env, env.outer))
+        if objects:
+            result.append(Structure(name, size, objects, frames))
+    result.sort(key=lambda structure: structure.size, reverse=True)
+    return result[:limit]
+
+
+class MemorySnapshot:
+    """
+    The memory held by the global variables at some point.
+
+    Attributes:
+        structures (Dict[Symbol, Structure]): What each global variable keeps alive.
+        traced (Optional[tracemalloc.Snapshot]): The allocations, if tracemalloc is tracing.
+    """
+    def __init__(self, env: Env = global_env) -> None:
+        """
+        Take the snapshot.
+
+        Args:
+            env (Env): The environment to measure. Defaults to the global one.
+        """
+        self.structures = {structure.name: structure for structure in structures(env)}
+        self.traced = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+
+    def compare_to(self, older: 'MemorySnapshot') -> List[Structure]:
+        """
+        Return the growth of the global variables since an older snapshot, the largest first.
+
+        Args:
+            older (MemorySnapshot): The older snapshot.
+
+        Returns:
+            List[Structure]: The differences of size, objects and frames of the variables
+                that changed; new variables count in full, and removed ones negatively.
+        """
+        empty = Structure(None, 0, 0, 0)
+        growth = []
+        for name in self.structures.keys() | older.structures.keys():
+            new, old = self.structures.get(name, empty), older.structures.get(name, empty)
+            if new[1:] != old[1:]:
+                growth.append(Structure(name, new.size - old.size, new.objects - old.objects,
+                                        new.frames - old.frames))
+        growth.sort(key=lambda structure: structure.size, reverse=True)
+        return growth
+
+
+class MemoryProfiler(Hook):
+    """
+    A profiler of the memory allocated by Lispy procedures.
+
+    It is an evaluator hook, active between `enable` and `disable`, or in a
+    `with` block, and starts tracemalloc if it is not tracing already.
+    Allocations outside any procedure are charged to the top level.
+
+    Attributes:
+        entries (Dict[int, MemoryEntry]): The statistics, by procedure body.
+        toplevel (MemoryEntry): The statistics of the code outside procedures.
+        stack (List[MemoryEntry]): The procedures of the calls in progress.
+    """
+    def __init__(self) -> None:
+        self.entries: Dict[int, MemoryEntry] = {}
+        self.bodies: List[Exp] = []      # keeps the ids of the entries valid
+        self.toplevel = MemoryEntry(UNKNOWN_LOCATION + (TOPLEVEL_FRAME,))
+        self.stack: List[MemoryEntry] = []
+        self._last = (0, 0, 0)
+        self._tracing = False
+
+    def enable(self) -> None:
+        """
+        Start measuring the memory the procedures the evaluator calls allocate.
+        """
+        self._tracing = not tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.start()
+        count_events(True)
+        self._last = self._measure()
+        add_hook(self)
+
+    def disable(self) -> None:
+        """
+        Stop measuring; the calls still in progress end now.
+        """
+        remove_hook(self)
+        self._charge()
+        count_events(False)
+        self.stack.clear()
+        if self._tracing:
+            tracemalloc.stop()
+
+    def __enter__(self) -> 'MemoryProfiler':
+        self.enable()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.disable()
+
+    def run(self, source: Union[str, InPort]) -> Any:
+        """
+        Evaluate a program under the memory profiler.
+
+        Args:
+            source (Union[str, InPort]): The program, or a port to read it from.
+
+        Returns:
+            Any: The value of the last expression.
+        """
+        inport = InPort(io.StringIO(source)) if isinstance(source, str) else source
+        val = None
+        while True:
+            x = parse(inport)
+            if x is EOF_OBJECT:
+                return val
+            with self:
+                val = evaluator.eval(x)
+            locate(x, (inport.name, inport.datum_line))
+
+    @staticmethod
+    def _measure() -> Tuple[int, int, int]:
+        counters = CURRENT_COUNTERS.get()
+        return tracemalloc.get_traced_memory()[0], counters.env_frames, counters.procedures
+
+    def _charge(self) -> None:
+        now = self._measure()
+        size, frames, procedures = now
+        entry = self.stack[-1] if self.stack else self.toplevel
+        delta = size - self._last[0]
+        entry.net += delta
+        entry.allocated += max(delta, 0)
+        entry.frames += frames - self._last[1]
+        entry.procedures += procedures - self._last[2]
+        self._last = now
+
+    def _entry(self, proc: Procedure) -> MemoryEntry:
+        entry = self.entries.get(id(proc.exp))
+        if entry is None:
+            entry = self.entries[id(proc.exp)] = MemoryEntry(label(proc))
+            self.bodies.append(proc.exp)
+        elif entry.label[:2] == UNKNOWN_LOCATION and proc.location is not None:
+            entry.label = label(proc)
+        return entry
+
+    def enter(self, proc: Procedure, args: List[Any]) -> None:
+        self._charge()
+        entry = self._entry(proc)
+        entry.calls += 1
+        self.stack.append(entry)
+
+    def tail_call(self, caller: Procedure, proc: Procedure, args: List[Any]) -> None:
+        self._charge()
+        if self.stack:                  # unless the caller started before the profiler
+            self.stack.pop()
+        entry = self._entry(proc)
+        entry.calls += 1
+        self.stack.append(entry)
+
+    def exit(self, proc: Procedure, value: Any, error: Optional[BaseException]) -> None:
+        self._charge()
+        if self.stack:
+            self.stack.pop()
+
+    def _sorted(self) -> List[MemoryEntry]:
+        entries = list(self.entries.values()) + [self.toplevel]
+        return sorted(entries, key=lambda entry: entry.allocated, reverse=True)
+
+    def to_json(self) -> Dict[str, Any]:
+        """
+        Return the statistics, and the largest global structures, as JSON-serializable data.
+
+        Returns:
+            Dict[str, Any]: {"procedures": [...], "structures": [...]}, each procedure with its
+                name, file, line, calls, allocated and net bytes, frames and procedures.
+        """
+        procedures = [{'name': entry.label[2], 'file': entry.label[0], 'line': entry.label[1],
+                       'calls': entry.calls, 'allocated': entry.allocated, 'net': entry.net,
+                       'frames': entry.frames, 'procedures': entry.procedures} for entry in self._sorted()]
+        return {'procedures': procedures, 'structures': [structure._asdict() for structure in structures()]}
+
+    def dump_json(self, filename: str) -> None:
+        """
+        Write the statistics to a JSON file (see `to_json`).
+        """
+        with open(filename, 'w') as f:
+            json.dump(self.to_json(), f, indent=2)
+
+    def print_stats(self, limit: Optional[int] = None, out: Optional[TextIO] = None) -> None:
+        """
+        Print a report of the procedures, the largest allocators first, then of the largest global structures.
+
+        Args:
+            limit (Optional[int]): The number of procedures and structures to show. Defaults to all.
+            out (TextIO): The output stream. Defaults to sys.stdout.
+        """
+        out = sys.stdout if out is None else out
+        print(REPORT_HEADER, file=out)
+        for entry in self._sorted()[:limit]:
+            file, line, name = entry.label
+            print(REPORT_LINE.format(entry.allocated, entry.net, entry.frames, entry.procedures, entry.calls,
+                                     name, file, line), file=out)
+        print(file=out)
+        print_structures(limit, out)
+
+
+def print_structures(limit: Optional[int] = None, out: Optional[TextIO] = None) -> None:
+    """
+    Print the largest structures reachable from the global environment.
+
+    Args:
+        limit (Optional[int]): The number of structures to show. Defaults to all.
+        out (TextIO): The output stream. Defaults to sys.stdout.
+    """
+    out = sys.stdout if out is None else out
+    print(STRUCTURES_HEADER, file=out)
+    for structure in structures(limit=limit):
+        print(STRUCTURES_LINE.format(structure.size, structure.objects, structure.frames, structure.name), file=out)
+
+
+def memory_file(filename: str, output: Optional[str] = None, limit: Optional[int] = None) -> None:
+    """
+    Run a program under the memory profiler, for `python -m lispy --memory`.
+
+    Args:
+        filename (str): The program.
+        output (Optional[str]): The JSON file to write the statistics to. Defaults to a report on stderr.
+        limit (Optional[int]): The number of lines of each part of the report. Defaults to all.
+    """
+    profiler = MemoryProfiler()
+    try:
+        with open(filename) as f:
+            profiler.run(InPort(f))
+    finally:
+        if output is None:
+            profiler.print_stats(limit, out=sys.stderr)
+        else:
+            profiler.dump_json(output)
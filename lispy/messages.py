@@ -5,16 +5,48 @@ ERR_WRONG_LENGTH = "Incorrect number of arguments"
 ERR_CANT_SPLICE = "Unquote-splicing is not allowed in this context"
 ERR_ILLEGAL_BINDING = "Illegal binding list: '{}'"
 ERR_DEFINE_MACRO_TOPLEVEL = "Define-macro is only allowed at the top level"
+ERR_DEFINE_SYNTAX_TOPLEVEL = "Define-syntax is only allowed at the top level"
+ERR_SYNTAX_RULES = "Expected (syntax-rules (literal ...) (pattern template) ...), got '{}'"
+ERR_NO_MATCHING_RULE = "No syntax-rules pattern matches '{}'"
+ERR_ELLIPSIS_TEMPLATE = "Ellipsis in template does not follow a matching pattern variable: '{}'"
 ERR_MACRO_PROCEDURE = "Macro body must evaluate to a procedure, got '{}'"
 ERR_DEFINE_SYMBOL = "First argument to 'define' must be a symbol, got '{}'"
 ERR_SET_SYMBOL = "First argument to 'set!' must be a symbol, got '{}'"
+ERR_ILLEGAL_CLAUSE = "Illegal clause: '{}'"
+ERR_ELSE_NOT_LAST = "'else' clause must be the last clause"
 ERR_ILLEGAL_LAMBDA = "Lambda argument list must be a list of symbols, got '{}'"
 ERR_CURRY_USER_PROC = "Only user-defined procedures can be curried, got '{}'"
 ERR_CURRY_VARIADIC = "Cannot curry variadic procedures"
+ERR_LIST_STAR_TAIL = "list* expects at least one argument, the tail list"
 ERR_TYPE_MISMATCH = "Argument type mismatch: expected '{}', got '{}'"
+ERR_STATIC_TYPE_MISMATCH = "Type error in '{}': expected '{}', got '{}'"
 ERR_UNKNOWN_TYPE = "Unknown type specified in annotation: '{}'"
 ERR_UNEXPECTED_TYPE_ANNOTATION = "Unexpected '{}' in parameter list"
 ERR_MISSING_TYPE_ANNOTATION = "Missing type after '{}' for parameter '{}'"
+ERR_RECORD_TYPE = ("Expected (define-record-type name (constructor field ...) predicate "
+                   "(field [:: type] accessor [modifier]) ...), got '{}'")
+ERR_RECORD_FIELD = "Record type '{}' has no field '{}'"
+ERR_MATCH_PATTERN = "Illegal match pattern: '{}'"
+ERR_MATCH_VARIABLE = "Variable '{}' is bound twice in a match pattern"
+ERR_NO_MATCH = "No match clause matches '{}'"
+ERR_DUPLICATE_FIELD = "Duplicate field '{}' in record type '{}'"
+ERR_BUILTIN_TYPE = "Record type '{}' would hide a builtin type"
+ERR_BENCHMARK_DEFINITION = "Benchmark '{}' does not define '{}'"
+ERR_BENCHMARK_RESULT = "Benchmark '{}' returned '{}', expected '{}'"
+ERR_BENCH_OPTION = "Unknown option '{}', expected #:iterations or #:warmup"
+ERR_BENCHMARK_UNKNOWN = "No benchmark named '{}' in '{}'"
+ERR_DEFINE_LIBRARY_TOPLEVEL = "Define-library is only allowed at the top level"
+ERR_IMPORT_TOPLEVEL = "Import is only allowed at the top level"
+ERR_LIBRARY_DECLARATION = "Expected (export spec ...), (import set ...) or (begin form ...) in a library, got '{}'"
+ERR_LIBRARY_NAME = "Expected a library name, a list of symbols and integers, got '{}'"
+ERR_IMPORT_SET = "Illegal import set: '{}'"
+ERR_LIBRARY_NOT_FOUND = "Library '{}' not found in {}"
+ERR_LIBRARY_NOT_DECLARED = "'{}' does not declare library '{}'"
+ERR_LIBRARY_FILE = "Expected only define-library forms in '{}', got '{}'"
+ERR_LIBRARY_CYCLE = "Library '{}' imports itself"
+ERR_LIBRARY_EXPORT = "Library '{}' exports '{}', which it does not define"
+ERR_LIBRARY_IMPORT = "Library '{}' does not export '{}'"
+ERR_NO_LIBRARIES = "Libraries cannot be imported in this environment"
 
 PROMPT = "lispy> "
 WELCOME = "Welcome to Lispy!"
@@ -0,0 +1,293 @@
+"""
+Microbenchmarks of the subsystems.
+
+Whole programs (see `lispy.bench`) tell whether the interpreter got faster,
+not which part did. These microbenchmarks measure each stage on its own:
+
+- `next-token` and `read`: the tokenizer and the reader on a large
+  synthetic program, in MB/s,
+- `expand`: the expander on macro-heavy forms (derived forms, quasiquote,
+  a `syntax-rules` macro), in forms/s,
+- `find-depth-N`: `Env.find` for a variable N frames up the chain, in ns,
+- `call` and `call-typed`: the evaluation of a procedure call, without and
+  with a type annotation to check, in ns,
+- `to-string-deep` and `to-string-wide`: `to_string` on a deeply nested and
+  on a long flat structure, in MB/s.
+
+Their results can be pinned as budgets: a file giving, for each one, the
+lowest rate or the highest time it may have. Checking the budgets on CI
+shows the effect of a change on the module it touches.
+
+    python -m lispy.bench --micro --pin budgets.json
+    python -m lispy.bench --micro --budgets budgets.json
+"""
+import io
+import sys
+import time
+from itertools import repeat
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, TextIO, Tuple
+
+from . import evaluator
+from .env import Env, global_env
+from .errors import BenchmarkError
+from .macros import expand
+from .messages import ERR_BENCHMARK_UNKNOWN
+from .parser import InPort, read, to_string
+from .repl import parse
+from .types import EOF_OBJECT, get_symbol
+
+RATE_UNITS = ('MB/s', 'forms/s')
+"""The units of the microbenchmarks where more is better; for the others (ns), less is."""
+
+SOURCE_CHUNK = """; A chunk of a synthetic program
+(define (micro-chunk x y)
+  (if (< x y)
+      (cons "a string with \\"quotes\\"" (list 1 2.5 -3 'symbol `(a ,x ,@y)))
+      (let loop ((k 0) (acc '()))
+        (cond ((= k 10) acc)
+              (else (loop (+ k 1) (cons (* k 1.5) acc)))))))
+"""
+
+EXPAND_FORMS = """
+(define-syntax micro-swap!
+  (syntax-rules () ((_ a b) (let ((tmp a)) (set! a b) (set! b tmp)))))
+(let loop ((k 0) (a 1) (b 2))
+  (when (< k 10) (micro-swap! a b) (loop (+ k 1) a b)))
+(cond ((and (> x 1) (or (< y 2) z)) 'one)
+      ((assv x alist) => cdr)
+      (else (case y ((1 2) 'small) ((3) 'three) (else 'other))))
+(do ((k 0 (+ k 1)) (acc '() (cons `(item ,k ,@rest) acc)))
+    ((= k 10) acc))
+(define (micro-expand x) (unless (null? x) (micro-swap! x y) (and x y (or z w))))
+"""
+
+MICRO_HEADER = '{:<16} {:>14} {:<8} {:>14}'.format('microbenchmark', 'value', 'unit', 'budget')
+MICRO_LINE = '{:<16} {:>14.2f} {:<8} {:>14}  {}'
+
+ITERATIONS = 10000
+"""The number of operations the ns microbenchmarks time in a run."""
+
+
+class Microbenchmark(NamedTuple):
+    """
+    A microbenchmark.
+
+    Attributes:
+        unit (str): What it measures: 'MB/s', 'forms/s' or 'ns' (per operation).
+        setup (Callable[[int], Tuple[Callable[[], Any], float]]): Given a size, return the thunk
+            to time and the work it does, in megabytes, forms or operations.
+        size (int): The default size.
+    """
+    unit: str
+    setup: Callable[[int], Tuple[Callable[[], Any], float]]
+    size: int
+
+
+def synthetic_source(size: int) -> str:
+    """
+    Return a program of at least size characters.
+    """
+    return SOURCE_CHUNK * (size // len(SOURCE_CHUNK) + 1)
+
+
+def setup_next_token(size: int) -> Tuple[Callable[[], Any], float]:
+    text = synthetic_source(size)
+
+    def tokenize() -> None:
+        inport = InPort(io.StringIO(text))
+        while inport.next_token() is not EOF_OBJECT:
+            pass
+    return tokenize, len(text.encode()) / 1e6
+
+
+def setup_read(size: int) -> Tuple[Callable[[], Any], float]:
+    text = synthetic_source(size)
+
+    def read_all() -> None:
+        inport = InPort(io.StringIO(text))
+        while read(inport) is not EOF_OBJECT:
+            pass
+    return read_all, len(text.encode()) / 1e6
+
+
+def setup_expand(size: int) -> Tuple[Callable[[], Any], float]:
+    inport = InPort(io.StringIO(EXPAND_FORMS))
+    forms = list(iter(lambda: read(inport), EOF_OBJECT))
+    expand(forms[0], toplevel=True)         # define the macro
+    forms = (forms[1:] * size)[:size]
+
+    def expand_all() -> None:
+        for x in forms:
+            expand(x, toplevel=True)
+    return expand_all, len(forms)
+
+
+def setup_find(depth: int) -> Callable[[int], Tuple[Callable[[], Any], float]]:
+    def setup(size: int) -> Tuple[Callable[[], Any], float]:
+        var = get_symbol('micro-var')
+        env = Env([var], [1])
+        for i in range(depth):
+            env = Env([get_symbol('micro-{}'.format(i))], [i], env)
+        find = env.find
+
+        def lookups() -> None:
+            for _ in repeat(None, size):
+                find(var)
+        return lookups, size
+    return setup
+
+
+def setup_call(source: str) -> Callable[[int], Tuple[Callable[[], Any], float]]:
+    def setup(size: int) -> Tuple[Callable[[], Any], float]:
+        # The procedure is bound in a local frame, so the optimizer does not inline it
+        name = get_symbol('micro-proc')
+        env = Env([name], [evaluator.eval(parse(source))], global_env)
+        x, eval = parse('(micro-proc 1)'), evaluator.eval
+
+        def calls() -> None:
+            for _ in repeat(None, size):
+                eval(x, env)
+        return calls, size
+    return setup
+
+
+def nested(depth: int) -> List[Any]:
+    x: List[Any] = [1, 'leaf', get_symbol('leaf')]
+    for _ in range(depth):
+        x = [get_symbol('node'), x, 2.5]
+    return x
+
+
+def setup_to_string(make: Callable[[int], Any]) -> Callable[[int], Tuple[Callable[[], Any], float]]:
+    def setup(size: int) -> Tuple[Callable[[], Any], float]:
+        x = make(size)
+        return lambda: to_string(x), len(to_string(x).encode()) / 1e6
+    return setup
+
+
+MICROBENCHMARKS: Dict[str, Microbenchmark] = {
+    'next-token': Microbenchmark('MB/s', setup_next_token, 200000),
+    'read': Microbenchmark('MB/s', setup_read, 100000),
+    'expand': Microbenchmark('forms/s', setup_expand, 500),
+    'find-depth-0': Microbenchmark('ns', setup_find(0), ITERATIONS),
+    'find-depth-4': Microbenchmark('ns', setup_find(4), ITERATIONS),
+    'find-depth-16': Microbenchmark('ns', setup_find(16), ITERATIONS),
+    'call': Microbenchmark('ns', setup_call('(lambda (x) x)'), ITERATIONS),
+    'call-typed': Microbenchmark('ns', setup_call('(lambda (x :: int) x)'), ITERATIONS),
+    'to-string-deep': Microbenchmark('MB/s', setup_to_string(nested), 300),
+    'to-string-wide': Microbenchmark('MB/s', setup_to_string(
+        lambda size: [[i, str(i), get_symbol('s'), i / 2, True] for i in range(size)]), 5000),
+}
+"""The microbenchmarks, by name."""
+
+
+def measure(name: str, repeat_count: int = 5, size: Optional[int] = None,
+            timer: Callable[[], float] = time.perf_counter) -> Dict[str, Any]:
+    """
+    Run a microbenchmark.
+
+    The thunk runs once untimed, then repeat_count times; the fastest run counts.
+
+    Args:
+        name (str): The microbenchmark.
+        repeat_count (int): The number of timed runs.
+        size (Optional[int]): The size of the work. Defaults to that of the microbenchmark.
+        timer (Callable[[], float]): The clock.
+
+    Returns:
+        Dict[str, Any]: The value and its unit.
+    """
+    bench = MICROBENCHMARKS[name]
+    thunk, work = bench.setup(bench.size if size is None else size)
+    thunk()
+    best = float('inf')
+    for _ in range(repeat_count):
+        start = timer()
+        thunk()
+        best = min(best, timer() - start)
+    value = work / best if bench.unit in RATE_UNITS else best / work * 1e9
+    return {'value': value, 'unit': bench.unit}
+
+
+def run_micro(names: Optional[List[str]] = None, repeat_count: int = 5) -> Dict[str, Dict[str, Any]]:
+    """
+    Run microbenchmarks.
+
+    Args:
+        names (Optional[List[str]]): The microbenchmarks. Defaults to all.
+        repeat_count (int): The number of timed runs of each.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: The result of each (see `measure`), by name.
+
+    Raises:
+        BenchmarkError: If one of the names is not a microbenchmark.
+    """
+    for name in names or ():
+        if name not in MICROBENCHMARKS:
+            raise BenchmarkError(ERR_BENCHMARK_UNKNOWN.format(name, __name__))
+    return {name: measure(name, repeat_count) for name in (names or MICROBENCHMARKS)}
+
+
+def pin_budgets(results: Dict[str, Dict[str, Any]], slack: float) -> Dict[str, Dict[str, Any]]:
+    """
+    Return budgets from results, with room for noise.
+
+    Args:
+        results (Dict[str, Dict[str, Any]]): The results (see `run_micro`).
+        slack (float): The factor the rates may fall by, or the times grow by.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: For each microbenchmark, its unit and its "min" rate or "max" time.
+    """
+    budgets = {}
+    for name, result in results.items():
+        if result['unit'] in RATE_UNITS:
+            budgets[name] = {'unit': result['unit'], 'min': round(result['value'] / slack, 2)}
+        else:
+            budgets[name] = {'unit': result['unit'], 'max': round(result['value'] * slack, 2)}
+    return budgets
+
+
+def check_budgets(results: Dict[str, Dict[str, Any]],
+                  budgets: Dict[str, Dict[str, Any]]) -> List[Tuple[str, float, Dict[str, Any]]]:
+    """
+    Return the results that are not within their budgets.
+
+    Args:
+        results (Dict[str, Dict[str, Any]]): The results (see `run_micro`).
+        budgets (Dict[str, Dict[str, Any]]): The budgets (see `pin_budgets`).
+
+    Returns:
+        List[Tuple[str, float, Dict[str, Any]]]: The name, value and budget of each result over budget.
+    """
+    over = []
+    for name, result in results.items():
+        budget = budgets.get(name)
+        if budget is None:
+            continue
+        if result['value'] < budget.get('min', float('-inf')) or result['value'] > budget.get('max', float('inf')):
+            over.append((name, result['value'], budget))
+    return over
+
+
+def print_micro(results: Dict[str, Dict[str, Any]], budgets: Optional[Dict[str, Dict[str, Any]]] = None,
+                out: Optional[TextIO] = None) -> None:
+    """
+    Print the results of microbenchmarks, with their budgets if given, one per line.
+
+    Args:
+        results (Dict[str, Dict[str, Any]]): The results (see `run_micro`).
+        budgets (Optional[Dict[str, Dict[str, Any]]]): The budgets (see `pin_budgets`).
+        out (Optional[TextIO]): The output stream. Defaults to sys.stdout.
+    """
+    out = sys.stdout if out is None else out
+    budgets = budgets or {}
+    over = {name for name, _, _ in check_budgets(results, budgets)}
+    print(MICRO_HEADER, file=out)
+    for name, result in results.items():
+        budget = budgets.get(name, {})
+        limit = '>= {:.2f}'.format(budget['min']) if 'min' in budget else \
+            '<= {:.2f}'.format(budget['max']) if 'max' in budget else ''
+        status = 'OVER BUDGET' if name in over else ''
+        print(MICRO_LINE.format(name, result['value'], result['unit'], limit, status).rstrip(), file=out)
@@ -0,0 +1,500 @@
+"""
+Libraries.
+
+`load` evaluates a file in the global environment of the program, so all
+of it runs at startup and its names mix with those of the program. A
+library instead has an environment of its own and an explicit list of
+exports:
+
+    (define-library (geometry shapes)
+      (export area (rename make-square square))
+      (import (geometry util))
+      (begin
+        (define (make-square side) (list 'square side))
+        (define (area shape) (sq (car (cdr shape))))))
+
+and a program uses it with `(import (geometry shapes))`. Import sets
+select and rename what is imported: `(only set id ...)`, `(except set id
+...)`, `(prefix set prefix)` and `(rename set (id new-id) ...)`.
+
+Libraries are instantiated lazily, once per interpreter (see `Libraries`):
+the first import of a library finds it, among those declared by
+define-library in the program or else in the files of the search path
+(`(geometry shapes)` is `geometry/shapes.sld` or `geometry/shapes.scm` in
+one of its directories), runs its body in a new environment, a fork of the
+primitives (see `lispy.env.GlobalEnv.fork`), and keeps it; the next imports
+only bind the exported names.
+
+Imported names are linked when they are imported: each one is bound in the
+importing environment to the value it has in the library, so a reference to
+it is an ordinary global lookup there, with no indirection through the
+library. The library keeps a link to the binding (see
+`lispy.env.GlobalEnv.link`) to update it if the library rebinds the name.
+Exported macros are defined in the importing environment, and so are the
+record types of exported variables bound to one, for type annotations.
+
+The expanded body of a library read from a file is cached on disk, next to
+it in `__lispycache__`, so later instantiations skip macro expansion. The
+cache is used while the file and those of the libraries it imports keep
+their size and modification time. Forms that define macros are kept
+unexpanded in the cache and expanded again, to define the macros.
+"""
+import os
+import pickle
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, TextIO, Tuple
+
+from . import evaluator
+from .closures import convert_closures
+from .constants import (
+    LIBRARY_CACHE_DIRNAME,
+    LIBRARY_CACHE_FORMAT,
+    LIBRARY_CACHE_VERSION,
+    LIBRARY_EXTENSIONS,
+    LIBRARY_PATH_VARIABLE,
+)
+from .env import GlobalEnv
+from .errors import LibraryError
+from .inference import infer_types
+from .macros import expand, is_pair, require
+from .messages import (
+    ERR_IMPORT_SET,
+    ERR_LIBRARY_CYCLE,
+    ERR_LIBRARY_DECLARATION,
+    ERR_LIBRARY_EXPORT,
+    ERR_LIBRARY_FILE,
+    ERR_LIBRARY_IMPORT,
+    ERR_LIBRARY_NAME,
+    ERR_LIBRARY_NOT_DECLARED,
+    ERR_LIBRARY_NOT_FOUND,
+)
+from .optimizer import optimize
+from .parser import InPort, read, to_string
+from .primitives import fork_globals
+from .repl import locate
+from .types import (
+    EOF_OBJECT,
+    Exp,
+    Record,
+    Symbol,
+    _begin,
+    _define_library,
+    _except,
+    _export,
+    _import,
+    _only,
+    _prefix,
+    _rename,
+    gensym,
+    get_symbol,
+    is_interned,
+)
+
+LibraryName = Tuple[Any, ...]
+Stamp = Tuple[int, int]
+
+_CODE = 'code'
+_SYNTAX = 'syntax'
+_UNBOUND = object()
+
+
+class Library:
+    """
+    A declared library, and once instantiated, its environment.
+
+    Attributes:
+        name (LibraryName): The name, such as `(geometry shapes)` as a tuple.
+        exports (Dict[Symbol, Symbol]): The names of the exported bindings in the library, by exported name.
+        imports (List[Exp]): The import sets of the library.
+        body (Optional[List[Exp]]): The forms of the body, or None if it was read from the cache.
+        compiled (Optional[List[Tuple[str, Exp]]]): The body read from the cache: expanded forms, and
+            forms that define macros, to expand again.
+        filename (Optional[str]): The file it was declared in, if it was read from one.
+        line (int): The line of its define-library form.
+        sources (Optional[Dict[str, Stamp]]): The size and modification time of the files of the library
+            and, once instantiated, of those of the libraries it imports. None if it was declared in a
+            program, or imports such a library: it is not cached.
+        env (Optional[GlobalEnv]): The environment, once instantiated.
+    """
+    def __init__(self, name: LibraryName, exports: Dict[Symbol, Symbol], imports: List[Exp],
+                 body: Optional[List[Exp]] = None, compiled: Optional[List[Tuple[str, Exp]]] = None,
+                 filename: Optional[str] = None, line: int = 0,
+                 sources: Optional[Dict[str, Stamp]] = None) -> None:
+        self.name = name
+        self.exports = exports
+        self.imports = imports
+        self.body = body
+        self.compiled = compiled
+        self.filename = filename
+        self.line = line
+        self.sources = sources
+        self.env: Optional[GlobalEnv] = None
+
+    def bind(self, external: Symbol, env: GlobalEnv, name: Symbol) -> None:
+        """
+        Bind an exported name in an importing environment, linking a variable to the library.
+
+        Args:
+            external (Symbol): The exported name.
+            env (GlobalEnv): The importing environment.
+            name (Symbol): The name to bind it to there.
+        """
+        internal = self.exports[external]
+        if internal in self.env.macros:
+            env.define_macro(name, self.env.macros[internal])
+        else:
+            value = self.env.get(internal)
+            env[name] = value
+            self.env.link(internal, env, name)
+            if isinstance(value, type) and issubclass(value, Record) and self.env.find_type(value.type_name) is value:
+                env.define_type(value.type_name, value)
+
+
+class Libraries:
+    """
+    The libraries of an interpreter: those it declared, found or instantiated.
+
+    Attributes:
+        make_base (Callable[[], GlobalEnv]): Creates the environment with the primitives that the
+            environments of the libraries are forks of.
+        out (Optional[TextIO]): The output port of the libraries. None for sys.stdout.
+        path (List[str]): The directories to look for library files in.
+        cache (bool): Whether to read and write the on-disk cache.
+        declared (Dict[LibraryName, Library]): The libraries, by name.
+    """
+    def __init__(self, make_base: Callable[[], GlobalEnv], out: Optional[TextIO] = None,
+                 path: Optional[List[str]] = None, cache: bool = True) -> None:
+        """
+        Initialize the libraries of an interpreter.
+
+        Args:
+            make_base (Callable[[], GlobalEnv]): Creates the environment of the primitives, on the
+                first instantiation.
+            out (Optional[TextIO]): The output port. Defaults to sys.stdout.
+            path (Optional[List[str]]): The search path. Defaults to the current directory,
+                followed by the directories of the LISPY_PATH environment variable.
+            cache (bool): Whether to use the on-disk cache. Defaults to True.
+        """
+        self.make_base = make_base
+        self.out = out
+        self.path = default_path() if path is None else list(path)
+        self.cache = cache
+        self.declared: Dict[LibraryName, Library] = {}
+        self._base: Optional[GlobalEnv] = None
+        self._instantiating: List[LibraryName] = []
+
+    def declare(self, x: Exp, filename: Optional[str] = None, line: int = 0) -> Library:
+        """
+        Declare a library, replacing any of the same name.
+
+        Args:
+            x (Exp): The form (define-library name declaration ...).
+            filename (Optional[str]): The file it was read from, if any.
+            line (int): The line it was read on.
+
+        Returns:
+            Library: The library, not instantiated.
+
+        Raises:
+            SchemeSyntaxError: If a declaration is illegal.
+        """
+        require(x, len(x) >= 2)
+        name = library_name(x[1])
+        exports: Dict[Symbol, Symbol] = {}
+        imports: List[Exp] = []
+        body: List[Exp] = []
+        for declaration in x[2:]:
+            require(x, is_pair(declaration) and declaration[0] in (_export, _import, _begin),
+                    ERR_LIBRARY_DECLARATION.format(to_string(declaration)))
+            if declaration[0] is _export:
+                for spec in declaration[1:]:
+                    if isinstance(spec, Symbol):
+                        exports[spec] = spec
+                    else:
+                        require(x, is_pair(spec) and spec[0] is _rename and len(spec) == 3
+                                and all(isinstance(s, Symbol) for s in spec[1:]),
+                                ERR_LIBRARY_DECLARATION.format(to_string(declaration)))
+                        exports[spec[2]] = spec[1]
+            elif declaration[0] is _import:
+                imports.extend(declaration[1:])
+            else:
+                body.extend(declaration[1:])
+        library = self.declared[name] = Library(name, exports, imports, body=body, filename=filename, line=line)
+        return library
+
+    def find(self, name: LibraryName) -> Library:
+        """
+        Return a library, reading it from the search path if it was not declared.
+
+        A file is read from the cache if it is up to date; otherwise every
+        library it declares is declared.
+
+        Args:
+            name (LibraryName): The name of the library.
+
+        Returns:
+            Library: The library.
+
+        Raises:
+            LibraryError: If no file of the search path declares it.
+        """
+        library = self.declared.get(name)
+        if library is not None:
+            return library
+        for directory in self.path:
+            for extension in LIBRARY_EXTENSIONS:
+                filename = os.path.join(directory, *map(str, name)) + extension
+                if not os.path.isfile(filename):
+                    continue
+                library = self.read_cache(filename, name) if self.cache else None
+                if library is None:
+                    self.read(filename)
+                    if name not in self.declared:
+                        raise LibraryError(ERR_LIBRARY_NOT_DECLARED.format(filename, to_string(list(name))))
+                    library = self.declared[name]
+                self.declared[name] = library
+                return library
+        raise LibraryError(ERR_LIBRARY_NOT_FOUND.format(to_string(list(name)), os.pathsep.join(self.path)))
+
+    def read(self, filename: str) -> None:
+        """
+        Declare the libraries of a file, which contains only define-library forms.
+
+        Raises:
+            LibraryError: If the file contains another form.
+        """
+        sources = {filename: stamp(filename)}
+        with open(filename) as f:
+            inport = InPort(f)
+            while True:
+                x = read(inport)
+                if x is EOF_OBJECT:
+                    return
+                if not (is_pair(x) and x[0] is _define_library):
+                    raise LibraryError(ERR_LIBRARY_FILE.format(filename, to_string(x)))
+                self.declare(x, filename, inport.datum_line).sources = dict(sources)
+
+    def instantiate(self, name: LibraryName) -> Library:
+        """
+        Return a library, instantiating it if it is not yet.
+
+        Raises:
+            LibraryError: If it cannot be found, exports a name it does not define, or imports itself.
+        """
+        library = self.find(name)
+        if library.env is None:
+            if name in self._instantiating:
+                raise LibraryError(ERR_LIBRARY_CYCLE.format(to_string(list(name))))
+            self._instantiating.append(name)
+            try:
+                self._instantiate(library)
+            finally:
+                self._instantiating.pop()
+        return library
+
+    def _instantiate(self, library: Library) -> None:
+        """
+        Create the environment of a library, import its imports and run its body.
+        """
+        if self._base is None:
+            self._base = self.make_base()
+        env = fork_globals(self._base, self.out)
+        env.libraries = self
+        sources = None if library.sources is None else dict(library.sources)
+        for spec in library.imports:
+            dependency = self.link(spec, env)
+            if sources is not None and dependency.sources is not None:
+                sources.update(dependency.sources)
+            else:
+                sources = None
+        location = (library.filename, library.line) if library.filename is not None else None
+        compiled = library.compiled
+        if compiled is None:
+            compiled = []
+            for x in flatten(library.body):
+                macros = dict(env.macros)
+                y = expand(x, toplevel=True, env=env)
+                compiled.append((_SYNTAX, x) if env.macros != macros else (_CODE, y))
+                run(y, env, location)
+        else:
+            for kind, x in compiled:
+                run(expand(x, toplevel=True, env=env) if kind == _SYNTAX else x, env, location)
+        for external, internal in library.exports.items():
+            if internal not in env.macros and env.get(internal, _UNBOUND) is _UNBOUND:
+                raise LibraryError(ERR_LIBRARY_EXPORT.format(to_string(list(library.name)), external))
+        if library.compiled is None and sources is not None and self.cache:
+            write_cache(library, compiled, sources)
+        library.env, library.sources = env, sources
+
+    def link(self, spec: Exp, env: GlobalEnv) -> Library:
+        """
+        Import an import set into an environment.
+
+        Args:
+            spec (Exp): The import set.
+            env (GlobalEnv): The importing environment.
+
+        Returns:
+            Library: The library imported from.
+        """
+        library, names = self.resolve(spec)
+        for name, external in names.items():
+            library.bind(external, env, name)
+        return library
+
+    def resolve(self, spec: Exp) -> Tuple[Library, Dict[Symbol, Symbol]]:
+        """
+        Instantiate the library of an import set, and return the names it imports.
+
+        Args:
+            spec (Exp): The import set.
+
+        Returns:
+            Tuple[Library, Dict[Symbol, Symbol]]: The library, and the exported names imported, by
+                the name they are imported as.
+
+        Raises:
+            SchemeSyntaxError: If the import set is illegal.
+            LibraryError: If it names identifiers the library does not export.
+        """
+        msg = ERR_IMPORT_SET.format(to_string(spec))
+        require(spec, is_pair(spec), msg)
+        head = spec[0]
+        if head in (_only, _except, _prefix, _rename) and len(spec) >= 2 and is_pair(spec[1]):
+            library, names = self.resolve(spec[1])
+            if head is _prefix:
+                require(spec, len(spec) == 3 and isinstance(spec[2], Symbol), msg)
+                return library, {get_symbol(spec[2] + name): external for name, external in names.items()}
+            if head is _rename:
+                require(spec, all(is_pair(p) and len(p) == 2 and all(isinstance(s, Symbol) for s in p)
+                                  for p in spec[2:]), msg)
+                renames = dict(spec[2:])
+            else:
+                require(spec, all(isinstance(s, Symbol) for s in spec[2:]), msg)
+                renames = dict.fromkeys(spec[2:])
+            for identifier in renames:
+                if identifier not in names:
+                    raise LibraryError(ERR_LIBRARY_IMPORT.format(to_string(list(library.name)), identifier))
+            if head is _only:
+                return library, {name: names[name] for name in renames}
+            if head is _except:
+                return library, {name: external for name, external in names.items() if name not in renames}
+            return library, {renames.get(name) or name: external for name, external in names.items()}
+        library = self.instantiate(library_name(spec))
+        return library, {external: external for external in library.exports}
+
+    def read_cache(self, filename: str, name: LibraryName) -> Optional[Library]:
+        """
+        Return a library of a file from the cache, or None if it is missing or out of date.
+        """
+        try:
+            with open(cache_filename(filename, name), 'rb') as f:
+                data = _Unpickler(f).load()
+            if any(stamp(source) != tuple(value) for source, value in data['sources'].items()):
+                return None
+        except (OSError, EOFError, KeyError, TypeError, ValueError, AttributeError, pickle.UnpicklingError):
+            return None
+        return Library(name, data['exports'], data['imports'], compiled=data['compiled'], filename=filename,
+                       line=data['line'], sources={filename: tuple(data['sources'][filename])})
+
+
+class _Pickler(pickle.Pickler):
+    """
+    Pickles expressions, saving symbols by name so that they are interned again when loaded.
+    """
+    def persistent_id(self, obj: Any) -> Optional[Tuple[str, str]]:
+        if isinstance(obj, Symbol):
+            return ('symbol' if is_interned(obj) else 'gensym', str(obj))
+        return None
+
+
+class _Unpickler(pickle.Unpickler):
+    """
+    Loads expressions pickled by `_Pickler`, giving each generated symbol a fresh one.
+    """
+    def __init__(self, file: IO[bytes]) -> None:
+        super().__init__(file)
+        self.gensyms: Dict[str, Symbol] = {}
+
+    def persistent_load(self, pid: Tuple[str, str]) -> Symbol:
+        kind, name = pid
+        if kind == 'symbol':
+            return get_symbol(name)
+        if name not in self.gensyms:
+            self.gensyms[name] = gensym(name.rsplit(';', 1)[0])
+        return self.gensyms[name]
+
+
+def default_path() -> List[str]:
+    """
+    Return the default search path: the current directory, then those of the LISPY_PATH environment variable.
+    """
+    return [os.curdir] + [d for d in os.environ.get(LIBRARY_PATH_VARIABLE, '').split(os.pathsep) if d]
+
+
+def library_name(x: Exp) -> LibraryName:
+    """
+    Return a library name as a tuple.
+
+    Raises:
+        SchemeSyntaxError: If x is not a list of symbols and integers.
+    """
+    require(x, is_pair(x) and all(isinstance(p, Symbol) or type(p) is int for p in x),
+            ERR_LIBRARY_NAME.format(to_string(x)))
+    return tuple(x)
+
+
+def flatten(forms: List[Exp]) -> Iterator[Exp]:
+    """
+    Yield the forms of a body, with those of its top-level begin forms spliced in.
+    """
+    for x in forms:
+        if is_pair(x) and x[0] is _begin:
+            yield from flatten(x[1:])
+        else:
+            yield x
+
+
+def run(x: Exp, env: GlobalEnv, location: Optional[Tuple[str, int]]) -> None:
+    """
+    Optimize, type-check, closure-convert and evaluate an expanded form of a library body.
+    """
+    x = convert_closures(infer_types(optimize(x, env), env), env)
+    evaluator.eval(x, env)
+    if location is not None:
+        locate(x, location, env)
+
+
+def stamp(filename: str) -> Stamp:
+    """
+    Return the modification time, in nanoseconds, and the size of a file.
+    """
+    st = os.stat(filename)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def cache_filename(filename: str, name: LibraryName) -> str:
+    """
+    Return the name of the cache file of a library declared in a file.
+    """
+    return os.path.join(os.path.dirname(filename), LIBRARY_CACHE_DIRNAME,
+                        LIBRARY_CACHE_FORMAT.format('.'.join(map(str, name)), LIBRARY_CACHE_VERSION))
+
+
+def write_cache(library: Library, compiled: List[Tuple[str, Exp]], sources: Dict[str, Stamp]) -> None:
+    """
+    Write the compiled body of a library to the cache, if possible: the cache is only an optimization.
+    """
+    filename = cache_filename(library.filename, library.name)
+    data = {'exports': library.exports, 'imports': library.imports, 'compiled': compiled,
+            'line': library.line, 'sources': sources}
+    temp = '%s.%d' % (filename, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(temp, 'wb') as f:
+            _Pickler(f, pickle.HIGHEST_PROTOCOL).dump(data)
+        os.replace(temp, filename)
+    except (OSError, TypeError, AttributeError, pickle.PicklingError):
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
@@ -0,0 +1,758 @@
+"""
+Optimizer module.
+
+This module implements a partial evaluation pass that runs on expanded code,
+between `lispy.macros.expand` and `eval`. It:
+
+- folds calls of pure procedures whose arguments are all constants,
+- replaces `if` forms whose test is a constant by the selected branch,
+- drops side-effect free subforms of `begin` whose value is unused,
+- propagates constants bound by `let` or by global definitions that are
+  never assigned with `set!`,
+- inlines calls of small global procedures and immediately applied lambdas,
+  unless an evaluator hook (a profiler) is installed.
+
+Folds that rely on the value of a global name (the procedure bound to `+`, a
+global constant, an inlined procedure) produce `OptimizedExp` nodes registered
+with the global environment, so that rebinding the name deoptimizes them back
+to the original code. Like the expander, the pass runs as generator tasks driven by
+`lispy.macros.run_tasks`, so it does not recurse on the Python stack.
+"""
+from types import GeneratorType
+from typing import Any, Callable, Dict, FrozenSet, List, NamedTuple, Optional, Set, Tuple
+
+from .constants import INLINE_DEPTH_LIMIT, INLINE_SIZE_LIMIT, TYPE_ANNOTATION_CHAR
+from .env import Env, GlobalEnv, global_env
+from .evaluator import PROFILERS, SPECIAL_FORMS, Procedure
+from .macros import Tasks, is_pair, param_names, run_tasks
+from .types import (
+    Exp,
+    OptimizedExp,
+    Symbol,
+    _arrow,
+    _begin,
+    _box,
+    _case,
+    _cond,
+    _cover,
+    _define,
+    _do,
+    _dynamic_let,
+    _if,
+    _lambda,
+    _let,
+    _letrec,
+    _letrec_star,
+    _loop,
+    _quote,
+    _recur,
+    _set,
+    _set_box,
+    _try,
+    _unbox,
+    _unless,
+    _when,
+    gensym,
+)
+
+PURE_PROCEDURES: Set[Callable] = set()
+"""Procedures without side effects that may be called at compile time; filled by `lispy.primitives`."""
+
+ATOM_TYPES = (int, float, complex, str)
+"""Types of immutable values that folding may embed in code."""
+
+NO_DEPS: FrozenSet[Symbol] = frozenset()
+
+BINDING_FORMS = {_lambda, _let, _letrec, _letrec_star, _loop, _do}
+
+
+class Constant(NamedTuple):
+    """
+    A value known at compile time.
+
+    Attributes:
+        value (Any): The value.
+        deps (FrozenSet[Symbol]): The global names whose bindings the value relies on.
+    """
+    value: Any
+    deps: FrozenSet[Symbol]
+
+
+Result = Tuple[Exp, Optional[Constant]]
+
+
+class Scope:
+    """
+    The lexical context of the optimizer.
+
+    Lexical bindings are kept as a stack of known constants (or None) per name,
+    pushed and popped as binding forms are entered and left.
+
+    Attributes:
+        env (Env): The global environment the code will run in.
+        assigned (Set[Symbol]): Names the program assigns or defines, which are not constants.
+        local_defines (Set[Symbol]): Names defined inside a procedure or let body.
+        bindings (Dict[Symbol, List[Optional[Constant]]]): The lexical bindings in scope.
+        inlining (Set[Symbol]): The procedures whose inlined body is being optimized.
+    """
+    def __init__(self, env: Env, assigned: Set[Symbol], local_defines: Set[Symbol]) -> None:
+        self.env = env
+        self.tracked = isinstance(env, GlobalEnv)
+        self.assigned = assigned
+        self.local_defines = local_defines
+        self.bindings: Dict[Symbol, List[Optional[Constant]]] = {}
+        self.inlining: Set[Symbol] = set()
+
+    def bind(self, names: List[Symbol], constants: Optional[List[Optional[Constant]]] = None) -> None:
+        """
+        Enter a scope binding names, with their constant values if known.
+        """
+        for i, name in enumerate(names):
+            self.bindings.setdefault(name, []).append(constants[i] if constants else None)
+
+    def unbind(self, names: List[Symbol]) -> None:
+        """
+        Leave the scope entered by `bind`.
+        """
+        for name in names:
+            stack = self.bindings[name]
+            stack.pop()
+            if not stack:
+                del self.bindings[name]
+
+    def global_value(self, name: Symbol) -> Any:
+        """
+        Return the value a free name has in the global environment, if it can be relied upon.
+
+        Args:
+            name (Symbol): The name.
+
+        Returns:
+            Any: The value, or None if the name is lexically bound, assigned,
+                unbound, or the environment cannot track its dependents.
+        """
+        if (not self.tracked or name in self.bindings or name in self.local_defines
+                or name in self.assigned or name in self.env.assigned):
+            return None
+        return self.env.get(name)
+
+    def lookup(self, name: Symbol) -> Result:
+        """
+        Optimize a variable reference.
+
+        Args:
+            name (Symbol): The variable.
+
+        Returns:
+            Result: The constant value of the variable if known, or the variable.
+        """
+        stack = self.bindings.get(name)
+        if stack:
+            known = stack[-1]
+            return (name, None) if known is None else (_literal(known.value), known)
+        value = self.global_value(name)
+        if not isinstance(value, ATOM_TYPES):
+            return name, None
+        deps = frozenset([name])
+        return self.guard([_quote, value], [_begin, name], deps), Constant(value, deps)
+
+    def substitutable(self, x: Exp) -> bool:
+        """
+        Check whether an optimized expression may be duplicated or moved freely.
+
+        This is the case for constants and for lexical variables that are never
+        assigned.
+        """
+        if isinstance(x, Symbol):
+            return x in self.bindings and x not in self.assigned and x not in self.local_defines
+        return not isinstance(x, list) or x[0] is _quote
+
+    def guard(self, exp: List[Exp], original: List[Exp], deps: FrozenSet[Symbol]) -> Exp:
+        """
+        Make optimized code that falls back to the original when a dependency is rebound.
+
+        Args:
+            exp (List[Exp]): The optimized code.
+            original (List[Exp]): The original code.
+            deps (FrozenSet[Symbol]): The global names the optimization relies on.
+
+        Returns:
+            Exp: exp itself if there are no dependencies, else an `OptimizedExp`.
+        """
+        if not deps:
+            return exp
+        node = OptimizedExp(exp, original, deps)
+        self.env.depend(deps, node)
+        return node
+
+
+def _literal(value: Any) -> Exp:
+    """
+    Return code evaluating to a constant value.
+    """
+    return [_quote, value] if isinstance(value, (Symbol, list)) else value
+
+
+def _as_node(x: Exp) -> Tuple[List[Exp], FrozenSet[Symbol]]:
+    """
+    Return a fresh list evaluating as x, suitable for an `OptimizedExp`.
+
+    Loop forms are wrapped rather than copied, since their frame keeps a
+    reference to the form itself.
+
+    Returns:
+        Tuple[List[Exp], FrozenSet[Symbol]]: The list, and the dependencies of x
+            if it was an `OptimizedExp` that has been copied.
+    """
+    if not isinstance(x, list) or x[0] is _loop:
+        return [_begin, x], NO_DEPS
+    return list(x), getattr(x, 'deps', NO_DEPS)
+
+
+def _is_pure(proc: Any) -> bool:
+    """
+    Check whether a value is a procedure that may be called at compile time.
+    """
+    try:
+        return proc in PURE_PROCEDURES
+    except TypeError:                   # unhashable values are not procedures
+        return False
+
+
+def _child(x: Exp, scope: Scope) -> Tasks:
+    """
+    Optimize a sub-expression; lists are optimized as a sub-task.
+
+    Args:
+        x (Exp): The expression.
+        scope (Scope): The lexical context.
+
+    Returns:
+        Result: The optimized expression and its constant value, if known.
+    """
+    if isinstance(x, list):
+        return (yield _optimize(x, scope))
+    elif isinstance(x, Symbol):
+        return scope.lookup(x)
+    return x, Constant(x, NO_DEPS)
+
+
+def _children(xs: List[Exp], scope: Scope) -> Tasks:
+    """
+    Optimize every expression of a list, in order.
+
+    Returns:
+        List[Result]: The results.
+    """
+    results = []
+    for x in xs:
+        results.append((yield from _child(x, scope)))
+    return results
+
+
+def optimize_quote(x: Exp, scope: Scope) -> Result:
+    """
+    Optimize a quote expression: its datum is a constant.
+    """
+    return x, Constant(x[1], NO_DEPS)
+
+
+def optimize_if(x: Exp, scope: Scope) -> Tasks:
+    """
+    Optimize an if expression, selecting the branch when the test is a constant.
+
+    Returns:
+        Result: The optimized expression.
+    """
+    test, known = yield from _child(x[1], scope)
+    branches = yield from _children(x[2:], scope)
+    exp = [_if, test] + [e for e, _ in branches]
+    if known is None:
+        return exp, None
+    branches.append((None, Constant(None, NO_DEPS)))
+    branch, value = branches[0] if known.value else branches[1]
+    value = value and Constant(value.value, known.deps | value.deps)
+    if not known.deps:
+        return branch, value
+    node, deps = _as_node(branch)
+    return scope.guard(node, exp, known.deps | deps), value
+
+
+def optimize_set(x: Exp, scope: Scope) -> Tasks:
+    """
+    Optimize a set! or define expression: only the value is optimized.
+
+    Returns:
+        Result: The optimized expression.
+    """
+    value, _ = yield from _child(x[-1], scope)
+    return x[:-1] + [value], None
+
+
+def optimize_lambda(x: Exp, scope: Scope) -> Tasks:
+    """
+    Optimize a lambda expression; its parameters shadow outer bindings.
+
+    Returns:
+        Result: The optimized expression.
+    """
+    params = param_names(x[1])
+    scope.bind(params)
+    body, _ = yield from _child(x[2], scope)
+    scope.unbind(params)
+    return [_lambda, x[1], body] + x[3:], None
+
+
+def _discardable(x: Exp, known: Optional[Constant], scope: Scope) -> bool:
+    """
+    Check whether evaluating an optimized expression has no effect at all.
+    """
+    if known is not None:
+        return not known.deps
+    elif isinstance(x, Symbol):
+        return x in scope.bindings
+    return type(x) is list and x[0] is _lambda
+
+
+def optimize_begin(x: Exp, scope: Scope) -> Tasks:
+    """
+    Optimize a begin expression, dropping effect-free subforms whose value is unused.
+
+    Returns:
+        Result: The optimized expression.
+    """
+    if len(x) == 1:
+        return x, None
+    results = yield from _children(x[1:], scope)
+    body = [e for e, known in results[:-1] if not _discardable(e, known, scope)]
+    last, known = results[-1]
+    if not body:
+        return last, known
+    return [_begin] + body + [last], None
+
+
+def _defines(x: Exp) -> bool:
+    """
+    Check whether evaluating x may define a variable in the current frame.
+
+    Lambda bodies run in their own frame and are not searched.
+    """
+    stack = [x]
+    while stack:
+        x = stack.pop()
+        if not is_pair(x) or x[0] is _quote or x[0] is _lambda:
+            continue
+        elif x[0] is _define:
+            return True
+        stack.extend(x)
+    return False
+
+
+def optimize_let(x: Exp, scope: Scope) -> Tasks:
+    """
+    Optimize a let, named let or #%loop expression.
+
+    The variables of a plain let that are bound to constants and never
+    assigned are propagated into the body and their bindings dropped; a let
+    left without bindings is replaced by its body, unless the body defines
+    variables in its frame.
+
+    Returns:
+        Result: The optimized expression.
+    """
+    named = isinstance(x[1], Symbol)
+    names = [x[1]] if named else []
+    bindings, body = x[-2], x[-1]
+    names_vars = [b[0] for b in bindings]
+    inits = yield from _children([b[1] for b in bindings], scope)
+    constants = None
+    if not named:
+        constants = [known if known is not None and not known.deps
+                     and var not in scope.assigned and var not in scope.local_defines else None
+                     for var, (_, known) in zip(names_vars, inits)]
+    scope.bind(names)
+    scope.bind(names_vars, constants)
+    body, known = yield from _child(body, scope)
+    scope.unbind(names_vars)
+    scope.unbind(names)
+    bindings = [[var, init] for var, (init, _) in zip(names_vars, inits)]
+    if named:
+        return x[:-2] + [bindings, body], None
+    bindings = [b for b, propagated in zip(bindings, constants) if propagated is None]
+    if not bindings and not _defines(body):
+        return body, known
+    return [_let, bindings, body], None
+
+
+def optimize_letrec(x: Exp, scope: Scope) -> Tasks:
+    """
+    Optimize a letrec or letrec* expression; the values are in the scope of the variables.
+
+    Returns:
+        Result: The optimized expression.
+    """
+    (op, bindings, body) = x
+    names_vars = [b[0] for b in bindings]
+    scope.bind(names_vars)
+    inits = yield from _children([b[1] for b in bindings], scope)
+    body, _ = yield from _child(body, scope)
+    scope.unbind(names_vars)
+    return [op, [[var, init] for var, (init, _) in zip(names_vars, inits)], body], None
+
+
+def optimize_recur(x: Exp, scope: Scope) -> Tasks:
+    """
+    Optimize a #%recur expression: only the new values are optimized.
+
+    Returns:
+        Result: The optimized expression.
+    """
+    args = yield from _children(x[2:], scope)
+    return x[:2] + [e for e, _ in args], None
+
+
+def optimize_do(x: Exp, scope: Scope) -> Tasks:
+    """
+    Optimize a do loop.
+
+    Returns:
+        Result: The optimized expression.
+    """
+    (_, bindings, test_and_result, command, fresh) = x
+    names_vars = [b[0] for b in bindings]
+    inits = yield from _children([b[1] for b in bindings], scope)
+    scope.bind(names_vars)
+    steps = yield from _children([b[2] for b in bindings if len(b) == 3], scope)
+    test_and_result = yield from _children(test_and_result, scope)
+    command, _ = yield from _child(command, scope)
+    scope.unbind(names_vars)
+    steps = iter(steps)
+    bindings = [[b[0], init] + ([next(steps)[0]] if len(b) == 3 else [])
+                for b, (init, _) in zip(bindings, inits)]
+    return [_do, bindings, [e for e, _ in test_and_result], command, fresh], None
+
+
+def optimize_cond(x: Exp, scope: Scope) -> Tasks:
+    """
+    Optimize a cond expression.
+
+    Returns:
+        Result: The optimized expression.
+    """
+    clauses = []
+    for clause in x[1:]:
+        parts = [e for e in clause if e is not _arrow]
+        parts = [e for e, _ in (yield from _children(parts, scope))]
+        if len(clause) == 3:
+            parts.insert(1, _arrow)
+        clauses.append(parts)
+    return [_cond] + clauses, None
+
+
+def optimize_case(x: Exp, scope: Scope) -> Tasks:
+    """
+    Optimize a case expression.
+
+    Returns:
+        Result: The optimized expression.
+    """
+    (_, key, table, bodies, default) = x
+    key, _ = yield from _child(key, scope)
+    bodies = yield from _children(bodies, scope)
+    default, _ = yield from _child(default, scope)
+    return [_case, key, table, [e for e, _ in bodies], default], None
+
+
+def optimize_children(x: Exp, scope: Scope) -> Tasks:
+    """
+    Optimize a special form whose operands are all expressions (try, when, unless).
+
+    Returns:
+        Result: The optimized expression.
+    """
+    operands = yield from _children(x[1:], scope)
+    return [x[0]] + [e for e, _ in operands], None
+
+
+def optimize_cover(x: Exp, scope: Scope) -> Tasks:
+    """
+    Optimize a coverage probe: only its expression is optimized, and it is never a constant,
+    so that the probe is not folded away.
+
+    Returns:
+        Result: The optimized expression.
+    """
+    (exp, _), = yield from _children(x[-1:], scope)
+    return x[:-1] + [exp], None
+
+
+def optimize_dynamic_let(x: Exp, scope: Scope) -> Tasks:
+    """
+    Optimize a dynamic-let expression.
+
+    Returns:
+        Result: The optimized expression.
+    """
+    (_, bindings, *body) = x
+    inits = yield from _children([b[1] for b in bindings], scope)
+    body = yield from _children(body, scope)
+    bindings = [[b[0], init] for b, (init, _) in zip(bindings, inits)]
+    return [_dynamic_let, bindings] + [e for e, _ in body], None
+
+
+def _inline_info(body: Exp) -> Optional[Tuple[Set[Symbol], Set[Symbol], Set[Symbol]]]:
+    """
+    Inspect a procedure body to decide whether it may be inlined.
+
+    Args:
+        body (Exp): The body.
+
+    Returns:
+        Optional[Tuple[Set[Symbol], Set[Symbol], Set[Symbol]]]: The symbols used by
+            the body, the variables it binds and the variables it assigns; or None
+            if the body is larger than INLINE_SIZE_LIMIT, defines variables,
+            creates procedures or holds boxes made by `lispy.closures`.
+
+    A body creating a procedure is not inlined: at a call site in a loop whose
+    frame is reused by each iteration (see `lispy.closures`), the procedure
+    would capture the loop's variables rather than their values.
+    """
+    symbols, binders, assigned = set(), set(), set()
+    stack, size = [body], 0
+    while stack:
+        x = stack.pop()
+        size += 1
+        if size > INLINE_SIZE_LIMIT:
+            return None
+        elif isinstance(x, Symbol):
+            symbols.add(x)
+        if not is_pair(x) or x[0] is _quote:
+            continue
+        op = x[0]
+        if op is _define or op is _lambda or op is _box or op is _unbox or op is _set_box:
+            return None
+        elif op is _let and len(x) == 5:     # converted closures
+            return None
+        elif op is _set:
+            assigned.add(x[1])
+        elif op is _dynamic_let:
+            assigned.update(b[0] for b in x[1])
+        elif isinstance(op, Symbol) and op in BINDING_FORMS:
+            if isinstance(x[1], Symbol):    # named let
+                binders.add(x[1])
+            binders.update(b[0] for b in x[2 if isinstance(x[1], Symbol) else 1])
+        stack.extend(x)
+        if isinstance(x, OptimizedExp):
+            stack.append(x.original)
+    return symbols, binders, assigned
+
+
+def _substitute(x: Exp, mapping: Dict[Symbol, Exp], scope: Scope) -> Exp:
+    """
+    Copy an inlined body, replacing its parameters.
+
+    Guarded nodes are copied into new guarded nodes with the same dependencies;
+    quoted data is shared.
+
+    Args:
+        x (Exp): The body.
+        mapping (Dict[Symbol, Exp]): The replacement of each parameter.
+        scope (Scope): The lexical context of the call site.
+
+    Returns:
+        Exp: The copy.
+    """
+    if isinstance(x, Symbol):
+        return mapping.get(x, x)
+    elif not is_pair(x) or x[0] is _quote:
+        return x
+    copy = [_substitute(xi, mapping, scope) for xi in x]
+    if isinstance(x, OptimizedExp):
+        return scope.guard(copy, _substitute(x.original, mapping, scope), x.deps)
+    return copy
+
+
+def _inline(x: List[Exp], scope: Scope) -> Optional[Exp]:
+    """
+    Return the body of the procedure called by x, with the arguments in place of the parameters.
+
+    Only global procedures defined at top level, without type annotations,
+    with a fixed arity, and whose body is small, does not define variables and
+    does not call the procedure itself, are inlined. The body must not use a
+    name that the call site binds lexically, and must not rebind a parameter.
+    Arguments that are constants or unassigned lexical variables are
+    substituted directly; the others are bound by a let to fresh names.
+    Nothing is inlined while an evaluator hook is installed (see
+    `PROFILERS`), so that the calls show in its profile.
+
+    Args:
+        x (List[Exp]): An optimized call.
+        scope (Scope): The lexical context of the call.
+
+    Returns:
+        Optional[Exp]: The code to evaluate instead of the call, or None.
+    """
+    name, args = x[0], x[1:]
+    if (PROFILERS or not isinstance(name, Symbol) or name in scope.inlining
+            or len(scope.inlining) >= INLINE_DEPTH_LIMIT):
+        return None
+    proc = scope.global_value(name)
+    if (not isinstance(proc, Procedure) or proc.env is not scope.env or proc.types
+            or not isinstance(proc.parms, list) or len(proc.parms) != len(args)):
+        return None
+    info = _inline_info(proc.exp)
+    if info is None:
+        return None
+    symbols, binders, assigned = info
+    params = set(proc.parms)
+    if (name in symbols or binders & params
+            or any(s in scope.bindings or s in scope.local_defines for s in symbols - params)):
+        return None
+    mapping, bindings = {}, []
+    for param, arg in zip(proc.parms, args):
+        if param not in assigned and scope.substitutable(arg):
+            mapping[param] = arg
+        else:
+            mapping[param] = gensym(param)
+            bindings.append([mapping[param], arg])
+    scope.assigned.update(mapping[param] for param in assigned & params)
+    body = _substitute(proc.exp, mapping, scope)
+    return [_let, bindings, body] if bindings else body
+
+
+def optimize_call(x: Exp, scope: Scope) -> Tasks:
+    """
+    Optimize a procedure call.
+
+    A lambda applied directly becomes a let. A call of a pure procedure on
+    constant arguments is folded, unless it raises or returns a mutable
+    value. A call of a small global procedure is inlined.
+
+    Returns:
+        Result: The optimized expression.
+    """
+    op = x[0]
+    if (is_pair(op) and op[0] is _lambda and isinstance(op[1], list)
+            and len(op[1]) == len(x) - 1 and TYPE_ANNOTATION_CHAR not in op[1]):
+        return (yield _optimize([_let, [[p, arg] for p, arg in zip(op[1], x[1:])], op[2]], scope))
+    results = yield from _children(x, scope)
+    exp = [e for e, _ in results]
+    args = [known for _, known in results[1:]]
+    if isinstance(op, Symbol) and all(known is not None for known in args):
+        proc = scope.global_value(op)
+        if _is_pure(proc):
+            try:
+                value = proc(*[known.value for known in args])
+            except Exception:
+                value = None
+            if isinstance(value, ATOM_TYPES):
+                deps = frozenset([op]).union(*[known.deps for known in args])
+                return scope.guard([_quote, value], exp, deps), Constant(value, deps)
+    inlined = _inline(exp, scope)
+    if inlined is None:
+        return exp, None
+    scope.inlining.add(op)
+    inlined, known = yield from _child(inlined, scope)
+    scope.inlining.discard(op)
+    node, deps = _as_node(inlined)
+    deps |= {op}
+    return scope.guard(node, exp, deps), known and Constant(known.value, known.deps | deps)
+
+
+OPTIMIZERS = {
+    _quote: optimize_quote,
+    _if: optimize_if,
+    _set: optimize_set,
+    _define: optimize_set,
+    _lambda: optimize_lambda,
+    _begin: optimize_begin,
+    _try: optimize_children,
+    _dynamic_let: optimize_dynamic_let,
+    _let: optimize_let,
+    _loop: optimize_let,
+    _recur: optimize_recur,
+    _letrec: optimize_letrec,
+    _letrec_star: optimize_letrec,
+    _do: optimize_do,
+    _cond: optimize_cond,
+    _case: optimize_case,
+    _when: optimize_children,
+    _unless: optimize_children,
+    _cover: optimize_cover,
+}
+
+
+def _optimize(x: List[Exp], scope: Scope) -> Tasks:
+    """
+    Task that optimizes a compound expression.
+
+    Special forms without an optimizer are left unchanged.
+
+    Args:
+        x (List[Exp]): The expression.
+        scope (Scope): The lexical context.
+
+    Returns:
+        Result: The optimized expression and its constant value, if known.
+    """
+    op = x[0] if x else None
+    if isinstance(x, OptimizedExp):     # already optimized (in an inlined body)
+        return x, Constant(x[1], x.deps) if op is _quote else None
+    elif isinstance(op, Symbol) and op in SPECIAL_FORMS:
+        if op not in OPTIMIZERS:
+            return x, None
+        result = OPTIMIZERS[op](x, scope)
+        if isinstance(result, GeneratorType):
+            result = yield from result
+        return result
+    return (yield from optimize_call(x, scope))
+
+
+def _scan(x: Exp) -> Tuple[Set[Symbol], Set[Symbol], Set[Symbol]]:
+    """
+    Collect the names a program assigns or defines.
+
+    Args:
+        x (Exp): The expanded program.
+
+    Returns:
+        Tuple[Set[Symbol], Set[Symbol], Set[Symbol]]: The names assigned by set!
+            or dynamic-let, the names defined inside a procedure or let body, and
+            the names defined at top level.
+    """
+    assigned, local_defines, defined = set(), set(), set()
+    stack = [(x, False)]
+    while stack:
+        x, inside = stack.pop()
+        if not is_pair(x) or x[0] is _quote:
+            continue
+        op = x[0]
+        if op is _set:
+            assigned.add(x[1])
+        elif op is _dynamic_let:
+            assigned.update(b[0] for b in x[1])
+        elif op is _define:
+            (local_defines if inside else defined).add(x[1])
+        inside = inside or (isinstance(op, Symbol) and op in BINDING_FORMS)
+        stack.extend((xi, inside) for xi in x)
+    return assigned, local_defines, defined
+
+
+def optimize(x: Exp, env: Optional[Env] = None) -> Exp:
+    """
+    Optimize an expanded program.
+
+    Args:
+        x (Exp): The expanded program.
+        env (Optional[Env]): The global environment it will run in. Defaults to global_env.
+
+    Returns:
+        Exp: The optimized program.
+    """
+    if env is None:
+        env = global_env
+    assigned, local_defines, defined = _scan(x)
+    if isinstance(env, GlobalEnv):
+        env.assigned.update(assigned)
+    scope = Scope(env, assigned | defined, local_defines)
+    return run_tasks(_child(x, scope))[0]
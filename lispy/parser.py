@@ -6,22 +6,28 @@ Abstract Syntax Trees (ASTs).
 """
 import re
 from functools import singledispatch
-from typing import Any, Optional, TextIO
+from typing import Any, Dict, Optional, TextIO, Tuple
 
 from .constants import (
     COMMENT_CHAR,
     COMPLEX_IMAG_CHAR_PYTHON,
     COMPLEX_IMAG_CHAR_SCHEME,
     FALSE_LITERAL,
+    HASH_TABLE_FORMAT,
     LPAREN,
     READ_CHUNK_SIZE,
+    RECORD_FIELD_FORMAT,
+    RECORD_FORMAT,
+    RECORD_SLOT_FORMAT,
     RPAREN,
+    SOURCE_STRING,
     STRING_QUOTE,
     TOKENIZER_REGEX,
     TRUE_LITERAL,
+    VECTOR_PREFIX,
 )
 from .errors import ParseError
-from .types import EOF_OBJECT, QUOTES, Atom, Exp, Symbol, get_symbol
+from .types import EOF_OBJECT, QUOTES, Atom, Exp, HashTable, Record, Symbol, Vector, get_symbol
 
 
 class InPort:
@@ -31,18 +37,28 @@ class InPort:
     Attributes:
         file (TextIO): The file object to read from.
         line (str): The current line buffer.
+        name (str): The name of the file, for source locations.
+        lineno (int): The number of lines read so far.
+        datum_line (int): The line on which the last datum read starts.
+        positions (Optional[Dict[int, Tuple[int, list]]]): If set, the line on which each list read
+            starts, with the list, by id.
     """
     tokenizer = TOKENIZER_REGEX
 
-    def __init__(self, file: TextIO) -> None:
+    def __init__(self, file: TextIO, name: Optional[str] = None) -> None:
         """
         Initialize the InPort.
 
         Args:
             file (TextIO): The file-like object to read from.
+            name (Optional[str]): The name of the source. Defaults to the name of the file.
         """
         self.file = file
         self.line = ''
+        self.name = name if name is not None else getattr(file, 'name', SOURCE_STRING)
+        self.lineno = 0
+        self.datum_line = 0
+        self.positions: Optional[Dict[int, Tuple[int, list]]] = None
 
     def next_token(self) -> Optional[str]:
         """
@@ -54,8 +70,9 @@ class InPort:
         while True:
             if self.line == '':
                 self.line = self.file.readline()
-            if self.line == '':
-                return EOF_OBJECT
+                if self.line == '':
+                    return EOF_OBJECT
+                self.lineno += 1
             token, self.line = re.match(InPort.tokenizer, self.line).groups()
             if token != '' and not token.startswith(COMMENT_CHAR):
                 return token
@@ -103,6 +120,8 @@ def read(inport: InPort) -> Exp:
         """
         if LPAREN == token:
             L = []
+            if inport.positions is not None:
+                inport.positions[id(L)] = (inport.lineno, L)
             while True:
                 token = inport.next_token()
                 if token == RPAREN:
@@ -112,14 +131,21 @@ def read(inport: InPort) -> Exp:
         elif RPAREN == token:
             raise ParseError('unexpected )')
         elif token in QUOTES:
-            return [QUOTES[token], read(inport)]
+            L = [QUOTES[token]]
+            if inport.positions is not None:
+                inport.positions[id(L)] = (inport.lineno, L)
+            L.append(read(inport))
+            return L
         elif token is EOF_OBJECT:
             raise ParseError('unexpected EOF in list')
         else:
             return atom(token)
 
     token1 = inport.next_token()
-    return EOF_OBJECT if token1 is EOF_OBJECT else read_ahead(token1)
+    line = inport.lineno
+    x = EOF_OBJECT if token1 is EOF_OBJECT else read_ahead(token1)
+    inport.datum_line = line
+    return x
 
 
 def atom(token: str) -> Atom:
@@ -184,6 +210,23 @@ def _(x: list) -> str:
     return LPAREN + ' '.join(map(to_string, x)) + RPAREN
 
 
+@to_string.register
+def _(x: Vector) -> str:
+    return VECTOR_PREFIX + LPAREN + ' '.join(map(to_string, x.items)) + RPAREN
+
+
+@to_string.register
+def _(x: HashTable) -> str:
+    return HASH_TABLE_FORMAT.format(len(x))
+
+
+@to_string.register
+def _(x: Record) -> str:
+    values = (RECORD_FIELD_FORMAT.format(field, to_string(getattr(x, RECORD_SLOT_FORMAT.format(i))))
+              for i, field in enumerate(x.fields))
+    return RECORD_FORMAT.format(' '.join([x.type_name, *values]))
+
+
 @to_string.register
 def _(x: complex) -> str:
     return str(x).replace(COMPLEX_IMAG_CHAR_PYTHON, COMPLEX_IMAG_CHAR_SCHEME)
@@ -0,0 +1,412 @@
+"""
+Pattern matching.
+
+This module compiles `match` expressions into decision trees at expansion time:
+
+    (match exp
+      (pattern body ...)
+      ...
+      (else body ...))
+
+The patterns are:
+
+- `_`, which matches anything, and a symbol, which binds the value to it;
+- a number, string or boolean, or a quoted datum, compared like eqv?
+  (equal? for quoted lists);
+- `(p ...)`, a list of exactly as many elements, and `(p ... . rest)`, a list
+  of at least as many elements, binding `rest` to the remaining ones;
+- `(p q ... r)`: a `...` after a pattern matches it against zero or more
+  elements, and binds each of its variables to the list of their values;
+- `(? pred p ...)`: a value for which `pred` is true and that matches every p;
+- `($ type p ...)`: a record of the record type `type` whose first fields
+  match the p.
+
+Every pattern is reduced to a list of tests on the parts of the value, each
+identified by its path (indexes into lists and records). The clauses are then
+compiled together into nested `if` expressions: a test is made once on any
+path through the tree, whatever the number of clauses that need it, and a test
+whose outcome follows from earlier ones (a list of length 2 is not of length 3)
+is not made at all. A leaf binds the variables of its clause with a `let`,
+reading each part by index, without the copies `cdr` makes. The body of a
+clause reached from several leaves is made a procedure, unless it is small
+enough to be repeated.
+
+Clauses that test the same parts in different ways can make the tree grow
+exponentially with their number, since a test that fails for one clause
+leaves the others to test in both branches. Beyond `MATCH_TREE_LIMIT` tests,
+the clauses are instead tried in turn, each making all of its tests.
+
+The result is ordinary code, which the later passes optimize like any other.
+"""
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from .constants import INLINE_SIZE_LIMIT, MATCH_TREE_LIMIT
+from .errors import SchemeSyntaxError
+from .messages import ERR_ILLEGAL_CLAUSE, ERR_MATCH_PATTERN, ERR_MATCH_VARIABLE
+from .parser import to_string
+from .types import (
+    Exp,
+    Symbol,
+    _begin,
+    _dot,
+    _ellipsis,
+    _else,
+    _if,
+    _lambda,
+    _let,
+    _list_ref,
+    _list_slice,
+    _list_tail,
+    _match_eq,
+    _match_equal,
+    _match_error,
+    _match_every,
+    _match_length,
+    _match_map,
+    _match_min_length,
+    _match_predicate,
+    _match_record,
+    _match_record_type,
+    _quote,
+    _record_field,
+    _underscore,
+    gensym,
+)
+
+# Kinds of tests
+LENGTH = 'length'           # (LENGTH, path, n): a list of n elements
+MIN_LENGTH = 'min-length'   # (MIN_LENGTH, path, n): a list of at least n elements
+EQUAL = 'equal'             # (EQUAL, path, datum)
+PREDICATE = 'predicate'     # (PREDICATE, path, exp)
+RECORD = 'record'           # (RECORD, path, exp)
+EVERY = 'every'             # (EVERY, path, tests): every element passes the tests
+
+# Steps of paths
+INDEX = 'index'             # (INDEX, k): element k, counted from the end if negative
+TAIL = 'tail'               # (TAIL, k): the elements from k on
+SLICE = 'slice'             # (SLICE, start, end): the elements from start, without the last end
+FIELD = 'field'             # (FIELD, k): field k of a record
+
+STEPS = {INDEX: _list_ref, TAIL: _list_tail, SLICE: _list_slice, FIELD: _record_field}
+
+Path = Tuple[Tuple[Any, ...], ...]
+Test = Tuple[Any, ...]
+Access = Tuple[Any, ...]    # ('path', path) or ('each', path, access) for variables under an ellipsis
+
+
+class Pattern(NamedTuple):
+    """
+    A compiled pattern.
+
+    Attributes:
+        tests (List[Test]): The tests the value must pass, each after those on the enclosing parts.
+        binds (List[Tuple[Symbol, Access]]): The variables and where their values are.
+    """
+    tests: List[Test]
+    binds: List[Tuple[Symbol, Access]]
+
+
+def _fail(pattern: Exp) -> None:
+    raise SchemeSyntaxError(ERR_MATCH_PATTERN.format(to_string(pattern)))
+
+
+def _bind(var: Symbol, access: Access, out: Pattern) -> None:
+    if any(var == name for name, _ in out.binds):
+        raise SchemeSyntaxError(ERR_MATCH_VARIABLE.format(var))
+    out.binds.append((var, access))
+
+
+def compile_pattern(pattern: Exp, path: Path = (), out: Optional[Pattern] = None) -> Pattern:
+    """
+    Reduce a pattern to tests and bindings.
+
+    Args:
+        pattern (Exp): The pattern.
+        path (Path): The path of the part of the value it is matched against.
+        out (Optional[Pattern]): Accumulator.
+
+    Returns:
+        Pattern: The tests and bindings.
+
+    Raises:
+        SchemeSyntaxError: If the pattern is malformed or binds a variable twice.
+    """
+    out = Pattern([], []) if out is None else out
+    if isinstance(pattern, Symbol):
+        if pattern is _ellipsis or pattern is _dot:
+            _fail(pattern)
+        elif pattern is not _underscore:
+            _bind(pattern, ('path', path), out)
+    elif not isinstance(pattern, list):
+        out.tests.append((EQUAL, path, pattern))
+    elif not pattern:
+        out.tests.append((LENGTH, path, 0))
+    elif pattern[0] is _quote:
+        if len(pattern) != 2:
+            _fail(pattern)
+        out.tests.append((EQUAL, path, pattern[1]))
+    elif pattern[0] is _match_predicate or pattern[0] is _match_record_type:
+        if len(pattern) < 2:
+            _fail(pattern)
+        out.tests.append((PREDICATE if pattern[0] is _match_predicate else RECORD, path, pattern[1]))
+        for i, p in enumerate(pattern[2:]):
+            compile_pattern(p, path if pattern[0] is _match_predicate else path + ((FIELD, i),), out)
+    else:
+        _compile_list(pattern, path, out)
+    return out
+
+
+def _compile_list(pattern: List[Exp], path: Path, out: Pattern) -> None:
+    """
+    Reduce a list pattern, with an optional dotted tail or ellipsis, to tests and bindings.
+    """
+    dots = [i for i, p in enumerate(pattern) if p is _dot]
+    ellipses = [i for i, p in enumerate(pattern) if p is _ellipsis]
+    if dots:
+        if len(dots) > 1 or ellipses or dots[0] != len(pattern) - 2 or dots[0] == 0:
+            _fail(pattern)
+        head = pattern[:-2]
+        out.tests.append((MIN_LENGTH, path, len(head)))
+        for i, p in enumerate(head):
+            compile_pattern(p, path + ((INDEX, i),), out)
+        compile_pattern(pattern[-1], path + ((TAIL, len(head)),), out)
+    elif ellipses:
+        if len(ellipses) > 1 or ellipses[0] == 0:
+            _fail(pattern)
+        k = ellipses[0]
+        head, repeated, tail = pattern[:k - 1], pattern[k - 1], pattern[k + 1:]
+        out.tests.append((MIN_LENGTH, path, len(head) + len(tail)))
+        for i, p in enumerate(head):
+            compile_pattern(p, path + ((INDEX, i),), out)
+        items = path + ((SLICE, len(head), len(tail)),)
+        inner = compile_pattern(repeated)
+        if inner.tests:
+            out.tests.append((EVERY, items, inner.tests))
+        for var, access in inner.binds:
+            _bind(var, ('each', items, access), out)
+        for i, p in enumerate(tail):
+            compile_pattern(p, path + ((INDEX, i - len(tail)),), out)
+    else:
+        out.tests.append((LENGTH, path, len(pattern)))
+        for i, p in enumerate(pattern):
+            compile_pattern(p, path + ((INDEX, i),), out)
+
+
+def same_datum(a: Any, b: Any) -> bool:
+    """
+    Compare a value with a datum of a pattern, like equal? but with 1, 1.0 and #t different.
+
+    Args:
+        a (Any): The value.
+        b (Any): The datum.
+
+    Returns:
+        bool: Whether they are the same.
+    """
+    if isinstance(a, (list, tuple)) and type(a) is type(b):
+        return len(a) == len(b) and all(map(same_datum, a, b))
+    return type(a) is type(b) and a == b
+
+
+def _implied(test: Test, facts: List[Tuple[Test, bool]]) -> Optional[bool]:
+    """
+    Return the outcome of a test if it follows from the outcomes of earlier tests.
+    """
+    kind, path = test[0], test[1]
+    for fact, outcome in facts:
+        if same_datum(fact, test):
+            return outcome
+        elif fact[1] != path:
+            continue
+        elif kind in (LENGTH, MIN_LENGTH) and fact[0] in (LENGTH, MIN_LENGTH):
+            n, m = fact[2], test[2]
+            if outcome and fact[0] == LENGTH:           # a list of n elements
+                return m == n if kind == LENGTH else m <= n
+            elif outcome and kind == MIN_LENGTH and m <= n:
+                return True
+            elif outcome and kind == LENGTH and m < n:
+                return False
+            elif not outcome and fact[0] == MIN_LENGTH and m >= n:
+                return False
+        elif kind == EQUAL and fact[0] == EQUAL and outcome:
+            return same_datum(fact[2], test[2])
+    return None
+
+
+class _Leaf(NamedTuple):
+    clause: int
+
+
+class _Node(NamedTuple):
+    test: Test
+    yes: Any
+    no: Any
+
+
+class _TreeTooLarge(Exception):
+    pass
+
+
+def _build(clauses: List[Tuple[int, List[Test]]], facts: List[Tuple[Test, bool]], budget: List[int]) -> Any:
+    """
+    Build the decision tree of clauses, given the outcomes of the tests made so far.
+
+    The next test is the first one the first remaining clause still needs; the
+    clauses it rules out are dropped from the branch where it fails, and those
+    it rules in are dropped from the other one.
+
+    Args:
+        clauses (List[Tuple[int, List[Test]]]): The index and tests of each clause.
+        facts (List[Tuple[Test, bool]]): The tests made so far, and their outcome.
+        budget (List[int]): The number of tests the tree may still have, decremented.
+
+    Returns:
+        Any: A _Node, a _Leaf or None when no clause matches.
+
+    Raises:
+        _TreeTooLarge: If the tree needs more tests than the budget.
+    """
+    remaining = []
+    for index, tests in clauses:
+        outcomes = [(test, _implied(test, facts)) for test in tests]
+        if all(outcome is not False for _, outcome in outcomes):
+            remaining.append((index, [test for test, outcome in outcomes if outcome is None]))
+    if not remaining:
+        return None
+    index, tests = remaining[0]
+    if not tests:
+        return _Leaf(index)
+    budget[0] -= 1
+    if budget[0] < 0:
+        raise _TreeTooLarge()
+    test = tests[0]
+    return _Node(test, _build(remaining, facts + [(test, True)], budget),
+                 _build(remaining, facts + [(test, False)], budget))
+
+
+def _value(path: Path, root: Symbol, bound: Dict[Path, Symbol]) -> Exp:
+    """
+    Return the code of the part of the value at a path.
+    """
+    if path in bound:
+        return bound[path]
+    elif not path:
+        return root
+    (kind, *args) = path[-1]
+    return [STEPS[kind], _value(path[:-1], root, bound)] + args
+
+
+def _test(test: Test, value: Exp) -> Exp:
+    """
+    Return the code of a test of a value.
+    """
+    kind = test[0]
+    if kind == LENGTH or kind == MIN_LENGTH:
+        return [_match_length if kind == LENGTH else _match_min_length, value, test[2]]
+    elif kind == EQUAL and isinstance(test[2], (Symbol, bool)):
+        return [_match_eq, value, [_quote, test[2]]]      # symbols and booleans are unique
+    elif kind == EQUAL:
+        return [_match_equal, value, [_quote, test[2]]]
+    elif kind == PREDICATE:
+        return [test[2], value]
+    elif kind == RECORD:
+        return [_match_record, value, test[2]]
+    item = gensym('item')
+    return [_match_every, [_lambda, [item], _conjunction([_test(t, _value(t[1], item, {})) for t in test[2]])], value]
+
+
+def _conjunction(tests: List[Exp]) -> Exp:
+    code = tests[-1]
+    for test in reversed(tests[:-1]):
+        code = [_if, test, code, False]
+    return code
+
+
+def _access(access: Access, root: Symbol, bound: Dict[Path, Symbol]) -> Exp:
+    """
+    Return the code of the value of a pattern variable.
+    """
+    if access[0] == 'path':
+        return _value(access[1], root, bound)
+    (_, path, inner) = access
+    item = gensym('item')
+    code = _access(inner, item, {})
+    items = _value(path, root, bound)
+    return items if code is item else [_match_map, [_lambda, [item], code], items]
+
+
+def _size(x: Exp) -> int:
+    return 1 + sum(map(_size, x)) if isinstance(x, list) else 1
+
+
+def _leaves(tree: Any, counts: Dict[int, int]) -> Dict[int, int]:
+    if isinstance(tree, _Leaf):
+        counts[tree.clause] = counts.get(tree.clause, 0) + 1
+    elif isinstance(tree, _Node):
+        _leaves(tree.yes, counts)
+        _leaves(tree.no, counts)
+    return counts
+
+
+def compile_match(x: Exp) -> Exp:
+    """
+    Compile a match expression into a decision tree.
+
+    Args:
+        x (Exp): The expression (match exp (pattern body ...) ...).
+
+    Returns:
+        Exp: Equivalent code made of let, if, lambda and calls of the internal
+            match procedures, still to be expanded.
+
+    Raises:
+        SchemeSyntaxError: If a clause or pattern is malformed.
+    """
+    if len(x) < 2:
+        raise SchemeSyntaxError(ERR_MATCH_PATTERN.format(to_string(x)))
+    patterns, bodies = [], []
+    for clause in x[2:]:
+        if not isinstance(clause, list) or len(clause) < 2:
+            raise SchemeSyntaxError(ERR_ILLEGAL_CLAUSE.format(to_string(clause)))
+        patterns.append(compile_pattern(_underscore if clause[0] is _else else clause[0]))
+        bodies.append(clause[1] if len(clause) == 2 else [_begin] + clause[1:])
+
+    try:
+        tree, sequential = _build([(i, p.tests) for i, p in enumerate(patterns)], [], [MATCH_TREE_LIMIT]), False
+    except _TreeTooLarge:
+        tree, sequential = None, True
+    root = x[1] if isinstance(x[1], Symbol) else gensym('value')
+    bindings = [] if root is x[1] else [[root, x[1]]]
+    procedures = {}
+    for clause, count in _leaves(tree, {}).items():
+        if count > 1 and _size(bodies[clause]) > INLINE_SIZE_LIMIT:
+            procedures[clause] = gensym('clause')
+            bindings.append([procedures[clause], [_lambda, [var for var, _ in patterns[clause].binds], bodies[clause]]])
+
+    def generate(node: Any, bound: Dict[Path, Symbol]) -> Exp:
+        if node is None:
+            return [_match_error, root]
+        elif isinstance(node, _Leaf):
+            binds = patterns[node.clause].binds
+            values = [_access(access, root, bound) for _, access in binds]
+            if node.clause in procedures:
+                return [procedures[node.clause]] + values
+            body = bodies[node.clause]
+            return [_let, [[var, value] for (var, _), value in zip(binds, values)], body] if binds else body
+        path, temp = node.test[1], None
+        if path and path not in bound and node.test[0] in (LENGTH, MIN_LENGTH, RECORD):
+            # The parts of a list or record are read from a variable holding it
+            temp, value = gensym('part'), _value(path, root, bound)
+            bound = {**bound, path: temp}
+        code = [_if, _test(node.test, _value(path, root, bound)), generate(node.yes, bound), generate(node.no, bound)]
+        return [_let, [[temp, value]], code] if temp is not None else code
+
+    if sequential:
+        code = [_match_error, root]
+        for clause in reversed(range(len(patterns))):
+            tests = patterns[clause].tests
+            leaf = generate(_Leaf(clause), {})
+            code = [_if, _conjunction([_test(t, _value(t[1], root, {})) for t in tests]), leaf, code] if tests else leaf
+    else:
+        code = generate(tree, {})
+    return [_let, bindings, code] if bindings else code
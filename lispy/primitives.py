@@ -11,18 +11,59 @@ import io
 import math
 import operator as op
 import sys
-from typing import Any, Callable
-
-from .constants import FILE_WRITE_MODE
-from .env import Env
-from .errors import ArgumentError, Continuation, UserError
+from typing import Any, Callable, Dict, Optional, TextIO
+
+from . import evaluator
+from .closures import convert_closures
+from .constants import FILE_WRITE_MODE, RECORD_SLOT_FORMAT
+from .counters import CURRENT_COUNTERS, lispy_stats
+from .env import CURRENT_ENV, GlobalEnv
+from .errors import ArgumentError, Continuation, MatchError, TypeMismatchError, UserError
 from .evaluator import Procedure
-from .evaluator import eval as lispy_eval
+from .inference import (
+    OPERATORS,
+    RESULT_TYPES,
+    comparison_type,
+    infer_types,
+    numeric_type,
+    quotient_type,
+    returns,
+    sequence_type,
+)
 from .macros import expand
-from .messages import ERR_CURRY_USER_PROC, ERR_CURRY_VARIADIC
+from .messages import ERR_CURRY_USER_PROC, ERR_CURRY_VARIADIC, ERR_LIST_STAR_TAIL, ERR_NO_MATCH, ERR_TYPE_MISMATCH
+from .optimizer import PURE_PROCEDURES, optimize
 from .parser import read, readchar, to_string
+from .patterns import same_datum
+from .profiler import profile
+from .records import make_record_type, record_accessor, record_constructor, record_modifier, record_predicate
 from .repl import load
-from .types import EOF_OBJECT, Exp, ListType, Promise, Symbol
+from .timing import bench_thunk, time_thunk
+from .type_checker import compile_type, type_name
+from .types import (
+    EOF_OBJECT,
+    Exp,
+    HashTable,
+    ListType,
+    Promise,
+    Symbol,
+    Vector,
+    _bench_call,
+    _list_ref,
+    _list_slice,
+    _list_tail,
+    _match_eq,
+    _match_equal,
+    _match_error,
+    _match_every,
+    _match_length,
+    _match_map,
+    _match_min_length,
+    _match_record,
+    _profile_call,
+    _record_field,
+    _time_call,
+)
 
 
 def callcc(proc: Callable) -> Any:
@@ -85,6 +126,8 @@ def force(obj: Any) -> Any:
         if not obj.computed:
             obj.memo = obj.proc()
             obj.computed = True
+            obj.proc = None         # the thunk, and the frames it holds, are not needed anymore
+            CURRENT_COUNTERS.get().promises_forced += 1
         obj = obj.memo
     return obj
 
@@ -148,6 +191,136 @@ def cons(x: Any, y: ListType) -> ListType:
     return [x] + list(y)
 
 
+def list_star(*args: Any) -> ListType:
+    """
+    Construct a list from leading elements followed by a list of the rest.
+
+    (list* a b rest) is (cons a (cons b rest)), built with a single copy.
+
+    Args:
+        *args (Any): The leading elements; the last argument is the tail list.
+
+    Returns:
+        ListType: The new list.
+
+    Raises:
+        ArgumentError: If there are no arguments.
+    """
+    if not args:
+        raise ArgumentError(ERR_LIST_STAR_TAIL)
+    return list(args[:-1]) + list(args[-1])
+
+
+def _element_check(element_type: Exp, env: Optional[GlobalEnv]) -> Optional[Callable[[Any], bool]]:
+    """
+    Return the predicate of a container element type, or None for untyped containers.
+    """
+    return None if element_type is None else compile_type(element_type, env)
+
+
+def _validate(check: Optional[Callable[[Any], bool]], type_exp: Exp, val: Any) -> None:
+    """
+    Check a value stored into a typed container.
+
+    Raises:
+        TypeMismatchError: If the value does not have the element type.
+    """
+    if check is not None and not check(val):
+        raise TypeMismatchError(ERR_TYPE_MISMATCH.format(type_name(type_exp), type(val).__name__))
+
+
+def make_vector(k: int, fill: Any = 0, element_type: Exp = None, env: Optional[GlobalEnv] = None) -> Vector:
+    """
+    Create a vector of k elements, optionally restricted to an element type.
+
+    (make-vector 3 0.0 'float) makes a vector of floats, stored unboxed.
+
+    Args:
+        k (int): The length.
+        fill (Any): The initial value of the elements.
+        element_type (Exp): The type of the elements, or None for any value.
+        env (Optional[GlobalEnv]): The environment record types are looked up in.
+
+    Returns:
+        Vector: The new vector.
+    """
+    check = _element_check(element_type, env)
+    _validate(check, element_type, fill)
+    return Vector([fill] * k, element_type, check)
+
+
+def list_to_vector(lst: ListType, element_type: Exp = None, env: Optional[GlobalEnv] = None) -> Vector:
+    """
+    Create a vector from the elements of a list, optionally restricted to an element type.
+
+    Args:
+        lst (ListType): The elements.
+        element_type (Exp): The type of the elements, or None for any value.
+        env (Optional[GlobalEnv]): The environment record types are looked up in.
+
+    Returns:
+        Vector: The new vector.
+    """
+    check = _element_check(element_type, env)
+    for val in lst:
+        _validate(check, element_type, val)
+    return Vector(lst, element_type, check)
+
+
+def vector_set(v: Vector, k: int, val: Any) -> None:
+    """
+    Store a value in a vector, checking it against the element type.
+
+    Args:
+        v (Vector): The vector.
+        k (int): The index.
+        val (Any): The value.
+    """
+    _validate(v.check, v.element_type, val)
+    v.items[k] = val
+
+
+def make_hash_table(key_type: Exp = None, value_type: Exp = None, env: Optional[GlobalEnv] = None) -> HashTable:
+    """
+    Create an empty hash table, optionally restricted to key and value types.
+
+    Args:
+        key_type (Exp): The type of the keys, or None for any value.
+        value_type (Exp): The type of the values, or None for any value.
+        env (Optional[GlobalEnv]): The environment record types are looked up in.
+
+    Returns:
+        HashTable: The new hash table.
+    """
+    key, value = _element_check(key_type, env), _element_check(value_type, env)
+    return HashTable(key_type, value_type, (key, value))
+
+
+def hash_set(h: HashTable, key: Any, val: Any) -> None:
+    """
+    Store an entry in a hash table, checking it against the key and value types.
+
+    Args:
+        h (HashTable): The hash table.
+        key (Any): The key.
+        val (Any): The value.
+    """
+    if h.check is not None:
+        _validate(h.check[0], h.key_type, key)
+        _validate(h.check[1], h.value_type, val)
+    h[key] = val
+
+
+def match_error(x: Any) -> None:
+    """
+    Signal that no clause of a match expression matches a value.
+
+    Raises:
+        MatchError: Always.
+    """
+    raise MatchError(ERR_NO_MATCH.format(to_string(x)))
+
+
 def raise_error(x: Any) -> None:
     """
     Raise an exception.
@@ -164,45 +337,199 @@ def raise_error(x: Any) -> None:
         raise UserError(to_string(x))
 
 
-def add_globals(env: Env) -> Env:
+PURE_PRIMITIVES = {
+    '+': lambda *x: sum(x),
+    '-': lambda x, *y: x - sum(y) if y else -x,
+    '*': lambda *x: functools.reduce(op.mul, x, 1),
+    '/': lambda x, *y: functools.reduce(op.truediv, y, x) if y else 1 / x,
+    'string-append': lambda *x: "".join(map(str, x)),
+    'not': op.not_,
+    '>': op.gt, '<': op.lt, '>=': op.ge, '<=': op.le, '=': op.eq,
+    'equal?': op.eq, 'length': len,
+    'car': lambda x: x[0], 'cdr': lambda x: x[1:],
+    'list?': lambda x: isinstance(x, list),
+    'null?': lambda x: x == [], 'symbol?': lambda x: isinstance(x, Symbol),
+    'boolean?': lambda x: isinstance(x, bool), 'pair?': is_pair,
+    'str': str,
+}
+"""Standard procedures without side effects, which the optimizer may call at compile time."""
+
+PRIMITIVE_TYPES = {
+    '+': numeric_type, '-': numeric_type, '*': numeric_type, '/': quotient_type,
+    'string-append': returns('str'), 'str': returns('str'), 'length': returns('int'),
+    'not': returns('bool'), '>': comparison_type, '<': comparison_type, '>=': comparison_type,
+    '<=': comparison_type, '=': comparison_type, 'equal?': comparison_type,
+    'list?': returns('bool'), 'null?': returns('bool'), 'symbol?': returns('bool'),
+    'boolean?': returns('bool'), 'pair?': returns('bool'), 'cdr': sequence_type,
+}
+"""Result types of the pure primitives, for static type inference."""
+
+CONTAINER_PRIMITIVES = {
+    'vector': lambda *x: Vector(x),
+    'vector-ref': lambda v, k: v.items[k], 'vector-set!': vector_set,
+    'vector-length': lambda v: len(v.items), 'vector->list': lambda v: list(v.items),
+    'vector?': lambda x: isinstance(x, Vector),
+    'hash-set!': hash_set,
+    'hash-ref': lambda h, k, *default: h[k] if not default or k in h else default[0],
+    'hash-has-key?': lambda h, k: k in h, 'hash-remove!': lambda h, k: h.pop(k, None),
+    'hash-count': lambda h: len(h), 'hash-keys': lambda h: list(h),
+    'hash?': lambda x: isinstance(x, HashTable),
+    'record-constructor': record_constructor,
+    'record-predicate': record_predicate, 'record-accessor': record_accessor, 'record-modifier': record_modifier,
+}
+"""Procedures on vectors, hash tables and records, which are mutable and never called at compile time."""
+
+MATCH_PRIMITIVES = {
+    _match_length: lambda x, n: isinstance(x, list) and len(x) == n,
+    _match_min_length: lambda x, n: isinstance(x, list) and len(x) >= n,
+    _match_equal: same_datum, _match_eq: op.is_,
+    _match_record: lambda x, record_type: isinstance(x, record_type),
+    _list_ref: lambda x, k: x[k], _list_tail: lambda x, k: x[k:],
+    _list_slice: lambda x, start, end: x[start:len(x) - end],
+    _record_field: lambda x, k: getattr(x, RECORD_SLOT_FORMAT.format(k)),
+}
+"""The procedures that read and test values in the code of match expressions (see `lispy.patterns`)."""
+
+MATCH_TYPES = {
+    _match_length: returns('bool'), _match_min_length: returns('bool'), _match_equal: returns('bool'),
+    _match_eq: returns('bool'), _match_record: returns('bool'),
+}
+"""Result types of the match procedures."""
+
+CONTAINER_TYPES = {
+    'vector-length': returns('int'), 'vector?': returns('bool'), 'hash-count': returns('int'),
+    'hash-has-key?': returns('bool'), 'hash?': returns('bool'),
+}
+"""Result types of the container procedures."""
+
+PURE_PROCEDURES.update(PURE_PRIMITIVES.values())
+PURE_PROCEDURES.update(MATCH_PRIMITIVES.values())
+RESULT_TYPES.update((PURE_PRIMITIVES[name], rule) for name, rule in PRIMITIVE_TYPES.items())
+RESULT_TYPES.update((CONTAINER_PRIMITIVES[name], rule) for name, rule in CONTAINER_TYPES.items())
+RESULT_TYPES.update((MATCH_PRIMITIVES[name], rule) for name, rule in MATCH_TYPES.items())
+OPERATORS.update({
+    PURE_PRIMITIVES['+']: op.add, PURE_PRIMITIVES['-']: op.sub, PURE_PRIMITIVES['*']: op.mul,
+    PURE_PRIMITIVES['/']: op.truediv,
+    op.gt: op.gt, op.lt: op.lt, op.ge: op.ge, op.le: op.le, op.eq: op.eq,
+})
+PURE_PROCEDURES.update(f for module in (math, cmath)
+                       for name, f in vars(module).items() if callable(f) and not name.startswith('_'))
+
+
+def evaluate(x: Exp, env: GlobalEnv) -> Any:
+    """
+    Evaluate a datum as a program in a global environment: the `eval` procedure.
+
+    The environment is the current one while the program runs (see
+    `lispy.env.CURRENT_ENV`), so that procedures of its bases see its bindings.
+
+    Args:
+        x (Exp): The datum, read but not expanded.
+        env (GlobalEnv): The environment, which has the macros to expand it with.
+
+    Returns:
+        Any: The value.
+    """
+    token = CURRENT_ENV.set(env)
+    try:
+        return evaluator.eval(convert_closures(infer_types(optimize(expand(x, env=env), env), env), env), env)
+    finally:
+        CURRENT_ENV.reset(token)
+
+
+def environment_procedures(env: GlobalEnv, out: Optional[TextIO] = None) -> Dict[str, Any]:
+    """
+    Return the procedures bound to a global environment and an output port.
+
+    `eval` and `load` evaluate in env (`eval` takes another environment as
+    an optional argument), `fork-environment` forks env unless given another
+    environment, record types are defined in env and the element types of
+    containers looked up there, and `write`, `display` and the reports of
+    `profile`, `time` and `bench` go to out unless given a port.
+
+    Args:
+        env (GlobalEnv): The environment.
+        out (Optional[TextIO]): The output port. Defaults to sys.stdout, when writing.
+
+    Returns:
+        Dict[str, Any]: The procedures, by name.
+    """
+    def port_or_out(port: Optional[TextIO]) -> TextIO:
+        return port if port is not None else sys.stdout if out is None else out
+
+    return {
+        'eval': lambda x, target=None: evaluate(x, env if target is None else target),
+        'load': lambda fn: load(fn, env),
+        'interaction-environment': lambda: env,
+        'make-record-type': lambda name, fields, types=None: make_record_type(name, fields, types, env),
+        'make-vector': lambda k, fill=0, element_type=None: make_vector(k, fill, element_type, env),
+        'list->vector': lambda lst, element_type=None: list_to_vector(lst, element_type, env),
+        'make-hash-table': lambda key_type=None, value_type=None: make_hash_table(key_type, value_type, env),
+        'fork-environment': lambda base=None: fork_globals(env if base is None else base, out),
+        'write': lambda x, port=None: port_or_out(port).write(to_string(x)),
+        'display': lambda x, port=None: port_or_out(port).write(x if isinstance(x, str) else to_string(x)),
+        _profile_call: lambda thunk: profile(thunk, out),
+        _time_call: lambda thunk: time_thunk(thunk, out),
+        _bench_call: lambda thunk, iterations, warmup: bench_thunk(thunk, iterations, warmup, out),
+    }
+
+
+def add_globals(env: GlobalEnv, out: Optional[TextIO] = None) -> GlobalEnv:
     """
     Add some Scheme standard procedures to the environment.
 
+    The procedures bound to an environment (see `environment_procedures`)
+    are bound to env and out.
+
     Args:
-        env (Env): The environment to populate.
+        env (GlobalEnv): The environment to populate: global_env, or that of an `Interpreter`.
+        out (Optional[TextIO]): The output port. Defaults to sys.stdout, when writing.
 
     Returns:
-        Env: The updated environment.
+        GlobalEnv: The updated environment.
     """
     env.update(vars(math))
     env.update(vars(cmath))
+    env.update(PURE_PRIMITIVES)
+    env.update(CONTAINER_PRIMITIVES)
+    env.update(MATCH_PRIMITIVES)
     env.update({
-        '+': lambda *x: sum(x),
-        '-': lambda x, *y: x - sum(y) if y else -x,
-        '*': lambda *x: functools.reduce(op.mul, x, 1),
-        '/': lambda x, *y: functools.reduce(op.truediv, y, x) if y else 1 / x,
-        'string-append': lambda *x: "".join(map(str, x)),
-        'not': op.not_,
-        '>': op.gt, '<': op.lt, '>=': op.ge, '<=': op.le, '=': op.eq,
-        'equal?': op.eq, 'eq?': op.is_, 'length': len, 'cons': cons,
-        'car': lambda x: x[0], 'cdr': lambda x: x[1:],
+        'eq?': op.is_, 'cons': cons,
         'append': lambda *x: functools.reduce(op.add, x, []),
-        'list': lambda *x: list(x), 'list?': lambda x: isinstance(x, list),
-        'null?': lambda x: x == [], 'symbol?': lambda x: isinstance(x, Symbol),
-        'boolean?': lambda x: isinstance(x, bool), 'pair?': is_pair,
+        'list': lambda *x: list(x), 'list*': list_star,
         'port?': lambda x: isinstance(x, io.IOBase), 'apply': lambda proc, lst: proc(*lst),
-        'eval': lambda x: lispy_eval(expand(x)), 'load': lambda fn: load(fn), 'call/cc': callcc,
+        'environment?': lambda x: isinstance(x, GlobalEnv),
+        'call/cc': callcc,
         'force': force, 'make-promise': make_promise, 'curry': curry,
         'open-input-file': open, 'close-input-port': lambda p: p.file.close(),
         'open-output-file': lambda f: open(f, FILE_WRITE_MODE), 'close-output-port': lambda p: p.close(),
         'eof-object?': lambda x: x is EOF_OBJECT, 'read-char': readchar,
-        'read': read, 'write': lambda x, port=sys.stdout: port.write(to_string(x)),
-        'display': lambda x, port=sys.stdout: port.write(x if isinstance(x, str) else to_string(x)),
+        'read': read,
         'raise': raise_error,
-        'str': str,
+        _match_every: lambda f, xs: all(map(f, xs)), _match_map: lambda f, xs: list(map(f, xs)),
+        _match_error: match_error, 'lispy-stats': lispy_stats,
         'py-import': importlib.import_module,
         'py-getattr': getattr,
         'py-eval': lambda x: eval(x),
         'py-exec': lambda x: exec(x),
     })
+    env.update(environment_procedures(env, out))
+    return env
+
+
+def fork_globals(base: GlobalEnv, out: Optional[TextIO] = None) -> GlobalEnv:
+    """
+    Fork a global environment populated by `add_globals` (see `GlobalEnv.fork`).
+
+    The fork has its own procedures bound to an environment, bound to itself and out.
+
+    Args:
+        base (GlobalEnv): The environment to fork.
+        out (Optional[TextIO]): The output port of the fork. Defaults to sys.stdout, when writing.
+
+    Returns:
+        GlobalEnv: The fork.
+    """
+    env = base.fork()
+    env.update(environment_procedures(env, out))
     return env
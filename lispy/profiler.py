@@ -0,0 +1,352 @@
+"""
+Deterministic profiler.
+
+The profiler attributes time and calls to Lispy procedures rather than to the
+Python functions of the interpreter. It is an evaluator hook (see
+`lispy.evaluator.Hook`), told of every procedure call, tail call and return.
+A procedure is shown under the name it was defined with and the location of
+its top-level definition; anonymous procedures are shown as `lambda` with
+their parameter list.
+
+For each procedure the profiler counts calls and tail calls, and measures
+inclusive time (with the procedures it calls; counted once for recursive
+calls) and exclusive time. A tail call ends the activation of the caller, so
+the time spent after it is charged to the callee. Calls are also counted per
+caller, which gives the call graph.
+
+    >>> profiler = Profiler()
+    >>> profiler.run('(define (f n) (if (= n 0) 0 (f (- n 1)))) (f 100)')
+    0
+    >>> profiler.print_stats()
+
+The results can be exported in the format of `pstats` (`dump_stats`, or
+`pstats.Stats(profiler)`), or as JSON (`to_json`, `dump_json`). From Lispy,
+`(profile exp)` evaluates an expression under a profiler and prints the
+report, and `python -m lispy --profile file.lsp` profiles a program.
+"""
+import io
+import json
+import marshal
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, TextIO, Tuple, Union
+
+from . import evaluator
+from .constants import JSON_SUFFIX, LAMBDA_NAME, PROFILE_NAME, UNKNOWN_LOCATION
+from .evaluator import Hook, Procedure, add_hook, remove_hook
+from .parser import InPort, to_string
+from .repl import locate, parse
+from .types import EOF_OBJECT, Exp
+
+Label = Tuple[str, int, str]
+"""A procedure as pstats shows it: (file, line, name)."""
+
+SORT_KEYS = {
+    'calls': lambda entry: entry.calls,
+    'inclusive': lambda entry: entry.inclusive,
+    'exclusive': lambda entry: entry.exclusive,
+    'name': lambda entry: entry.label[2],
+}
+"""The orders of the report: the largest first, and names alphabetically."""
+
+REPORT_HEADER = '{:>9} {:>9} {:>12} {:>12}  {}'.format('calls', 'tail', 'inclusive', 'exclusive', 'procedure')
+REPORT_LINE = '{:>9} {:>9} {:>12.6f} {:>12.6f}  {} ({}:{})'
+
+
+class Entry:
+    """
+    The statistics of a procedure.
+
+    Attributes:
+        label (Label): The location and name of the procedure.
+        calls (int): The number of calls.
+        tail_calls (int): The number of those that were tail calls.
+        primitive_calls (int): The number of calls that were not recursive.
+        inclusive (float): The time spent in the procedure and the procedures it called.
+        exclusive (float): The time spent in the procedure itself.
+        active (int): The number of activations in progress.
+        callers (Dict[Optional[Entry], List]): For each caller (None at the top level),
+            [calls, tail calls, primitive calls, exclusive, inclusive].
+    """
+    def __init__(self, label: Label) -> None:
+        self.label = label
+        self.calls = self.tail_calls = self.primitive_calls = 0
+        self.inclusive = self.exclusive = 0.0
+        self.active = 0
+        self.callers: Dict[Optional['Entry'], List] = {}
+
+
+class Activation:
+    """
+    A procedure call in progress.
+
+    Attributes:
+        entry (Entry): The statistics of the procedure.
+        caller (Optional[Entry]): The statistics of the caller.
+        start (float): The time the call started.
+        children (float): The time spent in the procedures it called so far.
+        outermost (bool): Whether no other call of the procedure was in progress.
+    """
+    __slots__ = ('entry', 'caller', 'start', 'children', 'outermost')
+
+    def __init__(self, entry: Entry, caller: Optional[Entry], start: float) -> None:
+        self.entry, self.caller, self.start = entry, caller, start
+        self.children = 0.0
+        self.outermost = entry.active == 0
+
+
+def label(proc: Procedure) -> Label:
+    """
+    Return the location and name a procedure is shown under.
+    """
+    file, line = proc.location or UNKNOWN_LOCATION
+    if proc.name is not None:
+        return file, line, str(proc.name)
+    return file, line, '{} {}'.format(LAMBDA_NAME, to_string(proc.signature))
+
+
+class Profiler(Hook):
+    """
+    A deterministic profiler of Lispy procedures.
+
+    It is an evaluator hook, active between `enable` and `disable`, or in a `with` block.
+
+    Attributes:
+        timer (Callable[[], float]): The clock.
+        entries (Dict[int, Entry]): The statistics, by procedure body.
+        stack (List[Activation]): The calls in progress.
+        total (float): The time the profiler was active.
+    """
+    def __init__(self, timer: Callable[[], float] = time.perf_counter) -> None:
+        self.timer = timer
+        self.entries: Dict[int, Entry] = {}
+        self.bodies: List[Exp] = []      # keeps the ids of the entries valid
+        self.stack: List[Activation] = []
+        self.total = 0.0
+        self._started: Optional[float] = None
+
+    def enable(self) -> None:
+        """
+        Start profiling the procedures the evaluator calls.
+        """
+        add_hook(self)
+        self._started = self.timer()
+
+    def disable(self) -> None:
+        """
+        Stop profiling; the calls still in progress end now.
+        """
+        now = self.timer()
+        while self.stack:
+            self._finish(now)
+        self.total += now - self._started
+        remove_hook(self)
+
+    def __enter__(self) -> 'Profiler':
+        self.enable()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.disable()
+
+    def run(self, source: Union[str, InPort]) -> Any:
+        """
+        Evaluate a program under the profiler.
+
+        Args:
+            source (Union[str, InPort]): The program, or a port to read it from.
+
+        Returns:
+            Any: The value of the last expression.
+        """
+        inport = InPort(io.StringIO(source)) if isinstance(source, str) else source
+        val = None
+        while True:
+            x = parse(inport)
+            if x is EOF_OBJECT:
+                return val
+            with self:
+                val = evaluator.eval(x)
+            locate(x, (inport.name, inport.datum_line))
+
+    def _entry(self, proc: Procedure) -> Entry:
+        entry = self.entries.get(id(proc.exp))
+        if entry is None:
+            entry = self.entries[id(proc.exp)] = Entry(label(proc))
+            self.bodies.append(proc.exp)
+        elif entry.label[:2] == UNKNOWN_LOCATION and proc.location is not None:
+            entry.label = label(proc)       # defined at the top level after its first call
+        return entry
+
+    def enter(self, proc: Procedure, args: List[Any]) -> None:
+        self._start(proc, False, self.timer())
+
+    def tail_call(self, caller: Procedure, proc: Procedure, args: List[Any]) -> None:
+        now = self.timer()
+        if self.stack:                  # unless the caller started before the profiler
+            self._finish(now)
+        self._start(proc, True, now)
+
+    def exit(self, proc: Procedure, value: Any, error: Optional[BaseException]) -> None:
+        if self.stack:
+            self._finish(self.timer())
+
+    def _start(self, proc: Procedure, tail: bool, now: float) -> None:
+        caller = self.stack[-1].entry if self.stack else None
+        entry = self._entry(proc)
+        activation = Activation(entry, caller, now)
+        entry.calls += 1
+        entry.tail_calls += tail
+        entry.primitive_calls += activation.outermost
+        edge = entry.callers.get(caller)
+        if edge is None:
+            edge = entry.callers[caller] = [0, 0, 0, 0.0, 0.0]
+        edge[0] += 1
+        edge[1] += tail
+        edge[2] += activation.outermost
+        entry.active += 1
+        self.stack.append(activation)
+
+    def _finish(self, now: float) -> None:
+        activation = self.stack.pop()
+        entry = activation.entry
+        elapsed = now - activation.start
+        exclusive = elapsed - activation.children
+        inclusive = elapsed if activation.outermost else 0.0
+        entry.exclusive += exclusive
+        entry.inclusive += inclusive
+        entry.active -= 1
+        edge = entry.callers[activation.caller]
+        edge[3] += exclusive
+        edge[4] += inclusive
+        if self.stack:
+            self.stack[-1].children += elapsed
+
+    def create_stats(self) -> None:
+        """
+        Build `self.stats` in the format of `pstats`, so that `pstats.Stats(profiler)` reads them.
+
+        Procedures are keyed by (file, line, name); the top level is not a caller.
+        """
+        stats: Dict[Label, Tuple] = {}
+        for entry in self.entries.values():
+            callers = {}
+            for caller, (calls, _, primitive, exclusive, inclusive) in entry.callers.items():
+                if caller is not None:
+                    callers[caller.label] = _add(callers.get(caller.label), (primitive, calls, exclusive, inclusive))
+            row = (entry.primitive_calls, entry.calls, entry.exclusive, entry.inclusive)
+            previous = stats.get(entry.label)
+            if previous is not None:        # two anonymous procedures on the same line
+                row = _add(previous[:4], row)
+                for key, value in previous[4].items():
+                    callers[key] = _add(callers.get(key), value)
+            stats[entry.label] = row + (callers,)
+        self.stats = stats
+
+    def dump_stats(self, filename: str) -> None:
+        """
+        Write the statistics to a file that `pstats` (and tools such as snakeviz) can read.
+        """
+        self.create_stats()
+        with open(filename, 'wb') as f:
+            marshal.dump(self.stats, f)
+
+    def to_json(self) -> Dict[str, Any]:
+        """
+        Return the statistics and the call graph as JSON-serializable data.
+
+        Returns:
+            Dict[str, Any]: {"total": seconds, "procedures": [...]}, each procedure with its
+                name, file, line, calls, tail_calls, inclusive and exclusive times, and its callers.
+        """
+        def describe(entry: Optional[Entry]) -> Dict[str, Any]:
+            if entry is None:
+                return {'name': None, 'file': None, 'line': None}
+            file, line, name = entry.label
+            return {'name': name, 'file': file, 'line': line}
+
+        procedures = []
+        for entry in self._sorted('inclusive'):
+            callers = [dict(describe(caller), calls=calls, tail_calls=tail, inclusive=inclusive, exclusive=exclusive)
+                       for caller, (calls, tail, _, exclusive, inclusive) in entry.callers.items()]
+            procedures.append(dict(describe(entry), calls=entry.calls, tail_calls=entry.tail_calls,
+                                   inclusive=entry.inclusive, exclusive=entry.exclusive, callers=callers))
+        return {'total': self.total, 'procedures': procedures}
+
+    def dump_json(self, filename: str) -> None:
+        """
+        Write the statistics to a JSON file (see `to_json`).
+        """
+        with open(filename, 'w') as f:
+            json.dump(self.to_json(), f, indent=2)
+
+    def _sorted(self, sort: str) -> List[Entry]:
+        return sorted(self.entries.values(), key=SORT_KEYS[sort], reverse=sort != 'name')
+
+    def print_stats(self, sort: str = 'inclusive', limit: Optional[int] = None,
+                    out: Optional[TextIO] = None) -> None:
+        """
+        Print a report of the procedures, one per line.
+
+        Args:
+            sort (str): 'inclusive', 'exclusive', 'calls' or 'name'.
+            limit (Optional[int]): The number of procedures to show. Defaults to all.
+            out (TextIO): The output stream. Defaults to sys.stdout.
+        """
+        out = sys.stdout if out is None else out
+        print('{} procedure calls in {:.6f} seconds'.format(
+            sum(entry.calls for entry in self.entries.values()), self.total), file=out)
+        print(REPORT_HEADER, file=out)
+        for entry in self._sorted(sort)[:limit]:
+            file, line, name = entry.label
+            print(REPORT_LINE.format(entry.calls, entry.tail_calls, entry.inclusive, entry.exclusive,
+                                     name, file, line), file=out)
+
+
+def _add(a: Optional[Tuple], b: Tuple) -> Tuple:
+    return b if a is None else tuple(x + y for x, y in zip(a, b))
+
+
+def profile(thunk: Callable[[], Any], out: Optional[TextIO] = None) -> Any:
+    """
+    Call a procedure under a profiler and print the report.
+
+    This is what `(profile exp)` expands into, with exp wrapped in a thunk.
+
+    Args:
+        thunk (Callable[[], Any]): The procedure, of no arguments.
+        out (TextIO): The output stream of the report. Defaults to sys.stdout.
+
+    Returns:
+        Any: The value of the call.
+    """
+    if isinstance(thunk, Procedure) and thunk.name is None:
+        thunk.name = PROFILE_NAME
+    profiler = Profiler()
+    try:
+        with profiler:
+            return thunk()
+    finally:
+        profiler.print_stats(out=out)
+
+
+def profile_file(filename: str, output: Optional[str] = None) -> None:
+    """
+    Run a program under a profiler, for `python -m lispy --profile`.
+
+    Args:
+        filename (str): The program.
+        output (Optional[str]): The file to write the statistics to, as JSON if its name ends
+            with .json and for pstats otherwise. Defaults to a report on stderr.
+    """
+    profiler = Profiler()
+    try:
+        with open(filename) as f:
+            profiler.run(InPort(f))
+    finally:
+        if output is None:
+            profiler.print_stats(out=sys.stderr)
+        elif output.endswith(JSON_SUFFIX):
+            profiler.dump_json(output)
+        else:
+            profiler.dump_stats(output)
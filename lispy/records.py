@@ -0,0 +1,205 @@
+"""
+Record types module.
+
+`define-record-type` is expanded into definitions that call the procedures of
+this module at run time:
+
+    (define-record-type <point> (make-point x y) point?
+      (x :: float point-x set-point-x!)
+      (y :: float point-y))
+
+becomes
+
+    (begin
+      (define <point> (make-record-type '<point> '(x y) '(float float)))
+      (define make-point (record-constructor <point> '(x y)))
+      (define point? (record-predicate <point>))
+      (define point-x (record-accessor <point> 'x))
+      (define set-point-x! (record-modifier <point> 'x))
+      (define point-y (record-accessor <point> 'y)))
+
+A record type is a subclass of `lispy.types.Record` with `__slots__`, and is
+registered as a type for annotations under its name without the angle
+brackets (`point`), in the global environment that defines it; it may not
+hide a builtin type. The constructor is compiled for its fields, and fields
+with a type annotation are checked when they are set. Accessors and
+modifiers are registered for type inference, which replaces their calls on
+records proven to be of their record class by a direct slot access
+(`#%field-ref`, `#%field-set!`). Proofs are made for the class, not its
+name, so the procedures of a record type that was redefined since do not
+accept the records of the new one.
+"""
+from operator import attrgetter
+from typing import Any, Callable, List, Optional
+
+from .constants import RECORD_SLOT_FORMAT, RECORD_TYPE_BRACKETS
+from .env import Env, global_env
+from .errors import ArgumentError, TypeMismatchError
+from .inference import FIELDS, RESULT_TYPES, Field, proof_type, returns
+from .messages import ERR_DUPLICATE_FIELD, ERR_RECORD_FIELD, ERR_TYPE_MISMATCH
+from .type_checker import ANY, compile_type, register_type, type_name
+from .types import Exp, Record, Symbol, get_symbol
+
+
+def record_type_name(name: Symbol) -> str:
+    """
+    Return the type symbol of a record type: its name without the angle brackets.
+    """
+    opening, closing = RECORD_TYPE_BRACKETS
+    if len(name) > 2 and name.startswith(opening) and name.endswith(closing):
+        return get_symbol(name[1:-1])
+    return name
+
+
+def _mismatch(expected: Exp, val: Any) -> None:
+    """
+    Raise a type error for a value that is not of the expected type.
+
+    Raises:
+        TypeMismatchError: Always.
+    """
+    raise TypeMismatchError(ERR_TYPE_MISMATCH.format(type_name(expected), type(val).__name__))
+
+
+def _slot(cls: type, field: Symbol) -> int:
+    """
+    Return the index of the slot of a field.
+
+    Raises:
+        ArgumentError: If the record type has no such field.
+    """
+    if field not in cls.fields:
+        raise ArgumentError(ERR_RECORD_FIELD.format(cls.type_name, field))
+    return cls.fields.index(field)
+
+
+def make_record_type(name: Symbol, fields: List[Symbol], types: Optional[List[Exp]] = None,
+                     env: Optional[Env] = None) -> type:
+    """
+    Create a record type and register it for type annotations.
+
+    The types of the fields are looked up in env, where the record type is
+    registered.
+
+    Args:
+        name (Symbol): The name of the record type, e.g. <point>.
+        fields (List[Symbol]): The field names.
+        types (Optional[List[Exp]]): The type of each field, `any` for untyped fields.
+        env (Optional[Env]): The environment defining the record type. Defaults to global_env.
+
+    Returns:
+        type: The record class.
+
+    Raises:
+        ArgumentError: If a field name is repeated, or the name is that of a builtin type.
+    """
+    env = global_env if env is None else env
+    for i, field in enumerate(fields):
+        if field in fields[:i]:
+            raise ArgumentError(ERR_DUPLICATE_FIELD.format(field, name))
+    types = [ANY] * len(fields) if types is None else types
+    checks = tuple(None if type_exp == ANY else compile_type(type_exp, env) for type_exp in types)
+    type_sym = record_type_name(name)
+    cls = type(str(type_sym), (Record,), {
+        '__slots__': tuple(RECORD_SLOT_FORMAT.format(i) for i in range(len(fields))),
+        'type_name': type_sym,
+        'fields': tuple(fields),
+        'types': tuple(types),
+        'checks': checks,
+        'proof_types': tuple(ANY if type_exp == ANY else proof_type(type_exp, env) for type_exp in types),
+    })
+    register_type(type_sym, cls, env)
+    return cls
+
+
+def record_constructor(cls: type, params: List[Symbol]) -> Callable:
+    """
+    Create the constructor of a record type.
+
+    The constructor is compiled for its parameters, so that a call assigns
+    the slots directly and checks only the typed fields. Fields that are not
+    parameters are initialized to #f.
+
+    Args:
+        cls (type): The record class.
+        params (List[Symbol]): The fields the constructor takes, in order.
+
+    Returns:
+        Callable: The constructor.
+    """
+    indexes = [_slot(cls, field) for field in params]
+    namespace = {'new': object.__new__, 'cls': cls, 'mismatch': _mismatch, 'types': cls.types}
+    lines = ['def construct({}):'.format(', '.join('a{}'.format(i) for i in range(len(params)))),
+             '    obj = new(cls)']
+    for i, index in enumerate(indexes):
+        check = cls.checks[index]
+        if check is not None:
+            namespace['check{}'.format(i)] = check
+            lines.append('    if not check{0}(a{0}): mismatch(types[{1}], a{0})'.format(i, index))
+        lines.append('    obj.{} = a{}'.format(RECORD_SLOT_FORMAT.format(index), i))
+    for index in sorted(set(range(len(cls.fields))) - set(indexes)):
+        lines.append('    obj.{} = False'.format(RECORD_SLOT_FORMAT.format(index)))
+    lines.append('    return obj')
+    exec('\n'.join(lines), namespace)
+    construct = namespace['construct']
+    RESULT_TYPES[construct] = returns(cls)
+    return construct
+
+
+def record_predicate(cls: type) -> Callable[[Any], bool]:
+    """
+    Create the predicate of a record type.
+    """
+    def predicate(obj: Any) -> bool:
+        return isinstance(obj, cls)
+    RESULT_TYPES[predicate] = returns('bool')
+    return predicate
+
+
+def record_accessor(cls: type, field: Symbol) -> Callable[[Any], Any]:
+    """
+    Create the accessor of a record field.
+
+    Args:
+        cls (type): The record class.
+        field (Symbol): The field name.
+
+    Returns:
+        Callable[[Any], Any]: A procedure returning the field of a record of the type.
+    """
+    index = _slot(cls, field)
+    getter = attrgetter(RECORD_SLOT_FORMAT.format(index))
+
+    def access(obj: Any) -> Any:
+        if not isinstance(obj, cls):
+            _mismatch(cls.type_name, obj)
+        return getter(obj)
+    FIELDS[access] = Field(cls, cls.proof_types[index], getter, False)
+    return access
+
+
+def record_modifier(cls: type, field: Symbol) -> Callable[[Any, Any], None]:
+    """
+    Create the modifier of a record field, which checks the field type if it has one.
+
+    Args:
+        cls (type): The record class.
+        field (Symbol): The field name.
+
+    Returns:
+        Callable[[Any, Any], None]: A procedure setting the field of a record of the type.
+    """
+    index = _slot(cls, field)
+    slot, check = RECORD_SLOT_FORMAT.format(index), cls.checks[index]
+
+    def setter(obj: Any, val: Any) -> None:
+        setattr(obj, slot, val)
+
+    def modify(obj: Any, val: Any) -> None:
+        if not isinstance(obj, cls):
+            _mismatch(cls.type_name, obj)
+        if check is not None and not check(val):
+            _mismatch(cls.types[index], val)
+        setattr(obj, slot, val)
+    FIELDS[modify] = Field(cls, cls.proof_types[index], setter, True)
+    return modify
@@ -5,44 +5,84 @@ This module implements the interactive shell and file loading functionality.
 """
 import io
 import sys
-from typing import Optional, TextIO, Union
+from typing import Callable, List, Optional, TextIO, Tuple, Union
 
+from . import evaluator
+from .closures import convert_closures
+from .env import GlobalEnv, global_env
 from .errors import LispyError
-from .evaluator import eval
+from .evaluator import Procedure
+from .inference import infer_types
 from .macros import expand
 from .messages import GOODBYE, PROMPT, WELCOME
+from .optimizer import optimize
 from .parser import InPort, read, to_string
-from .types import EOF_OBJECT, Exp
+from .types import EOF_OBJECT, Exp, _begin, _define
 
+INSTRUMENTERS: List[Callable[[Exp, InPort], Exp]] = []
+"""Passes run on each expanded program before it is optimized, such as `lispy.coverage.Coverage.instrument`.
 
-def parse(inport: Union[str, InPort]) -> Exp:
+While one is installed, the reader records the line of each list in `InPort.positions`.
+"""
+
+
+def parse(inport: Union[str, InPort], env: Optional[GlobalEnv] = None) -> Exp:
     """
-    Parse a program: read and expand/error-check it.
+    Parse a program: read, expand/error-check, optimize and type-check it, and convert its closures.
 
     Args:
         inport (Union[str, InPort]): The input string or port to read from.
+        env (Optional[GlobalEnv]): The global environment the program will run in. Defaults to global_env.
 
     Returns:
-        Exp: The parsed and expanded expression.
+        Exp: The parsed, expanded, optimized, type-checked and closure-converted expression.
     """
     if isinstance(inport, str):
         inport = InPort(io.StringIO(inport))
-    return expand(read(inport), toplevel=True)
+    if not INSTRUMENTERS:
+        return convert_closures(infer_types(optimize(expand(read(inport), toplevel=True, env=env), env), env), env)
+    inport.positions = {}
+    try:
+        x = expand(read(inport), toplevel=True, positions=inport.positions, env=env)
+        for instrument in INSTRUMENTERS:
+            x = instrument(x, inport)
+    finally:
+        inport.positions = None
+    return convert_closures(infer_types(optimize(x, env), env), env)
+
+
+def locate(x: Exp, location: Tuple[str, int], env: Optional[GlobalEnv] = None) -> None:
+    """
+    Record where the procedures defined by an evaluated top-level form come from.
+
+    Args:
+        x (Exp): The parsed top-level form.
+        location (Tuple[str, int]): The source name and line of the form.
+        env (Optional[GlobalEnv]): The global environment it was evaluated in. Defaults to global_env.
+    """
+    if isinstance(x, list) and x and x[0] is _begin:
+        for exp in x[1:]:
+            locate(exp, location, env)
+    elif isinstance(x, list) and len(x) > 2 and x[0] is _define:
+        val = (global_env if env is None else env).get(x[1])
+        if isinstance(val, Procedure) and val.location is None:
+            val.location = location
 
 
-def load(filename: str) -> None:
+def load(filename: str, env: Optional[GlobalEnv] = None) -> None:
     """
     Eval every expression from a file.
 
     Args:
         filename (str): The path to the file to load.
+        env (Optional[GlobalEnv]): The global environment to evaluate in. Defaults to global_env.
     """
     with open(filename) as f:
-        repl(None, InPort(f), None, stop_on_error=True)
+        repl(None, InPort(f), None, stop_on_error=True, env=env)
 
 
 def repl(prompt: str = PROMPT, inport: Optional[InPort] = None, out: Optional[TextIO] = sys.stdout,
-         stop_on_error: bool = False) -> None:
+         stop_on_error: bool = False, env: Optional[GlobalEnv] = None) -> None:
     """
     A prompt-read-eval-print loop.
 
@@ -51,6 +91,7 @@ def repl(prompt: str = PROMPT, inport: Optional[InPort] = None, out: Optional[Te
         inport (Optional[InPort], optional): The input port. Defaults to None (stdin).
         out (Optional[TextIO], optional): The output stream. Defaults to sys.stdout.
         stop_on_error (bool, optional): Whether to exit on error. Defaults to False.
+        env (Optional[GlobalEnv]): The global environment to evaluate in. Defaults to global_env.
     """
     if inport is None:
         inport = InPort(sys.stdin)
@@ -63,12 +104,13 @@ def repl(prompt: str = PROMPT, inport: Optional[InPort] = None, out: Optional[Te
             if prompt:
                 sys.stderr.write(prompt)
                 sys.stderr.flush()
-            x = parse(inport)
+            x = parse(inport, env)
             if x is EOF_OBJECT:
                 if prompt:
                     sys.stderr.write(GOODBYE + '\n')
                 return
-            val = eval(x)
+            val = evaluator.eval(x, env)
+            locate(x, (inport.name, inport.datum_line), env)
             if val is not None and out:
                 print(to_string(val), file=out)
         except LispyError as e:
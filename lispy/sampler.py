@@ -0,0 +1,219 @@
+"""
+Sampling profiler.
+
+The sampler looks at the Lispy call stack of a thread at regular intervals,
+from a background thread (or, on Unix, from a profiling timer signal), and
+counts how often each stack is seen. Unlike `lispy.profiler`, it does not
+change how programs are evaluated: it reads the procedures from the Python
+frames of the evaluator loop, where the local variable `proc` holds the
+procedure whose body a loop is running (and `self` in `Procedure.__call__`).
+Its cost is that of walking the stack at each sample, so it can stay on in
+long-running processes. The walk stops after SAMPLE_DEPTH_LIMIT frames of
+the evaluator, from the innermost: the procedures of a deeper recursion are
+shown under `<truncated>`, and a sample costs the same at any depth. Calls
+the optimizer inlined run no procedure, so the time of an inlined procedure
+is charged to its caller.
+
+    >>> sampler = Sampler(interval=0.001)
+    >>> with sampler:
+    ...     lispy.eval(lispy.parse('(fib 25)'))
+    >>> sampler.write_collapsed('fib.folded')
+
+The result is written in the collapsed-stack format that flame graph tools
+(flamegraph.pl, speedscope, inferno) read: one line per stack, the procedures
+from the outermost separated by `;`, followed by the number of samples.
+Procedures are shown as `name (file:line)`, as in `lispy.profiler`.
+"""
+import signal
+import sys
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import evaluator
+from .constants import (
+    COLLAPSED_STACK_FORMAT,
+    COLLAPSED_STACK_SEPARATOR,
+    DEFAULT_SAMPLE_INTERVAL,
+    SAMPLE_DEPTH_LIMIT,
+    TOPLEVEL_FRAME,
+    TRUNCATED_FRAME,
+)
+from .evaluator import Procedure
+from .parser import InPort
+from .profiler import label
+from .repl import locate, parse
+from .types import EOF_OBJECT
+
+_LOOPS = {evaluator._eval.__code__, evaluator._eval_hooked.__code__}
+_CALLS = {evaluator._call.__code__, evaluator._call_hooked.__code__}
+
+
+def lispy_stack(frame: Any, limit: Optional[int] = None) -> Optional[List[Optional[Procedure]]]:
+    """
+    Return the Lispy procedures active in a Python stack, the outermost first.
+
+    A procedure applied in the loop that `Procedure.__call__` started
+    replaces the called procedure, as a tail call does.
+
+    Args:
+        frame (Any): The innermost Python frame.
+        limit (Optional[int]): The most frames of the evaluator to read, from the innermost. Defaults to all.
+
+    Returns:
+        Optional[List[Optional[Procedure]]]: The procedures, or None if the stack is not evaluating Lispy
+            code. If the limit left frames of the evaluator unread, the first element is None.
+    """
+    frames = []
+    while frame is not None:
+        if frame.f_code in _LOOPS or frame.f_code in _CALLS:
+            if len(frames) == limit:
+                break
+            frames.append(frame)
+        frame = frame.f_back
+    if not frames:
+        return None
+    stack: List[Optional[Procedure]] = [] if frame is None else [None]
+    called = False
+    for frame in reversed(frames):
+        if frame.f_code in _CALLS:
+            stack.append(frame.f_locals['self'])
+            called = True
+            continue
+        proc = frame.f_locals.get('proc')
+        if isinstance(proc, Procedure):
+            if called:
+                stack[-1] = proc
+            else:
+                stack.append(proc)
+        called = False
+    return stack
+
+
+def frame_name(proc: Procedure) -> str:
+    """
+    Return how a procedure is shown in collapsed stacks.
+    """
+    file, line, name = label(proc)
+    return COLLAPSED_STACK_FORMAT.format(name, file, line).replace(COLLAPSED_STACK_SEPARATOR, ',')
+
+
+class Sampler:
+    """
+    A sampling profiler of the Lispy call stack of a thread.
+
+    It samples between `start` and `stop`, or in a `with` block.
+
+    Attributes:
+        interval (float): The time between samples, in seconds.
+        thread_id (int): The thread sampled; the one that starts the sampler by default.
+        depth (int): The most frames of the evaluator read per sample (see `lispy_stack`).
+        use_signal (bool): Whether to sample from a SIGPROF timer (Unix, main thread) instead of a thread.
+        samples (Counter): The number of samples of each stack, as a tuple of procedure names.
+    """
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL, thread_id: Optional[int] = None,
+                 use_signal: bool = False, depth: int = SAMPLE_DEPTH_LIMIT) -> None:
+        self.interval = interval
+        self.thread_id = thread_id
+        self.depth = depth
+        self.use_signal = use_signal
+        self.samples: Counter = Counter()
+        self._names: Dict[int, Tuple[Procedure, str]] = {}
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """
+        Start sampling.
+        """
+        if self.thread_id is None:
+            self.thread_id = threading.get_ident()
+        self._stopped.clear()
+        if self.use_signal:
+            signal.signal(signal.SIGPROF, self._handle)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        else:
+            self._thread = threading.Thread(target=self._run, name='lispy-sampler', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop sampling.
+        """
+        if self.use_signal:
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, signal.SIG_DFL)
+        else:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> 'Sampler':
+        self.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.sample(frame)
+
+    def _handle(self, signum: int, frame: Any) -> None:
+        self.sample(frame)
+
+    def sample(self, frame: Any) -> None:
+        """
+        Count the Lispy stack of a Python frame as one sample.
+        """
+        stack = lispy_stack(frame, self.depth)
+        if stack is not None:
+            self.samples[tuple(map(self._name, stack)) or (TOPLEVEL_FRAME,)] += 1
+
+    def _name(self, proc: Optional[Procedure]) -> str:
+        # Names are cached by body, like the entries of the deterministic profiler
+        if proc is None:
+            return TRUNCATED_FRAME
+        cached = self._names.get(id(proc.exp))
+        if cached is None or cached[0].exp is not proc.exp:
+            cached = self._names[id(proc.exp)] = (proc, frame_name(proc))
+        return cached[1]
+
+    def collapsed(self) -> str:
+        """
+        Return the samples in collapsed-stack format, the most frequent stacks first.
+        """
+        return ''.join('{} {}\n'.format(COLLAPSED_STACK_SEPARATOR.join(stack), count)
+                       for stack, count in self.samples.most_common())
+
+    def write_collapsed(self, filename: str) -> None:
+        """
+        Write the samples to a file in collapsed-stack format, for flame graph tools.
+        """
+        with open(filename, 'w') as f:
+            f.write(self.collapsed())
+
+
+def sample_file(filename: str, output: str, interval: float = DEFAULT_SAMPLE_INTERVAL) -> None:
+    """
+    Run a program under the sampler and write its collapsed stacks, for `python -m lispy --sample`.
+
+    Args:
+        filename (str): The program.
+        output (str): The file to write the collapsed stacks to.
+        interval (float): The time between samples, in seconds.
+    """
+    sampler = Sampler(interval)
+    try:
+        with open(filename) as f, sampler:
+            inport = InPort(f)
+            while True:
+                x = parse(inport)
+                if x is EOF_OBJECT:
+                    break
+                evaluator.eval(x)
+                locate(x, (inport.name, inport.datum_line))
+    finally:
+        sampler.write_collapsed(output)
@@ -0,0 +1,356 @@
+"""
+Syntax-rules macros.
+
+This module compiles `(syntax-rules (literal ...) (pattern template) ...)`
+specifications into `SyntaxRules` transformers. Every pattern is compiled once
+into a Python matcher and every template into an instantiator, so expanding a
+macro use never goes through the evaluator.
+
+Hygiene is provided by renaming: identifiers that a template introduces in a
+binding position (`lambda` parameters, `let`-family and `do` variables, named
+`let` names) are replaced by fresh uninterned symbols on every expansion, so
+they can neither capture nor be captured by the user's identifiers.
+Quoted data is left alone: identifiers under `quote`, or under `quasiquote`
+outside of its unquotes, are never renamed.
+"""
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from .errors import SchemeSyntaxError
+from .messages import ERR_ELLIPSIS_TEMPLATE, ERR_NO_MATCHING_RULE, ERR_SYNTAX_RULES
+from .parser import to_string
+from .types import (
+    Exp,
+    Symbol,
+    _do,
+    _ellipsis,
+    _lambda,
+    _let,
+    _letrec,
+    _letrec_star,
+    _quasiquote,
+    _quote,
+    _syntax_rules,
+    _underscore,
+    _unquote,
+    _unquotesplicing,
+    gensym,
+    get_symbol,
+)
+
+Bindings = Dict[Symbol, Exp]
+Matcher = Callable[[Exp, Bindings], bool]
+Instantiator = Callable[[Bindings, 'Renames'], Exp]
+
+# Forms whose binding list is ((var init ...) ...), after an optional name.
+LET_FORMS = {_let, get_symbol('let*'), _letrec, _letrec_star, _do}
+
+
+class Renames(dict):
+    """
+    Per-expansion map from introduced binders to fresh symbols.
+    """
+    def __missing__(self, name: Symbol) -> Symbol:
+        fresh = self[name] = gensym(name)
+        return fresh
+
+
+def _ellipsis_follows(xs: List[Exp], i: int) -> bool:
+    """
+    Check whether the element at index i is followed by an ellipsis.
+    """
+    return i + 1 < len(xs) and xs[i + 1] is _ellipsis
+
+
+def pattern_vars(pattern: Exp, literals: Set[Symbol], depth: int = 0,
+                 result: Optional[Dict[Symbol, int]] = None) -> Dict[Symbol, int]:
+    """
+    Collect the pattern variables of a pattern with their ellipsis depth.
+
+    Args:
+        pattern (Exp): The pattern.
+        literals (Set[Symbol]): The literal identifiers.
+        depth (int): The ellipsis depth of the pattern.
+        result (Dict[Symbol, int], optional): Accumulator.
+
+    Returns:
+        Dict[Symbol, int]: Variable => number of enclosing ellipses.
+    """
+    if result is None:
+        result = {}
+    if isinstance(pattern, Symbol):
+        if pattern not in literals and pattern is not _underscore and pattern is not _ellipsis:
+            result[pattern] = depth
+    elif isinstance(pattern, list):
+        for i, p in enumerate(pattern):
+            pattern_vars(p, literals, depth + _ellipsis_follows(pattern, i), result)
+    return result
+
+
+def compile_pattern(pattern: Exp, literals: Set[Symbol]) -> Matcher:
+    """
+    Compile a pattern into a matcher.
+
+    The matcher takes a form and a bindings dict, fills the dict and returns
+    whether the form matches. Variables under an ellipsis are bound to the
+    list of their values, one per repetition.
+
+    Args:
+        pattern (Exp): The pattern.
+        literals (Set[Symbol]): The literal identifiers.
+
+    Returns:
+        Matcher: The compiled matcher.
+    """
+    if isinstance(pattern, Symbol):
+        if pattern is _underscore:
+            return lambda x, b: True
+        if pattern in literals:
+            return lambda x, b: isinstance(x, Symbol) and x == pattern
+
+        def match_var(x: Exp, b: Bindings) -> bool:
+            b[pattern] = x
+            return True
+        return match_var
+
+    if not isinstance(pattern, list):
+        return lambda x, b: type(x) is type(pattern) and x == pattern
+
+    ellipses = [i for i in range(len(pattern)) if _ellipsis_follows(pattern, i)]
+    if len(ellipses) > 1:
+        raise SchemeSyntaxError(ERR_SYNTAX_RULES.format(to_string(pattern)))
+    if not ellipses:
+        items = [compile_pattern(p, literals) for p in pattern]
+        size = len(items)
+
+        def match_list(x: Exp, b: Bindings) -> bool:
+            if not isinstance(x, list) or len(x) != size:
+                return False
+            for match, xi in zip(items, x):
+                if not match(xi, b):
+                    return False
+            return True
+        return match_list
+
+    k = ellipses[0]
+    head = [compile_pattern(p, literals) for p in pattern[:k]]
+    repeated = compile_pattern(pattern[k], literals)
+    repeated_vars = list(pattern_vars(pattern[k], literals))
+    tail = [compile_pattern(p, literals) for p in pattern[k + 2:]]
+    minimum = len(head) + len(tail)
+    if repeated_vars == [pattern[k]]:       # (p ... ) with a plain variable: bind the slice
+        var = pattern[k]
+
+        def match_rest(x: Exp, b: Bindings) -> bool:
+            if not isinstance(x, list) or len(x) < minimum:
+                return False
+            end = len(x) - len(tail)
+            for match, xi in zip(head, x):
+                if not match(xi, b):
+                    return False
+            for match, xi in zip(tail, x[end:]):
+                if not match(xi, b):
+                    return False
+            b[var] = x[len(head):end]
+            return True
+        return match_rest
+
+    def match_ellipsis(x: Exp, b: Bindings) -> bool:
+        if not isinstance(x, list) or len(x) < minimum:
+            return False
+        end = len(x) - len(tail)
+        for match, xi in zip(head, x):
+            if not match(xi, b):
+                return False
+        for match, xi in zip(tail, x[end:]):
+            if not match(xi, b):
+                return False
+        seqs = {v: [] for v in repeated_vars}
+        for xi in x[len(head):end]:
+            sub = {}
+            if not repeated(xi, sub):
+                return False
+            for v in repeated_vars:
+                seqs[v].append(sub[v])
+        b.update(seqs)
+        return True
+    return match_ellipsis
+
+
+def template_binders(template: Exp, result: Optional[Set[Symbol]] = None, quasi: bool = False) -> Set[Symbol]:
+    """
+    Collect the identifiers a template binds with lambda, let-family or do forms.
+
+    Quoted data binds nothing: quote forms are skipped, and in a quasiquote
+    form only the unquoted expressions are looked into.
+
+    Args:
+        template (Exp): The template.
+        result (Set[Symbol], optional): Accumulator.
+        quasi (bool): Whether the template is quasiquoted data.
+
+    Returns:
+        Set[Symbol]: The binder identifiers.
+    """
+    if result is None:
+        result = set()
+    if not isinstance(template, list) or not template:
+        return result
+    op = template[0]
+    if quasi:
+        if op is _unquote or op is _unquotesplicing:
+            quasi = False
+        for t in template:
+            template_binders(t, result, quasi)
+        return result
+    if op is _quote:
+        return result
+    if op is _quasiquote:
+        quasi = True
+    elif op is _lambda and len(template) > 1:
+        params = template[1]
+        result.update(p for p in (params if isinstance(params, list) else [params]) if isinstance(p, Symbol))
+    elif isinstance(op, Symbol) and op in LET_FORMS and len(template) > 1:
+        bindings = template[1]
+        if isinstance(bindings, Symbol) and len(template) > 2:     # named let
+            result.add(bindings)
+            bindings = template[2]
+        if isinstance(bindings, list):
+            for b in bindings:
+                if isinstance(b, list) and b and isinstance(b[0], Symbol):
+                    result.add(b[0])
+    for t in template:
+        template_binders(t, result, quasi)
+    return result
+
+
+def compile_template(template: Exp, depths: Dict[Symbol, int], binders: Set[Symbol],
+                     unquoted: Optional[Set[Symbol]] = None) -> Instantiator:
+    """
+    Compile a template into an instantiator.
+
+    Pattern variables are substituted everywhere, but introduced identifiers
+    are not renamed in quoted data (see `template_binders`).
+
+    Args:
+        template (Exp): The template.
+        depths (Dict[Symbol, int]): Pattern variables and their remaining ellipsis depth.
+        binders (Set[Symbol]): Introduced identifiers to rename on each expansion.
+        unquoted (Optional[Set[Symbol]]): In quasiquoted data, where binders is empty, the
+            identifiers to rename again in unquoted expressions.
+
+    Returns:
+        Instantiator: A function of (bindings, renames) building the expansion.
+    """
+    if isinstance(template, Symbol):
+        if template in depths:
+            if depths[template]:
+                raise SchemeSyntaxError(ERR_ELLIPSIS_TEMPLATE.format(template))
+            return lambda b, r: b[template]
+        if template in binders:
+            return lambda b, r: r[template]
+        return lambda b, r: template
+    if not isinstance(template, list):
+        return lambda b, r: template
+    op = template[0] if template else None
+    if op is _quote:
+        binders = set()
+    elif op is _quasiquote:
+        binders, unquoted = set(), binders
+    elif unquoted is not None and (op is _unquote or op is _unquotesplicing):
+        binders, unquoted = unquoted, None
+
+    parts: List[Tuple[bool, Instantiator, List[Symbol]]] = []
+    i = 0
+    while i < len(template):
+        t = template[i]
+        if _ellipsis_follows(template, i):
+            iterated = [v for v in pattern_vars(t, set()) if depths.get(v, 0) > 0]
+            if not iterated:
+                raise SchemeSyntaxError(ERR_ELLIPSIS_TEMPLATE.format(to_string(t)))
+            inner = dict(depths)
+            for v in iterated:
+                inner[v] -= 1
+            if t in iterated and depths[t] == 1:    # (v ...): splice the matched sequence
+                parts.append((True, None, iterated))
+            else:
+                parts.append((True, compile_template(t, inner, binders, unquoted), iterated))
+            i += 2
+        else:
+            parts.append((False, compile_template(t, depths, binders, unquoted), []))
+            i += 1
+
+    def instantiate(b: Bindings, r: Renames) -> Exp:
+        result = []
+        for repeated, sub, iterated in parts:
+            if not repeated:
+                result.append(sub(b, r))
+                continue
+            if sub is None:
+                result.extend(b[iterated[0]])
+                continue
+            seqs = [b[v] for v in iterated]
+            if len(set(map(len, seqs))) > 1:
+                raise SchemeSyntaxError(ERR_ELLIPSIS_TEMPLATE.format(to_string(iterated)))
+            inner = dict(b)
+            for values in zip(*seqs):
+                inner.update(zip(iterated, values))
+                result.append(sub(inner, r))
+        return result
+    return instantiate
+
+
+class SyntaxRules:
+    """
+    A macro transformer compiled from a syntax-rules specification.
+
+    Instances are stored in the macro table and called, like `define-macro`
+    transformers, with the operands of a macro use.
+
+    Attributes:
+        name (Symbol): The macro keyword.
+        rules (List[Tuple[Matcher, Instantiator]]): Compiled rules, tried in order.
+    """
+    def __init__(self, name: Symbol, spec: Exp) -> None:
+        """
+        Compile a `(syntax-rules (literal ...) (pattern template) ...)` form.
+
+        Args:
+            name (Symbol): The macro keyword.
+            spec (Exp): The syntax-rules form.
+
+        Raises:
+            SchemeSyntaxError: If the specification is malformed.
+        """
+        if not (isinstance(spec, list) and len(spec) >= 2 and spec[0] is _syntax_rules
+                and isinstance(spec[1], list) and all(isinstance(lit, Symbol) for lit in spec[1])
+                and all(isinstance(r, list) and len(r) == 2 and isinstance(r[0], list) and r[0]
+                        for r in spec[2:])):
+            raise SchemeSyntaxError(ERR_SYNTAX_RULES.format(to_string(spec)))
+        self.name = name
+        literals = set(spec[1])
+        self.rules = []
+        for pattern, template in spec[2:]:
+            pattern = pattern[1:]                   # the keyword position is ignored
+            depths = pattern_vars(pattern, literals)
+            binders = template_binders(template) - set(depths)
+            self.rules.append((compile_pattern(pattern, literals), compile_template(template, depths, binders)))
+
+    def __call__(self, *args: Exp) -> Exp:
+        """
+        Expand a use of the macro.
+
+        Args:
+            *args (Exp): The operands of the macro use.
+
+        Returns:
+            Exp: The expansion of the first matching rule.
+
+        Raises:
+            SchemeSyntaxError: If no rule matches.
+        """
+        form = list(args)
+        for match, instantiate in self.rules:
+            bindings = {}
+            if match(form, bindings):
+                return instantiate(bindings, Renames())
+        raise SchemeSyntaxError(ERR_NO_MATCHING_RULE.format(to_string([self.name] + form)))
@@ -0,0 +1,151 @@
+"""
+Timing from Lispy.
+
+`(time exp)` evaluates an expression once and reports how long it took, on
+the wall clock and in CPU time, and what it allocated: environment frames
+and procedures (from the runtime counters, see `lispy.counters`) and the
+collections of the garbage collector it triggered.
+
+`(bench exp #:iterations n #:warmup k)` evaluates an expression k times
+untimed, then n times timed, and reports the distribution of the times:
+minimum, median, mean, 90th and 99th percentiles, maximum and standard
+deviation.
+
+    lispy> (bench (fib 15) #:iterations 50)
+    ; 50 iterations: median 2.102 ms, p90 2.240 ms, p99 2.517 ms, min 2.061 ms, stdev 0.083 ms
+
+Both print a report and return the results as a hash table from symbols,
+with times in nanoseconds (from `time.perf_counter_ns`), so they can be
+processed in Lispy: `(hash-ref (bench (fib 15)) 'median)`.
+"""
+import gc
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, TextIO
+
+from .constants import BENCH_REPORT_FORMAT, TIME_REPORT_FORMAT
+from .counters import CURRENT_COUNTERS
+from .evaluator import count_events
+from .types import HashTable, get_symbol
+
+
+def collections() -> int:
+    """
+    Return the number of collections the garbage collector has run, in all generations.
+    """
+    return sum(generation['collections'] for generation in gc.get_stats())
+
+
+def to_table(results: Dict[str, Any]) -> HashTable:
+    """
+    Return results as a hash table from symbols, with names written with dashes (`wall-ns`).
+    """
+    table = HashTable()
+    for name, value in results.items():
+        table[get_symbol(name.replace('_', '-'))] = value
+    return table
+
+
+def percentile(times: List[int], p: float) -> float:
+    """
+    Return a percentile of sorted times, interpolating between the two nearest.
+
+    Args:
+        times (List[int]): The times, in increasing order.
+        p (float): The percentile, from 0 to 100.
+
+    Returns:
+        float: The time below which p% of the times fall.
+    """
+    rank = (len(times) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(times) - 1)
+    return times[low] + (times[high] - times[low]) * (rank - low)
+
+
+def time_thunk(thunk: Callable[[], Any], out: Optional[TextIO] = None) -> HashTable:
+    """
+    Call a procedure once, timing it, and print the report.
+
+    This is what `(time exp)` expands into, with exp wrapped in a thunk.
+
+    Args:
+        thunk (Callable[[], Any]): The procedure, of no arguments.
+        out (Optional[TextIO]): The output stream of the report. Defaults to sys.stdout.
+
+    Returns:
+        HashTable: The value of the call (`value`), the wall and CPU times (`wall-ns`, `cpu-ns`),
+            the frames and procedures allocated (`env-frames`, `procedures`; the frame of the
+            thunk counts) and the collections of the garbage collector (`collections`).
+    """
+    counters = CURRENT_COUNTERS.get()
+    count_events(True)
+    try:
+        frames, procedures, collected = counters.env_frames, counters.procedures, collections()
+        cpu_start = time.process_time_ns()
+        start = time.perf_counter_ns()
+        value = thunk()
+        wall = time.perf_counter_ns() - start
+        cpu = time.process_time_ns() - cpu_start
+    finally:
+        count_events(False)
+    results = {
+        'value': value,
+        'wall_ns': wall,
+        'cpu_ns': cpu,
+        'env_frames': counters.env_frames - frames,
+        'procedures': counters.procedures - procedures,
+        'collections': collections() - collected,
+    }
+    print(TIME_REPORT_FORMAT.format(wall / 1e6, cpu / 1e6, results['env_frames'], results['procedures'],
+                                    results['collections']), file=sys.stdout if out is None else out)
+    return to_table(results)
+
+
+def bench_thunk(thunk: Callable[[], Any], iterations: int, warmup: int, out: Optional[TextIO] = None) -> HashTable:
+    """
+    Call a procedure repeatedly, timing each call, and print the report.
+
+    This is what `(bench exp #:iterations n #:warmup k)` expands into, with exp wrapped
+    in a thunk. The garbage collector runs once before the timed calls.
+
+    Args:
+        thunk (Callable[[], Any]): The procedure, of no arguments.
+        iterations (int): The number of timed calls (at least one).
+        warmup (int): The number of untimed calls before.
+        out (Optional[TextIO]): The output stream of the report. Defaults to sys.stdout.
+
+    Returns:
+        HashTable: The value of the last call (`value`), the settings (`iterations`, `warmup`),
+            the times of the calls in nanoseconds (`times`) and their statistics: `min`, `median`,
+            `mean`, `p90`, `p99`, `max` and `stdev`.
+    """
+    iterations = max(iterations, 1)
+    for _ in range(warmup):
+        thunk()
+    gc.collect()
+    times = []
+    clock = time.perf_counter_ns
+    for _ in range(iterations):
+        start = clock()
+        value = thunk()
+        times.append(clock() - start)
+    ordered = sorted(times)
+    results = {
+        'value': value,
+        'iterations': iterations,
+        'warmup': warmup,
+        'times': times,
+        'min': ordered[0],
+        'median': statistics.median(ordered),
+        'mean': statistics.mean(ordered),
+        'p90': percentile(ordered, 90),
+        'p99': percentile(ordered, 99),
+        'max': ordered[-1],
+        'stdev': statistics.stdev(ordered) if iterations > 1 else 0.0,
+    }
+    print(BENCH_REPORT_FORMAT.format(iterations, results['median'] / 1e6, results['p90'] / 1e6, results['p99'] / 1e6,
+                                     results['min'] / 1e6, results['stdev'] / 1e6),
+          file=sys.stdout if out is None else out)
+    return to_table(results)
@@ -0,0 +1,146 @@
+"""
+Ring-buffer tracer.
+
+A `Tracer` is an evaluator hook (see `lispy.evaluator.Hook`) that keeps the
+last events of evaluation in a bounded buffer: procedure calls, tail calls,
+returns (with their duration) and exceptions, macro expansions, exceptions
+caught by `try` and, if asked for, every special form. Old events are
+dropped as new ones come, so a tracer can stay installed in a long-running
+process and be dumped when something goes wrong, e.g. after a slow request.
+
+    >>> with Tracer(capacity=1000) as tracer:
+    ...     lispy.eval(lispy.parse('(handle request)'))
+    >>> tracer.dump()
+
+Events hold the objects they are about, and are formatted only when dumped.
+"""
+import sys
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, NamedTuple, Optional, TextIO
+
+from .constants import DEFAULT_TRACE_CAPACITY, TRACE_EVENT_FORMAT
+from .env import Env
+from .evaluator import Hook, Procedure
+from .profiler import label
+from .types import Exp, Symbol
+
+# Kinds of events
+ENTER = 'enter'
+TAIL_CALL = 'tail-call'
+EXIT = 'exit'
+RAISE = 'raise'             # a procedure call ended with an exception
+SPECIAL_FORM = 'form'
+MACRO = 'macro'
+CATCH = 'catch'             # a try expression caught an exception
+
+DEFAULT_KINDS = frozenset([ENTER, TAIL_CALL, EXIT, RAISE, MACRO, CATCH])
+"""The events traced by default: all but special forms, which are many."""
+
+
+class TraceEvent(NamedTuple):
+    """
+    An evaluation event.
+
+    Attributes:
+        time (float): When it happened, by the clock of the tracer.
+        kind (str): The kind of event (ENTER, EXIT...).
+        subject (Any): The procedure, special form or macro name, or exception it is about.
+        duration (Optional[float]): For EXIT and RAISE, how long the call took.
+        depth (int): The number of calls in progress.
+    """
+    time: float
+    kind: str
+    subject: Any
+    duration: Optional[float]
+    depth: int
+
+    def describe(self) -> str:
+        """
+        Return what the event is about, as text.
+        """
+        subject = self.subject
+        if isinstance(subject, Procedure):
+            file, line, name = label(subject)
+            return '{} ({}:{})'.format(name, file, line)
+        elif isinstance(subject, BaseException):
+            return '{}: {}'.format(type(subject).__name__, subject)
+        return str(subject)
+
+
+class Tracer(Hook):
+    """
+    An evaluator hook keeping the last events in a ring buffer.
+
+    Attributes:
+        events (Deque[TraceEvent]): The last events, the oldest first.
+        kinds (frozenset): The kinds of events traced.
+        timer (Callable[[], float]): The clock.
+    """
+    def __init__(self, capacity: int = DEFAULT_TRACE_CAPACITY, kinds: Optional[Iterable[str]] = None,
+                 timer: Callable[[], float] = time.perf_counter) -> None:
+        """
+        Initialize the Tracer.
+
+        Args:
+            capacity (int): The number of events kept.
+            kinds (Optional[Iterable[str]]): The kinds of events to trace. Defaults to DEFAULT_KINDS.
+            timer (Callable[[], float]): The clock.
+        """
+        self.events: Deque[TraceEvent] = deque(maxlen=capacity)
+        self.kinds = DEFAULT_KINDS if kinds is None else frozenset(kinds)
+        self.timer = timer
+        self._starts: List[float] = []
+
+    def _record(self, kind: str, subject: Any, duration: Optional[float] = None) -> None:
+        if kind in self.kinds:
+            self.events.append(TraceEvent(self.timer(), kind, subject, duration, len(self._starts)))
+
+    def enter(self, proc: Procedure, args: List[Any]) -> None:
+        self._record(ENTER, proc)
+        self._starts.append(self.timer())
+
+    def tail_call(self, caller: Procedure, proc: Procedure, args: List[Any]) -> None:
+        now = self.timer()
+        if self._starts:
+            self._record(EXIT, caller, now - self._starts.pop())
+        self._record(TAIL_CALL, proc)
+        self._starts.append(now)
+
+    def exit(self, proc: Procedure, value: Any, error: Optional[BaseException]) -> None:
+        duration = self.timer() - self._starts.pop() if self._starts else None
+        self._record(EXIT if error is None else RAISE, proc, duration)
+
+    def special_form(self, x: Exp, env: Env) -> None:
+        self._record(SPECIAL_FORM, x[0])
+
+    def macro(self, name: Symbol, x: Exp, expansion: Exp) -> None:
+        self._record(MACRO, name)
+
+    def catch(self, error: Exception, x: Exp, env: Env) -> None:
+        self._record(CATCH, error)
+
+    def clear(self) -> None:
+        """
+        Forget the events traced so far.
+        """
+        self.events.clear()
+
+    def to_json(self) -> List[Dict[str, Any]]:
+        """
+        Return the events as JSON-serializable data, the oldest first.
+        """
+        return [{'time': e.time, 'kind': e.kind, 'subject': e.describe(), 'duration': e.duration, 'depth': e.depth}
+                for e in self.events]
+
+    def dump(self, out: Optional[TextIO] = None) -> None:
+        """
+        Print the events, one per line, indented by call depth.
+
+        Args:
+            out (Optional[TextIO]): The output stream. Defaults to sys.stderr.
+        """
+        out = sys.stderr if out is None else out
+        for e in self.events:
+            duration = '' if e.duration is None else ' {:.6f}s'.format(e.duration)
+            print(TRACE_EVENT_FORMAT.format(e.time, '  ' * e.depth, e.kind, e.describe(), duration), file=out)
@@ -1,10 +1,35 @@
 """
 Type checking functionality.
+
+A type annotation is either a type symbol (`int`, `float`, `vector`, ...) or
+a type expression built from the type constructors:
+
+- `(list-of T)`: a list whose elements are all of type T.
+- `(vector-of T)`: a vector of elements of type T.
+- `(hash-of K V)`: a hash table with keys of type K and values of type V.
+- `(or T ...)`: a value of any of the given types.
+- `(procedure n)`: a procedure that accepts n arguments.
+
+Record types (see `lispy.records`) are type symbols too, but only in the
+global environment that defines them and its forks: the checks of code
+running in an environment look them up there (see `GlobalEnv.find_type`).
+
+Containers created with an element type validate the values stored in them
+(see `lispy.types.Vector` and `lispy.types.HashTable`), so checking that such
+a container has a declared type does not look at its elements. Lists carry
+no type and are checked element by element.
 """
-from typing import Any
+import inspect
+from typing import Any, Callable, Dict, Optional, Tuple
 
-from .errors import UserError
-from .messages import ERR_UNKNOWN_TYPE
+from .constants import ANY_TYPE, LPAREN, RPAREN
+from .env import Env, GlobalEnv
+from .errors import ArgumentError, UserError
+from .messages import ERR_BUILTIN_TYPE, ERR_UNKNOWN_TYPE
+from .parser import to_string
+from .types import Exp, HashTable, Symbol, Vector
+
+ANY = ANY_TYPE
 
 TYPE_MAPPING = {
     'int': int,
@@ -12,25 +37,179 @@ TYPE_MAPPING = {
     'str': str,
     'bool': bool,
     'list': list,
+    'vector': Vector,
+    'hash': HashTable,
+}
+
+TYPE_PREDICATES = {
+    'procedure': callable,
+    ANY: lambda val: True,
+}
+"""Type symbols that are not checked with isinstance."""
+
+
+def register_type(name: str, cls: type, env: Env) -> None:
+    """
+    Make a class available as a type symbol in the annotations of the code running in an environment.
+
+    Args:
+        name (str): The type symbol.
+        cls (type): The class of the values of the type.
+        env (Env): The environment; the type is defined in its global environment.
+
+    Raises:
+        ArgumentError: If name is a builtin type or type constructor.
+    """
+    if name in TYPE_MAPPING or name in TYPE_PREDICATES or name in TYPE_CONSTRUCTORS:
+        raise ArgumentError(ERR_BUILTIN_TYPE.format(name))
+    env.top().define_type(name, cls)
+
+
+def type_name(type_exp: Exp) -> str:
+    """
+    Return the printed form of a type annotation, for error messages.
+
+    Type names are printed as they are, whether symbols or strings (such as
+    the names of record types), rather than as Scheme strings.
+    """
+    if isinstance(type_exp, str):
+        return type_exp
+    if isinstance(type_exp, list):
+        return LPAREN + ' '.join(map(type_name, type_exp)) + RPAREN
+    return to_string(type_exp)
+
+
+def _accepts(proc: Any, n: int) -> bool:
+    """
+    Check if a procedure can be called with n arguments.
+    """
+    parms = getattr(proc, 'parms', None)
+    if isinstance(parms, Symbol):
+        return True
+    elif isinstance(parms, list):
+        return len(parms) == n
+    try:
+        inspect.signature(proc).bind(*range(n))
+    except TypeError:
+        return False
+    except ValueError:
+        # No signature is available for some builtins
+        return True
+    return True
+
+
+def _list_of(element: Callable[[Any], bool]) -> Callable[[Any], bool]:
+    return lambda val: isinstance(val, list) and all(map(element, val))
+
+
+def _vector_of(env: Optional[Env], type_exp: Exp) -> Callable[[Any], bool]:
+    element = compile_type(type_exp, env)
+
+    def check(val: Any) -> bool:
+        if not isinstance(val, Vector):
+            return False
+        # A typed vector has validated its elements on insertion
+        return val.element_type == type_exp or type_exp == ANY or all(map(element, val.items))
+    return check
+
+
+def _hash_of(env: Optional[Env], key_exp: Exp, value_exp: Exp) -> Callable[[Any], bool]:
+    key, value = compile_type(key_exp, env), compile_type(value_exp, env)
+
+    def check(val: Any) -> bool:
+        if not isinstance(val, HashTable):
+            return False
+        elif ((val.key_type == key_exp or key_exp == ANY)
+              and (val.value_type == value_exp or value_exp == ANY)):
+            return True
+        return all(key(k) and value(v) for k, v in val.items())
+    return check
+
+
+def _union(env: Optional[Env], *type_exps: Exp) -> Callable[[Any], bool]:
+    checks = [compile_type(t, env) for t in type_exps]
+    return lambda val: any(check(val) for check in checks)
+
+
+def _procedure(env: Optional[Env], n: Any) -> Callable[[Any], bool]:
+    if not isinstance(n, int) or isinstance(n, bool):
+        raise UserError(ERR_UNKNOWN_TYPE.format(type_name(['procedure', n])))
+    return lambda val: callable(val) and _accepts(val, n)
+
+
+TYPE_CONSTRUCTORS = {
+    'list-of': (1, lambda env, t: _list_of(compile_type(t, env))),
+    'vector-of': (1, _vector_of),
+    'hash-of': (2, _hash_of),
+    'or': (None, _union),
+    'procedure': (1, _procedure),
 }
+"""Parametric types: the number of parameters (None for any) and the predicate builder, given the environment."""
+
+_compiled: Dict[int, Tuple[Exp, Callable[[Any], bool]]] = {}
+"""The predicates of the type expressions checked outside any global environment."""
+
+
+def compile_type(type_exp: Exp, env: Optional[Env] = None) -> Callable[[Any], bool]:
+    """
+    Return a predicate recognizing the values of a type.
+
+    The predicates of type expressions are cached, by global environment, so
+    that the checks of an annotation are compiled once.
+
+    Args:
+        type_exp (Exp): A type symbol or type expression.
+        env (Optional[Env]): The environment its record types are looked up in, if any.
+
+    Returns:
+        Callable[[Any], bool]: The predicate.
+
+    Raises:
+        UserError: If the type is unknown or malformed.
+    """
+    if not isinstance(type_exp, list):
+        check_type(None, type_exp, env)     # reject unknown type symbols now
+        return lambda val: check_type(val, type_exp, env)
+    top = None if env is None else env.top()
+    compiled = top.type_checks if isinstance(top, GlobalEnv) else _compiled
+    entry = compiled.get(id(type_exp))
+    if entry is not None and entry[0] is type_exp:
+        return entry[1]
+    name, args = (type_exp[0], type_exp[1:]) if type_exp else (None, [])
+    if not isinstance(name, Symbol) or name not in TYPE_CONSTRUCTORS:
+        raise UserError(ERR_UNKNOWN_TYPE.format(type_name(type_exp)))
+    arity, build = TYPE_CONSTRUCTORS[name]
+    if arity is not None and len(args) != arity:
+        raise UserError(ERR_UNKNOWN_TYPE.format(type_name(type_exp)))
+    check = build(env, *args)
+    compiled[id(type_exp)] = (type_exp, check)
+    return check
 
 
-def check_type(val: Any, type_sym: str) -> bool:
+def check_type(val: Any, type_sym: Exp, env: Optional[Env] = None) -> bool:
     """
-    Check if value matches the Scheme type symbol.
+    Check if value matches the Scheme type symbol or type expression.
 
     Args:
         val (Any): The value to check.
-        type_sym (str): The type symbol (e.g. 'int').
+        type_sym (Exp): The type symbol (e.g. 'int') or type expression (e.g. (list-of int)).
+        env (Optional[Env]): The environment of the annotation, where record types are looked up.
 
     Returns:
         bool: True if the value matches the type, False otherwise.
 
     Raises:
-        UserError: If the type symbol is unknown.
+        UserError: If the type is unknown.
     """
+    if isinstance(type_sym, list):
+        return compile_type(type_sym, env)(val)
     if type_sym not in TYPE_MAPPING:
-        raise UserError(ERR_UNKNOWN_TYPE.format(type_sym))
+        if type_sym in TYPE_PREDICATES:
+            return TYPE_PREDICATES[type_sym](val)
+        record_type = None if env is None else env.find_type(type_sym)
+        if record_type is None:
+            raise UserError(ERR_UNKNOWN_TYPE.format(type_sym))
+        return isinstance(val, record_type)
 
     expected_type = TYPE_MAPPING[type_sym]
     # Special case for numbers? In Python bool is int.
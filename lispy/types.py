@@ -4,9 +4,18 @@ Type definitions for Lispy.
 This module defines the types used in the interpreter, such as `Symbol`, `Exp`,
 and `Atom`.
 """
-from typing import Any, Callable, Dict, List, Optional, Union
+import itertools
+from array import array
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple, Union
 
-from .constants import QUASIQUOTE_CHAR, QUOTE_CHAR, UNQUOTE_CHAR, UNQUOTE_SPLICING_CHAR
+from .constants import (
+    FLOAT_ARRAY_TYPECODE,
+    GENSYM_FORMAT,
+    QUASIQUOTE_CHAR,
+    QUOTE_CHAR,
+    UNQUOTE_CHAR,
+    UNQUOTE_SPLICING_CHAR,
+)
 
 Number = Union[int, float]
 Atom = Union[str, Number]
@@ -25,6 +34,90 @@ class Promise:
         self.computed: bool = False
 
 
+class Box:
+    """
+    A mutable cell holding a variable shared by a frame and the closures that capture it.
+
+    A box created for a variable that is not bound yet (an internal define)
+    has no `value` attribute until it is assigned.
+    """
+    __slots__ = ('value',)
+
+
+class Vector:
+    """
+    A Scheme vector: a fixed-length sequence with constant-time access.
+
+    A vector made with an element type only accepts values of that type, which
+    the procedures that store into it check on insertion; reading an element
+    needs no check. Vectors of floats store their elements unboxed in an
+    `array.array`.
+
+    Attributes:
+        items (MutableSequence[Any]): The elements.
+        element_type (Optional[Exp]): The type of the elements, or None for any value.
+        check (Optional[Callable[[Any], bool]]): The predicate of the element type.
+    """
+    __slots__ = ('items', 'element_type', 'check')
+
+    def __init__(self, items: Iterable[Any], element_type: Optional['Exp'] = None,
+                 check: Optional[Callable[[Any], bool]] = None) -> None:
+        self.items = array(FLOAT_ARRAY_TYPECODE, items) if element_type == 'float' else list(items)
+        self.element_type = element_type
+        self.check = check
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, Vector) and list(self.items) == list(other.items)
+
+    __hash__ = None
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+
+class HashTable(dict):
+    """
+    A Scheme hash table.
+
+    Like vectors, a hash table made with key and value types checks the
+    entries stored into it.
+
+    Attributes:
+        key_type (Optional[Exp]): The type of the keys, or None for any value.
+        value_type (Optional[Exp]): The type of the values, or None for any value.
+        check (Optional[Tuple[Optional[Callable[[Any], bool]], ...]]): The predicates of
+            the key and value types.
+    """
+    __slots__ = ('key_type', 'value_type', 'check')
+
+    def __init__(self, key_type: Optional['Exp'] = None, value_type: Optional['Exp'] = None,
+                 check: Optional[Tuple[Optional[Callable[[Any], bool]], ...]] = None) -> None:
+        super().__init__()
+        self.key_type = key_type
+        self.value_type = value_type
+        self.check = check
+
+
+class Record:
+    """
+    Base class of the record types made by `define-record-type`.
+
+    Each record type is a subclass with one slot per field, so a record holds
+    its fields and nothing else, and reading a field is an attribute access.
+    The slots are named `_0`, `_1`, ... since field names need not be Python
+    identifiers.
+
+    Attributes:
+        type_name (str): The name of the record type.
+        fields (Tuple[Symbol, ...]): The field names, in slot order.
+        types (Tuple[Exp, ...]): The type annotation of each field.
+    """
+    __slots__ = ()
+    type_name: str = ''
+    fields: Tuple['Symbol', ...] = ()
+    types: Tuple['Exp', ...] = ()
+
+
 class Symbol(str):
     """
     A Scheme Symbol.
@@ -55,6 +148,60 @@ def get_symbol(s: str, symbol_table: Dict[str, Symbol] = _symbol_table) -> Symbo
     return symbol_table[s]
 
 
+_gensym_counter = itertools.count(1)
+
+
+def gensym(name: str = 'g') -> Symbol:
+    """
+    Create a fresh, uninterned Symbol.
+
+    The symbol is not entered in the symbol table and its name contains a
+    character the reader treats as a delimiter, so it can never be equal to a
+    symbol written in a program.
+
+    Args:
+        name (str): A readable prefix for the new symbol.
+
+    Returns:
+        Symbol: The fresh symbol.
+    """
+    return Symbol(GENSYM_FORMAT.format(name, next(_gensym_counter)))
+
+
+def is_interned(s: Symbol) -> bool:
+    """
+    Check whether a symbol is the one of the symbol table, rather than one made by `gensym`.
+    """
+    return _symbol_table.get(s) is s
+
+
+class OptimizedExp(list):
+    """
+    An expression rewritten under assumptions about global bindings.
+
+    It evaluates as the optimized code until one of the global names it
+    depends on is rebound; the global environment then calls `deoptimize`,
+    which replaces its contents with the original code in place, so that every
+    procedure sharing the node sees the change.
+
+    Attributes:
+        original (List[Any]): The code to fall back to.
+        deps (FrozenSet[Symbol]): The global names the optimized code relies on.
+    """
+    __slots__ = ('original', 'deps', '__weakref__')
+
+    def __init__(self, optimized: List[Any], original: List[Any], deps: FrozenSet['Symbol']) -> None:
+        super().__init__(optimized)
+        self.original = original
+        self.deps = deps
+
+    def deoptimize(self) -> None:
+        """
+        Replace the optimized code with the original one.
+        """
+        self[:] = self.original
+
+
 # Global symbols
 _quote = get_symbol('quote')
 _if = get_symbol('if')
@@ -68,12 +215,83 @@ _unquote = get_symbol('unquote')
 _unquotesplicing = get_symbol('unquote-splicing')
 _append = get_symbol('append')
 _cons = get_symbol('cons')
+_list = get_symbol('list')
+_list_star = get_symbol('list*')
 _let = get_symbol('let')
+_letrec = get_symbol('letrec')
+_letrec_star = get_symbol('letrec*')
 _try = get_symbol('try')
 _dynamic_let = get_symbol('dynamic-let')
+_and = get_symbol('and')
+_or = get_symbol('or')
 _delay = get_symbol('delay')
 _make_promise = get_symbol('make-promise')
+_profile = get_symbol('profile')
+_profile_call = get_symbol('#%profile')
+_time = get_symbol('time')
+_time_call = get_symbol('#%time')
+_bench = get_symbol('bench')
+_bench_call = get_symbol('#%bench')
+_iterations_keyword = get_symbol('#:iterations')
+_warmup_keyword = get_symbol('#:warmup')
+_cover = get_symbol('#%cover')
 _do = get_symbol('do')
+_cond = get_symbol('cond')
+_case = get_symbol('case')
+_when = get_symbol('when')
+_unless = get_symbol('unless')
+_else = get_symbol('else')
+_arrow = get_symbol('=>')
+_definesyntax = get_symbol('define-syntax')
+_syntax_rules = get_symbol('syntax-rules')
+_ellipsis = get_symbol('...')
+_underscore = get_symbol('_')
+_define_record_type = get_symbol('define-record-type')
+_match = get_symbol('match')
+_define_library = get_symbol('define-library')
+_export = get_symbol('export')
+_import = get_symbol('import')
+_only = get_symbol('only')
+_except = get_symbol('except')
+_prefix = get_symbol('prefix')
+_rename = get_symbol('rename')
+_match_predicate = get_symbol('?')
+_match_record_type = get_symbol('$')
+_dot = get_symbol('.')
+_make_record_type = get_symbol('make-record-type')
+_record_constructor = get_symbol('record-constructor')
+_record_predicate = get_symbol('record-predicate')
+_record_accessor = get_symbol('record-accessor')
+_record_modifier = get_symbol('record-modifier')
+
+# Internal forms produced by the expander
+_loop = get_symbol('#%loop')
+_recur = get_symbol('#%recur')
+
+# Internal forms produced by closure conversion
+_box = get_symbol('#%box')
+_unbox = get_symbol('#%unbox')
+_set_box = get_symbol('#%set-box!')
+
+# Internal forms produced by type inference
+_typed_call = get_symbol('#%typed-call')
+_operator = get_symbol('#%operator')
+_field_ref = get_symbol('#%field-ref')
+_field_set = get_symbol('#%field-set!')
+
+# Internal procedures called by the code match expressions expand into
+_match_length = get_symbol('#%length=?')
+_match_min_length = get_symbol('#%length>=?')
+_match_equal = get_symbol('#%same-datum?')
+_match_eq = get_symbol('#%eq?')
+_match_record = get_symbol('#%record?')
+_match_every = get_symbol('#%every?')
+_match_map = get_symbol('#%map')
+_match_error = get_symbol('#%match-error')
+_list_ref = get_symbol('#%list-ref')
+_list_tail = get_symbol('#%list-tail')
+_list_slice = get_symbol('#%list-slice')
+_record_field = get_symbol('#%record-field')
 
 EOF_OBJECT = get_symbol('#<eof-object>')
 
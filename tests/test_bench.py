@@ -0,0 +1,64 @@
+import io
+import json
+
+import pytest
+
+from lispy.bench import compare, find_benchmarks, main, run_benchmark, run_suite
+from lispy.errors import BenchmarkError
+
+
+def write_benchmark(directory, name, source):
+    path = directory / (name + '.scm')
+    path.write_text(source)
+    return str(path)
+
+
+def test_suite_has_workloads():
+    names = [path.rsplit('/', 1)[-1] for path in find_benchmarks()]
+    assert {'fib.scm', 'tak.scm', 'nqueens.scm', 'streams.scm', 'macros.scm'} <= set(names)
+    with pytest.raises(BenchmarkError):
+        find_benchmarks(names=['no-such-benchmark'])
+
+
+def test_run_benchmark(tmp_path):
+    filename = write_benchmark(tmp_path, 'count', """
+    (define (bench-count n :: int) (if (= n 0) 'done (bench-count (- n 1))))
+    (define bench-input 100)
+    (define (bench-run n) (bench-count n))
+    (define bench-expected 'done)
+    """)
+    result = run_benchmark(filename, repeat=3, warmup=0)
+    assert result['input'] == 100 and len(result['times']) == 3
+    assert result['min'] <= result['median'] <= result['max']
+    results = run_suite([filename], repeat=2, out=io.StringIO())
+    assert list(results['benchmarks']) == ['count'] and results['repeat'] == 2
+
+
+def test_wrong_benchmarks(tmp_path):
+    wrong = write_benchmark(tmp_path, 'wrong', """
+    (define bench-input 1)
+    (define (bench-run n) (+ n 1))
+    (define bench-expected 3)
+    """)
+    with pytest.raises(BenchmarkError, match="returned '2', expected '3'"):
+        run_benchmark(wrong, repeat=1)
+    missing = write_benchmark(tmp_path, 'missing', "(define (bench-run n) n)")
+    with pytest.raises(BenchmarkError, match='bench-input'):
+        run_benchmark(missing, repeat=1)
+
+
+def test_compare(tmp_path, capsys):
+    def results(**times):
+        return {'benchmarks': {name: {'min': t, 'median': t, 'mean': t} for name, t in times.items()}}
+
+    old, new = results(a=1.0, b=1.0, c=1.0, d=1.0), results(a=1.05, b=1.5, c=0.5)
+    rows = {row['name']: row for row in compare(old, new)}
+    assert set(rows) == {'a', 'b', 'c'}
+    assert [rows[name]['status'] for name in 'abc'] == ['same', 'slower', 'faster']
+    assert rows['b']['ratio'] == 1.5
+    old_file, new_file = tmp_path / 'old.json', tmp_path / 'new.json'
+    old_file.write_text(json.dumps(old))
+    new_file.write_text(json.dumps(new))
+    assert main(['--compare', str(old_file), str(new_file)]) == 1
+    assert 'SLOWER' in capsys.readouterr().out
+    assert main(['--compare', str(old_file), str(new_file), '--threshold', '0.6']) == 0
@@ -0,0 +1,78 @@
+import pytest
+
+import lispy
+from lispy.errors import SymbolNotFoundError, TypeMismatchError
+from lispy.repl import parse
+from lispy.types import _box, _lambda, _unbox, get_symbol
+from tests.utils import run
+
+
+def test_closures_capture_free_variables_only():
+    run("(define (clo-make-adder n) (let ((unused (list 1 2 3))) (lambda (x) (+ x n))))")
+    adder = run("(clo-make-adder 5)")
+    assert dict(adder.env) == {'n': 5}
+    assert adder.env.outer is lispy.global_env
+    assert run("((clo-make-adder 5) 10)") == 15
+    assert run("(lambda (x) x)").env is lispy.global_env
+    x = parse("(lambda (a b) (lambda () a))")
+    assert x[2] == [_lambda, [], get_symbol('a'), [get_symbol('a')]]
+
+
+def test_mutated_variables_are_boxed():
+    run("(define (clo-counter) (let ((n 0)) (lambda () (set! n (+ n 1)) n)))")
+    assert run("(let ((c (clo-counter))) (c) (c) (c))") == 3
+    x = parse("(lambda (n) (lambda () (set! n (+ n 1)) n))")
+    assert x[2][0] is _box and x[2][1] == [get_symbol('n')]
+    assert x[2][2][2][-1] == [_unbox, get_symbol('n')]
+    # Variables that are never assigned are not boxed
+    assert parse("(lambda (n) (lambda () n))")[2][0] is _lambda
+
+
+def test_shared_mutation():
+    code = """
+    (let ((n 0))
+      (define (inc) (set! n (+ n 1)))
+      (define (get) n)
+      (inc) (inc)
+      (set! n (* n 10))
+      (list (get) n))
+    """
+    assert run(code) == [20, 20]
+    code = "(let ((x 1)) (define f (lambda () x)) (set! x 2) (f))"
+    assert run(code) == 2
+
+
+def test_internal_defines_and_letrec():
+    code = """
+    (define (clo-parity n)
+      (define (ev? k) (if (= k 0) #t (od? (- k 1))))
+      (define (od? k) (if (= k 0) #f (ev? (- k 1))))
+      (list (ev? n) (od? n)))
+    """
+    run(code)
+    assert run("(clo-parity 7)") == [False, True]
+    code = "(letrec ((ev? (lambda (k) (if (= k 0) #t (od? (- k 1))))) (od? (lambda (k) (ev? k)))) (ev? 4))"
+    assert run(code) is True
+    with pytest.raises(SymbolNotFoundError):
+        run("((lambda () (define (g) clo-h) (g) (define clo-h 1)))")
+
+
+def test_loops():
+    assert run("(let loop ((k 0) (acc '())) (if (= k 3) acc (loop (+ k 1) (cons k acc))))") == [2, 1, 0]
+    run("(define (clo-countdown n) (let loop ((k n)) (lambda () (if (= k 0) 'done ((loop (- k 1)))))))")
+    assert run("((clo-countdown 3))") == get_symbol('done')
+    code = "(do ((k 0 (+ k 1)) (fs '() (cons (lambda () k) fs))) ((= k 2) (list ((car fs)) ((car (cdr fs))))))"
+    assert run(code) == [1, 0]
+    # Assigned loop variables cannot be boxed: the closure keeps its whole environment
+    code = "(do ((k 0 (+ k 1)) (f #f (lambda () (set! k 10)))) ((> k 3) k) (if f (f)))"
+    assert len(parse(code)[1][1][2]) == 3
+    assert run(code) == 4
+
+
+def test_dynamic_let_and_promises():
+    code = "(let ((x 1)) (define (get) x) (list (dynamic-let ((x 2)) (get)) (get)))"
+    assert run(code) == [2, 1]
+    code = "(let ((n 0)) (define p (delay (begin (set! n (+ n 1)) n))) (force p) (force p) n)"
+    assert run(code) == 1
+    with pytest.raises(TypeMismatchError):
+        run("(let ((f #f)) (define x :: int 1) (set! f (lambda () x)) (define x :: int 1.5))")
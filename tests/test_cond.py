@@ -0,0 +1,79 @@
+import re
+
+import pytest
+
+from lispy.errors import SchemeSyntaxError
+from lispy.messages import ERR_ELSE_NOT_LAST, ERR_ILLEGAL_CLAUSE
+from lispy.repl import parse
+from lispy.types import _case, _loop
+from tests.utils import run
+
+
+def test_cond():
+    run("(define (sign n) (cond ((< n 0) 'neg) ((= n 0) 'zero) (else 'pos)))")
+    assert [run("(sign -3)"), run("(sign 0)"), run("(sign 5)")] == ["neg", "zero", "pos"]
+    assert run("(cond (#f 1))") is None
+    assert run("(cond ((+ 1 1)))") == 2
+    assert run("(cond (#f 1) ((car (list 2 3)) => (lambda (x) (* x 10))) (else 0))") == 20
+    assert run("(cond ((= 1 1) (define q 1) (+ q 1)))") == 2
+
+
+def test_cond_tail_position():
+    run("(define (count-down n) (cond ((= n 0) 'done) (else (count-down (- n 1)))))")
+    assert run("(count-down 20000)") == "done"
+
+
+def test_when_unless():
+    assert run("(when (> 2 1) 'a 'b)") == "b"
+    assert run("(when (< 2 1) 'a)") is None
+    assert run("(unless (< 2 1) 'a 'b)") == "b"
+    assert run("(unless (> 2 1) 'a)") is None
+
+
+def test_case():
+    run("""(define (classify x)
+             (case x
+               ((1 2 3) 'small)
+               ((a b) 'symbol)
+               (("s") 'string)
+               ((#t) 'true)
+               (else 'other)))""")
+    assert run("(classify 2)") == "small"
+    assert run("(classify 'b)") == "symbol"
+    assert run("(classify \"s\")") == "string"
+    assert run("(classify #t)") == "true"
+    # eqv? semantics: 1.0 and #t are not 1, lists never match
+    assert run("(classify 1.0)") == "other"
+    assert run("(classify (list 1))") == "other"
+    assert run("(case 5 ((1) 'one))") is None
+
+
+def test_case_jump_table():
+    clauses = " ".join("((%d) %d)" % (i, i * i) for i in range(60))
+    x = parse("(case k %s (else -1))" % clauses)
+    assert x[0] is _case
+    assert len(x[2]) == 60
+    run("(define (dispatch k) (case k %s (else -1)))" % clauses)
+    assert run("(dispatch 59)") == 59 * 59
+    assert run("(dispatch 60)") == -1
+
+
+def test_clause_errors():
+    with pytest.raises(SchemeSyntaxError, match=ERR_ELSE_NOT_LAST):
+        run("(cond (else 1) (#t 2))")
+    with pytest.raises(SchemeSyntaxError, match=re.escape(ERR_ILLEGAL_CLAUSE.format("1"))):
+        run("(cond 1)")
+    with pytest.raises(SchemeSyntaxError, match=re.escape(ERR_ILLEGAL_CLAUSE.format("(1 2)"))):
+        run("(case 1 (1 2))")
+    with pytest.raises(SchemeSyntaxError, match=ERR_ELSE_NOT_LAST):
+        run("(case 1 (else 1) ((1) 2))")
+
+
+def test_named_let_loop_through_cond_and_case():
+    code = """
+    (let loop ((k 0))
+      (cond ((= k 10) (case k ((10) 'ten) (else (loop 0))))
+            (else (when #t (loop (+ k 1))))))
+    """
+    assert parse(code)[0] is _loop
+    assert run(code) == "ten"
@@ -0,0 +1,104 @@
+import pytest
+
+from lispy.counters import reset_stats, stats, to_prometheus, write_prometheus
+from lispy.env import count_find_depths
+from lispy.evaluator import count_events
+from tests.utils import run
+
+
+@pytest.fixture
+def counting():
+    count_events(True)
+    yield
+    count_events(False)
+
+
+@pytest.fixture
+def find_depths(counting):
+    count_find_depths(True)
+    yield
+    count_find_depths(False)
+
+
+def test_calls_and_lookups(find_depths):
+    # Annotated procedures are not inlined by the optimizer
+    run("(define (count-fib n :: int) (if (< n 2) n (+ (count-fib (- n 1)) (count-fib (- n 2)))))")
+    reset_stats()
+    assert run("(count-fib 10)") == 55
+    counts = stats()
+    # One frame per call, and the if of each call is a tail call
+    assert counts['env_frames'] == 177
+    assert counts['tail_calls'] == 177 * 2
+    assert counts['procedures'] == 0
+    assert counts['lookups'] == sum(counts['find_depths'])
+    # n is found in the frame of the call, count-fib in the global environment
+    assert counts['find_depths'][1] == counts['global_lookups'] - 1 == 176 + 88
+
+
+def test_events(find_depths):
+    run("(define (count-adder a :: int) (lambda (b) (let ((c 1)) (+ a b c))))")
+    reset_stats()
+    assert run("((count-adder 1) 2)") == 4
+    assert stats()['procedures'] == 1
+    assert stats()['find_depths'][2] == 1
+    reset_stats()
+    run("(force (delay (+ 1 2)))")
+    run("(try (raise \"failed\") (lambda (e) 0))")
+    run("(and 1 2)")
+    counts = stats()
+    assert counts['promises_forced'] == 1
+    assert counts['exceptions_caught'] == 1
+    assert counts['macro_expansions'] >= 2
+
+
+def test_lispy_stats():
+    run("(define count-stats (lispy-stats))")
+    assert run("(hash-ref count-stats 'env-frames)") >= 0
+    assert run("(list? (hash-ref count-stats 'find-depths))")
+
+
+def test_prometheus(tmp_path, find_depths):
+    run("(define (count-const a :: int) (lambda () a))")
+    reset_stats()
+    run("(count-const 1)")
+    text = to_prometheus()
+    assert '# TYPE lispy_procedures_total counter\nlispy_procedures_total 1\n' in text
+    assert '# TYPE lispy_find_depth histogram\n' in text
+    depths = stats()['find_depths']
+    assert 'lispy_find_depth_count {}\n'.format(sum(depths)) in text
+    assert 'lispy_find_depth_bucket{{le="0"}} {}\n'.format(depths[0]) in text
+    filename = tmp_path / 'lispy.prom'
+    write_prometheus(str(filename))
+    assert filename.read_text().startswith('# HELP lispy_env_frames_total')
+
+
+def test_find_depths_off_by_default(counting):
+    run("(define (count-sum a :: int) (+ a a))")
+    reset_stats()
+    run("(count-sum 1)")
+    counts = stats()
+    assert counts['lookups'] >= 3 and counts['global_lookups'] >= 1
+    assert sum(counts['find_depths']) == 0
+
+
+def test_counting_off_by_default():
+    run("(define (count-off a :: int) (lambda () a))")
+    reset_stats()
+    run("(force (delay ((count-off 1))))")
+    counts = stats()
+    assert counts['env_frames'] == counts['procedures'] == counts['tail_calls'] == counts['lookups'] == 0
+    assert counts['promises_forced'] == 1
+
+
+def test_counting_nests():
+    run("(define (count-nested a :: int) a)")
+    count_events(True)
+    count_events(True)
+    count_events(False)
+    reset_stats()
+    run("(count-nested 1)")
+    count_events(False)
+    assert stats()['env_frames'] == 1
+    reset_stats()
+    run("(count-nested 1)")
+    assert stats()['env_frames'] == 0
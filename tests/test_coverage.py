@@ -0,0 +1,75 @@
+import json
+
+from lispy import global_env
+from lispy.coverage import Coverage, coverage_file
+from lispy.repl import INSTRUMENTERS
+from lispy.types import _cover, get_symbol
+
+SOURCE = """(define (cov-sign n :: int)
+  (cond ((< n 0)
+         'negative)
+        ((= n 0) 'zero)
+        (else
+         'positive)))
+(define (cov-unused y)
+  (display y))
+(cov-sign 5)
+(when (eq? (cov-sign 0) 'negative)
+  (display 1))
+"""
+
+
+def contains_probe(x):
+    return isinstance(x, list) and (x[:1] == [_cover] or any(contains_probe(y) for y in x))
+
+
+def test_lines_branches_and_functions():
+    coverage = Coverage()
+    assert coverage.run(SOURCE) is None
+    report = coverage.report()['<string>']
+    assert report['lines'] == {1: 1, 2: 1, 3: 0, 4: 1, 6: 1, 7: 1, 8: 0, 9: 1, 10: 1, 11: 0}
+    assert report['functions'] == [(1, 'cov-sign', 1), (7, 'cov-unused', 0)]
+    # Branches are numbered by block; skipping the body of the when is one
+    assert report['branches'] == [(2, 0, 0, 0), (2, 0, 1, 1), (2, 0, 2, 1), (10, 1, 0, 0), (10, 1, 1, 1)]
+    assert INSTRUMENTERS == []
+
+
+def test_lcov():
+    coverage = Coverage()
+    coverage.run(SOURCE)
+    lcov = coverage.to_lcov().splitlines()
+    assert lcov[:2] == ['TN:', 'SF:<string>']
+    assert 'FN:1,cov-sign' in lcov and 'FNDA:0,cov-unused' in lcov
+    assert 'DA:3,0' in lcov and 'DA:4,1' in lcov
+    assert 'LF:10' in lcov and 'LH:7' in lcov and 'FNH:1' in lcov
+    assert lcov[-1] == 'end_of_record'
+
+
+def test_coverage_file(tmp_path, capsys):
+    program = tmp_path / 'program.scm'
+    program.write_text(SOURCE)
+    output = tmp_path / 'coverage.json'
+    coverage_file(str(program), str(output))
+    report = json.loads(output.read_text())[str(program)]
+    assert report['lines']['3'] == 0 and report['lines']['9'] == 1
+    assert {'line': 1, 'name': 'cov-sign', 'called': 1} in report['functions']
+    coverage_file(str(program), str(tmp_path / 'coverage.info'))
+    assert (tmp_path / 'coverage.info').read_text().startswith('TN:\nSF:' + str(program))
+    coverage_file(str(program))
+    assert '7/10  70%' in capsys.readouterr().err
+
+
+def test_probes_disarm():
+    coverage = Coverage()
+    coverage.run("""
+    (define (cov-loop n :: int acc :: int)
+      (if (= n 0)
+          acc
+          (cov-loop (- n 1) (+ acc n))))
+    """)
+    body = global_env[get_symbol('cov-loop')].exp
+    assert contains_probe(body)
+    assert coverage.run("(cov-loop 10 0)") == 55
+    # Every probe of the procedure has run: they are gone, and the values are unchanged
+    assert not contains_probe(body)
+    assert coverage.run("(cov-loop 100 0)") == 5050
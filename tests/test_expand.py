@@ -0,0 +1,58 @@
+import lispy
+from lispy.macros import expand, expand_quasiquote
+from lispy.types import _begin, _if, _list, _quasiquote, _quote, _unquote, get_symbol
+from tests.utils import run
+
+DEPTH = 20000
+
+
+def test_deep_begin_chain():
+    x = 1
+    for _ in range(DEPTH):
+        x = [_begin, get_symbol("display-nothing"), x]
+    expanded = expand(x)
+    for _ in range(DEPTH):
+        assert expanded[0] is _begin
+        expanded = expanded[2]
+    assert expanded == 1
+
+
+def test_long_and_or_chains():
+    expanded = expand([get_symbol("and")] + [True] * (DEPTH - 1) + [7])
+    for _ in range(DEPTH - 1):
+        assert expanded[0] is _if and expanded[3] is False
+        expanded = expanded[2]
+    assert expanded == 7
+    x = [get_symbol("or")] + [False] * (DEPTH - 1) + [9]
+    assert lispy.eval(expand(x, toplevel=True)) == 9
+
+
+def test_deep_if_chain_evaluates():
+    x = 42
+    for _ in range(DEPTH):
+        x = [_if, True, x]
+    assert lispy.eval(expand(x, toplevel=True)) == 42
+
+
+def test_deep_quasiquote_template():
+    x = [_unquote, get_symbol("v")]
+    for _ in range(DEPTH):
+        x = [get_symbol("a"), x]
+    expanded = expand_quasiquote(x)
+    for _ in range(DEPTH):
+        assert expanded[:2] == [_list, [_quote, "a"]]
+        expanded = expanded[2]
+    assert expanded == "v"
+
+
+def test_long_quasiquote_template():
+    items = list(range(DEPTH))
+    assert expand([_quasiquote, items]) == [_quote, items]
+    lispy.global_env[get_symbol("v")] = "v"
+    assert lispy.eval(expand([_quasiquote, items + [[_unquote, get_symbol("v")]]])) == items + ["v"]
+
+
+def test_many_and_arguments():
+    args = " ".join(["#t"] * 3000)
+    assert run("(and %s 7)" % args) == 7
+    assert run("(or %s)" % " ".join(["#f"] * 300 + ["9"])) == 9
@@ -0,0 +1,82 @@
+import io
+
+import pytest
+
+from lispy import Interpreter
+from lispy.env import GlobalEnv
+from lispy.errors import SymbolNotFoundError
+from lispy.types import get_symbol
+from tests.utils import run
+
+
+def test_overlay():
+    base = GlobalEnv()
+    x, y, z = get_symbol('x'), get_symbol('y'), get_symbol('z')
+    base[x] = 1
+    base[z] = 1
+    fork = base.fork()
+    assert base.forked and not fork.forked and fork.outer is base
+    fork[y] = 2
+    assert fork.find(x)[x] == 1 and fork.get(y) == 2 and y not in base
+    fork[x] = 10
+    assert fork[x] == 10 and base[x] == 1
+    # The base can still change; the fork follows it for the names it does not bind
+    base[x] = 2
+    base[z] = 3
+    base.define_macro(z, 'macro')
+    assert fork[x] == 10 and fork.find(z)[z] == 3 and fork.macros[z] == 'macro'
+
+
+def test_interpreter_fork():
+    base = Interpreter()
+    base.run("""
+    (define fork-counter 0)
+    (define (fork-square x) (* x x))
+    (define (fork-bump!) (set! fork-counter (+ fork-counter 1)))
+    (define (fork-get) fork-counter)
+    (define-syntax fork-twice (syntax-rules () ((_ e) (list e e))))
+    """)
+    a, b = base.fork(), base.fork()
+    assert a.run("(fork-twice (fork-square 3))") == [9, 9]
+    a.run("(define (fork-square x) 0) (set! fork-counter 5) (define-syntax fork-twice (syntax-rules () ((_ e) e)))")
+    assert a.run("(list (fork-square 3) fork-counter (fork-twice 1))") == [0, 5, 1]
+    assert b.run("(list (fork-square 3) fork-counter (fork-twice 1))") == [9, 0, [1, 1]]
+    assert base['fork-counter'] == 0 and base.run("(fork-twice 1)") == [1, 1]
+    # Macro tables are shared until a fork defines a macro
+    assert b.macros is base.macros and a.macros is not base.macros
+    # Procedures of the base called in a fork see its bindings, and assign in it
+    assert a.run("(fork-bump!) (list (fork-get) fork-counter)") == [6, 6]
+    assert b.run("(fork-bump!) (fork-bump!) (fork-get)") == 2
+    assert base.run("(fork-get)") == 0 and a.run("(fork-get)") == 6
+    # The base is not frozen: the forks see what it defines, unless they bind it
+    base.run("(define fork-late 1) (set! fork-counter 10) (define (fork-square x) -1)")
+    assert a.run("(list fork-late fork-counter (fork-square 3))") == [1, 6, 0]
+    assert b.run("(list fork-late fork-counter (fork-square 3))") == [1, 2, -1]
+    assert 'fork-square' in a and 'fork-missing' not in a
+    with pytest.raises(SymbolNotFoundError):
+        a['fork-missing']
+
+
+def test_forks_of_forks_and_output():
+    out = io.StringIO()
+    base = Interpreter()
+    base.run("(define fork-depth 0)")
+    child = base.fork()
+    child.run("(define fork-depth 1) (define fork-child #t)")
+    grandchild = child.fork(out=out)
+    grandchild.run('(set! fork-depth 2) (display fork-child) (display (eval (quote fork-depth)))')
+    assert out.getvalue() == '#t2'
+    assert child['fork-depth'] == 1 and base['fork-depth'] == 0
+
+
+def test_fork_environment():
+    interpreter = Interpreter()
+    interpreter.run("(define fork-env-count 0) (define (fork-env-bump!) (set! fork-env-count (+ fork-env-count 1)))")
+    assert interpreter.run("""
+    (let ((env (fork-environment)))
+      (eval '(define fork-in-env 42) env)
+      (eval '(fork-env-bump!) env)
+      (list (environment? env) (eval 'fork-in-env env) (eval '(+ 1 2) env) (eval 'fork-env-count env)))
+    """) == [True, 42, 3, 1]
+    assert interpreter['fork-env-count'] == 0
+    assert interpreter.env.forked and run("(environment? 1)") is False
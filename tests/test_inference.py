@@ -0,0 +1,85 @@
+import pytest
+
+import lispy
+from lispy.errors import TypeMismatchError
+from lispy.repl import parse
+from lispy.types import OptimizedExp, _define, _typed_call, get_symbol
+from tests.utils import run
+
+
+def test_proven_calls_skip_checks():
+    run("(define (inf-double x :: int) (* 2 x))")
+    x = parse("(inf-double 21)")
+    assert x[0] is _typed_call and x[1] is lispy.global_env['inf-double'].signature
+    assert run("(inf-double 21)") == 42
+    # Untyped arguments keep the check
+    assert parse("(lambda (y) (inf-double y))")[2][0] == get_symbol('inf-double')
+    assert parse("(lambda (y :: int) (inf-double y))")[2][0] is _typed_call
+    with pytest.raises(TypeMismatchError):
+        run("((lambda (y) (inf-double y)) 1.5)")
+
+
+def test_types_of_primitive_results():
+    run("(define (inf-scale x :: float) (* x 2.0))")
+    x = parse("(lambda (a :: int b :: float) (inf-scale (+ a b)))")
+    assert isinstance(x[2], OptimizedExp) and x[2][0] is _typed_call
+    assert run("((lambda (a :: int b :: float) (inf-scale (+ a b))) 1 0.5)") == 3.0
+    assert parse("(lambda (a :: int) (inf-scale (/ a 2)))")[2][0] is _typed_call
+    assert parse("(lambda (a :: int) (inf-scale (if (> a 0) 1.0 -1.0)))")[2][0] is _typed_call
+
+
+def test_static_type_errors():
+    run("(define (inf-len s :: str) (length s))")
+    with pytest.raises(TypeMismatchError, match="inf-len") as error:
+        parse("(lambda () (inf-len 5))")
+    assert "expected 'str', got 'int'" in str(error.value)
+    with pytest.raises(TypeMismatchError):
+        parse("(lambda (n :: int) (inf-len (+ n 1)))")
+    with pytest.raises(TypeMismatchError):
+        parse("(define inf-s :: str (+ 1 2))")
+    with pytest.raises(TypeMismatchError) as error:
+        parse("(define inf-s :: str 2.5)")
+    assert str(error.value).endswith("'(define inf-s :: str 2.5)': expected 'str', got 'float'")
+    with pytest.raises(TypeMismatchError):
+        parse("(let ((f (lambda (b :: bool) b))) (f 1))")
+
+
+def test_typed_defines():
+    x = parse("(lambda (n :: int) (define m :: int (* n n)) m)")
+    assert x[2][1][:2] == [_define, get_symbol('m')] and len(x[2][1]) == 3
+    assert run("((lambda (n :: int) (define m :: int (* n n)) m) 4)") == 16
+    with pytest.raises(TypeMismatchError):
+        run("((lambda (n) (define m :: int n) m) 4.5)")
+
+
+def test_recursion_and_local_procedures():
+    run("(define (inf-fact n :: int) (if (= n 0) 1 (* n (inf-fact (- n 1)))))")
+    assert lispy.global_env['inf-fact'].exp[3][2][0] is _typed_call
+    assert run("(inf-fact 10)") == 3628800
+    code = """
+    (letrec ((ev? (lambda (k :: int) (if (= k 0) #t (od? (- k 1)))))
+             (od? (lambda (k :: int) (ev? k))))
+      (ev? 6))
+    """
+    assert run(code) is True
+    assert run("((lambda () (define (sq k :: int) (* k k)) (sq 5)))") == 25
+
+
+def test_fallback_on_rebinding():
+    run("(define (inf-inc x :: int) (+ x 1))")
+    run("(define (inf-twice x :: int) (inf-inc (inf-inc x)))")
+    assert run("(inf-twice 1)") == 3
+    # The callee is replaced by a procedure with other annotations: its checks run again
+    run("(define (inf-inc x :: float) (+ x 1.0))")
+    with pytest.raises(TypeMismatchError):
+        run("(inf-twice 1)")
+    original = lispy.global_env['+']
+    try:
+        run("(define (inf-next x :: int) x)")
+        run("(define (inf-use k :: int) (inf-next (+ k 1)))")
+        assert run("(inf-use 1)") == 2
+        run("(define + (lambda args 0.5))")
+        with pytest.raises(TypeMismatchError):
+            run("(inf-use 1)")
+    finally:
+        lispy.global_env['+'] = original
@@ -0,0 +1,83 @@
+import pytest
+
+import lispy
+from lispy.errors import TypeMismatchError
+from lispy.repl import parse
+from lispy.types import OptimizedExp, _let, _quote, get_symbol
+from tests.utils import run
+
+
+def test_beta_reduction():
+    assert parse("((lambda (a b) (+ a b)) 1 2)") == [_quote, 3]
+    x = parse("(lambda (q) ((lambda (a) (list a a)) (car q)))")
+    assert x[2][0] is _let
+    assert run("((lambda (a) (list a a)) (car '(1 2)))") == [1, 1]
+    assert run("((lambda (a b) (list a b)) 1 2)") == [1, 2]
+
+
+def test_inline_small_procedures():
+    run("(define (inl-square x) (* x x))")
+    run("(define (inl-first l) (car l))")
+    x = parse("(inl-square 3)")
+    assert x == [_quote, 9] and isinstance(x, OptimizedExp)
+    assert parse("(lambda (y) (inl-square y))")[2] == [get_symbol('*'), get_symbol('y'), get_symbol('y')]
+    # Non-trivial arguments are evaluated once, through a let
+    x = parse("(lambda (y) (inl-square (inl-first y)))")
+    assert x[2][0] is _let
+    assert run("((lambda (y) (inl-square (inl-first y))) '(7))") == 49
+
+
+def test_inline_argument_order_and_effects():
+    run("(define (inl-pair a b) (list b a))")
+    code = "(let ((log (list))) (inl-pair (begin (set! log (cons 1 log)) 1) (begin (set! log (cons 2 log)) 2)) log)"
+    assert run(code) == [2, 1]
+    run("(define (inl-bump x) (set! x (+ x 1)) x)")
+    assert run("(inl-bump 5)") == 6
+    assert run("(let ((k 5)) (inl-bump k) k)") == 5
+
+
+def test_no_capture():
+    run("(define inl-offset 100)")
+    run("(set! inl-offset 100)")
+    run("(define (inl-add-offset x) (+ x inl-offset))")
+    assert run("(let ((inl-offset 1)) (inl-add-offset 5))") == 105
+    run("(define (inl-adder x) (lambda (y) (+ x y)))")
+    assert run("(let ((y 10)) ((inl-adder y) 1))") == 11
+
+
+def test_not_inlined():
+    run("(define (inl-fact n) (if (= n 0) 1 (* n (inl-fact (- n 1)))))")
+    assert parse("(lambda (n) (inl-fact n))")[2][0] == get_symbol('inl-fact')
+    assert run("(inl-fact 5)") == 120
+    run("(define (inl-typed x :: int) x)")
+    assert parse("(lambda (n) (inl-typed n))")[2][0] == get_symbol('inl-typed')
+    with pytest.raises(TypeMismatchError):
+        run("(inl-typed 1.5)")
+    run("(define (inl-big x) (list x x x x x x x x x x x x x x x x x x x x x x x x x))")
+    assert parse("(lambda (n) (inl-big n))")[2][0] == get_symbol('inl-big')
+
+
+def test_closures_not_inlined_into_loops():
+    # Loop frames are reused by each iteration, so an inlined closure would capture the loop variable
+    run("(define (inl-make x) (lambda () x))")
+    run("(define (inl-call-all fs) (if (null? fs) (list) (cons ((car fs)) (inl-call-all (cdr fs)))))")
+    assert parse("(lambda (n) (inl-make n))")[2][0] == get_symbol('inl-make')
+    assert run("(do ((k 0 (+ k 1)) (fs (list) (cons (inl-make k) fs))) ((= k 3) (inl-call-all fs)))") == [2, 1, 0]
+    assert run("(let loop ((k 0) (fs (list))) (if (= k 3) (inl-call-all fs) (loop (+ k 1) (cons (inl-make k) fs))))") \
+        == [2, 1, 0]
+
+
+def test_mutual_recursion():
+    run("(define (inl-even? n) (if (= n 0) #t (inl-odd? (- n 1))))")
+    run("(define (inl-odd? n) (if (= n 0) #f (inl-even? (- n 1))))")
+    assert run("(inl-odd? 7)") is True
+    assert run("(inl-even? 100)") is True
+
+
+def test_deoptimize_on_redefinition():
+    run("(define (inl-twice x) (* 2 x))")
+    run("(define (inl-use y) (inl-twice y))")
+    assert run("(inl-use 5)") == 10
+    run("(define (inl-twice x) (+ 2 x))")
+    assert run("(inl-use 5)") == 7
+    assert lispy.global_env['inl-use'].exp == [get_symbol('inl-twice'), get_symbol('y')]
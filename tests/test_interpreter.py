@@ -0,0 +1,118 @@
+import io
+import threading
+
+import pytest
+
+import lispy
+from lispy import DEFAULT, Hook, Interpreter, global_env
+from lispy.errors import SymbolNotFoundError
+from lispy.evaluator import count_events
+from tests.utils import run
+
+
+def test_definitions_are_isolated():
+    a, b = Interpreter(), Interpreter()
+    a.run("(define iso-x 1)")
+    b.run("(define iso-x 2)")
+    assert a.run("iso-x") == 1 and b.run("iso-x") == 2
+    assert 'iso-x' not in global_env
+    # Rebinding a primitive, and the code optimized against it, stay in one interpreter
+    b.run("(define (+ . xs) 0)")
+    assert a.run("(+ 1 2)") == 3 and b.run("(+ 1 2)") == 0 and run("(+ 1 2)") == 3
+    a['iso-py'] = lambda n: n * 10
+    assert a.run("(iso-py 4)") == 40 and a['iso-x'] == 1 and 'iso-py' not in b
+
+
+def test_macros_are_isolated():
+    a, b = Interpreter(), Interpreter()
+    a.run("(define-syntax iso-twice (syntax-rules () ((_ e) (list e e))))")
+    a.run("(define-macro (iso-answer) 42)")
+    assert a.run("(iso-twice 1)") == [1, 1] and a.run("(eval '(iso-answer))") == 42
+    assert 'iso-twice' in a.macros and 'iso-twice' not in b.macros
+    with pytest.raises(SymbolNotFoundError):
+        b.run("(iso-answer)")
+    # Every interpreter has the prelude and the built-in macros
+    assert b.run("(and 1 (or #f 2))") == 2 and b.run("(force (delay 3))") == 3
+
+
+@pytest.fixture
+def counting():
+    count_events(True)
+    yield
+    count_events(False)
+
+
+def test_output_port_and_stats(counting):
+    out = io.StringIO()
+    interpreter = Interpreter(out=out)
+    interpreter.run('(display "iso") (write "iso")')
+    assert out.getvalue() == 'iso"iso"'
+    interpreter.run("(define (iso-fib n :: int) (if (< n 2) n (+ (iso-fib (- n 1)) (iso-fib (- n 2)))))")
+    interpreter.reset_stats()
+    run("(define (iso-other n :: int) n)")
+    run("(iso-other 1)")
+    interpreter.run("(iso-fib 10)")
+    assert interpreter.stats()['env_frames'] == 177
+    assert interpreter.run("(hash-ref (lispy-stats) 'env-frames)") == 177
+    assert DEFAULT.counters is lispy.counters.COUNTERS
+
+
+def test_threads():
+    results = {}
+
+    def tenant(k):
+        interpreter = Interpreter()
+        interpreter.run("(define-syntax iso-add (syntax-rules () ((_ v) (+ v %d))))" % k)
+        interpreter.run("(define iso-k %d)" % k)
+        results[k] = [interpreter.run("(iso-add iso-k)") for _ in range(50)]
+
+    threads = [threading.Thread(target=tenant, args=(k,)) for k in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {k: [2 * k] * 50 for k in range(8)}
+
+
+def test_stats_of_threads(counting):
+    busy, idle = Interpreter(), Interpreter()
+    busy.run("(define (iso-count n :: int) (if (= n 0) 0 (+ 1 (iso-count (- n 1)))))")
+    busy.reset_stats()
+    worker = threading.Thread(target=lambda: busy.run("(iso-count 100)"))
+
+    def wait():
+        # The other thread runs while idle is running, but its events are not idle's
+        worker.start()
+        worker.join()
+    idle['iso-wait'] = wait
+    idle.reset_stats()
+    idle.run("(iso-wait)")
+    assert busy.stats()['env_frames'] == 101
+    assert idle.stats()['env_frames'] == 0
+
+
+def test_hooks_of_threads():
+    profiled, other = Interpreter(), Interpreter()
+    for interpreter in (profiled, other):
+        interpreter.run("(define (iso-down n) (if (= n 0) 'done (iso-down (- n 1))))")
+    calls = []
+
+    class Calls(Hook):
+        def enter(self, proc, args):
+            calls.append(str(proc.name))
+
+        def tail_call(self, caller, proc, args):
+            calls.append(str(proc.name))
+    worker = threading.Thread(target=lambda: other.run("(iso-down 50)"))
+
+    def wait():
+        worker.start()
+        worker.join()
+    profiled['iso-wait'] = wait
+    hook = Calls()
+    profiled.add_hook(hook)
+    try:
+        assert profiled.run("(iso-wait) (iso-down 2)") == 'done'
+    finally:
+        profiled.remove_hook(hook)
+    assert calls == ['iso-down'] * 3
@@ -0,0 +1,76 @@
+from lispy.repl import parse
+from lispy.types import _do, _let, _loop, _recur
+from tests.utils import run
+
+
+def test_let_is_native():
+    x = parse("(let ((a (read)) (b 2)) (display a) (+ a b))")
+    assert x[0] is _let
+    assert run("(let ((a 1) (b 2)) (+ a b))") == 3
+    assert run("(let () 5)") == 5
+    assert run("(let ((x 1)) (let ((x 2) (y x)) (list x y)))") == [2, 1]
+
+
+def test_named_let_loop():
+    x = parse("(let loop ((k 0) (acc 0)) (if (= k 10) acc (loop (+ k 1) (+ acc k))))")
+    assert x[0] is _loop
+    assert x[3][3][0] is _recur
+    assert run("(let loop ((k 0) (acc 0)) (if (= k 10) acc (loop (+ k 1) (+ acc k))))") == 45
+    assert run("(let loop ((k 0)) (if (< k 100000) (loop (+ k 1)) k))") == 100000
+
+
+def test_named_let_loop_through_nested_forms():
+    code = """
+    (let outer ((k 0) (acc (list)))
+      (if (= k 3)
+          acc
+          (let ((next (+ k 1)))
+            (begin
+              (let inner ((m 0))
+                (if (< m 2) (inner (+ m 1)) #f))
+              (outer next (cons k acc))))))
+    """
+    assert parse(code)[0] is _loop
+    assert run(code) == [2, 1, 0]
+
+
+def test_named_let_general():
+    # Non-tail recursion keeps the procedure semantics
+    code = "(let fact ((n 5)) (if (= n 0) 1 (* n (fact (- n 1)))))"
+    assert parse(code)[0] is _let
+    assert run(code) == 120
+    # The loop procedure can escape
+    assert run("((let self ((n 1)) (if (> n 1) n self)) 7)") == 7
+    # Closures capture the variables of each iteration
+    code = """
+    (let loop ((k 0) (fs (list)))
+      (if (= k 3)
+          (map (lambda (f) (f)) fs)
+          (loop (+ k 1) (cons (lambda () k) fs))))
+    """
+    run("(define (map f l) (if (null? l) (list) (cons (f (car l)) (map f (cdr l)))))")
+    assert run(code) == [2, 1, 0]
+
+
+def test_letrec():
+    code = """
+    (letrec ((even? (lambda (n) (if (= n 0) #t (odd? (- n 1)))))
+             (odd? (lambda (n) (if (= n 0) #f (even? (- n 1))))))
+      (list (even? 10) (odd? 7) (even? 3)))
+    """
+    assert run(code) == [True, True, False]
+    assert run("(letrec* ((a 1) (b (+ a 1))) (list a b))") == [1, 2]
+
+
+def test_do_frames():
+    x = parse("(do ((k 0 (+ k 1))) ((= k 3) k))")
+    assert x[0] is _do
+    assert x[-1] is False
+    # A closure created in the loop sees the value of its own iteration
+    code = """
+    (do ((k 0 (+ k 1))
+         (fs (list) (cons (lambda () k) fs)))
+        ((= k 3) (list ((car fs)) ((car (cdr fs))))))
+    """
+    assert parse(code)[-1] is True
+    assert run(code) == [2, 1]
@@ -0,0 +1,86 @@
+import pytest
+
+from lispy.errors import MatchError, SchemeSyntaxError
+from lispy.parser import to_string
+from lispy.repl import parse
+from tests.utils import run
+
+
+def test_literal_and_list_patterns():
+    run("""
+    (define (m-classify x)
+      (match x
+        ((1 2) 'pair)
+        ((1 y) (list 'one y))
+        ((a b c) 'triple)
+        ((h . t) t)
+        (() 'empty)
+        (else 'other)))
+    """)
+    assert to_string(run("(m-classify '(1 2))")) == "pair"
+    assert to_string(run("(m-classify '(1 5))")) == "(one 5)"
+    assert to_string(run("(m-classify '(1 2 3))")) == "triple"
+    assert to_string(run("(m-classify '(4 5 6 7))")) == "(5 6 7)"
+    assert to_string(run("(m-classify '())")) == "empty"
+    assert to_string(run("(m-classify 5)")) == "other"
+    # Literals are compared by type: 1 is not #t
+    assert to_string(run("(match '(#t) ((1) 'int) ((#t) 'bool))")) == "bool"
+    assert to_string(run("(match '(1 \"s\" foo) ((1 \"s\" 'foo) 'yes) (_ 'no))")) == "yes"
+
+
+def test_predicates_and_ellipses():
+    run("""
+    (define (m-args x)
+      (match x
+        ((op (? (lambda (v) (not (symbol? v))) a) b ...) (list op a b))
+        ((xs ... last) last)
+        (_ 'none)))
+    """)
+    assert to_string(run("(m-args '(+ 1 2 3))")) == "(+ 1 (2 3))"
+    assert to_string(run("(m-args '(+ k 2 3))")) == "3"
+    assert to_string(run("(m-args '())")) == "none"
+    assert to_string(run("(match '((a 1) (b 2)) (((k v) ...) (list k v)))")) == "((a b) (1 2))"
+    assert to_string(run("(match '((a 1) (b)) (((k v) ...) 'all) (_ 'some))")) == "some"
+
+
+def test_record_patterns():
+    run("(define-record-type <m-point> (make-m-point x y) m-point? (x m-point-x) (y m-point-y))")
+    code = "(match (make-m-point 1 2) (($ <m-point> 0 y) 'origin) (($ <m-point> 1 y) y))"
+    assert run(code) == 2
+    assert run("(match (list 1 2) (($ <m-point> x y) 'point) (_ 'list))") == run("'list")
+
+
+def test_decision_tree_shares_tests():
+    x = parse("(lambda (e) (match e (('+ a b) 1) (('* a b) 2) (('- a) 3)))")
+    code = to_string(x)
+    assert code.count("#%length=? e 3") == 1
+    assert code.count("#%length=? e 2") == 1
+    # Symbols are compared by identity
+    assert "#%same-datum?" not in code and "#%eq?" in code
+
+
+def test_overlapping_clauses_stay_small():
+    # Each clause tests two elements that others test too: the tree would double with every clause
+    clauses = []
+    for k in range(14):
+        elems = ['_'] * 14
+        elems[k], elems[(k + 1) % 14] = "'a", "'b"
+        clauses.append("(({}) {})".format(' '.join(elems), k))
+    code = "(lambda (e) (match e {} (_ -1)))".format(' '.join(clauses))
+    assert len(to_string(parse(code))) < 10000
+    run("(define match-overlap " + code + ")")
+    assert run("(match-overlap '(x x x a b x x x x x x x x x))") == 3
+    assert run("(match-overlap '(b x x x x x x x x x x x x a))") == 13
+    assert run("(match-overlap '(a a x x x x x x x x x x x x))") == -1
+    assert run("(match-overlap '(a b))") == -1
+
+
+def test_match_errors():
+    with pytest.raises(MatchError):
+        run("(match 5 ((a) a))")
+    with pytest.raises(SchemeSyntaxError):
+        run("(match 5 ((a a) a))")
+    with pytest.raises(SchemeSyntaxError):
+        run("(match 5 ((a ... b ...) a))")
+    with pytest.raises(SchemeSyntaxError):
+        run("(match 5 (a))")
@@ -0,0 +1,63 @@
+import json
+
+from lispy import evaluator, global_env
+from lispy.memory import MemoryProfiler, MemorySnapshot, memory_file, reachable, structures
+from tests.utils import run
+
+
+def entries_by_name(profiler):
+    return {entry['name']: entry for entry in profiler.to_json()['procedures']}
+
+
+def test_allocations_by_procedure():
+    profiler = MemoryProfiler()
+    profiler.run("""
+    (define (mem-build n acc) (if (= n 0) acc (mem-build (- n 1) (cons n acc))))
+    (define (mem-adder a) (lambda (b) (+ a b)))
+    (mem-build 300 (list))
+    (mem-adder 1)
+    """)
+    entries = entries_by_name(profiler)
+    build, adder = entries['mem-build'], entries['mem-adder']
+    assert build['calls'] == 301 and build['frames'] >= 300
+    assert build['allocated'] > 300 * 8
+    assert (build['file'], build['line']) == ('<string>', 2)
+    assert adder['procedures'] == 1
+    assert profiler.stack == []
+    assert evaluator.eval is evaluator._eval
+
+
+def test_structures():
+    run("(define mem-big (list 1 2 3 4 5 6 7 8 9 10))")
+    run("(define mem-small (list 1))")
+    run("(define (mem-make a) (let ((b (list a a))) (lambda () b)))")
+    run("(define mem-closure (mem-make 1))")
+    found = {structure.name: structure for structure in structures()}
+    assert found['mem-big'].size > found['mem-small'].size
+    assert found['mem-big'].objects == 11
+    # The closure keeps the frame it captured, but not the global environment
+    assert found['mem-closure'].frames == 1
+    assert found['mem-closure'].size < reachable(global_env)[0]
+    assert [s.name for s in structures(limit=2)] == [s.name for s in structures()[:2]]
+
+
+def test_forced_promise_releases_thunk():
+    run("(define mem-promise (delay (list 1 2 3)))")
+    before = MemorySnapshot()
+    run("(force mem-promise)")
+    assert global_env['mem-promise'].proc is None
+    run("(define mem-grown (list 1 2 3 4 5 6 7 8 9 10))")
+    growth = {structure.name: structure for structure in MemorySnapshot().compare_to(before)}
+    assert growth['mem-grown'].objects == 11
+    assert 'mem-big' not in growth
+
+
+def test_memory_file(tmp_path):
+    source = tmp_path / 'program.lsp'
+    source.write_text("(define (mem-id x) x)\n(mem-id 1)\n")
+    output = str(tmp_path / 'memory.json')
+    memory_file(str(source), output)
+    with open(output) as f:
+        report = json.load(f)
+    assert {p['name'] for p in report['procedures']} >= {'mem-id', '<toplevel>'}
+    assert any(s['name'] == 'mem-id' for s in report['structures'])
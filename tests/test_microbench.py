@@ -0,0 +1,36 @@
+import json
+
+import pytest
+
+from lispy.bench import main
+from lispy.errors import BenchmarkError
+from lispy.microbench import MICROBENCHMARKS, check_budgets, measure, pin_budgets, run_micro
+
+
+def test_measure_every_microbenchmark():
+    for name in MICROBENCHMARKS:
+        result = measure(name, repeat_count=1, size=20)
+        assert result['value'] > 0
+        assert result['unit'] == MICROBENCHMARKS[name].unit
+    with pytest.raises(BenchmarkError):
+        run_micro(['no-such-microbenchmark'])
+
+
+def test_budgets():
+    results = {'read': {'value': 2.0, 'unit': 'MB/s'}, 'call': {'value': 1000.0, 'unit': 'ns'}}
+    budgets = pin_budgets(results, 2.0)
+    assert budgets == {'read': {'unit': 'MB/s', 'min': 1.0}, 'call': {'unit': 'ns', 'max': 2000.0}}
+    assert check_budgets(results, budgets) == []
+    slower = {'read': {'value': 0.5, 'unit': 'MB/s'}, 'call': {'value': 3000.0, 'unit': 'ns'},
+              'expand': {'value': 1.0, 'unit': 'forms/s'}}
+    assert [name for name, _, _ in check_budgets(slower, budgets)] == ['read', 'call']
+
+
+def test_pin_and_check(tmp_path, capsys):
+    budgets = tmp_path / 'budgets.json'
+    assert main(['--micro', 'find-depth-0', '--repeat', '1', '--pin', str(budgets), '--slack', '100']) == 0
+    assert set(json.loads(budgets.read_text())) == {'find-depth-0'}
+    assert main(['--micro', 'find-depth-0', '--repeat', '1', '--budgets', str(budgets)]) == 0
+    budgets.write_text(json.dumps({'find-depth-0': {'unit': 'ns', 'max': 0.001}}))
+    assert main(['--micro', 'find-depth-0', '--repeat', '1', '--budgets', str(budgets)]) == 1
+    assert 'OVER BUDGET' in capsys.readouterr().out
@@ -0,0 +1,116 @@
+import io
+import os
+
+import pytest
+
+from lispy import Interpreter
+from lispy.errors import LibraryError, SchemeSyntaxError, SymbolNotFoundError
+
+SHAPES = """
+(define-library (shapes)
+  (export area (rename make-square square) counter bump! twice)
+  (begin
+    (display "loading shapes")
+    (define counter 0)
+    (define (bump!) (set! counter (+ counter 1)))
+    (define (sq x) (* x x))
+    (define (make-square side) (list 'square side))
+    (define (area shape) (sq (car (cdr shape))))
+    (define-syntax twice (syntax-rules () ((_ e) (list e e))))))
+"""
+
+
+def test_define_library_and_import():
+    out = io.StringIO()
+    interpreter = Interpreter(out=out)
+    interpreter.run(SHAPES)
+    assert out.getvalue() == ''
+    assert interpreter.run("(import (shapes)) (list (area (square 3)) (twice 1))") == [9, [1, 1]]
+    # Names the library does not export stay in it, and its body ran once
+    assert 'sq' not in interpreter and 'make-square' not in interpreter
+    interpreter.run("(import (shapes))")
+    assert out.getvalue() == 'loading shapes'
+    # Imported variables follow the library, until the importer rebinds them
+    assert interpreter.run("(bump!) (bump!) counter") == 2
+    interpreter.run("(define counter 'mine) (bump!)")
+    assert interpreter['counter'] == 'mine'
+    # Every interpreter instantiates its own libraries; forks share them
+    other = Interpreter(out=out)
+    other.run(SHAPES + "(import (shapes))")
+    assert other['counter'] == 0 and out.getvalue() == 'loading shapes' * 2
+    fork = interpreter.fork()
+    assert fork.run("(import (only (shapes) counter)) counter") == 3
+
+
+def test_import_sets():
+    interpreter = Interpreter(out=io.StringIO())
+    interpreter.run(SHAPES)
+    interpreter.run("(import (prefix (only (shapes) area square) s:) (rename (except (shapes) twice) (area surface)))")
+    assert interpreter.run("(list (s:area (s:square 2)) (surface (square 4)))") == [4, 16]
+    assert 's:counter' not in interpreter and 'twice' not in interpreter.macros
+    with pytest.raises(LibraryError):
+        interpreter.run("(import (only (shapes) sq))")
+    with pytest.raises(SchemeSyntaxError):
+        interpreter.run("(import (prefix (shapes)))")
+    with pytest.raises(SchemeSyntaxError):
+        interpreter.run("(let () (import (shapes)) 1)")
+
+
+def test_library_errors(tmp_path):
+    interpreter = Interpreter(path=[str(tmp_path)])
+    with pytest.raises(LibraryError):
+        interpreter.run("(import (missing))")
+    interpreter.run("(define-library (lonely) (export ghost) (begin (define other 1)))")
+    with pytest.raises(LibraryError):
+        interpreter.run("(import (lonely))")
+    interpreter.run("(define-library (ping) (import (pong)) (begin))")
+    interpreter.run("(define-library (pong) (import (ping)) (begin))")
+    with pytest.raises(LibraryError):
+        interpreter.run("(import (ping))")
+    with pytest.raises(SymbolNotFoundError):
+        interpreter.run("(define-library (closed) (export f) (begin (define (f) hidden))) (define hidden 1)"
+                        "(import (closed)) (f)")
+
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+def test_lazy_loading_and_cache(tmp_path):
+    write(tmp_path / 'util' / 'math.sld', """
+    (define-library (util math)
+      (export square (rename swap-pair swap))
+      (begin
+        (define-syntax swap-pair (syntax-rules () ((_ a b) (list b a))))
+        (define (square x) (* x x))))
+    """)
+    write(tmp_path / 'app.scm', """
+    (define-library (app)
+      (export run)
+      (import (prefix (util math) m:))
+      (begin (define (run n) (m:swap (m:square n) n))))
+    """)
+    write(tmp_path / 'broken.sld', "(this is not a library")
+    interpreter = Interpreter(path=[str(tmp_path)])
+    assert interpreter.run("(import (app)) (run 3)") == [3, 9]
+    app = interpreter.libraries.declared[('app',)]
+    assert app.compiled is None and set(app.sources) == {str(tmp_path / 'app.scm'), str(tmp_path / 'util' / 'math.sld')}
+    assert os.path.exists(tmp_path / '__lispycache__' / 'app.lispy-1.pickle')
+    # A new interpreter reads the expanded bodies from the cache; forms defining macros are expanded again
+    interpreter = Interpreter(path=[str(tmp_path)])
+    expansions = interpreter.counters.macro_expansions
+    assert interpreter.run("(import (app) (util math)) (list (run 4) (swap 1 2))") == [[4, 16], [2, 1]]
+    assert interpreter.libraries.declared[('app',)].compiled is not None
+    assert interpreter.counters.macro_expansions - expansions == 1
+    # Changing a library invalidates its cache, and that of the libraries importing it
+    write(tmp_path / 'util' / 'math.sld', """
+    (define-library (util math)
+      (export square swap)
+      (begin
+        (define-syntax swap (syntax-rules () ((_ a b) (list 'swapped b a))))
+        (define (square x) (* x x x))))
+    """)
+    interpreter = Interpreter(path=[str(tmp_path)])
+    assert interpreter.run("(import (app)) (run 2)") == ['swapped', 2, 8]
+    assert interpreter.libraries.declared[('app',)].compiled is None
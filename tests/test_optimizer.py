@@ -0,0 +1,84 @@
+import lispy
+from lispy.repl import parse
+from lispy.types import OptimizedExp, _begin, _quote, get_symbol
+from tests.utils import run
+
+
+def test_fold_pure_calls():
+    assert parse("(+ 1 (* 2 3))") == [_quote, 7]
+    assert parse('(string-append "a" "b")') == [_quote, "ab"]
+    assert parse("(car '(a b))") == [_quote, get_symbol('a')]
+    assert run("(+ 1 (* 2 3))") == 7
+
+
+def test_no_fold_when_unsafe():
+    # Errors are left to run time, mutable results are not shared
+    assert parse("(/ 1 0)")[0] == get_symbol('/')
+    assert parse("(cdr '(a b))")[0] == get_symbol('cdr')
+    assert parse("(list 1 2)")[0] == get_symbol('list')
+    assert run("(begin (define (f) (list 1 2)) (eq? (f) (f)))") is False
+
+
+def test_if_on_constant_test():
+    assert parse("(if (< 1 2) 'yes 'no)") == [_quote, get_symbol('yes')]
+    assert parse("(if #f (display 1) opt-unbound)") == get_symbol('opt-unbound')
+    assert run("(if (> 1 2) 'yes)") is None
+
+
+def test_begin_drops_unused_constants():
+    x = parse("(begin 1 'a (lambda () 2) (display 3) 4)")
+    assert x == [_begin, [get_symbol('display'), 3], 4]
+    assert parse("(begin 1 2)") == 2
+
+
+def test_let_constant_propagation():
+    assert parse("(let ((x 10)) (* x y))") == [get_symbol('*'), 10, get_symbol('y')]
+    assert parse("(let ((x 10) (y (opt-read))) (* x y))")[1] == [[get_symbol('y'), [get_symbol('opt-read')]]]
+    assert run("(let ((x 1)) (define y 2) (+ x y))") == 3
+    assert run("(let ((x 1)) (set! x 2) (+ x 1))") == 3
+    assert run("(let ((x 1)) (define x 5) (+ x 1))") == 6
+    assert run("(let ((x 1)) (let ((x (list x))) x))") == [1]
+
+
+def test_lexical_shadowing():
+    assert run("(let ((+ -)) (+ 5 3))") == 2
+    assert run("((lambda (+) (+ 5 3)) *)") == 15
+    assert run("(begin (define (f car) (car '(1 2))) (f length))") == 2
+
+
+def test_global_constant_propagation():
+    run("(define opt-size 8)")
+    x = parse("(* opt-size 2)")
+    assert x == [_quote, 16] and isinstance(x, OptimizedExp)
+    run("(define opt-counter 0)")
+    run("(define (opt-incr) (set! opt-counter (+ opt-counter 1)) opt-counter)")
+    assert parse("(+ opt-counter 1)")[0] == get_symbol('+')
+    assert run("(opt-incr)") == 1
+
+
+def test_deoptimize_on_redefinition():
+    run("(define opt-base 10)")
+    run("(define (opt-get) (+ opt-base 1))")
+    assert run("(opt-get)") == 11
+    run("(define opt-base 20)")
+    assert run("(opt-get)") == 21
+    assert lispy.global_env['opt-get'].exp == [get_symbol('+'), [_begin, get_symbol('opt-base')], 1]
+
+
+def test_deoptimize_on_primitive_rebinding():
+    original = lispy.global_env['string-append']
+    try:
+        run('(define (opt-greet) (string-append "hello" " " "world"))')
+        assert run("(opt-greet)") == "hello world"
+        run("(define string-append (lambda args 'rebound))")
+        assert run("(opt-greet)") == get_symbol('rebound')
+        assert parse('(string-append "a" "b")')[0] == get_symbol('string-append')
+    finally:
+        lispy.global_env['string-append'] = original
+    assert parse('(string-append "a" "b")') == [_quote, "ab"]
+
+
+def test_rebinding_within_program():
+    run("(define opt-limit 3)")
+    assert run("(begin (define opt-limit 4) (* opt-limit 2))") == 8
+    assert run("(begin (set! opt-limit 5) (* opt-limit 2))") == 10
@@ -0,0 +1,101 @@
+import json
+import pstats
+
+import pytest
+
+from lispy import evaluator
+from lispy.errors import UserError
+from lispy.profiler import Profiler, profile_file
+from tests.utils import run
+
+
+def stats_by_name(profiler):
+    return {entry['name']: entry for entry in profiler.to_json()['procedures']}
+
+
+def test_calls_and_tail_calls():
+    profiler = Profiler()
+    result = profiler.run("""
+    (define (prof-fib n) (if (< n 2) n (+ (prof-fib (- n 1)) (prof-fib (- n 2)))))
+    (define (prof-count n) (if (= n 0) 'done (prof-count (- n 1))))
+    (list (prof-fib 10) (prof-count 10000))
+    """)
+    assert run("'done") == result[1] and result[0] == 55
+    stats = stats_by_name(profiler)
+    fib, count = stats['prof-fib'], stats['prof-count']
+    assert fib['calls'] == 177 and fib['tail_calls'] == 0
+    assert (fib['file'], fib['line']) == ('<string>', 2)
+    # Tail calls run in constant stack space and are counted
+    assert count['calls'] == 10001 and count['tail_calls'] == 10000
+    assert fib['inclusive'] >= fib['exclusive'] > 0
+    callers = {caller['name']: caller['calls'] for caller in fib['callers']}
+    assert callers == {None: 1, 'prof-fib': 176}
+    assert profiler.stack == []
+
+
+def test_pstats_export(tmp_path):
+    profiler = Profiler()
+    profiler.run("""
+    (define (prof-leaf x) (* x x))
+    (define (prof-sum n acc) (if (= n 0) acc (prof-sum (- n 1) (+ acc (prof-leaf n)))))
+    (prof-sum 20 0)
+    """)
+    stats = pstats.Stats(profiler).stats
+    (leaf_key,) = [key for key in stats if key[2] == 'prof-leaf']
+    (sum_key,) = [key for key in stats if key[2] == 'prof-sum']
+    primitive, calls, exclusive, inclusive, callers = stats[leaf_key]
+    assert calls == 20 and set(callers) == {sum_key}
+    filename = str(tmp_path / 'out.prof')
+    profiler.dump_stats(filename)
+    assert pstats.Stats(filename).stats[sum_key][1] == 21
+    profiler.dump_json(str(tmp_path / 'out.json'))
+    with open(tmp_path / 'out.json') as f:
+        assert {p['name'] for p in json.load(f)['procedures']} == {'prof-leaf', 'prof-sum'}
+
+
+def test_profile_form(capsys):
+    run("(define (prof-square x) (* x x))")
+    run("(define (prof-twice f x) (f (f x)))")
+    assert run("(profile (prof-twice prof-square 3))") == 81
+    out = capsys.readouterr().out
+    assert 'procedure calls' in out and 'prof-square' in out and 'prof-twice' in out
+
+
+def test_inlined_procedures(capsys):
+    # Compiled before the profiler runs, the calls of prof-odd? and prof-inc are inlined
+    run("(define (prof-even? n) (if (= n 0) #t (prof-odd? (- n 1))))")
+    run("(define (prof-odd? n) (if (= n 0) #f (prof-even? (- n 1))))")
+    run("(define (prof-inc x) (+ x 1))")
+    run("(define (prof-use n) (prof-inc (prof-inc n)))")
+    profiler = Profiler()
+    with profiler:
+        assert run("(list (prof-even? 100) (prof-use 1))") == [True, 3]
+    stats = stats_by_name(profiler)
+    assert stats['prof-even?']['calls'] == 51 and stats['prof-odd?']['calls'] == 50
+    assert stats['prof-inc']['calls'] == 2
+    assert evaluator.PROFILERS == []
+
+
+def test_profiler_restores_evaluator():
+    profiler = Profiler()
+    with pytest.raises(UserError):
+        profiler.run("""
+        (define (prof-fail n) (if (= n 0) (raise "failed") (+ 1 (prof-fail (- n 1)))))
+        (prof-fail 5)
+        """)
+    assert profiler.stack == []
+    assert stats_by_name(profiler)['prof-fail']['calls'] == 6
+    assert evaluator.eval is evaluator._eval
+    assert evaluator.Procedure.__call__ is evaluator._call
+
+
+def test_profile_file(tmp_path):
+    source = tmp_path / 'program.lsp'
+    source.write_text("(define (prof-id x) x)\n\n"
+                      "(define (prof-main n) (prof-id (prof-id n)))\n(prof-main 1)\n")
+    output = str(tmp_path / 'profile.json')
+    profile_file(str(source), output)
+    with open(output) as f:
+        procedures = {p['name']: p for p in json.load(f)['procedures']}
+    assert procedures['prof-main']['line'] == 3
+    assert procedures['prof-id']['calls'] == 2
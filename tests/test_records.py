@@ -0,0 +1,135 @@
+import pytest
+
+from lispy import Interpreter
+from lispy.errors import ArgumentError, SchemeSyntaxError, TypeMismatchError, UserError
+from lispy.parser import to_string
+from lispy.records import make_record_type, record_constructor
+from lispy.repl import parse
+from lispy.types import Record, _field_ref, _field_set, get_symbol
+from tests.utils import run
+
+
+def test_record_procedures():
+    run("""
+    (define-record-type <rec-point> (make-rec-point x y) rec-point?
+      (x rec-point-x set-rec-point-x!)
+      (y rec-point-y))
+    """)
+    p = run("(make-rec-point 1 2)")
+    assert isinstance(p, Record) and not hasattr(p, '__dict__')
+    code = "(let ((p (make-rec-point 1 2))) (set-rec-point-x! p 10) (list (rec-point-x p) (rec-point-y p)))"
+    assert run(code) == [10, 2]
+    assert run("(rec-point? (make-rec-point 1 2))") is True
+    assert run("(rec-point? (list 1 2))") is False
+    assert to_string(p) == "#<rec-point x=1 y=2>"
+    with pytest.raises(TypeMismatchError):
+        run("(rec-point-x (list 1 2))")
+
+
+def test_constructor_fields():
+    run("(define-record-type node (make-node value) node? (value node-value) (next node-next set-node-next!))")
+    assert run("(node-next (make-node 1))") is False
+    assert run("(let ((a (make-node 1)) (b (make-node 2))) (set-node-next! a b) (node-value (node-next a)))") == 2
+    with pytest.raises(TypeError):
+        run("(make-node 1 2)")
+
+
+def test_typed_fields():
+    run("""
+    (define-record-type <rec-vec> (make-rec-vec x y) rec-vec?
+      (x :: float rec-vec-x set-rec-vec-x!)
+      (y :: float rec-vec-y))
+    """)
+    assert run("(rec-vec-x (make-rec-vec 1.0 2.0))") == 1.0
+    with pytest.raises(TypeMismatchError):
+        run("(make-rec-vec 1 2.0)")
+    with pytest.raises(TypeMismatchError):
+        run("(let ((v (make-rec-vec 1.0 2.0)) (x 3)) (set-rec-vec-x! v x))")
+    # Record types can be used in annotations
+    run("(define (rec-norm2 v :: rec-vec) (+ (* (rec-vec-x v) (rec-vec-x v)) (* (rec-vec-y v) (rec-vec-y v))))")
+    assert run("(rec-norm2 (make-rec-vec 3.0 4.0))") == 25.0
+    with pytest.raises(TypeMismatchError, match="expected 'rec-vec', got 'list'"):
+        run("(rec-norm2 (list 3.0 4.0))")
+    with pytest.raises(TypeMismatchError, match="expected '\\(list-of rec-vec\\)', got 'int'"):
+        run("((lambda (vs :: (list-of rec-vec)) vs) 5)")
+    assert run("((lambda (vs :: (list-of rec-vec)) (length vs)) (list (make-rec-vec 1.0 1.0)))") == 1
+
+
+def test_proven_field_access():
+    run("""
+    (define-record-type <rec-pair> (make-rec-pair a b) rec-pair?
+      (a :: int rec-pair-a set-rec-pair-a!)
+      (b rec-pair-b))
+    """)
+    x = parse("(lambda (p :: rec-pair) (+ (rec-pair-a p) 1))")
+    assert x[2][2][0] is _field_ref and x[2][0] != get_symbol('+')
+    x = parse("(lambda (p :: rec-pair n :: int) (set-rec-pair-a! p n))")
+    assert x[2][0] is _field_set
+    assert run("((lambda (p :: rec-pair n :: int) (set-rec-pair-a! p n) (rec-pair-a p)) (make-rec-pair 1 2) 5)") == 5
+    # Unproven records and values keep the checked procedures
+    assert parse("(lambda (p) (rec-pair-a p))")[2][0] == get_symbol('rec-pair-a')
+    assert parse("(lambda (p :: rec-pair n) (set-rec-pair-a! p n))")[2][0] == get_symbol('set-rec-pair-a!')
+    with pytest.raises(TypeMismatchError, match="expected 'rec-pair', got 'int'"):
+        parse("(lambda () (rec-pair-b 5))")
+    with pytest.raises(TypeMismatchError):
+        parse("(lambda (p :: rec-pair) (set-rec-pair-a! p 1.5))")
+
+
+def test_malformed_record_types():
+    with pytest.raises(SchemeSyntaxError):
+        run("(define-record-type rec-bad make-rec-bad rec-bad?)")
+    with pytest.raises(SchemeSyntaxError):
+        run("(define-record-type rec-bad (make-rec-bad a) rec-bad? (a))")
+    with pytest.raises(ArgumentError):
+        run("(define-record-type rec-bad (make-rec-bad a) rec-bad? (b rec-bad-b))")
+    with pytest.raises(ArgumentError):
+        run("(define-record-type rec-bad (make-rec-bad a) rec-bad? (a rec-bad-a) (a rec-bad-a2))")
+
+
+def test_redefined_record_types():
+    run("(define-record-type <rec-redef> (make-rec-redef a b) rec-redef? (a rec-redef-a) (b rec-redef-b))")
+    run("(define make-rec-redef-old make-rec-redef)")
+    run("(define-record-type <rec-redef> (make-rec-redef b a) rec-redef? (b rec-redef-b) (a rec-redef-a))")
+    # Records of the old type are not proven to be of the new one, which has another layout
+    with pytest.raises(TypeMismatchError):
+        parse("(lambda () (rec-redef-a (make-rec-redef-old 1 2)))")
+    with pytest.raises(TypeMismatchError):
+        run("(let ((r (make-rec-redef-old 1 2))) (if (rec-redef? r) 'new (rec-redef-a r)))")
+    assert run("(rec-redef-a (make-rec-redef 1 2))") == 2
+
+
+def test_record_types_do_not_hide_builtins():
+    with pytest.raises(ArgumentError):
+        run("(define-record-type <int> (make-int v) int? (v int-v))")
+    with pytest.raises(ArgumentError):
+        run("(define-record-type list (make-my-list v) my-list? (v my-list-v))")
+    assert run("((lambda (n :: int) (+ n 1)) 1)") == 2
+
+
+def test_record_types_are_scoped():
+    one, other = Interpreter(), Interpreter()
+    one.run("(define-record-type <rec-scoped> (make-rec-scoped v) rec-scoped? (v rec-scoped-v))")
+    one.run("(define (rec-scoped-get r :: rec-scoped) (rec-scoped-v r))")
+    assert one.run("(rec-scoped-get (make-rec-scoped 1))") == 1
+    other.run("(define (rec-scoped-get r :: rec-scoped) r)")
+    with pytest.raises(UserError):
+        other.run("(rec-scoped-get 1)")
+    # Forks see the record types of their base, and libraries export them with their variable
+    assert one.fork().run("((lambda (r :: rec-scoped) (rec-scoped-v r)) (make-rec-scoped 2))") == 2
+    other.run("""
+    (define-library (rec-lib) (export <rec-lib> make-rec-lib)
+      (begin (define-record-type <rec-lib> (make-rec-lib v) rec-lib? (v rec-lib-v))))
+    (import (rec-lib))
+    """)
+    assert other.run("(vector-length (make-vector 2 (make-rec-lib 1) 'rec-lib))") == 2
+
+
+def test_type_names_in_errors():
+    env = Interpreter().env
+    inner = make_record_type('<rec-inner>', ['v'], ['int'], env)
+    assert inner.type_name == get_symbol('rec-inner')
+    with pytest.raises(TypeMismatchError, match="expected 'int', got 'float'"):
+        record_constructor(inner, ['v'])(1.5)
+    outer = make_record_type('<rec-outer>', ['r'], ['rec-inner'], env)
+    with pytest.raises(TypeMismatchError, match="expected 'rec-inner', got 'int'"):
+        record_constructor(outer, ['r'])(1)
@@ -0,0 +1,64 @@
+import sys
+
+from lispy import global_env
+from lispy.sampler import Sampler, lispy_stack
+from tests.utils import run
+
+
+def probe_stack():
+    return [proc.name for proc in lispy_stack(sys._getframe(1))]
+
+
+def test_lispy_stack():
+    global_env['samp-probe'] = probe_stack
+    # Annotated procedures are not inlined by the optimizer
+    run("(define (samp-inner n :: int) (samp-probe))")
+    run("(define (samp-outer n :: int) (cons n (samp-inner n)))")
+    run("(define (samp-tail n :: int) (samp-inner n))")
+    assert run("(samp-outer 1)") == [1, 'samp-outer', 'samp-inner']
+    # A tail call replaces the caller
+    assert run("(cons 0 (samp-tail 1))") == [0, 'samp-inner']
+    # Procedures called from primitives
+    assert run("(apply samp-outer '(1))") == [1, 'samp-outer', 'samp-inner']
+    assert run("(samp-probe)") == []
+    # Sampling does not stop inlining: inlined procedures are charged to their caller
+    with Sampler(interval=60):
+        run("(define (samp-plain n) (samp-probe))")
+        run("(define (samp-inlined n :: int) (cons n (samp-plain n)))")
+        assert run("(samp-inlined 1)") == [1, 'samp-inlined']
+
+
+def test_collapsed_stacks(tmp_path):
+    sampler = Sampler()
+    global_env['samp-sample'] = lambda: sampler.sample(sys._getframe(1))
+    run("(define (samp-leaf n :: int) (samp-sample))")
+    run("(define (samp-root n :: int) (samp-leaf n) (samp-leaf n) (samp-sample))")
+    run("(samp-root 1)")
+    run("(samp-sample)")
+    assert sampler.collapsed() == ("samp-root (<unknown>:0);samp-leaf (<unknown>:0) 2\n"
+                                   "samp-root (<unknown>:0) 1\n"
+                                   "<toplevel> 1\n")
+    filename = tmp_path / 'out.folded'
+    sampler.write_collapsed(str(filename))
+    assert filename.read_text() == sampler.collapsed()
+
+
+def test_sampler_thread():
+    run("(define (samp-spin n) (if (= n 0) 0 (samp-spin (- n 1))))")
+    with Sampler(interval=0.001) as sampler:
+        run("(samp-spin 30000)")
+    assert sampler.samples
+    assert all(stack[-1].startswith('samp-spin') for stack in sampler.samples if stack != ('<toplevel>',))
+
+
+def test_depth_limit():
+    sampler = Sampler(interval=60, depth=3)
+    global_env['samp-sample'] = lambda: sampler.sample(sys._getframe(1))
+    with sampler:
+        run("(define (samp-deep n) (if (= n 0) (begin (samp-sample) 0) (+ 1 (samp-deep (- n 1)))))")
+        run("(samp-deep 10)")
+        run("(samp-deep 1)")
+    # Only the innermost frames of the evaluator are read, some of them evaluating arguments
+    (truncated, shallow) = sorted(sampler.samples, key=len, reverse=True)
+    assert truncated[0] == '<truncated>' and 1 < len(truncated) <= 4
+    assert set(truncated[1:]) == set(shallow) == {'samp-deep (<unknown>:0)'} and len(shallow) == 2
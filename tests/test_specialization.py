@@ -0,0 +1,62 @@
+import operator
+
+import lispy
+from lispy.repl import parse
+from lispy.types import _do, _operator, get_symbol
+from tests.utils import run
+
+
+def test_numeric_operators():
+    x = parse("(lambda (a :: int b :: float) (list (+ a b) (* a a) (< a b) (/ a 2)))")
+    calls = x[2][1:]
+    assert [c[0] for c in calls] == [_operator] * 4
+    assert [c[1] for c in calls] == [operator.add, operator.mul, operator.lt, operator.truediv]
+    assert run("((lambda (a :: int b :: float) (list (+ a b) (* a a) (< a b) (/ a 2))) 3 0.5)") == [3.5, 9, False, 1.5]
+    # Unknown or non-numeric operands keep the generic primitives
+    assert parse("(lambda (a b) (+ a b))")[2][0] == get_symbol('+')
+    assert parse("(lambda (a :: int) (+ a 1 2))")[2][0] == get_symbol('+')
+    assert parse('(lambda (s :: str) (= s "a"))')[2][0] == get_symbol('=')
+
+
+def test_typed_loops():
+    code = "(lambda (n :: int) (let loop ((k 0) (acc 0.0)) (if (= k n) acc (loop (+ k 1) (+ acc (* 0.5 k))))))"
+    body = parse(code)[2][3]
+    assert body[1][0] is _operator
+    assert [arg[0] for arg in body[3][2:]] == [_operator, _operator]
+    assert run("(" + code + " 4)") == 3.0
+    x = parse("(lambda (n :: int) (do ((k 0 (+ k 1)) (acc 0 (+ acc k))) ((= k n) acc)))")
+    assert x[2][0] is _do and x[2][1][1][2][0] is _operator
+    assert run("((lambda (n :: int) (do ((k 0 (+ k 1)) (acc 0 (+ acc k))) ((= k n) acc))) 5)") == 10
+
+
+def test_nested_loops():
+    # Inner loops are proven once the outer loop's types are known, without nested speculation
+    x = parse("(lambda (n :: int) (do ((k 0 (+ k 1))) ((= k n) k) (do ((m 0 (+ m 1))) ((= m k) m) m)))")
+    inner = x[2][3]
+    assert inner[0] is _do and inner[1][0][2][0] is _operator and inner[2][0][0] is _operator
+    code = "0"
+    for depth in range(12):
+        code = "(do ((v 0 (+ v 1)) (a{0} 0 (+ a{0} 1.5))) ((= v 1) a{0}) {1})".format(depth, code)
+    assert run(code) == 1.5
+
+
+def test_loop_variables_changing_type():
+    run("(define (spec-half x :: float) (/ x 2))")
+    code = "(let loop ((k 0) (acc '())) (if (> k 1) acc (loop (+ k 0.5) (if (> k 0) (cons (spec-half k) acc) acc))))"
+    x = parse(code)
+    assert x[3][1][0] == get_symbol('>')
+    assert run(code) == [0.5, 0.25]
+    assert run("(do ((k 1 (/ k 2))) ((< k 0.3) k))") == 0.25
+
+
+def test_generic_fallback():
+    original = lispy.global_env['*']
+    try:
+        run("(define (spec-square x :: int) (* x x))")
+        assert lispy.global_env['spec-square'].exp[0] is _operator
+        assert run("(spec-square 7)") == 49
+        run('(define * (lambda args "rebound"))')
+        assert run("(spec-square 7)") == "rebound"
+    finally:
+        lispy.global_env['*'] = original
+    assert run("(spec-square 7)") == 49
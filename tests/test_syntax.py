@@ -2,7 +2,7 @@ import re
 
 import pytest
 
-from lispy.errors import SchemeSyntaxError
+from lispy.errors import ArgumentError, SchemeSyntaxError
 from lispy.messages import (
     ERR_CANT_SPLICE,
     ERR_DEFINE_MACRO_TOPLEVEL,
@@ -11,6 +11,8 @@ from lispy.messages import (
     ERR_ILLEGAL_LAMBDA,
     ERR_WRONG_LENGTH,
 )
+from lispy.repl import parse
+from lispy.types import _append, _list, _list_star, _quote
 from tests.utils import run
 
 
@@ -25,6 +27,37 @@ def test_quasiquote():
     assert run("`(testing ,L testing)") == ["testing", [1, 2, 3], "testing"]
 
 
+def test_quasiquote_segments():
+    run("(define L (list 1 2 3))")
+    assert run("`(,@L)") == [1, 2, 3]
+    assert run("`(,@L ,@L)") == [1, 2, 3, 1, 2, 3]
+    assert run("`(a ,@L)") == ["a", 1, 2, 3]
+    assert run("`(a b unquote L)") == ["a", "b", 1, 2, 3]
+    assert run("`(a (b ,(car L)) ,@L c (d e))") == ["a", ["b", 1], 1, 2, 3, "c", ["d", "e"]]
+    assert run("`(1 \"s\" #t ,(+ 1 1))") == [1, "s", True, 2]
+    assert run("(car `(,(let ((x 5)) x)))") == 5
+
+
+def test_quasiquote_expansion():
+    assert parse("`(a (b c) 1)") == [_quote, ["a", ["b", "c"], 1]]
+    assert parse("`(a ,b c)") == [_list, [_quote, "a"], "b", [_quote, "c"]]
+    assert parse("`(a ,b ,@c)") == [_list_star, [_quote, "a"], "b", "c"]
+    assert parse("`(a b ,@c d)") == [_append, [_quote, ["a", "b"]], "c", [_quote, ["d"]]]
+
+
+def test_quasiquote_empty_unquote():
+    with pytest.raises(SchemeSyntaxError):
+        parse("`(a ,())")
+    assert run("`(a ,'())") == ["a", []]
+    assert run("`(a (b ,'(1)))") == ["a", ["b", [1]]]
+    assert run("`(())") == [[]]
+    assert run("`(a ())") == ["a", []]
+    assert run("(let ((x 1)) `(,x ()))") == [1, []]
+    assert run("(list* 1 2 '(3))") == [1, 2, 3]
+    with pytest.raises(ArgumentError):
+        run("(list*)")
+
+
 def test_comments():
     code = """'(1 ;test comments '
      ;skip this line
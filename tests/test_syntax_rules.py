@@ -0,0 +1,82 @@
+import re
+
+import pytest
+
+from lispy.errors import SchemeSyntaxError
+from lispy.messages import ERR_DEFINE_SYNTAX_TOPLEVEL, ERR_ELLIPSIS_TEMPLATE, ERR_NO_MATCHING_RULE
+from tests.utils import run
+
+
+def test_simple_rule():
+    run("(define-syntax swap! (syntax-rules () ((_ a b) (let ((tmp a)) (set! a b) (set! b tmp)))))")
+    run("(define x 1)")
+    run("(define y 2)")
+    run("(swap! x y)")
+    assert run("(list x y)") == [2, 1]
+
+
+def test_hygienic_temporaries():
+    # The template's 'tmp' must not capture the user's 'tmp'
+    run("(define-syntax swap! (syntax-rules () ((_ a b) (let ((tmp a)) (set! a b) (set! b tmp)))))")
+    run("(define tmp 1)")
+    run("(define other 2)")
+    run("(swap! tmp other)")
+    assert run("(list tmp other)") == [2, 1]
+    # The 'or' temporary no longer collides with user variables
+    assert run("(let ((temp 5)) (or #f temp))") == 5
+
+
+def test_quoted_binders_are_not_renamed():
+    run("(define-syntax sr-quoted (syntax-rules () ((_ a) (let ((tmp a)) (list tmp 'tmp `(tmp ,tmp))))))")
+    assert run("(sr-quoted 1)") == [1, "tmp", ["tmp", 1]]
+    # Pattern variables are still substituted in quoted data
+    run("(define-syntax sr-name (syntax-rules () ((_ a) (let ((tmp 0)) '(a tmp)))))")
+    assert run("(sr-name x)") == ["x", "tmp"]
+
+
+def test_ellipsis():
+    run("(define-syntax my-list (syntax-rules () ((_ x ...) (list x ...))))")
+    assert run("(my-list)") == []
+    assert run("(my-list 1 2 3)") == [1, 2, 3]
+    run("(define-syntax my-let* (syntax-rules () "
+        "((_ () body ...) (let () body ...)) "
+        "((_ ((n v) rest ...) body ...) (let ((n v)) (my-let* (rest ...) body ...)))))")
+    assert run("(my-let* ((a 1) (b (+ a 1))) (* a b))") == 2
+
+
+def test_nested_ellipsis_and_tail():
+    run("(define-syntax pairs (syntax-rules () ((_ (k v ...) ... last) (list (list 'k v ...) ... last))))")
+    assert run("(pairs (a 1 2) (b) 9)") == [["a", 1, 2], ["b"], 9]
+
+
+def test_literals():
+    run("(define-syntax arrow (syntax-rules (=>) ((_ a => b) (list a b)) ((_ a b) 'no-arrow)))")
+    assert run("(arrow 1 => 2)") == [1, 2]
+    assert run("(arrow 1 2)") == "no-arrow"
+
+
+def test_recursive_macro():
+    run("(define-syntax my-and (syntax-rules () ((_) #t) ((_ e) e) ((_ e r ...) (if e (my-and r ...) #f))))")
+    assert run("(my-and 1 2 3)") == 3
+    assert run("(my-and 1 #f 3)") is False
+
+
+def test_do_loop_name_is_hygienic():
+    code = """
+    (begin
+      (define (__do_loop__ x) 'user)
+      (do ((k 0 (+ k 1))) ((= k 2) (__do_loop__ k))))
+    """
+    assert run(code) == "user"
+
+
+def test_errors():
+    run("(define-syntax two (syntax-rules () ((_ a b) (list a b))))")
+    with pytest.raises(SchemeSyntaxError, match=re.escape(ERR_NO_MATCHING_RULE.format("(two 1)"))):
+        run("(two 1)")
+    with pytest.raises(SchemeSyntaxError, match=ERR_DEFINE_SYNTAX_TOPLEVEL):
+        run("(if #t (define-syntax a (syntax-rules () ((_) 1))))")
+    with pytest.raises(SchemeSyntaxError, match=re.escape(ERR_ELLIPSIS_TEMPLATE.format("x"))):
+        run("(define-syntax bad (syntax-rules () ((_ x ...) (list x))))")
+    with pytest.raises(SchemeSyntaxError):
+        run("(define-syntax bad (syntax-rules (1) ((_) 1)))")
@@ -0,0 +1,44 @@
+import pytest
+
+from lispy.errors import SchemeSyntaxError
+from lispy.timing import percentile
+from tests.utils import run
+
+
+def test_time(capsys):
+    run("(define (time-fib n) (if (< n 2) n (+ (time-fib (- n 1)) (time-fib (- n 2)))))")
+    assert run("(hash-ref (time (time-fib 10)) 'value)") == 55
+    # One frame per call, and one for the thunk the expression is wrapped in
+    assert run("(hash-ref (time (time-fib 10)) 'env-frames)") == 178
+    assert run("(hash-ref (time ((lambda (x) (lambda () x)) 1)) 'procedures)") >= 1
+    assert run("(>= (hash-ref (time (time-fib 10)) 'wall-ns) 0)") is True
+    out = capsys.readouterr().out
+    assert out.count('; wall ') == 4 and '178 frames' in out
+
+
+def test_bench(capsys):
+    run("(define (bench-sum n) (if (= n 0) 0 (+ n (bench-sum (- n 1)))))")
+    run("(define bench-result (bench (bench-sum 20) #:warmup 2 #:iterations 7))")
+    assert run("(hash-ref bench-result 'value)") == 210
+    assert run("(hash-ref bench-result 'iterations)") == 7
+    assert run("(length (hash-ref bench-result 'times))") == 7
+    assert run("(<= (hash-ref bench-result 'min) (hash-ref bench-result 'median))") is True
+    assert run("(<= (hash-ref bench-result 'p90) (hash-ref bench-result 'max))") is True
+    assert '; 7 iterations: median ' in capsys.readouterr().out
+    assert run("(hash-ref (bench (bench-sum 1)) 'warmup)") == 10
+
+
+def test_bench_options():
+    with pytest.raises(SchemeSyntaxError, match='Unknown option'):
+        run("(bench 1 #:repeat 3)")
+    with pytest.raises(SchemeSyntaxError):
+        run("(bench 1 #:iterations)")
+
+
+def test_percentile():
+    times = [10, 20, 30, 40, 50]
+    assert percentile(times, 0) == 10
+    assert percentile(times, 50) == 30
+    assert percentile(times, 90) == 46
+    assert percentile(times, 100) == 50
+    assert percentile([7], 99) == 7
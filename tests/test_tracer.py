@@ -0,0 +1,67 @@
+import io
+
+from lispy import evaluator
+from lispy.evaluator import Hook
+from lispy.tracer import DEFAULT_KINDS, SPECIAL_FORM, Tracer
+from tests.utils import run
+
+
+def kinds_and_names(tracer):
+    return [(e.kind, getattr(e.subject, 'name', e.subject)) for e in tracer.events]
+
+
+def test_calls_tail_calls_and_exceptions():
+    run("(define (trace-down n) (if (= n 0) (raise \"bottom\") (trace-down (- n 1))))")
+    run("(define (trace-safe n) (try (trace-down n) (lambda (e) 'caught)))")
+    with Tracer() as tracer:
+        assert run("(trace-safe 2)") == run("'caught")
+    events = kinds_and_names(tracer)
+    assert events[:6] == [('enter', 'trace-safe'), ('enter', 'trace-down'),
+                          ('exit', 'trace-down'), ('tail-call', 'trace-down'),
+                          ('exit', 'trace-down'), ('tail-call', 'trace-down')]
+    assert events[6] == ('raise', 'trace-down')
+    assert events[7][0] == 'catch' and str(events[7][1]) == '"bottom"'
+    # The handler is called in tail position
+    assert events[8:] == [('exit', 'trace-safe'), ('tail-call', None), ('exit', None)]
+    assert [e.depth for e in tracer.events][:3] == [0, 1, 1]
+    assert all(e.duration >= 0 for e in tracer.events if e.kind in ('exit', 'raise'))
+    out = io.StringIO()
+    tracer.dump(out)
+    assert 'tail-call trace-down (<unknown>:0)' in out.getvalue()
+    assert len(tracer.to_json()) == len(tracer.events)
+
+
+def test_ring_buffer():
+    run("(define (trace-loop n) (if (= n 0) 'done (trace-loop (- n 1))))")
+    with Tracer(capacity=10) as tracer:
+        run("(trace-loop 1000)")
+    assert len(tracer.events) == 10
+    assert tracer.events[-1].kind == 'exit'
+    tracer.clear()
+    assert not tracer.events
+
+
+def test_special_forms_and_macros():
+    with Tracer(kinds=DEFAULT_KINDS | {SPECIAL_FORM}) as tracer:
+        run("(define-macro trace-macro (lambda (x) `(if ,x 1 2)))")
+        assert run("(trace-macro (car (list #t)))") == 1
+    events = kinds_and_names(tracer)
+    assert ('macro', 'trace-macro') in events
+    assert ('form', 'if') in events
+
+
+def test_custom_hook():
+    class Calls(Hook):
+        def __init__(self):
+            self.names = []
+
+        def enter(self, proc, args):
+            self.names.append((proc.name, list(args)))
+
+    run("(define (trace-id x) x)")
+    with Calls() as calls:
+        run("(trace-id (trace-id 1))")
+    assert calls.names == [('trace-id', [1]), ('trace-id', [1])]
+    assert evaluator.eval is evaluator._eval
+    assert evaluator.Procedure.__call__ is evaluator._call
+    assert evaluator.HOOKS == []
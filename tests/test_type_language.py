@@ -0,0 +1,88 @@
+from array import array
+
+import pytest
+
+from lispy.errors import TypeMismatchError, UserError
+from lispy.parser import to_string
+from lispy.repl import parse
+from lispy.types import _typed_call
+from tests.utils import run
+
+
+def test_vectors():
+    assert to_string(run("(vector 1 \"a\" 'b)")) == '#(1 "a" b)'
+    assert run("(let ((v (make-vector 3 0))) (vector-set! v 1 5) (vector->list v))") == [0, 5, 0]
+    assert run("(vector-length (list->vector '(1 2 3)))") == 3
+    assert run("(vector? (vector))") is True
+    assert run("(vector? '())") is False
+
+
+def test_typed_vectors():
+    v = run("(make-vector 3 0.0 'float)")
+    assert isinstance(v.items, array)
+    assert to_string(v) == "#(0.0 0.0 0.0)"
+    with pytest.raises(TypeMismatchError, match="float"):
+        run("(vector-set! (make-vector 3 0.0 'float) 0 1)")
+    with pytest.raises(TypeMismatchError):
+        run("(list->vector '(1 2.5) 'int)")
+    assert run("(let ((v (make-vector 2 \"\" '(or str int)))) (vector-set! v 0 1) (vector->list v))") == [1, ""]
+
+
+def test_hash_tables():
+    code = """
+    (let ((h (make-hash-table)))
+      (hash-set! h "a" 1) (hash-set! h 2 3) (hash-remove! h 2)
+      (list (hash-ref h "a") (hash-ref h 2 #f) (hash-count h)))
+    """
+    assert run(code) == [1, False, 1]
+    assert to_string(run("(make-hash-table)")) == "#<hash-table 0>"
+    with pytest.raises(TypeMismatchError):
+        run("(hash-set! (make-hash-table 'str 'int) \"a\" 1.5)")
+    with pytest.raises(TypeMismatchError):
+        run("(hash-set! (make-hash-table 'str 'int) 1 1)")
+
+
+def test_parametric_annotations():
+    run("""
+    (define (tl-sum v :: (vector-of float))
+      (do ((k 0 (+ k 1)) (acc 0.0 (+ acc (vector-ref v k)))) ((= k (vector-length v)) acc)))
+    """)
+    assert run("(tl-sum (list->vector '(1.0 2.5) 'float))") == 3.5
+    # Untyped containers are checked element by element
+    assert run("(tl-sum (vector 1.0 2.5))") == 3.5
+    with pytest.raises(TypeMismatchError, match=r"\(vector-of float\)"):
+        run("(tl-sum (vector 1 2.5))")
+    with pytest.raises(TypeMismatchError):
+        run("(tl-sum (list->vector '(1 2) 'int))")
+    run("(define (tl-count h :: (hash-of str any)) (hash-count h))")
+    assert run("(tl-count (make-hash-table 'str 'list))") == 0
+    run("(define tl-xs :: (list-of (or int str)) (list 1 \"a\"))")
+    with pytest.raises(TypeMismatchError):
+        run("(define tl-ys :: (list-of int) (list 1 \"a\"))")
+
+
+def test_unions_and_procedures():
+    run("(define (tl-show x :: (or int str)) x)")
+    assert run('(list (tl-show 1) (tl-show "a"))') == [1, "a"]
+    with pytest.raises(TypeMismatchError):
+        run("(tl-show 1.5)")
+    run("(define (tl-apply2 f :: (procedure 2) a b) (f a b))")
+    assert run("(tl-apply2 cons 1 '())") == [1]
+    assert run("(tl-apply2 (lambda (a b) (+ a b)) 1 2)") == 3
+    assert run("(tl-apply2 (lambda args args) 1 2)") == [1, 2]
+    with pytest.raises(TypeMismatchError):
+        run("(tl-apply2 car 1 2)")
+    with pytest.raises(TypeMismatchError):
+        run("(tl-apply2 (lambda (a) a) 1 2)")
+    run("(define (tl-call f :: procedure x :: any) (f x))")
+    assert parse("(tl-call (lambda (y) y) 1)")[0] is _typed_call
+    assert run("(tl-call car '(1))") == 1
+
+
+def test_unknown_type_expressions():
+    with pytest.raises(UserError):
+        run("(define x :: (array-of int) 1)")
+    with pytest.raises(UserError):
+        run("(define x :: (list-of int str) '())")
+    with pytest.raises(UserError):
+        run("(make-vector 2 0 'integer)")